@@ -12,10 +12,16 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# 电影数据的访问层 movie_repository 在仓库的 数据库代码 目录中，与导入脚本、评分流程共用
+MOVIE_REPOSITORY_DIR = BASE_DIR.parent.parent / '数据库代码'
+if str(MOVIE_REPOSITORY_DIR) not in sys.path:
+    sys.path.append(str(MOVIE_REPOSITORY_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -96,6 +102,22 @@ DATABASES = {
 }
 
 
+# 电影数据（moviemate_movies 等表）所在的数据库，与 Django 使用同一个 MySQL 实例，
+# 主机、端口和账号取自 DATABASES['default']。views 中的查询从进程内共享的连接池借用连接（见 webGUI/db_pool.py）
+MOVIE_DATABASE = {
+    'NAME': 'MovieMate',
+    'CHARSET': 'utf8mb4',
+    # 连接池最多保持的连接数
+    'POOL_SIZE': 8,
+    # 连接池已满时等待空闲连接的最长时间（秒）
+    'POOL_TIMEOUT': 5,
+    # 连接建立超过这个时间（秒）后关闭重建，避免被 MySQL 的 wait_timeout 断开或长期占用服务端资源
+    'MAX_LIFETIME': 1800,
+    # 连接空闲超过这个时间（秒）后，借出前先 ping 一次检查是否仍然可用
+    'HEALTH_CHECK_INTERVAL': 30,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -133,6 +155,12 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATICFILES_ROOT=(os.path.join(BASE_DIR,'static'),)
 
+# 离线任务（推荐算法代码/similar_movies.py）生成的相似电影表
+SIMILAR_MOVIES_FILE = BASE_DIR / 'data' / 'similar_movies.npz'
+
+# 离线任务（推荐算法代码/implicit_als.py）导出的协同过滤模型目录
+COLLABORATIVE_MODEL_DIR = BASE_DIR / 'data' / 'collaborative'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
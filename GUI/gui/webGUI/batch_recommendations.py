@@ -0,0 +1,26 @@
+import json
+
+from .models import Recommendation
+from .similar_movies import get_table
+
+
+#离线批处理预先算好的推荐
+def precomputed_movies(kind, subject, k=10):
+    """
+    功能:
+    - 按 (kind, subject) 查出 推荐算法代码/batch_recommendations.py 写入的推荐列表，
+      格式与 similar_movies 相同。
+
+    输入:
+    - kind: 'user' 或 'movie'。
+    - subject: 用户名或电影标题。
+
+    输出:
+    - 电影字典列表；没有预先算好的结果时返回空列表，由调用方回退到实时计算。
+    """
+    table = get_table()
+    row = Recommendation.objects.filter(kind=kind, subject=subject).values_list('titles', flat=True).first()
+    if table is None or row is None:
+        return []
+    titles = [title for title in json.loads(row) if title in table.index]
+    return [table.movie(table.index[title]) for title in titles[:k]]
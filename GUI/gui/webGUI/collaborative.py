@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .similar_movies import get_table
+
+# 内存中的协同过滤模型，导出新版本后在下一次请求时重新载入
+_model = None
+_lock = threading.Lock()
+
+
+def model_version(directory):
+    """
+    功能:
+    - 返回 (模型文件所在目录, 版本标识)。implicit_als.save_model 把每个版本写入单独的子目录，
+      CURRENT 记录当前版本的子目录名；没有 CURRENT 的旧导出格式以 meta.json 的修改时间为版本。
+      模型不存在时返回 (None, None)。
+    """
+    try:
+        with open(os.path.join(directory, 'CURRENT'), 'r', encoding='utf-8') as file:
+            version = file.read().strip()
+        return os.path.join(directory, version), version
+    except OSError:
+        pass
+    try:
+        return directory, os.path.getmtime(os.path.join(directory, 'meta.json'))
+    except OSError:
+        return None, None
+
+
+class CollaborativeModel(object):
+    def __init__(self, directory, version=None):
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        self.users = {user_name: i for i, user_name in enumerate(meta['users'])}
+        self.items = meta['items']
+        # 因子矩阵以只读内存映射方式打开，多个 web 进程共享同一份数据
+        self.user_factors = np.load(os.path.join(directory, 'user_factors.npy'), mmap_mode='r')
+        self.item_factors = np.load(os.path.join(directory, 'item_factors.npy'), mmap_mode='r')
+        self.top_items = np.load(os.path.join(directory, 'top_items.npy'), mmap_mode='r')
+        self.version = version
+
+    def recommend(self, user_name, k=10):
+        # 训练时为每个用户预先算好的 top-N 标题；用户不在模型中时返回空列表
+        i = self.users.get(user_name)
+        if i is None:
+            return []
+        return [self.items[j] for j in self.top_items[i, :k].tolist() if j >= 0]
+
+
+def get_model(directory=None):
+    global _model
+    directory = directory or settings.COLLABORATIVE_MODEL_DIR
+    path, version = model_version(directory)
+    if path is None:
+        return None
+    if _model is None or _model.version != version:
+        with _lock:
+            if _model is None or _model.version != version:
+                # 旧版本的文件不会被改写，换用新版本前仍在使用旧模型的请求不受影响
+                _model = CollaborativeModel(path, version)
+    return _model
+
+
+#协同过滤推荐
+def collaborative_movies(user_name, k=10):
+    """
+    功能:
+    - 返回协同过滤模型为该用户推荐的电影，格式与 similar_movies 相同；模型或相似电影表不存在时返回空列表。
+    """
+    model, table = get_model(), get_table()
+    if model is None or table is None:
+        return []
+    return [table.movie(table.index[title]) for title in model.recommend(user_name, k) if title in table.index]
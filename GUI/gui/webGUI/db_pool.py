@@ -0,0 +1,174 @@
+import contextlib
+import threading
+import time
+
+import pymysql
+from django.conf import settings
+
+# 进程内共享的连接池，第一次使用时按 settings.MOVIE_DATABASE 创建
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    线程安全的 pymysql 连接池。
+
+    - 最多保持 size 个连接；都被借出时等待归还，超过 timeout 秒抛出 PoolTimeout。
+    - 空闲连接按后进先出借出，刚归还的连接最“热”，长期不用的连接自然留在栈底。
+    - 连接建立超过 max_lifetime 秒后在借出时关闭重建；空闲超过 health_check_interval 秒的连接借出前先 ping。
+    - 归还时回滚，结束借用期间可能打开的事务，下一个借用者不会读到旧的一致性快照。
+    - 记录借用等待时间等指标，见 stats()。
+    """
+
+    def __init__(self, connect, size=8, timeout=5.0, max_lifetime=1800.0, health_check_interval=30.0):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = []  # (连接, 建立时间, 归还时间)
+        self._created_at = {}
+        self._opened = 0
+        self._condition = threading.Condition()
+        self._metrics = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'timeouts': 0,
+                         'opened': 0, 'recycled': 0, 'health_check_failures': 0}
+
+    def _open(self):
+        connection = self.connect()
+        self._created_at[id(connection)] = time.monotonic()
+        with self._condition:
+            self._metrics['opened'] += 1
+        return connection
+
+    def _close(self, connection):
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _discard(self, connection):
+        # 关闭连接并归还名额
+        self._close(connection)
+        with self._condition:
+            self._opened -= 1
+            self._condition.notify()
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._condition:
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise PoolTimeout(f'等待数据库连接超过 {self.timeout} 秒')
+                self._condition.wait(remaining)
+            if self._idle:
+                connection, created_at, returned_at = self._idle.pop()
+            else:
+                connection, created_at, returned_at = None, None, None
+                # 先占住名额，建立连接在锁外进行
+                self._opened += 1
+            waited = time.monotonic() - start
+            self._metrics['acquired'] += 1
+            self._metrics['wait_seconds'] += waited
+            self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], waited)
+            if waited > 0.001:
+                self._metrics['waited'] += 1
+
+        try:
+            now = time.monotonic()
+            # 过期或检查失败的连接直接关闭，借用者占用的名额用于建立新连接
+            if connection is not None and now - created_at > self.max_lifetime:
+                self._close(connection)
+                with self._condition:
+                    self._metrics['recycled'] += 1
+                connection = None
+            elif connection is not None and now - returned_at > self.health_check_interval:
+                try:
+                    connection.ping(reconnect=False)
+                except Exception:
+                    self._close(connection)
+                    with self._condition:
+                        self._metrics['health_check_failures'] += 1
+                    connection = None
+            if connection is None:
+                connection = self._open()
+        except Exception:
+            # 建立连接失败时归还名额
+            with self._condition:
+                self._opened -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    def release(self, connection):
+        if connection is None:
+            return
+        try:
+            connection.rollback()
+        except Exception:
+            # 连接已断开，丢弃后由下一个借用者重新建立
+            self._discard(connection)
+            return
+        created_at = self._created_at.get(id(connection), time.monotonic())
+        with self._condition:
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        # with pool.connection() as connection: ...  用完自动归还
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self):
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics.update(size=self.size, open=self._opened, idle=len(self._idle))
+        metrics['avg_wait_ms'] = metrics['wait_seconds'] / metrics['acquired'] * 1000 if metrics['acquired'] else 0.0
+        metrics['max_wait_ms'] = metrics.pop('max_wait_seconds') * 1000
+        metrics['wait_ms'] = metrics.pop('wait_seconds') * 1000
+        return metrics
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+
+def connect_movie_database():
+    default = settings.DATABASES['default']
+    config = settings.MOVIE_DATABASE
+    return pymysql.connect(host=default.get('HOST') or 'localhost', port=int(default.get('PORT') or 3306),
+                           user=default['USER'], password=default['PASSWORD'], database=config['NAME'],
+                           charset=config.get('CHARSET', 'utf8mb4'))
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = settings.MOVIE_DATABASE
+                _pool = ConnectionPool(connect_movie_database, size=config.get('POOL_SIZE', 8),
+                                       timeout=config.get('POOL_TIMEOUT', 5),
+                                       max_lifetime=config.get('MAX_LIFETIME', 1800),
+                                       health_check_interval=config.get('HEALTH_CHECK_INTERVAL', 30))
+    return _pool
+
+
+#从连接池借用一个电影数据库连接
+def movie_connection():
+    return get_pool().connection()
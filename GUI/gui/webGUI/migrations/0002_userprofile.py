@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("webGUI", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_name", models.CharField(max_length=20, unique=True)),
+                ("profile", models.TextField(default="{}")),
+                ("history", models.TextField(default="[]")),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -4,4 +4,36 @@ from django.db import models
 class UserInfo(models.Model):
     user_id = models.CharField(True, max_length=20)
     user_name = models.CharField(max_length=20)
-    user_password = models.CharField(max_length=20)
\ No newline at end of file
+    user_password = models.CharField(max_length=20)
+
+# 用户的兴趣画像与最近的搜索记录
+class UserProfile(models.Model):
+    user_name = models.CharField(max_length=20, unique=True)
+    # {特征: 权重} 的 JSON，每次搜索后衰减并累加所搜电影的特征
+    profile = models.TextField(default='{}')
+    # 最近搜索的电影信息列表的 JSON，最新的在前
+    history = models.TextField(default='[]')
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# 用户与电影的交互记录（搜索、点击），用于训练协同过滤模型
+class Interaction(models.Model):
+    user_name = models.CharField(max_length=20, db_index=True)
+    title = models.CharField(max_length=255)
+    # 'search' 或 'click'
+    kind = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+# 离线批处理预先算好的推荐列表，每个用户、每部电影一行
+class Recommendation(models.Model):
+    # 'user' 或 'movie'
+    kind = models.CharField(max_length=10)
+    # 用户名或电影标题
+    subject = models.CharField(max_length=255)
+    # 按得分从高到低排列的电影标题列表的 JSON
+    titles = models.TextField(default='[]')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'subject')
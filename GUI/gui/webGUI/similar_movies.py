@@ -0,0 +1,134 @@
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# 内存中的相似电影表，文件更新后在下一次请求时重新载入
+_table = None
+_lock = threading.Lock()
+
+
+class SimilarMovieTable(object):
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.titles = data['titles'].tolist()
+            self.mm_ratings = data['mm_ratings'].tolist()
+            self.poster_urls = data['poster_urls'].tolist()
+            self.detail_urls = data['detail_urls'].tolist()
+            self.neighbours = data['neighbours']
+            if 'tokens' in data.files:
+                self.tokens = data['tokens'].tolist()
+                self.feature_indptr = data['feature_indptr']
+                self.feature_indices = data['feature_indices']
+                self.feature_values = data['feature_values']
+            else:
+                self.tokens = []
+                self.feature_indptr = np.zeros(len(self.titles) + 1, dtype=np.int64)
+                self.feature_indices = np.zeros(0, dtype=np.int32)
+                self.feature_values = np.zeros(0, dtype=np.float32)
+        self.mtime = os.path.getmtime(path)
+        # 标题 -> 行号
+        self.index = {title: i for i, title in enumerate(self.titles)}
+        self.token_index = {token: i for i, token in enumerate(self.tokens)}
+
+        # 特征矩阵按列（特征）重新排列：用户画像只涉及少量特征，打分时只访问这些列
+        order = np.argsort(self.feature_indices, kind='stable')
+        rows = np.repeat(np.arange(len(self.titles), dtype=np.int32), np.diff(self.feature_indptr))
+        self.column_rows = rows[order]
+        self.column_values = self.feature_values[order]
+        self.column_offsets = np.zeros(len(self.tokens) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.feature_indices, minlength=len(self.tokens)), out=self.column_offsets[1:])
+
+    def movie(self, i):
+        return {
+            'title': self.titles[i],
+            'mm_rating': self.mm_ratings[i],
+            'poster_url': self.poster_urls[i],
+            'detail_url': self.detail_urls[i],
+        }
+
+    def movie_features(self, title):
+        # 电影的特征及权重 {特征: 权重}；表中没有这部电影时返回空字典
+        i = self.index.get(title)
+        if i is None:
+            return {}
+        start, stop = self.feature_indptr[i], self.feature_indptr[i + 1]
+        return {self.tokens[j]: float(value)
+                for j, value in zip(self.feature_indices[start:stop].tolist(), self.feature_values[start:stop].tolist())}
+
+    def score_profiles(self, profiles, k=10, exclude=()):
+        """
+        功能:
+        - 对一批用户画像打分：每个画像与所有电影特征向量的内积，即 特征矩阵 × 画像向量。
+          只累加画像中出现的特征所在的列，代价与这些列的非零元个数成正比，而不是与电影总数成正比。
+
+        输入:
+        - profiles: 画像列表，每个画像为 {特征: 权重}。
+        - k: 每个用户返回的电影数量。
+        - exclude: 与 profiles 等长的列表，每项为该用户需要排除的标题（例如已搜索过的电影）。
+
+        输出:
+        - 与 profiles 等长的列表，每项为按得分从高到低排列的电影字典列表。
+        """
+        n = len(self.titles)
+        results = []
+        for profile, excluded in zip(profiles, list(exclude) + [()] * (len(profiles) - len(exclude))):
+            columns = [(self.token_index[token], weight) for token, weight in profile.items()
+                       if token in self.token_index]
+            if not columns:
+                results.append([])
+                continue
+            starts = np.array([self.column_offsets[j] for j, _ in columns])
+            stops = np.array([self.column_offsets[j + 1] for j, _ in columns])
+            lengths = stops - starts
+            positions = np.repeat(stops - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+            weights = np.repeat(np.array([weight for _, weight in columns]), lengths)
+            scores = np.bincount(self.column_rows[positions], weights=self.column_values[positions] * weights,
+                                 minlength=n)
+            for title in excluded:
+                if title in self.index:
+                    scores[self.index[title]] = 0
+
+            # 只在得分为正的电影中取前 k 个
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            results.append([self.movie(i) for i in candidates.tolist()])
+        return results
+
+    def similar(self, title, k=10):
+        i = self.index.get(title)
+        if i is None:
+            return None
+        return [self.movie(j) for j in self.neighbours[i, :k].tolist() if j >= 0]
+
+
+def get_table(path=None):
+    global _table
+    path = path or settings.SIMILAR_MOVIES_FILE
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _table is None or _table.mtime != mtime:
+        with _lock:
+            if _table is None or _table.mtime != mtime:
+                _table = SimilarMovieTable(path)
+    return _table
+
+
+#与某部电影最相似的k部电影
+def similar_movies(title, k=10):
+    """
+    功能:
+    - 从预先计算的相似电影表中查出与 title 最相似的 k 部电影，格式与 best_10_movies_by_genre 相同。
+
+    输出:
+    - 字典列表；表不存在或没有这部电影时返回 None，由调用方回退到按类别查询。
+    """
+    table = get_table()
+    if table is None:
+        return None
+    return table.similar(title, k)
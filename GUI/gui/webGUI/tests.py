@@ -1,3 +1,327 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from . import collaborative, user_profiles
+from .db_pool import ConnectionPool, PoolTimeout
+from .models import Interaction, UserProfile
+from .title_suggest import MAX_SUGGESTIONS, PrefixIndex, suggestion_count
+
+
+class FakeConnection(object):
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise ConnectionError('gone')
+
+    def rollback(self):
+        if not self.alive:
+            raise ConnectionError('gone')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class Clock(object):
+    # 代替 time.monotonic，由测试手动推进
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+        self.clock = Clock()
+        patcher = mock.patch('webGUI.db_pool.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def pool(self, **options):
+        options.setdefault('size', 2)
+        options.setdefault('timeout', 0.05)
+        return ConnectionPool(self.connect, **options)
+
+    def test_reuses_released_connection(self):
+        pool = self.pool()
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(self.opened), 1)
+        # 归还时回滚，结束借用期间打开的事务
+        self.assertEqual(first.rollbacks, 2)
+
+    def test_timeout_raises_pool_timeout(self):
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        with mock.patch('webGUI.db_pool.time.monotonic', side_effect=[0.0, 0.0, 1.0]):
+            with self.assertRaises(PoolTimeout):
+                pool.acquire()
+        pool.release(connection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiting_borrower_gets_released_connection(self):
+        pool = ConnectionPool(self.connect, size=1, timeout=5.0)
+        connection = pool.acquire()
+        borrowed = []
+        thread = threading.Thread(target=lambda: borrowed.append(pool.acquire()))
+        thread.start()
+        pool.release(connection)
+        thread.join(5)
+        self.assertEqual(borrowed, [connection])
+        self.assertEqual(len(self.opened), 1)
+
+    def test_stale_connection_is_recycled(self):
+        pool = self.pool(max_lifetime=60, health_check_interval=600)
+        with pool.connection() as first:
+            pass
+        self.clock.now += 61
+        with pool.connection() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        stats = pool.stats()
+        self.assertEqual((stats['recycled'], stats['opened'], stats['open']), (1, 2, 1))
+
+    def test_failed_health_check_replaces_connection(self):
+        pool = self.pool(max_lifetime=3600, health_check_interval=30)
+        with pool.connection() as first:
+            pass
+        # 刚归还的连接不检查
+        self.clock.now += 10
+        with pool.connection() as again:
+            self.assertIs(again, first)
+        first.alive = False
+        self.clock.now += 31
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+
+    def test_broken_connection_is_discarded_on_release(self):
+        pool = self.pool(size=1)
+        connection = pool.acquire()
+        connection.alive = False
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['open'], 0)
+        # 名额已归还，可以建立新连接
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_release_none_is_noop(self):
+        pool = self.pool()
+        pool.release(None)
+        stats = pool.stats()
+        self.assertEqual((stats['open'], stats['idle']), (0, 0))
+
+    def test_failed_connect_returns_slot(self):
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError('refused')
+            return self.connect()
+
+        pool = ConnectionPool(connect, size=1, timeout=0.05)
+        with self.assertRaises(ConnectionError):
+            pool.acquire()
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertIsNotNone(pool.acquire())
+
+    def test_stats_counters(self):
+        pool = self.pool()
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        stats = pool.stats()
+        self.assertEqual((stats['acquired'], stats['opened'], stats['open'], stats['idle'], stats['size']),
+                         (2, 2, 2, 1, 2))
+        self.assertEqual(stats['avg_wait_ms'], 0.0)
+        pool.release(second)
+        pool.close()
+        self.assertTrue(first.closed and second.closed)
+        self.assertEqual(pool.stats()['open'], 0)
+
+
+class FakeTable(object):
+    def movie_features(self, title):
+        return {'genre:' + title: 1.0}
+
+
+class RecordSearchTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(user_profiles, 'get_table', return_value=FakeTable())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, title):
+        user_profiles.record_search('alice', {'Name': title, 'detail_url': 'https://movie/' + title})
+
+    def test_profile_decays_and_history_deduplicates(self):
+        self.search('霸王别姬')
+        self.search('活着')
+        self.search('霸王别姬')
+        profile = UserProfile.objects.get(user_name='alice')
+        self.assertEqual([item['Name'] for item in user_profiles.search_history('alice')], ['霸王别姬', '活着'])
+        weights = user_profiles.json.loads(profile.profile)
+        self.assertAlmostEqual(weights['genre:霸王别姬'], 1.0 + user_profiles.PROFILE_DECAY ** 2)
+        self.assertAlmostEqual(weights['genre:活着'], user_profiles.PROFILE_DECAY)
+        self.assertEqual(Interaction.objects.filter(user_name='alice', kind='search').count(), 3)
+
+    def test_profile_row_is_locked_inside_transaction(self):
+        # TestCase 本身已在事务中，比较嵌套层数确认加锁发生在 record_search 自己的事务里
+        outer = len(connection.atomic_blocks)
+        depths = []
+        select_for_update = UserProfile.objects.select_for_update
+
+        def locking():
+            depths.append(len(connection.atomic_blocks))
+            return select_for_update()
+
+        with mock.patch.object(UserProfile.objects, 'select_for_update', side_effect=locking):
+            self.search('霸王别姬')
+        self.assertEqual(depths, [outer + 1])
+
+
+class CollaborativeModelTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.object(collaborative, '_model', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, path, items):
+        # 与 implicit_als.save_model 导出的文件相同
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'user_factors.npy'), np.zeros((1, 2), dtype=np.float32))
+        np.save(os.path.join(path, 'item_factors.npy'), np.zeros((len(items), 2), dtype=np.float32))
+        np.save(os.path.join(path, 'top_items.npy'), np.arange(len(items), dtype=np.int32)[None, :])
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'users': ['alice'], 'items': items}, file, ensure_ascii=False)
+
+    def point(self, version):
+        with open(os.path.join(self.directory.name, 'CURRENT'), 'w', encoding='utf-8') as file:
+            file.write(version)
+
+    def test_missing_model(self):
+        self.assertIsNone(collaborative.get_model(self.directory.name))
+
+    def test_legacy_layout(self):
+        self.write(self.directory.name, ['霸王别姬'])
+        self.assertEqual(collaborative.get_model(self.directory.name).recommend('alice'), ['霸王别姬'])
+
+    def test_switches_version_when_current_changes(self):
+        self.write(os.path.join(self.directory.name, 'v1'), ['霸王别姬'])
+        self.point('v1')
+        first = collaborative.get_model(self.directory.name)
+        self.assertIs(collaborative.get_model(self.directory.name), first)
+        # 新版本写完后才切换 CURRENT，旧模型的内存映射不受影响
+        self.write(os.path.join(self.directory.name, 'v2'), ['活着', '霸王别姬'])
+        self.assertIs(collaborative.get_model(self.directory.name), first)
+        self.point('v2')
+        second = collaborative.get_model(self.directory.name)
+        self.assertEqual(second.recommend('alice'), ['活着', '霸王别姬'])
+        self.assertEqual(first.recommend('alice'), ['霸王别姬'])
+        self.assertEqual(second.recommend('bob'), [])
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        # (title, mm_rating, rating_count, poster_url, detail_url)
+        self.index = PrefixIndex([
+            ('阿凡达', '8.8', '1000', 'p1', 'd1'),
+            ('阿凡达：水之道', '8.5', '500', 'p2', 'd2'),
+            ('阿甘正传', '9.5', '2000', 'p3', 'd3'),
+            ('霸王别姬', '9.6', '3000', 'p4', 'd4'),
+            ('霸王别姬', '7.0', '10', 'p5', 'd5'),
+            ('The Matrix', '9.1', '800', 'p6', 'd6'),
+            ('the matrix', None, '0', 'p7', 'd7'),
+            ('Ｔｈｅ Ｍａｔｒｉｘ Ｒｅｌｏａｄｅｄ', '8.5', '600', 'p8', 'd8'),
+            ('  ', '9.9', '0', 'p9', 'd9'),
+        ], {'阿凡达：水之道': 10000})
+
+    def titles(self, prefix, k=10):
+        return [item['title'] for item in self.index.suggest(prefix, k)]
+
+    def test_prefix_bounds(self):
+        self.assertEqual(sorted(self.titles('阿凡')), ['阿凡达', '阿凡达：水之道'])
+        self.assertEqual(self.titles('阿甘正传'), ['阿甘正传'])
+        self.assertEqual(len(self.titles('阿')), 3)
+        # 比所有标题都小、都大或落在两个标题之间的前缀
+        for prefix in ('0', '龥', '阿b', '阿甘正传2'):
+            self.assertEqual(self.titles(prefix), [], prefix)
+        self.assertEqual(self.titles(''), [])
+        self.assertEqual(self.titles(None), [])
+
+    def test_full_width_and_case_are_normalized(self):
+        self.assertEqual(self.titles('THE mat'), ['The Matrix', 'Ｔｈｅ Ｍａｔｒｉｘ Ｒｅｌｏａｄｅｄ'])
+        self.assertEqual(self.titles('ｔｈｅｍａｔｒｉｘｒ'), ['Ｔｈｅ Ｍａｔｒｉｘ Ｒｅｌｏａｄｅｄ'])
+        self.assertEqual(self.titles(' 霸王 别姬 '), ['霸王别姬'])
+
+    def test_same_title_keeps_best_entry(self):
+        movie, = self.index.suggest('霸王别姬')
+        self.assertEqual(movie, {'title': '霸王别姬', 'mm_rating': '9.6', 'poster_url': 'p4', 'detail_url': 'd4'})
+        # 只有大小写不同的标题视为同一部，保留得分高的
+        self.assertEqual(self.titles('the matrix', 1), ['The Matrix'])
+        # 规范化后为空的标题不进入索引
+        self.assertNotIn('  ', self.index.titles)
+
+    def test_ordered_by_score(self):
+        # 站内点击把评分较低的续集排到前面
+        self.assertEqual(self.titles('阿凡达'), ['阿凡达：水之道', '阿凡达'])
+        self.assertEqual(self.titles('阿'), ['阿凡达：水之道', '阿甘正传', '阿凡达'])
+        self.assertEqual(self.titles('阿', 2), ['阿凡达：水之道', '阿甘正传'])
+        self.assertEqual(self.titles('阿', 100), self.titles('阿'))
+
+    def test_non_positive_k(self):
+        for k in (0, -1, -100):
+            self.assertEqual(self.index.suggest('阿', k), [], k)
+        self.assertEqual(self.titles('阿', '1'), ['阿凡达：水之道'])
+
+    def test_suggestion_count(self):
+        for value, expected in ((None, 10), ('', 10), ('3', 3), ('0', 1), ('-5', 1), ('1000', MAX_SUGGESTIONS)):
+            self.assertEqual(suggestion_count(value), expected, value)
+        for value in ('abc', '2.5'):
+            with self.assertRaises(ValueError):
+                suggestion_count(value)
+
+    def test_suggest_view_validates_k(self):
+        try:
+            from . import views
+        except ImportError as e:
+            self.skipTest(f'views 的依赖未安装：{e}')
+        factory = RequestFactory()
+        with mock.patch.object(views, 'suggest_titles', return_value=[]) as suggest:
+            for k, expected in (('3', 3), ('0', 1), ('-5', 1), ('1000', MAX_SUGGESTIONS)):
+                response = views.suggest_view(factory.get('/suggest/', {'q': '阿', 'k': k}))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(suggest.call_args[0], ('阿', expected))
+            views.suggest_view(factory.get('/suggest/', {'q': '阿'}))
+            self.assertEqual(suggest.call_args[0], ('阿', 10))
+            calls = suggest.call_count
+            response = views.suggest_view(factory.get('/suggest/', {'q': '阿', 'k': 'abc'}))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(suggest.call_count, calls)
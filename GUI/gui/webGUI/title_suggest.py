@@ -0,0 +1,150 @@
+import bisect
+import math
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.db import connection as django_connection
+from django.db.models import Count
+from movie_repository import MovieRepository
+
+from .db_pool import movie_connection
+from .models import Interaction
+
+# 每次补全最多返回的候选数
+MAX_SUGGESTIONS = 20
+# 两次检查 moviemate_movies 是否更新的最短间隔（秒）
+CHECK_INTERVAL = 30
+# 排序得分 = mm_rating + POPULARITY_WEIGHT × log10(1 + 评分人数 + CLICK_WEIGHT × 站内搜索/点击次数)
+POPULARITY_WEIGHT = 0.5
+CLICK_WEIGHT = 100
+
+# 当前的前缀索引；重建时整体替换，读请求看到的要么是旧索引要么是新索引
+_index = None
+_lock = threading.Lock()
+_last_check = 0.0
+
+
+def normalize(text):
+    # 全角转半角、转小写、去掉空白，用户输入和标题按同样的方式规范化
+    return ''.join(unicodedata.normalize('NFKC', str(text or '')).lower().split())
+
+
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PrefixIndex(object):
+    """
+    按规范化标题排序的数组：某个前缀的所有标题在数组中是连续的一段，用两次二分查找定位，
+    再在这一段的得分数组上用 argpartition 取前 k 个。构建后不再修改。
+    """
+
+    def __init__(self, rows, clicks, version=None):
+        best = {}
+        for title, mm_rating, rating_count, poster_url, detail_url in rows:
+            key = normalize(title)
+            if not key:
+                continue
+            rating = parse_number(mm_rating)
+            popularity = parse_number(rating_count) + CLICK_WEIGHT * clicks.get(title, 0)
+            score = rating + POPULARITY_WEIGHT * math.log10(1 + popularity)
+            # 同名电影只保留得分最高的一条
+            if key not in best or score > best[key][0]:
+                best[key] = (score, title, '' if mm_rating is None else str(mm_rating), poster_url, detail_url)
+
+        self.keys = sorted(best)
+        entries = [best[key] for key in self.keys]
+        self.scores = np.array([entry[0] for entry in entries], dtype=np.float64)
+        self.titles = [entry[1] for entry in entries]
+        self.mm_ratings = [entry[2] for entry in entries]
+        self.poster_urls = [entry[3] for entry in entries]
+        self.detail_urls = [entry[4] for entry in entries]
+        self.version = version
+
+    def suggest(self, prefix, k=10):
+        # k 不大于 0 时没有候选，否则 argpartition 的下标 k - 1 越界或取到负数
+        k = int(k)
+        prefix = normalize(prefix)
+        if not prefix or k <= 0:
+            return []
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        if lo == hi:
+            return []
+        scores = self.scores[lo:hi]
+        top = np.arange(hi - lo)
+        if len(top) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')] + lo
+        return [{
+            'title': self.titles[i],
+            'mm_rating': self.mm_ratings[i],
+            'poster_url': self.poster_urls[i],
+            'detail_url': self.detail_urls[i],
+        } for i in top.tolist()]
+
+
+#从数据库构建前缀索引
+def build_index():
+    """
+    功能:
+    - 读取 moviemate_movies 的标题、评分和评分人数，以及站内交互记录中每部电影的次数，构建 PrefixIndex。
+    """
+    with movie_connection() as db:
+        repository = MovieRepository(db)
+        # MAX(id)、UPDATE_TIME 与最后一条变更记录都不变时不需要重建
+        version = repository.table_version('moviemate_movies')
+        rows = list(repository.iter_columns('moviemate_movies',
+                                            ['title', 'mm_rating', 'rating_count', 'poster_url', 'detail_url']))
+    clicks = dict(Interaction.objects.values_list('title').annotate(n=Count('id')))
+    return PrefixIndex(rows, clicks, version)
+
+
+def refresh_index():
+    # 在后台线程中运行：表有变化时构建新索引并整体替换；调用方已持有 _lock
+    global _index
+    try:
+        with movie_connection() as db:
+            version = MovieRepository(db).table_version('moviemate_movies')
+        if _index is None or version != _index.version:
+            _index = build_index()
+    except Exception as e:
+        print('重建标题前缀索引时发生异常：', e)
+    finally:
+        django_connection.close()
+        _lock.release()
+
+
+def get_index():
+    """
+    功能:
+    - 返回当前的前缀索引。第一次调用时同步构建；之后每隔 CHECK_INTERVAL 秒在后台线程中检查表是否更新，
+      需要时重建，请求线程不等待。
+    """
+    global _index, _last_check
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = build_index()
+                _last_check = time.monotonic()
+    elif time.monotonic() - _last_check > CHECK_INTERVAL and _lock.acquire(blocking=False):
+        _last_check = time.monotonic()
+        threading.Thread(target=refresh_index, daemon=True).start()
+    return _index
+
+
+#补全接口的候选数参数：缺省为 10，限制在 1 ~ MAX_SUGGESTIONS 之间，不是整数时抛出 ValueError
+def suggestion_count(value, default=10):
+    if value is None or value == '':
+        return default
+    return min(max(int(value), 1), MAX_SUGGESTIONS)
+
+
+#标题自动补全
+def suggest_titles(prefix, k=10):
+    return get_index().suggest(prefix, k)
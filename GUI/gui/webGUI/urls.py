@@ -6,8 +6,14 @@ urlpatterns = [
     path('login/', views.Login_view, name = 'login'),
 
     path("index/", views.index_view, name = 'index'),
+    path("index/data/", views.home_data_view, name='home_data'),
     path("post/", views.post_view, name='post'),
     path("author/", views.author_view, name='author'),
+    path("author/data/", views.author_data_view, name='author_data'),
+    path("click/", views.click_view, name='click'),
+    path("search/", views.search_view, name='search'),
+    path("suggest/", views.suggest_view, name='suggest'),
+    path("metrics/pool/", views.pool_stats_view, name='pool_stats'),
     path("chat/", views.chat_view, name='chat'),
 
     path('toregister/', views.toRegister_view, name='toregister'),
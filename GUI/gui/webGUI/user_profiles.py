@@ -0,0 +1,87 @@
+import json
+
+from django.db import transaction
+
+from .models import Interaction, UserProfile
+from .similar_movies import get_table
+
+# 每次搜索时旧画像的衰减系数，越小越偏重最近的搜索
+PROFILE_DECAY = 0.8
+# 画像最多保留的特征数
+PROFILE_SIZE = 200
+# 保留的最近搜索记录数
+HISTORY_SIZE = 20
+
+
+def get_profile(user_name):
+    profile, _ = UserProfile.objects.get_or_create(user_name=user_name)
+    return profile
+
+
+#根据一次搜索增量更新用户画像
+def record_search(user_name, result):
+    """
+    功能:
+    - 旧画像整体乘以 PROFILE_DECAY，再加上所搜电影的特征向量；只保留权重最大的 PROFILE_SIZE 个特征。
+    - 把搜索结果放到该用户搜索记录的最前面，只保留最近 HISTORY_SIZE 条。
+    - 读-改-写在一个事务中进行，并用 SELECT ... FOR UPDATE 锁住该用户的画像行，
+      同一用户并发的搜索依次更新，不会互相覆盖；所搜电影的特征在加锁前取出，锁只覆盖读写画像的部分。
+
+    输入:
+    - user_name: 登录的用户名。
+    - result: search_moviemate_data_by_title 返回的电影信息。
+    """
+    table = get_table()
+    features = table.movie_features(result['Name']) if table is not None else {}
+
+    with transaction.atomic():
+        get_profile(user_name)
+        profile = UserProfile.objects.select_for_update().get(user_name=user_name)
+        weights = {token: weight * PROFILE_DECAY for token, weight in json.loads(profile.profile).items()}
+        for token, weight in features.items():
+            weights[token] = weights.get(token, 0.0) + weight
+        weights = dict(sorted(weights.items(), key=lambda item: item[1], reverse=True)[:PROFILE_SIZE])
+
+        history = [item for item in json.loads(profile.history) if item.get('detail_url') != result.get('detail_url')]
+        history.insert(0, result)
+
+        profile.profile = json.dumps(weights, ensure_ascii=False)
+        profile.history = json.dumps(history[:HISTORY_SIZE], ensure_ascii=False)
+        profile.save(update_fields=['profile', 'history', 'updated_at'])
+        log_interaction(user_name, result['Name'], 'search')
+
+
+def log_interaction(user_name, title, kind):
+    # 记录一次搜索或点击，供协同过滤模型离线训练
+    Interaction.objects.create(user_name=user_name, title=title, kind=kind)
+
+
+def search_history(user_name):
+    return json.loads(get_profile(user_name).history)
+
+
+#为一批用户生成个性化推荐
+def recommend_for_users(user_names, k=10):
+    """
+    功能:
+    - 一次读出这批用户的画像，对相似电影表做批量打分，排除各自已经搜索过的电影。
+
+    输出:
+    - {用户名: 电影字典列表}；相似电影表不存在或用户还没有画像时对应的列表为空。
+    """
+    table = get_table()
+    profiles = {profile.user_name: profile for profile in UserProfile.objects.filter(user_name__in=user_names)}
+    recommendations = {user_name: [] for user_name in user_names}
+    if table is None or not profiles:
+        return recommendations
+
+    names = list(profiles)
+    vectors = [json.loads(profiles[name].profile) for name in names]
+    excluded = [[item.get('Name') for item in json.loads(profiles[name].history)] for name in names]
+    for name, movies in zip(names, table.score_profiles(vectors, k, excluded)):
+        recommendations[name] = movies
+    return recommendations
+
+
+def recommend_for_user(user_name, k=10):
+    return recommend_for_users([user_name], k)[user_name]
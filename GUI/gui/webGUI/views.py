@@ -12,6 +12,16 @@ import time
 from sparkai.llm.llm import ChatSparkLLM, ChunkPrintHandler
 from sparkai.core.messages import ChatMessage
 from . import chatbot_utils as util
+from .batch_recommendations import precomputed_movies
+from .collaborative import collaborative_movies
+from movie_repository import PAGE_SIZE, MovieRepository, query_stats
+from .db_pool import get_pool, movie_connection
+from .similar_movies import get_table, similar_movies
+from .title_suggest import suggest_titles, suggestion_count
+from .user_profiles import log_interaction, record_search, recommend_for_user, search_history
+from urllib.parse import urlencode
+from django.conf import settings
+import os
 def helloworld(request):  # request是必须带的实例。类似class下方法必须带self一样
     return HttpResponse("Hello World!!")  # 通过HttpResponse模块直接返回字符串到前端页面
 
@@ -43,6 +53,8 @@ def Login_view(request):
 
         c = UserInfo.objects.filter(user_name=u, user_password=p).count()
         if c:
+            # 记录登录的用户，搜索记录和推荐按用户区分
+            request.session['user_name'] = u
             return HttpResponseRedirect('http://127.0.0.1:8000/dev/index/')
         else:
             return HttpResponse('Login failed！')
@@ -84,122 +96,216 @@ def post_view(request):
 def index_view(request):
     question = request.POST.get('search', '')
     print(f'index-question: {question}')
-    host = 'localhost'
-    user = 'root'
-    password = '123456'
-    port = 3306
-    database = 'MovieMate'
-    charset = 'utf8'
     if question:
+        connection = None
         try:
-            connection = pymysql.connect(host=host, user=user, password=password, port=port, charset=charset, database=database)
+            #从共享连接池借用连接，请求结束时归还
+            connection = get_pool().acquire()
             print({f'connection:{connection}'})
             if connection:
-                with connection.cursor() as cursor:
-                    #搜索到的电影信息
-                    results = search_moviemate_data_by_title(cursor, question)
-                    # 搜索电影的类别,多个类别取第一个
-                    category = results['Category'].split('/')[0]
-                    print(f'category{category}')
-                    #同类别评分最高的十部电影
-                    best_movies = best_10_movies_by_genre(cursor, category)
-                    img_urls = []
-                    detail_urls = []
-                    for url in best_movies:
-                        img_urls.append(url['poster_url'])
-                        detail_urls.append((url['detail_url']))
-                    print(f'type:{best_movies}')
-                    if results:
-                        #更新author.json
-                        with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\author.json','r', encoding='utf-8') as file:
-                            data = json.load(file)
-                        if data:
-                            #更新author.json的imgurls
-                            if results['url'] not in data['imgurls']:
-                                data['imgurls'].insert(0, results['url']) #从列表开头插入元素
-                                data['detail_urls'].insert(0, results['detail_url'])
-                            if len(data['imgurls']) > 20 and len(data['detail_urls']) > 20:  # 只保留最近的二十条搜索记录
-                                del data['imgurls'][20:]
-                                del data['detail_urls'][20:]
-                        else:
-                            return HttpResponse('data is empty')
-                        with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\author.json','w', encoding='utf-8') as file:
-                            json.dump(data, file, ensure_ascii=False, indent=4)
-                        #更新post.json
-                        with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\post.json','r', encoding='utf-8') as file:
-                            data = json.load(file)
-                        if data:
-                            data['target'] = results
-                            data['imgurls'] = img_urls
-                            data['detail_urls'] = detail_urls
-                        else:
-                            return HttpResponse('data is empty')
-                        with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\post.json','w', encoding='utf-8') as file:
-                            json.dump(data, file, ensure_ascii=False, indent=4)
-                        # 处理浏览器缓存
-                        response = render(request, 'post.html')
-                        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                        response['Pragma'] = 'no-cache'
-                        response['Expires'] = '0'
-                        return response
+                repository = MovieRepository(connection)
+                #搜索到的电影信息
+                results = search_moviemate_data_by_title(repository, question)
+                if not results:
+                    return HttpResponse('No matched movies')
+                # 搜索电影的全部类别（按原有顺序），第一个为主类别
+                genres = movie_genres(repository, results['Name']) or results['Category'].split('/')[:1]
+                category = genres[0]
+                print(f'category{category}')
+                #优先使用离线批处理算好的推荐，其次是与搜索电影最相似的十部电影，
+                #都没有时退回到类别完全相同、再到主类别中评分最高的十部电影
+                best_movies = precomputed_movies('movie', results['Name'], 10) or \
+                    similar_movies(results['Name'], 10) or \
+                    best_movies_by_genres(repository, genres, exclude=results['Name']) or \
+                    best_10_movies_by_genre(repository, category)
+                img_urls = []
+                detail_urls = []
+                for url in best_movies:
+                    img_urls.append(url['poster_url'])
+                    detail_urls.append(click_url(url['title'], url['detail_url']))
+                print(f'type:{best_movies}')
+                if results:
+                    user_name = request.session.get('user_name')
+                    if user_name:
+                        #更新该用户的兴趣画像和搜索记录
+                        record_search(user_name, results)
+                    #更新author.json
+                    with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\author.json','r', encoding='utf-8') as file:
+                        data = json.load(file)
+                    if data:
+                        #更新author.json的imgurls
+                        if results['url'] not in data['imgurls']:
+                            data['imgurls'].insert(0, results['url']) #从列表开头插入元素
+                            data['detail_urls'].insert(0, results['detail_url'])
+                        if len(data['imgurls']) > 20 and len(data['detail_urls']) > 20:  # 只保留最近的二十条搜索记录
+                            del data['imgurls'][20:]
+                            del data['detail_urls'][20:]
                     else:
-                        return HttpResponse('No matched movies')
+                        return HttpResponse('data is empty')
+                    with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\author.json','w', encoding='utf-8') as file:
+                        json.dump(data, file, ensure_ascii=False, indent=4)
+                    #更新post.json
+                    with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\post.json','r', encoding='utf-8') as file:
+                        data = json.load(file)
+                    if data:
+                        data['target'] = results
+                        data['imgurls'] = img_urls
+                        data['detail_urls'] = detail_urls
+                    else:
+                        return HttpResponse('data is empty')
+                    with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\post.json','w', encoding='utf-8') as file:
+                        json.dump(data, file, ensure_ascii=False, indent=4)
+                    # 处理浏览器缓存
+                    response = render(request, 'post.html')
+                    response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+                    response['Pragma'] = 'no-cache'
+                    response['Expires'] = '0'
+                    return response
+                else:
+                    return HttpResponse('No matched movies')
             else:
                 return HttpResponse('Database connection failed')
         except Exception as e:
             print(e)
             return HttpResponse(f"An error occurred: {e}")
         finally:
-            if connection:
-                connection.close()  # 确保在最后关闭数据库连接
+            get_pool().release(connection)  # 确保在最后把连接归还连接池
     else:
         return render(request, 'index.html')
 
-#根据标题从数据库中搜索电影信息
-def search_moviemate_data_by_title(cursor, title):
+def read_user_data(name):
+    with open(os.path.join(settings.BASE_DIR, 'webGUI', 'static', 'assets', 'userData', name), 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+#经过点击记录的详情页链接；相似电影表中没有的电影直接使用原链接
+def click_url(title, detail_url):
+    table = get_table()
+    if table is None or title not in table.index:
+        return detail_url
+    return '/dev/click/?' + urlencode({'title': title})
+
+#记录点击后跳转到电影详情页
+def click_view(request):
+    title = request.GET.get('title', '')
+    table = get_table()
+    if table is None or title not in table.index:
+        return HttpResponse('No matched movies')
+    user_name = request.session.get('user_name')
+    if user_name:
+        log_interaction(user_name, title, 'click')
+    return HttpResponseRedirect(table.movie(table.index[title])['detail_url'])
+
+#主页的个性化推荐：优先使用离线批处理的结果；没有时先取协同过滤的结果，不足时用兴趣画像补齐
+def home_data_view(request, k=10):
+    user_name = request.session.get('user_name')
+    movies = []
+    if user_name:
+        movies = precomputed_movies('user', user_name, k)
+    if user_name and not movies:
+        movies = collaborative_movies(user_name, k)
+        titles = {movie['title'] for movie in movies}
+        movies += [movie for movie in recommend_for_user(user_name, k) if movie['title'] not in titles]
+    if not movies:
+        # 未登录或还没有搜索记录时使用默认的高分电影
+        return JsonResponse(read_user_data('home.json'))
+    movies = movies[:k]
+    return JsonResponse({
+        'imgurls': [movie['poster_url'] for movie in movies],
+        'detail_urls': [click_url(movie['title'], movie['detail_url']) for movie in movies]
+    })
+
+#用户界面的数据：该用户最近的搜索记录
+def author_data_view(request):
+    user_name = request.session.get('user_name')
+    history = search_history(user_name) if user_name else []
+    if not history:
+        return JsonResponse(read_user_data('author.json'))
+    target = dict(history[0])
+    target['user_name'] = user_name
+    return JsonResponse({
+        'target': target,
+        'imgurls': [item['url'] for item in history],
+        'detail_urls': [click_url(item['Name'], item['detail_url']) for item in history]
+    })
+
+#根据标题从数据库中搜索电影信息：取全文检索排名第一的电影，没有匹配时返回 None
+def search_moviemate_data_by_title(repository, title):
     try:
-        sql = 'SELECT * FROM moviemate_movies WHERE title LIKE %s'
-        cursor.execute(sql, ('%' + title + '%',))
-        result = cursor.fetchone()
+        matches = repository.search_titles(title, page_size=1)['results']
+        if not matches:
+            return None
+        movie = matches[0]
         results = {
-            'Name': result[6],
-            'img': result[9],
-            'MM Rating': result[10],
-            'Category': result[2],
-            'Star': result[1],
-            'Date': result[4],
-            'url': result[9],
-            'detail_url':result[5]
+            'Name': movie['title'],
+            'img': movie['poster_url'],
+            'MM Rating': movie['mm_rating'],
+            'Category': movie['genre'],
+            'Star': movie['starring'],
+            'Date': movie['year'],
+            'url': movie['poster_url'],
+            'detail_url': movie['detail_url']
         }
         return results
     except Exception as e:
         print('查询moviemate电影数据库时发生异常：', e)
         raise
 
-#同类别评分最高的十部电影
-def best_10_movies_by_genre(cursor, genre):
+#电影的全部类别，按原有顺序排列；类型关联表中没有这部电影时返回空列表
+def movie_genres(repository, title):
+    try:
+        return repository.movie_genres(title)
+    except pymysql.MySQLError as e:
+        print(f'查找电影 {title} 的类别时发生错误: {e}')
+        return []
+
+#同时属于全部给定类别的评分最高的电影
+def best_movies_by_genres(repository, genres, limit=10, exclude=None):
+    try:
+        return [movie.as_dict() for movie in repository.best_movies_by_genres(genres, limit, exclude)]
+    except pymysql.MySQLError as e:
+        print(f'查找类别为 {"/".join(genres)} 的电影时发生错误: {e}')
+        return []
+
+#标题搜索接口：按相关度排序、分页返回 JSON
+def search_view(request):
+    query = request.GET.get('q', '')
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = min(int(request.GET.get('page_size', PAGE_SIZE)), 50)
+    except ValueError:
+        return JsonResponse({'error': 'invalid page'}, status=400)
+    try:
+        with movie_connection() as connection:
+            data = MovieRepository(connection).search_titles(query, page, max(page_size, 1))
+        for movie in data['results']:
+            movie['detail_url'] = click_url(movie['title'], movie['detail_url'])
+        return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    except Exception as e:
+        print(e)
+        return JsonResponse({'error': str(e)}, status=500)
+
+#标题自动补全接口：从内存中的前缀索引返回按评分和热度排序的候选
+def suggest_view(request):
+    try:
+        k = suggestion_count(request.GET.get('k'))
+    except ValueError:
+        return JsonResponse({'error': 'invalid k'}, status=400)
+    try:
+        suggestions = suggest_titles(request.GET.get('q', ''), k)
+    except Exception as e:
+        print(e)
+        suggestions = []
+    return JsonResponse({'query': request.GET.get('q', ''), 'suggestions': suggestions},
+                        json_dumps_params={'ensure_ascii': False})
+
+#连接池指标：借用次数、等待时间、超时、回收和健康检查失败次数，以及各类查询的次数和耗时
+def pool_stats_view(request):
+    return JsonResponse({'pool': get_pool().stats(), 'queries': query_stats()})
+
+#同类别评分最高的十部电影：优先读取排行榜，排行榜尚未生成时经类型关联表查询
+def best_10_movies_by_genre(repository, genre):
     try:
-        # 编写SQL查询语句，按评分降序排列，同时筛选特定类别,因为重复太多了，限制的数量可以适当增加，现在选的是300
-        sql = f'SELECT title, mm_rating, poster_url, detail_url FROM moviemate_movies WHERE genre LIKE %s ORDER BY mm_rating DESC LIMIT 500'
-        # 执行SQL查询，传入类别参数
-        cursor.execute(sql, ('%' + genre + '%',))
-        # 获取查询结果
-        results = cursor.fetchall()
-        best_movies = []
-        for row in results:
-            movie_name, mm_rating, poster_url, detail_url = row
-            best_movies.append({
-                'title': movie_name,
-                'mm_rating': mm_rating,
-                'poster_url': poster_url,
-                'detail_url': detail_url
-            })
-        best_10_movies = []
-        #防止重复
-        for movie in best_movies:
-            if movie not in best_10_movies:
-                best_10_movies.append(movie)
-        return best_10_movies
+        return [movie.as_dict() for movie in repository.best_by_genre(genre, 10)]
     except Exception as e:
         # 打印异常信息
         print(f'查找类别为 {genre} 的评分最高的10部电影时发生错误: {e}')
@@ -0,0 +1,445 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from similar_movies import movie_tokens
+
+# 默认的 recall@10 目标，build 时据此标定 n_probe（见 MovieIndex.calibrate）
+RECALL_TARGET = 0.95
+
+
+# 特征的随机投影向量
+def token_projections(tokens, dim, seed=0):
+    """
+    功能:
+    - 每个特征的投影向量由 (seed, 特征) 的 BLAKE2b 摘要确定地生成，各分量取 ±1（Achlioptas 随机投影），
+      新增电影带来的新特征不需要重新训练就能投影到同一空间。
+
+    输入:
+    - tokens: 特征字符串列表。
+    - dim: 投影维度，需为 8 的倍数且不超过 512。
+    - seed: 随机数种子。
+
+    输出:
+    - projections: float32 数组，形状为 (特征数, dim)。
+    """
+    key = str(seed).encode('utf-8')
+    digests = b''.join(hashlib.blake2b(token.encode('utf-8'), digest_size=dim // 8, key=key).digest()
+                       for token in tokens)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(tokens), dim)
+    return bits.astype(np.float32) * 2 - 1
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# 基于倒排列表（IVF）的近似最近邻索引
+class MovieIndex(object):
+    """
+    电影元数据的近似最近邻索引：
+
+    - 每部电影的 TF-IDF 特征（见 similar_movies.movie_tokens）经随机投影压缩为 dim 维的单位向量，
+      向量内积近似原始 TF-IDF 向量的余弦相似度；
+    - 用球面 k-means 把向量划分为 n_lists 个簇，同簇向量在内存中连续存放；
+    - 查询时只扫描与查询向量最接近的 n_probe 个簇。n_probe 越大召回率越高、耗时越长，dim 决定相似度的近似精度。
+      n_probe 在 build 时按实测的召回率标定（见 calibrate），与索引一起保存。
+    """
+
+    def __init__(self, dim=64, n_lists=None, seed=0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.seed = seed
+        self.vocabulary = {}                                      # 特征 -> 下标
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.projections = np.zeros((0, dim), dtype=np.float32)
+        self.n_documents = 0                                      # 计算 IDF 时的电影数
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)       # 按簇排序后的向量
+        self.ids = np.zeros(0, dtype=np.int64)                    # vectors 每行对应的电影编号
+        self.offsets = np.zeros(1, dtype=np.int64)                # 第 c 个簇为 vectors[offsets[c]:offsets[c + 1]]
+        self.titles = []                                          # 电影编号 -> 标题
+        self.title_index = {}
+        self.n_probe = None                                       # calibrate 标定的扫描簇数
+        self.recall = None                                        # 标定时实测的 recall@10
+
+    @property
+    def size(self):
+        return len(self.titles)
+
+    def _token_ids(self, token_lists, grow):
+        # 把特征映射为下标；grow 为 True 时为新特征分配下标和投影向量，IDF 取最大值
+        new_tokens = []
+        ids = []
+        for tokens in token_lists:
+            row = []
+            for token, weight in tokens:
+                index = self.vocabulary.get(token)
+                if index is None and grow:
+                    index = self.vocabulary[token] = len(self.vocabulary)
+                    new_tokens.append(token)
+                if index is not None:
+                    row.append((index, weight))
+            ids.append(row)
+        if new_tokens:
+            max_idf = np.log(1 + self.n_documents) + 1
+            self.idf = np.concatenate([self.idf, np.full(len(new_tokens), max_idf, dtype=np.float32)])
+            self.projections = np.concatenate([self.projections, token_projections(new_tokens, self.dim, self.seed)])
+        return ids
+
+    def _embed(self, token_ids, chunk_size=100000):
+        # 分块计算 Σ 字段权重 × IDF × 投影向量，再归一化
+        vectors = np.zeros((len(token_ids), self.dim), dtype=np.float32)
+        for start in range(0, len(token_ids), chunk_size):
+            chunk = token_ids[start:start + chunk_size]
+            lengths = np.array([len(row) for row in chunk])
+            flat = [pair for row in chunk for pair in row]
+            if not flat:
+                continue
+            columns = np.array([index for index, _ in flat], dtype=np.int64)
+            weights = np.array([weight for _, weight in flat], dtype=np.float32) * self.idf[columns]
+            contributions = self.projections[columns] * weights[:, None]
+            # 按行分段求和
+            nonempty = lengths > 0
+            starts = np.r_[0, np.cumsum(lengths)[:-1]][nonempty]
+            vectors[start + np.flatnonzero(nonempty)] = np.add.reduceat(contributions, starts, axis=0)
+        return normalize_rows(vectors)
+
+    def _assign(self, vectors, chunk_size=65536):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            labels[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+        return labels
+
+    def _train(self, vectors, iterations=10, sample_size=256):
+        # 在抽样上做球面 k-means，得到 n_lists 个簇中心
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * sample_size), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            # 空簇保留原中心
+            empty = counts == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalize_rows(sums)
+
+    def _layout(self, vectors, ids, labels):
+        order = np.argsort(labels, kind='stable')
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.ids = ids[order]
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(self.centroids)), out=self.offsets[1:])
+
+    def _labels(self):
+        return np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+
+    # 构建索引
+    def build(self, movies, recall_target=RECALL_TARGET):
+        """
+        功能:
+        - 从电影字典列表构建索引：统计 IDF、投影、训练簇中心并按簇重排向量，再按 recall_target 标定 n_probe。
+
+        输入:
+        - movies: 电影字典列表，至少包含 title 和各特征字段。
+        - recall_target: 标定 n_probe 的 recall@10 目标。
+
+        输出:
+        - self
+        """
+        token_lists = [movie_tokens(movie) for movie in movies]
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.projections = np.zeros((0, self.dim), dtype=np.float32)
+        self.n_documents = len(movies)
+        token_ids = self._token_ids(token_lists, grow=True)
+
+        document_frequency = np.bincount([index for row in token_ids for index, _ in row],
+                                         minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + len(movies)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        vectors = self._embed(token_ids)
+        self.titles = [str(movie.get('title') or '') for movie in movies]
+        self.title_index = {}
+        for i, title in enumerate(self.titles):
+            self.title_index.setdefault(title, i)
+        self._train(vectors)
+        self._layout(vectors, np.arange(len(movies), dtype=np.int64), self._assign(vectors))
+        self.calibrate(recall_target)
+        return self
+
+    # 标定扫描的簇数
+    def calibrate(self, recall_target=RECALL_TARGET, k=10, n_queries=200):
+        """
+        功能:
+        - 用 evaluate_index 依次测量 n_probe = 1, 2, 4, ... 的 recall@k，取达到 recall_target 的最小值；
+          扫描全部簇时召回率为 1，因此总能达到目标。簇的分布变化较大（例如 add 了大量电影）后应重新标定。
+
+        输出:
+        - results: evaluate_index 的结果；标定的 n_probe 和实测召回率写入 self.n_probe、self.recall。
+        """
+        n_lists = len(self.centroids)
+        k = min(k, self.size - 1)
+        if k < 1:
+            self.n_probe, self.recall = n_lists, 1.0
+            return []
+        n_probes = [1 << i for i in range(int(np.log2(max(n_lists, 1))) + 1) if 1 << i < n_lists] + [n_lists]
+        results = evaluate_index(self, n_queries, k, n_probes, self.seed)
+        chosen = next((result for result in results if result['recall'] >= recall_target), results[-1])
+        self.n_probe, self.recall = chosen['n_probe'], chosen['recall']
+        return results
+
+    # 增量插入
+    def add(self, movies):
+        """
+        功能:
+        - 把新电影加入索引：沿用已有的 IDF 和簇中心，只计算新电影的向量并归并到各簇，不重新训练。
+          新增电影较多（例如超过原规模的一半）时建议重新 build，使簇的划分保持均衡。
+
+        输入:
+        - movies: 新电影的字典列表。
+
+        输出:
+        - ids: 新电影的编号数组。
+        """
+        if not len(self.centroids):
+            self.build(movies)
+            return np.arange(len(movies), dtype=np.int64)
+
+        vectors = self._embed(self._token_ids([movie_tokens(movie) for movie in movies], grow=True))
+        ids = np.arange(self.size, self.size + len(movies), dtype=np.int64)
+        for i, movie in zip(ids.tolist(), movies):
+            title = str(movie.get('title') or '')
+            self.titles.append(title)
+            self.title_index.setdefault(title, i)
+
+        self._layout(np.concatenate([self.vectors, vectors]), np.concatenate([self.ids, ids]),
+                     np.concatenate([self._labels(), self._assign(vectors)]))
+        return ids
+
+    def vector(self, movie_id):
+        # 电影编号 -> 向量；位置表按需建立
+        if getattr(self, '_positions', None) is None or len(self._positions) != self.size:
+            self._positions = np.empty(self.size, dtype=np.int64)
+            self._positions[self.ids] = np.arange(len(self.ids))
+        return self.vectors[self._positions[movie_id]]
+
+    # 查询
+    def search(self, query, k=10, n_probe=None, exclude=None):
+        """
+        功能:
+        - 查找与查询向量内积最大的 k 部电影，只扫描最近的 n_probe 个簇。
+
+        输入:
+        - query: dim 维单位向量。
+        - k: 返回的电影数量。
+        - n_probe: 扫描的簇数量，召回率与耗时的折中；默认使用 calibrate 标定的值。
+        - exclude: 可选的需要排除的电影编号（通常是查询电影本身）。
+
+        输出:
+        - ids: 电影编号数组，按相似度从高到低排列。
+        - scores: 对应的相似度。
+        """
+        n_probe = min(self.probe_count(n_probe), len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe] if n_probe < len(centroid_scores) \
+            else np.arange(len(centroid_scores))
+
+        ids, scores = [], []
+        for c in probes.tolist():
+            start, stop = self.offsets[c], self.offsets[c + 1]
+            if stop > start:
+                ids.append(self.ids[start:stop])
+                scores.append(self.vectors[start:stop] @ query)
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        if exclude is not None:
+            keep = ids != exclude
+            ids, scores = ids[keep], scores[keep]
+
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def probe_count(self, n_probe=None):
+        # 未指定 n_probe 时使用标定值
+        if n_probe is None:
+            n_probe = self.n_probe
+        if n_probe is None:
+            raise ValueError('索引尚未标定 n_probe，请先调用 calibrate 或指定 n_probe')
+        return n_probe
+
+    def search_title(self, title, k=10, n_probe=None):
+        # 按标题查询相似电影，返回 [(标题, 相似度), ...]；索引中没有这部电影时返回 None
+        movie_id = self.title_index.get(title)
+        if movie_id is None:
+            return None
+        ids, scores = self.search(self.vector(movie_id), k, n_probe, exclude=movie_id)
+        return [(self.titles[i], float(score)) for i, score in zip(ids.tolist(), scores.tolist())]
+
+    def search_movie(self, movie, k=10, n_probe=None):
+        # 查询索引外的电影（例如刚爬取、尚未入库的电影）
+        query = self._embed(self._token_ids([movie_tokens(movie)], grow=False))[0]
+        return self.search(query, k, n_probe)
+
+    # 保存到目录
+    def save(self, directory):
+        """
+        功能:
+        - 把索引保存到目录：数组各存为一个 .npy 文件，词表和参数存为 JSON。
+          载入时向量以内存映射方式打开，多个 web 进程共享同一份只读数据。
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ('idf', 'projections', 'centroids', 'vectors', 'ids', 'offsets'):
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        meta = {'dim': self.dim, 'n_lists': self.n_lists, 'seed': self.seed, 'n_documents': self.n_documents,
+                'n_probe': self.n_probe, 'recall': self.recall, 'vocabulary': list(self.vocabulary),
+                'titles': self.titles}
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(meta, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        功能:
+        - 从 save 保存的目录载入索引；mmap_mode 为 None 时整体读入内存（之后还需要 add 时使用）。
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        index = cls(meta['dim'], meta['n_lists'], meta['seed'])
+        index.n_documents = meta['n_documents']
+        index.n_probe, index.recall = meta.get('n_probe'), meta.get('recall')
+        index.vocabulary = {token: i for i, token in enumerate(meta['vocabulary'])}
+        index.titles = meta['titles']
+        for i, title in enumerate(index.titles):
+            index.title_index.setdefault(title, i)
+        for name in ('idf', 'projections', 'centroids', 'offsets'):
+            setattr(index, name, np.load(os.path.join(directory, f'{name}.npy')))
+        for name in ('vectors', 'ids'):
+            setattr(index, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+        return index
+
+
+# 评估召回率与查询耗时
+def evaluate_index(index, n_queries=1000, k=10, n_probes=(1, 2, 4, 8, 16, 32), seed=0):
+    """
+    功能:
+    - 随机抽取 n_queries 部电影作为查询，以全量扫描的结果为准（与第 k 名并列的也算命中），
+      统计不同 n_probe 下的 recall@k 和平均查询耗时，
+      用于在召回率与耗时之间选择 n_probe。
+
+    输出:
+    - results: 列表，每项为 {'n_probe', 'recall', 'mean_ms'}。
+    """
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(index.size, min(n_queries, index.size), replace=False)
+    vectors = np.asarray(index.vectors)
+
+    # 全量扫描得到第 k 高的相似度；相似度与之并列的电影都算命中
+    thresholds = []
+    for movie_id in queries.tolist():
+        scores = vectors @ index.vector(movie_id)
+        scores[index.ids == movie_id] = -np.inf
+        thresholds.append(np.partition(scores, len(scores) - k)[len(scores) - k] - 1e-6)
+
+    results = []
+    for n_probe in n_probes:
+        hits = 0
+        start = time.perf_counter()
+        found = [index.search(index.vector(movie_id), k, n_probe, exclude=movie_id)[1]
+                 for movie_id in queries.tolist()]
+        seconds = time.perf_counter() - start
+        for scores, threshold in zip(found, thresholds):
+            hits += int(np.sum(scores >= threshold))
+        results.append({'n_probe': n_probe, 'recall': hits / (len(queries) * k),
+                        'mean_ms': seconds / len(queries) * 1000})
+    return results
+
+
+# 用索引计算每部电影的 top-K 相似电影
+def index_top_k_neighbours(index, k=10, n_probe=None, ratings=None, block_size=1 << 23):
+    """
+    功能:
+    - 与 similar_movies.top_k_neighbours 输出格式和规则相同（排除自身、相似度相同时按 ratings 从高到低、
+      相似度低于 1e-4 的不算相似），但每部电影只扫描 n_probe 个簇，适用于全量两两比较过慢的大目录。
+    - 结果与逐部电影调用 search 相同，但按簇批量计算：先为所有电影选出要扫描的簇，对第 r 近的簇，
+      把扫描同一个簇的电影归为一组，与该簇的向量做一次矩阵乘法并取每行的 top-k，
+      最后在每部电影的 n_probe × k 个候选中取 top-k。Python 循环次数约为 n_probe × 簇数，而不是电影数。
+
+    输入:
+    - index: 已构建的 MovieIndex。
+    - k: 每部电影保留的相似电影数量。
+    - n_probe: 扫描的簇数量，默认使用 index.calibrate 标定的值。
+    - ratings: 可选的评分数组（按电影编号），用于打破平局。
+    - block_size: 每批候选数组的最大元素数，控制内存占用。
+
+    输出:
+    - neighbours: int32 数组，形状为 (电影数, k)，不足 k 部时以 -1 填充。
+    - scores: float32 数组，对应的相似度。
+    """
+    n = index.size
+    k = min(k, max(n - 1, 0))
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    n_lists = len(index.centroids)
+    n_probe = min(index.probe_count(n_probe), n_lists)
+    tie_break = np.zeros(n) if ratings is None else np.nan_to_num(np.asarray(ratings, dtype=np.float64)) * 1e-6
+    vectors, ids, offsets = np.asarray(index.vectors), np.asarray(index.ids), index.offsets
+    # 按向量在索引中的位置排列的平局权重；查询编号也使用向量的位置
+    position_tie_break = tie_break[ids]
+
+    chunk_size = max(1, block_size // (n_probe * k))
+    for chunk_start in range(0, len(vectors), chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, len(vectors))
+        centroid_scores = vectors[chunk_start:chunk_stop] @ index.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe] if n_probe < n_lists \
+            else np.broadcast_to(np.arange(n_lists), centroid_scores.shape)
+
+        # 每个查询在第 r 个扫描簇中的 top-k 写入 candidate_*[:, r * k:(r + 1) * k]
+        candidate_scores = np.full((chunk_stop - chunk_start, n_probe * k), -np.inf)
+        candidate_positions = np.full((chunk_stop - chunk_start, n_probe * k), -1, dtype=np.int64)
+        for r in range(n_probe):
+            order = np.argsort(probes[:, r], kind='stable')
+            bounds = np.searchsorted(probes[order, r], np.arange(n_lists + 1))
+            for c in np.flatnonzero(np.diff(bounds)).tolist():
+                lo, hi = offsets[c], offsets[c + 1]
+                if hi == lo:
+                    continue
+                query = order[bounds[c]:bounds[c + 1]]
+                similarity = vectors[chunk_start + query] @ vectors[lo:hi].T + position_tie_break[lo:hi]
+                # 排除自身
+                own = np.flatnonzero((chunk_start + query >= lo) & (chunk_start + query < hi))
+                similarity[own, chunk_start + query[own] - lo] = -np.inf
+
+                kk = min(k, hi - lo)
+                top = np.argpartition(-similarity, kk - 1, axis=1)[:, :kk] if kk < hi - lo \
+                    else np.broadcast_to(np.arange(kk), similarity.shape)
+                candidate_scores[query, r * k:r * k + kk] = np.take_along_axis(similarity, top, axis=1)
+                candidate_positions[query, r * k:r * k + kk] = lo + top
+
+        top = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k] if n_probe > 1 \
+            else np.broadcast_to(np.arange(k), candidate_scores.shape)
+        best_scores = np.take_along_axis(candidate_scores, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best = ids[np.take_along_axis(np.take_along_axis(candidate_positions, top, axis=1), order, axis=1)]
+
+        # 没有任何共同特征的电影不算相似
+        found = best_scores >= 1e-4
+        movie_ids = ids[chunk_start:chunk_stop]
+        neighbours[movie_ids] = np.where(found, best, -1)
+        scores[movie_ids] = np.where(found, best_scores - tie_break[best], 0)
+    return neighbours, scores
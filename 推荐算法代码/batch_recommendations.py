@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pymysql
+import scipy.sparse as sp
+
+# 数据访问层 movie_repository 在 ../数据库代码 中
+MOVIE_REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '数据库代码')
+if MOVIE_REPOSITORY_DIR not in sys.path:
+    sys.path.append(MOVIE_REPOSITORY_DIR)
+
+from movie_repository import stream_rows
+from implicit_als import current_model_dir
+from similar_movies import EXACT_LIMIT
+
+# 每个用户、每部电影保存的推荐数量
+TOP_N = 20
+# 协同过滤得分在混合得分中的权重，内容相似度的权重为 1
+CF_WEIGHT = 0.5
+# 每个任务块包含的用户数或电影数；用户块和精确模式的电影块的得分矩阵为 CHUNK_SIZE × 电影数
+CHUNK_SIZE = 512
+
+# 工作进程中载入的数据，由 init_worker 设置
+_features = None
+_transposed = None
+_neighbours = None
+_scores = None
+_item_factors = None
+_user_factors = None
+
+
+def load_item_factors(model_dir, titles):
+    """
+    功能:
+    - 读取 implicit_als 导出的当前版本模型（见 implicit_als.current_model_dir），把电影因子按相似电影表的行顺序重新排列并做 L2 归一化，
+      模型中没有的电影因子为 0。
+
+    输出:
+    - item_factors: (电影数, 因子维度) 数组；模型不存在时为 None。
+    - users: 模型中的用户名列表。
+    - user_factors: (用户数, 因子维度) 数组；模型不存在时为 None。
+    """
+    model_dir = current_model_dir(model_dir)
+    try:
+        with open(os.path.join(model_dir, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+    except OSError:
+        return None, [], None
+    index = {title: i for i, title in enumerate(titles)}
+    user_factors = np.load(os.path.join(model_dir, 'user_factors.npy'))
+    factors = np.load(os.path.join(model_dir, 'item_factors.npy'))
+
+    item_factors = np.zeros((len(titles), factors.shape[1]), dtype=np.float32)
+    rows = [(index[title], j) for j, title in enumerate(meta['items']) if title in index]
+    if rows:
+        target, source = np.array(rows).T
+        item_factors[target] = factors[source]
+    norms = np.linalg.norm(item_factors, axis=1, keepdims=True)
+    item_factors /= np.maximum(norms, 1e-12)
+    return item_factors, meta['users'], user_factors
+
+
+def init_worker(similar_file, model_dir):
+    # 每个工作进程只载入一次特征矩阵和模型因子，之后的任务只传递块编号和少量数据
+    global _features, _transposed, _neighbours, _scores, _item_factors, _user_factors
+    with np.load(similar_file) as data:
+        n = len(data['titles'])
+        _features = sp.csr_matrix((data['feature_values'], data['feature_indices'], data['feature_indptr']),
+                                  shape=(n, len(data['tokens'])))
+        _neighbours, _scores = data['neighbours'], data['scores']
+        titles = data['titles'].tolist()
+    _transposed = _features.T.tocsr()
+    _item_factors, _, _user_factors = load_item_factors(model_dir, titles) if model_dir else (None, [], None)
+
+
+def top_n(scores, n):
+    # 每行得分最高的 n 列，按得分从高到低排列；得分不为正的位置记为 -1
+    n = min(n, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    return np.where(top_scores > 1e-4, top, -1).astype(np.int32)
+
+
+def save_checkpoint(checkpoint_dir, name, result):
+    # 先写临时文件再重命名，中断时不会留下不完整的检查点
+    path = os.path.join(checkpoint_dir, f'{name}.npy')
+    np.save(path + '.tmp.npy', result)
+    os.replace(path + '.tmp.npy', path)
+
+
+def movie_chunk(checkpoint_dir, name, start, stop, n, exact=True):
+    """
+    功能:
+    - 为第 start ~ stop 部电影计算推荐：内容余弦相似度 + CF_WEIGHT × 协同过滤电影因子的余弦相似度，排除自身。
+    - exact 为 True 时与所有电影比较（得分矩阵为 块大小 × 电影数）；否则只对相似电影表中已算好的
+      top-K 相似电影（见 similar_movies.build_similar_movies，大目录由近似最近邻索引得到）重新打分，
+      每块只需 块大小 × K 次计算，内容不相似的电影不会出现在推荐中。
+    """
+    if not exact:
+        candidates = _neighbours[start:stop]
+        scores = np.where(candidates >= 0, _scores[start:stop], -np.inf)
+        if _item_factors is not None:
+            cf = np.einsum('ij,ikj->ik', _item_factors[start:stop], _item_factors[np.maximum(candidates, 0)])
+            scores += CF_WEIGHT * cf
+        top = top_n(scores, n)
+        top = np.where(top >= 0, np.take_along_axis(candidates, np.maximum(top, 0), axis=1), -1)
+        save_checkpoint(checkpoint_dir, name, top)
+        return name, stop - start
+
+    scores = (_features[start:stop] @ _transposed).toarray()
+    if _item_factors is not None:
+        scores += CF_WEIGHT * (_item_factors[start:stop] @ _item_factors.T)
+    scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+    save_checkpoint(checkpoint_dir, name, top_n(scores, n))
+    return name, stop - start
+
+
+def user_chunk(checkpoint_dir, name, profiles, model_rows, excluded, n):
+    """
+    功能:
+    - 为一块用户计算推荐：兴趣画像与电影特征的内积 + CF_WEIGHT × 协同过滤得分，排除已经搜索或点击过的电影。
+
+    输入:
+    - profiles: (块内用户数, 特征数) 稀疏矩阵。
+    - model_rows: 每个用户在协同过滤模型中的行号，不在模型中为 -1。
+    - excluded: (块内用户数, 电影数) 稀疏矩阵，非零处为需要排除的电影。
+    """
+    scores = (profiles @ _transposed).toarray()
+    if _item_factors is not None:
+        in_model = model_rows >= 0
+        if in_model.any():
+            user_factors = _user_factors[model_rows[in_model]]
+            user_factors = user_factors / np.maximum(np.linalg.norm(user_factors, axis=1, keepdims=True), 1e-12)
+            scores[in_model] += CF_WEIGHT * (user_factors @ _item_factors.T)
+    excluded = excluded.tocoo()
+    scores[excluded.row, excluded.col] = -np.inf
+    save_checkpoint(checkpoint_dir, name, top_n(scores, n))
+    return name, profiles.shape[0]
+
+
+def read_users(connection, titles, tokens, model_users):
+    """
+    功能:
+    - 从 Django 数据库读取用户画像和交互过的电影，构建画像矩阵和排除矩阵；
+      只在协同过滤模型中出现、还没有画像的用户也包含在内。
+
+    输出:
+    - users: 用户名列表。
+    - profiles: (用户数, 特征数) 稀疏矩阵。
+    - excluded: (用户数, 电影数) 稀疏矩阵。
+    """
+    title_index = {title: i for i, title in enumerate(titles)}
+    token_index = {token: i for i, token in enumerate(tokens)}
+    users = {}
+    profile_entries, excluded_entries = [], []
+
+    for user_name, profile, history in stream_rows(connection,
+                                                   'SELECT user_name, profile, history FROM webGUI_userprofile'):
+        row = users.setdefault(user_name, len(users))
+        for token, weight in json.loads(profile or '{}').items():
+            if token in token_index:
+                profile_entries.append((row, token_index[token], weight))
+        for item in json.loads(history or '[]'):
+            if item.get('Name') in title_index:
+                excluded_entries.append((row, title_index[item['Name']]))
+    for user_name, title in stream_rows(connection, 'SELECT DISTINCT user_name, title FROM webGUI_interaction'):
+        if title in title_index:
+            excluded_entries.append((users.setdefault(user_name, len(users)), title_index[title]))
+    for user_name in model_users:
+        users.setdefault(user_name, len(users))
+
+    def matrix(entries, n_columns):
+        rows, columns, values = (list(column) for column in zip(*entries)) if entries else ([], [], [])
+        return sp.csr_matrix((np.array(values, dtype=np.float32), (rows, columns)), shape=(len(users), n_columns))
+
+    profiles = matrix(profile_entries, len(tokens))
+    excluded = matrix([(row, column, 1.0) for row, column in excluded_entries], len(titles))
+    return list(users), profiles, excluded
+
+
+def user_watermark(connection):
+    """
+    功能:
+    - 用户画像和交互记录的高水位：画像的行数和最近更新时间（画像就地更新），交互记录的行数和最大 id（只追加）。
+      任一用户的画像或交互发生变化后高水位随之改变，用于判断用户块的检查点是否仍然有效。
+
+    输出:
+    - [画像数, 画像最近更新时间, 交互数, 交互最大 id]，可直接写入 JSON。
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(updated_at) FROM webGUI_userprofile')
+        profiles, updated_at = cursor.fetchone()
+        cursor.execute('SELECT COUNT(*), MAX(id) FROM webGUI_interaction')
+        interactions, last_id = cursor.fetchone()
+    return [profiles, str(updated_at), interactions, last_id]
+
+
+def prepare_checkpoints(checkpoint_dir, inputs):
+    # 检查点只对同一份输入有效：manifest 与本次输入不同时清空检查点目录
+    manifest = os.path.join(checkpoint_dir, 'manifest.json')
+    if os.path.exists(manifest):
+        with open(manifest, 'r', encoding='utf-8') as file:
+            if json.load(file) != inputs:
+                shutil.rmtree(checkpoint_dir)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(manifest, 'w', encoding='utf-8') as file:
+        json.dump(inputs, file)
+
+
+def run_stage(executor, tasks, stage, checkpoint_dir):
+    # 提交尚未完成（没有检查点）的任务块，汇总吞吐量
+    pending = [(name, function, args) for name, function, args in tasks
+               if not os.path.exists(os.path.join(checkpoint_dir, f'{name}.npy'))]
+    start = time.perf_counter()
+    done = 0
+    futures = [executor.submit(function, checkpoint_dir, name, *args) for name, function, args in pending]
+    for future in as_completed(futures):
+        done += future.result()[1]
+    seconds = time.perf_counter() - start
+    report = {'stage': stage, 'chunks': len(tasks), 'resumed': len(tasks) - len(pending), 'computed': done,
+              'seconds': seconds, 'per_second': done / seconds if seconds > 0 else 0.0}
+    print(f"{stage}: 共 {len(tasks)} 块，从检查点恢复 {report['resumed']} 块，计算 {done} 条，"
+          f"耗时 {seconds:.2f}s，{report['per_second']:.1f} 条/s")
+    return report
+
+
+def write_recommendations(connection, kind, subjects, top, titles, batch_size=2000):
+    """
+    功能:
+    - 把推荐结果分批写入 webGUI_recommendation：已有的行就地更新，本次没有出现的旧行删除。
+    """
+    rows = [(kind, subject, json.dumps([titles[j] for j in row if j >= 0], ensure_ascii=False))
+            for subject, row in zip(subjects, top.tolist())]
+    sql = ('INSERT INTO webGUI_recommendation(kind, subject, titles, updated_at) VALUES(%s, %s, %s, NOW()) '
+           'ON DUPLICATE KEY UPDATE titles = VALUES(titles), updated_at = VALUES(updated_at)')
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT NOW()')
+            started, = cursor.fetchone()
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+            cursor.execute('DELETE FROM webGUI_recommendation WHERE kind = %s AND updated_at < %s', (kind, started))
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print('写入推荐结果时发生异常：', e)
+        raise
+
+
+# 离线批量生成推荐
+def run_batch(connection, similar_file, model_dir=None, checkpoint_dir='batch_checkpoints', n=TOP_N,
+              chunk_size=CHUNK_SIZE, max_workers=None, exact_limit=EXACT_LIMIT):
+    """
+    功能:
+    - 为所有电影和所有用户预先计算推荐列表并写入 webGUI_recommendation，web 端请求时只需按主键查表。
+    - 任务按块分配到进程池，每块完成后立即把结果保存为检查点；中断后重新运行会跳过已完成的块。
+      输入文件（相似电影表、协同过滤模型）或用户画像、交互记录（见 user_watermark）更新后旧检查点自动作废。
+    - 电影数超过 exact_limit 时，电影推荐只对相似电影表中的 top-K 相似电影重新打分（见 movie_chunk）。
+
+    输入:
+    - connection: 连接到 Django 数据库的 pymysql 连接。
+    - similar_file: similar_movies.py 生成的相似电影表（需要其中的特征矩阵）。
+    - model_dir: implicit_als.py 导出的模型目录，可选。
+    - checkpoint_dir: 检查点目录，全部写入数据库后删除。
+    - n: 每个用户、每部电影保存的推荐数量。
+    - chunk_size: 每个任务块的用户数或电影数。
+    - max_workers: 进程数，默认为 CPU 核数。
+    - exact_limit: 电影推荐与所有电影精确比较的最大电影数。
+
+    输出:
+    - reports: 每个阶段的吞吐量统计列表。
+    """
+    with np.load(similar_file) as data:
+        titles = data['titles'].tolist()
+        tokens = data['tokens'].tolist()
+    _, model_users, _ = load_item_factors(model_dir, titles) if model_dir else (None, [], None)
+    # 先取高水位再读用户，读取期间的修改会使下次运行的检查点作废
+    watermark = user_watermark(connection)
+    users, profiles, excluded = read_users(connection, titles, tokens, model_users)
+    model_index = {user_name: i for i, user_name in enumerate(model_users)}
+    model_rows = np.array([model_index.get(user_name, -1) for user_name in users], dtype=np.int64)
+
+    exact = len(titles) <= exact_limit
+    inputs = {'similar_file': os.path.getmtime(similar_file), 'n': n, 'chunk_size': chunk_size, 'exact': exact,
+              'users': [len(users), *watermark]}
+    meta_file = os.path.join(current_model_dir(model_dir), 'meta.json') if model_dir else None
+    if meta_file and os.path.exists(meta_file):
+        # 版本目录随每次导出变化；旧的导出格式只能看修改时间
+        inputs['model'] = [os.path.abspath(meta_file), os.path.getmtime(meta_file)]
+    prepare_checkpoints(checkpoint_dir, inputs)
+
+    movie_tasks = [(f'movies_{start:09d}', movie_chunk, (start, min(start + chunk_size, len(titles)), n, exact))
+                   for start in range(0, len(titles), chunk_size)]
+    user_tasks = [(f'users_{start:09d}', user_chunk,
+                   (profiles[start:start + chunk_size], model_rows[start:start + chunk_size],
+                    excluded[start:start + chunk_size], n))
+                  for start in range(0, len(users), chunk_size)]
+
+    reports = []
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(similar_file, model_dir)) as executor:
+        reports.append(run_stage(executor, movie_tasks, '电影', checkpoint_dir))
+        reports.append(run_stage(executor, user_tasks, '用户', checkpoint_dir))
+
+    start = time.perf_counter()
+    for kind, subjects, tasks in [('movie', titles, movie_tasks), ('user', users, user_tasks)]:
+        top = [np.load(os.path.join(checkpoint_dir, f'{name}.npy')) for name, _, _ in tasks]
+        write_recommendations(connection, kind, subjects, np.concatenate(top) if top else np.zeros((0, n)), titles)
+    print(f"写入 {len(titles)} 部电影、{len(users)} 个用户的推荐，耗时 {time.perf_counter() - start:.2f}s")
+    shutil.rmtree(checkpoint_dir)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线批量生成所有用户和电影的推荐列表')
+    parser.add_argument('--similar-file', default='../GUI/gui/data/similar_movies.npz')
+    parser.add_argument('--model-dir', default='../GUI/gui/data/collaborative')
+    parser.add_argument('--checkpoint-dir', default='batch_checkpoints')
+    parser.add_argument('--top-n', type=int, default=TOP_N)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--exact-limit', type=int, default=EXACT_LIMIT,
+                        help='电影数超过该值时电影推荐只对相似电影表中的候选重新打分')
+    args = parser.parse_args()
+
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    # web 端（Django）使用的数据库
+    database = 'moviemate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            run_batch(connection, args.similar_file, args.model_dir, args.checkpoint_dir, args.top_n,
+                      args.chunk_size, args.workers, args.exact_limit)
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from rating_matrix import RatingMatrix
+from 真值推荐算法 import update_final_ratings, update_trustworthiness
+
+# 默认的基准测试规模：(电影数, 来源数, 缺失率)
+BENCHMARK_CASES = [
+    (10_000, 3, 0.2),
+    (100_000, 3, 0.2),
+    (1_000_000, 3, 0.2),
+    (100_000, 10, 0.5),
+]
+# 可选的可信度求解器，见 真值推荐算法.extrapolate_trust
+SOLVERS = ['fixed_point', 'aitken', 'anderson']
+
+
+# 生成合成评分数据
+def generate_ratings(n_movies, n_sources=3, missing_rate=0.2, noise=None, bias=None, seed=0):
+    """
+    功能:
+    - 生成合成的 电影 × 来源 评分矩阵：每部电影有一个 [1, 10] 之间的真实评分，
+      各来源在真实评分上叠加自己的偏差和噪声，并按缺失率随机缺失。
+
+    输入:
+    - n_movies: 电影数量。
+    - n_sources: 来源数量。
+    - missing_rate: 每条评分缺失的概率。
+    - noise: 各来源噪声的标准差列表，默认在 0.2 ~ 1.0 之间均匀分布。
+    - bias: 各来源的系统偏差列表，默认为 0。
+    - seed: 随机数种子。
+
+    输出:
+    - matrix: RatingMatrix 稀疏评分矩阵，标题为 '合成电影{编号}'。
+    - truth: 每部电影的真实评分数组。
+    """
+    rng = np.random.default_rng(seed)
+    noise = np.linspace(0.2, 1.0, n_sources) if noise is None else np.asarray(noise, dtype=np.float64)
+    bias = np.zeros(n_sources) if bias is None else np.asarray(bias, dtype=np.float64)
+
+    truth = rng.uniform(1.0, 10.0, n_movies)
+    dense = truth[:, None] + bias[None, :] + rng.normal(0.0, 1.0, (n_movies, n_sources)) * noise[None, :]
+    dense = np.clip(np.round(dense, 1), 0.1, 10.0).astype(np.float32)
+
+    # 随机缺失，但每部电影至少保留一个来源
+    observed = rng.random((n_movies, n_sources)) >= missing_rate
+    observed[np.arange(n_movies), rng.integers(0, n_sources, n_movies)] = True
+
+    rows, cols = np.nonzero(observed)
+    indptr = np.zeros(n_movies + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_movies), out=indptr[1:])
+    titles = np.array([f'合成电影{i}' for i in range(n_movies)], dtype=object)
+    sources = {f'来源{j}': j for j in range(n_sources)}
+    return RatingMatrix(indptr, cols, dense[rows, cols], np.arange(n_movies), titles, sources), truth
+
+
+# 运行一次基准测试
+def run_benchmark(n_movies, n_sources=3, missing_rate=0.2, noise=None, bias=None, max_iterations=100,
+                  tolerance=0.001, seed=0, solver='fixed_point', freeze_tolerance=None):
+    """
+    功能:
+    - 在合成数据上运行 update_trustworthiness 和 update_final_ratings，记录耗时、迭代次数、峰值内存和可信度轨迹。
+
+    输入:
+    - n_movies, n_sources, missing_rate, noise, bias, seed: 传给 generate_ratings。
+    - max_iterations, tolerance, solver, freeze_tolerance: 传给 update_trustworthiness。
+
+    输出:
+    - result: 可直接保存为 JSON 的字典。耗时和峰值内存分两遍测量：tracemalloc 会拖慢每次内存分配，
+      在它开启时计时得到的耗时偏大，因此计时的一遍不开启 tracemalloc，另一遍在相同数据上只测内存。
+    """
+    def run(matrix, history=None):
+        trustworthiness = update_trustworthiness(matrix, max_iterations, tolerance, history=history, solver=solver,
+                                                 freeze_tolerance=freeze_tolerance)
+        start = time.perf_counter()
+        update_final_ratings(matrix, trustworthiness)
+        return trustworthiness, time.perf_counter() - start
+
+    matrix, truth = generate_ratings(n_movies, n_sources, missing_rate, noise, bias, seed)
+    history = []
+    start = time.perf_counter()
+    trustworthiness, final_seconds = run(matrix, history)
+    trust_seconds = time.perf_counter() - start - final_seconds
+
+    memory_matrix, _ = generate_ratings(n_movies, n_sources, missing_rate, noise, bias, seed)
+    tracemalloc.start()
+    run(memory_matrix)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del memory_matrix
+
+    iteration_seconds = [record['seconds'] for record in history]
+    return {
+        'n_movies': n_movies,
+        'n_sources': n_sources,
+        'missing_rate': missing_rate,
+        'noise': None if noise is None else [float(value) for value in noise],
+        'bias': None if bias is None else [float(value) for value in bias],
+        'seed': seed,
+        'solver': solver,
+        'freeze_tolerance': freeze_tolerance,
+        'nnz': matrix.nnz,
+        'matrix_bytes': matrix.nbytes,
+        'iterations': len(history),
+        'converged': bool(history) and history[-1]['trust_diff'] < tolerance,
+        'active_movies': history[-1]['active_movies'] if history else n_movies,
+        'trust_seconds': trust_seconds,
+        'final_rating_seconds': final_seconds,
+        'mean_iteration_seconds': float(np.mean(iteration_seconds)) if iteration_seconds else 0.0,
+        'max_iteration_seconds': float(np.max(iteration_seconds)) if iteration_seconds else 0.0,
+        'peak_memory_bytes': peak_memory,
+        # 与真实评分的平均绝对误差，用于发现算法改动带来的精度退化
+        'mae': float(np.mean(np.abs(matrix.final_ratings - truth))),
+        'trust': trustworthiness,
+        'trust_trajectory': [record['trust'] for record in history],
+    }
+
+
+# 保存基准测试结果
+def save_results(results, output_file):
+    """
+    功能:
+    - 把一组基准测试结果连同运行环境保存为 JSON 文件。
+    """
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(output_file, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=4)
+
+
+# 比较两次基准测试结果
+def compare_results(baseline_file, current_file, threshold=1.2):
+    """
+    功能:
+    - 按 (电影数, 来源数, 缺失率, 求解器) 对齐两次结果，打印耗时、内存和迭代次数的变化，超过 threshold 倍的视为退化。
+
+    输入:
+    - baseline_file: 基准结果 JSON 文件路径。
+    - current_file: 本次结果 JSON 文件路径。
+    - threshold: 退化判定的倍数，默认 1.2。
+
+    输出:
+    - regressions: 退化项的列表，每项为 (规模, 指标, 基准值, 本次值)。
+    """
+    def load(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return {(r['n_movies'], r['n_sources'], r['missing_rate'], r.get('solver', 'fixed_point')): r
+                    for r in json.load(file)['results']}
+
+    baseline, current = load(baseline_file), load(current_file)
+    regressions = []
+    for case in sorted(baseline.keys() & current.keys()):
+        for metric in ('trust_seconds', 'mean_iteration_seconds', 'peak_memory_bytes', 'iterations'):
+            old, new = baseline[case][metric], current[case][metric]
+            ratio = new / old if old else float('inf') if new else 1.0
+            print(f"{case} {metric}: {old} -> {new} ({ratio:.2f}x)")
+            if ratio > threshold:
+                regressions.append((case, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在合成数据上测试可信度迭代的耗时和内存，并与之前的结果比较')
+    parser.add_argument('--movies', nargs='+', type=int, metavar='N',
+                        help='电影数，可给出多个；不给出时使用 BENCHMARK_CASES 中的规模')
+    parser.add_argument('--sources', type=int, default=3, help='来源数（与 --movies 一起使用）')
+    parser.add_argument('--missing-rate', type=float, default=0.2, help='缺失率（与 --movies 一起使用）')
+    parser.add_argument('--noise', nargs='+', type=float, metavar='STD',
+                        help='各来源噪声的标准差，个数须等于来源数；默认在 0.2 ~ 1.0 之间均匀分布')
+    parser.add_argument('--bias', nargs='+', type=float, metavar='B', help='各来源的系统偏差，个数须等于来源数；默认为 0')
+    parser.add_argument('--solver', nargs='+', choices=SOLVERS, default=['fixed_point'])
+    parser.add_argument('--max-iterations', type=int, default=100)
+    parser.add_argument('--tolerance', type=float, default=0.001)
+    parser.add_argument('--freeze-tolerance', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='结果文件，默认为 benchmark_rating_<时间>.json')
+    parser.add_argument('--baseline', default=None, help='与该结果文件比较，有退化时以状态码 1 退出')
+    parser.add_argument('--current', default=None, help='与 --baseline 一起使用时不运行测试，直接比较这两个文件')
+    parser.add_argument('--threshold', type=float, default=1.2, help='退化判定的倍数')
+    args = parser.parse_args()
+    if args.current and not args.baseline:
+        parser.error('--current 需要与 --baseline 一起使用')
+    if (args.noise or args.bias) and not args.movies:
+        parser.error('--noise、--bias 需要与 --movies 一起使用')
+    for name in ('noise', 'bias'):
+        if getattr(args, name) and len(getattr(args, name)) != args.sources:
+            parser.error(f'--{name} 的个数须等于来源数 {args.sources}')
+
+    if args.current:
+        current_file = args.current
+    else:
+        cases = BENCHMARK_CASES if not args.movies else \
+            [(n_movies, args.sources, args.missing_rate) for n_movies in args.movies]
+        results = []
+        for n_movies, n_sources, missing_rate in cases:
+            for solver in args.solver:
+                result = run_benchmark(n_movies, n_sources, missing_rate, args.noise, args.bias,
+                                       max_iterations=args.max_iterations,
+                                       tolerance=args.tolerance, seed=args.seed, solver=solver,
+                                       freeze_tolerance=args.freeze_tolerance)
+                results.append(result)
+                print(f"电影数 {n_movies}，来源数 {n_sources}，缺失率 {missing_rate}，{solver}：迭代 {result['iterations']} 轮，"
+                      f"共 {result['trust_seconds']:.3f}s，每轮 {result['mean_iteration_seconds'] * 1000:.1f}ms，"
+                      f"峰值内存 {result['peak_memory_bytes'] / 2 ** 20:.1f}MB")
+
+        current_file = args.output or f"benchmark_rating_{datetime.now():%Y%m%d_%H%M%S}.json"
+        save_results(results, current_file)
+        print(f"基准测试结果已保存到 {current_file}")
+
+    if args.baseline:
+        regressions = compare_results(args.baseline, current_file, args.threshold)
+        for case, metric, old, new in regressions:
+            print(f"退化：{case} {metric} {old} -> {new}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# 列式文件的扩展名：Parquet 用于落盘交换，Arrow IPC（Feather）可以零拷贝内存映射
+PARQUET_SUFFIXES = ('.parquet',)
+ARROW_SUFFIXES = ('.feather', '.arrow')
+EXCEL_SUFFIXES = ('.xlsx', '.xls')
+
+
+def file_suffix(file_path):
+    return os.path.splitext(str(file_path))[1].lower()
+
+
+# 读取数据表，只加载需要的列
+def read_columns(file_path, columns=None):
+    """
+    功能:
+    - 按扩展名读取 Parquet / Arrow / Excel / CSV 文件为 DataFrame。
+    - columns 不为空时只读取这些列（文件中不存在的列会被忽略）：
+      Parquet 和 Arrow 只解码所选列，并以内存映射方式打开文件，不把整个文件复制进内存。
+
+    输入:
+    - file_path: str类型，文件路径。
+    - columns: 可选的列名列表。
+
+    输出:
+    - DataFrame。
+    """
+    suffix = file_suffix(file_path)
+    if suffix in PARQUET_SUFFIXES:
+        if columns is not None:
+            names = pq.read_schema(file_path).names
+            columns = [column for column in columns if column in names]
+        return pd.read_parquet(file_path, columns=columns, memory_map=True)
+    if suffix in ARROW_SUFFIXES:
+        if columns is not None:
+            with pa.memory_map(str(file_path)) as source:
+                names = pa.ipc.open_file(source).schema.names
+            columns = [column for column in columns if column in names]
+        return feather.read_table(file_path, columns=columns, memory_map=True).to_pandas()
+    usecols = None if columns is None else (lambda column: column in columns)
+    if suffix in EXCEL_SUFFIXES:
+        return pd.read_excel(file_path, usecols=usecols)
+    if suffix == '.csv':
+        return pd.read_csv(file_path, usecols=usecols)
+    raise ValueError(f'不支持的文件格式：{file_path}')
+
+
+# 写出数据表
+def write_columns(df, file_path):
+    """
+    功能:
+    - 按扩展名把 DataFrame 写为 Parquet 或 Arrow 文件，保留各列的类型；Excel 请用 DataFrame.to_excel 显式导出。
+
+    输入:
+    - df: DataFrame。
+    - file_path: str类型，输出文件路径（.parquet / .feather / .arrow）。
+
+    输出:
+    - 无直接输出，数据写入 file_path。
+    """
+    suffix = file_suffix(file_path)
+    if suffix in PARQUET_SUFFIXES:
+        df.to_parquet(file_path, index=False, compression='zstd')
+    elif suffix in ARROW_SUFFIXES:
+        # Arrow 文件不压缩，才能以内存映射方式零拷贝读取
+        feather.write_feather(df.reset_index(drop=True), file_path, compression='uncompressed')
+    else:
+        raise ValueError(f'不支持的列式文件格式：{file_path}')
+
+
+# 把已有的 Excel / CSV 文件转换为 Parquet
+def convert_to_parquet(file_path, output_file=None, dtype=None):
+    """
+    功能:
+    - 一次性把旧的 Excel / CSV 文件转换为 Parquet，之后各阶段直接读取 Parquet。
+
+    输入:
+    - file_path: str类型，Excel 或 CSV 文件路径。
+    - output_file: 输出文件路径，默认与输入同名、扩展名为 .parquet。
+    - dtype: 传给 pandas 的列类型，例如入库用的文件可传 str 保持原样。
+
+    输出:
+    - output_file: 输出文件路径。
+    """
+    output_file = output_file or os.path.splitext(file_path)[0] + '.parquet'
+    if file_suffix(file_path) in EXCEL_SUFFIXES:
+        df = pd.read_excel(file_path, dtype=dtype)
+    else:
+        df = pd.read_csv(file_path, dtype=dtype)
+    write_columns(df, output_file)
+    return output_file
+
+
+def main():
+    """
+    功能:
+    - 把命令行给出的 Excel / CSV 文件逐个转换为 Parquet，例如：
+      python columnar_io.py 豆瓣电影_合并评分.xlsx ../爬取网站代码/movies_dytt.xlsx
+    """
+    for file_path in sys.argv[1:]:
+        print(f"{file_path} -> {convert_to_parquet(file_path)}")
+
+
+if __name__ == '__main__':
+    main()
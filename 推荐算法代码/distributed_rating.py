@@ -0,0 +1,331 @@
+import csv
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pymysql
+
+from rating_matrix import RatingMatrix
+from 真值推荐算法 import initialize_trust
+
+# 每个评分来源对应的数据表和评分列
+SOURCE_TABLES = {
+    'IMDb': ('dytt_movies', 'imdb_rating'),
+    '猫眼': ('maoyan_movies', 'grade'),
+    '豆瓣': ('douban_movies', 'rating'),
+}
+
+# 每条评分在分区文件中的存储格式
+ENTRY_DTYPE = np.dtype([('movie', np.int32), ('source', np.int8), ('rating', np.float32)])
+
+RATING_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+TITLE_PATTERN = re.compile(r'《(.+?)》')
+
+
+# 从评分文本中解析数值
+def parse_rating(text):
+    """
+    功能:
+    - 从 '7.5'、'7.5/10 from 1,234 users' 等文本中取出评分数值。
+
+    输入:
+    - text: 评分文本。
+
+    输出:
+    - float 类型的评分；无法解析或不在 (0, 10] 区间时返回 None。
+    """
+    match = RATING_PATTERN.search(str(text or ''))
+    if not match:
+        return None
+    rating = float(match.group(0))
+    return rating if 0 < rating <= 10 else None
+
+
+# 统一各数据表的电影标题
+def normalize_title(title):
+    """
+    功能:
+    - 电影天堂的标题形如 '2023年剧情《XXX》BD中字'，取书名号内的部分；其他来源去掉首尾空白。
+    """
+    title = str(title or '').strip()
+    match = TITLE_PATTERN.search(title)
+    return match.group(1).strip() if match else title
+
+
+def partition_of(title, n_partitions):
+    # 按标题的 CRC32 分区，保证同一部电影的所有评分落在同一分区
+    return zlib.crc32(title.encode('utf-8')) % n_partitions
+
+
+def partition_path(work_dir, partition, suffix):
+    return os.path.join(work_dir, f'part-{partition:04d}.{suffix}')
+
+
+# 第一阶段每个任务读取的 id 区间长度
+RANGE_SIZE = 200000
+
+
+# 把来源表按主键切分为互不相交的区间
+def id_ranges(db_config, source, range_size=RANGE_SIZE):
+    """
+    功能:
+    - 按来源表 id 的最小值和最大值切分为 [lo, hi) 区间，每个区间由一个 worker 读取。
+
+    输出:
+    - [(source, lo, hi), ...]；空表返回空列表。
+    """
+    table, _ = SOURCE_TABLES[source]
+    connection = pymysql.connect(**db_config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MIN(id), MAX(id) FROM {table}')
+            low, high = cursor.fetchone()
+    finally:
+        connection.close()
+    if low is None:
+        return []
+    return [(source, lo, min(lo + range_size, high + 1)) for lo in range(low, high + 1, range_size)]
+
+
+# 第一阶段：流式读取来源表的一个 id 区间并按标题分区落盘
+def shuffle_source_range(db_config, source, lo, hi, work_dir, n_partitions, batch_size=10000):
+    """
+    功能:
+    - 通过服务端游标（SSCursor）按主键顺序流式读取来源表 id 在 [lo, hi) 内的行，把 (id, 标题, 评分)
+      按标题分区追加写入该区间自己的分区文件。worker 之间读取的行互不相交，每个 worker 同时只在内存中保留
+      batch_size 行，内存占用与表和区间的大小无关。
+    - 同一部电影在不同区间的评分由 build_partition 按 id 合并。
+
+    输入:
+    - db_config: pymysql.connect 的参数字典。
+    - source: 来源名称，SOURCE_TABLES 中的键。
+    - lo, hi: id 区间。
+    - work_dir: 分区文件所在目录。
+    - n_partitions: 分区数量。
+    - batch_size: 每次从服务器取回的行数。
+
+    输出:
+    - 读取的有效评分条数。
+    """
+    table, column = SOURCE_TABLES[source]
+    connection = pymysql.connect(cursorclass=pymysql.cursors.SSCursor, **db_config)
+    files = [open(partition_path(work_dir, k, f'{source}-{lo:012d}.csv'), 'w', newline='', encoding='utf-8')
+             for k in range(n_partitions)]
+    writers = [csv.writer(file) for file in files]
+    count = 0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, title, {column} FROM {table} WHERE id >= %s AND id < %s ORDER BY id',
+                           (lo, hi))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for movie_id, title, text in rows:
+                    rating = parse_rating(text)
+                    title = normalize_title(title)
+                    if rating is None or not title:
+                        continue
+                    writers[partition_of(title, n_partitions)].writerow((movie_id, title, rating))
+                    count += 1
+    finally:
+        for file in files:
+            file.close()
+        connection.close()
+    return count
+
+
+# 第一阶段：把一个分区的各来源文件编码为评分条目数组
+def build_partition(work_dir, partition, sources):
+    """
+    功能:
+    - 读取一个分区的各来源文件，编码为 (movie, source, rating) 条目数组保存为 .npy，标题单独保存。
+    - 同一来源中同名电影出现多次时只保留 id 最大（最后一次）的评分，与 rating_pipeline.read_rating_matrix 一致。
+
+    输入:
+    - work_dir: 分区文件所在目录。
+    - partition: 分区编号。
+    - sources: 来源名称列表，下标即来源编号。
+
+    输出:
+    - 该分区的评分条数。
+    """
+    frames = []
+    for source in sources:
+        prefix = os.path.basename(partition_path(work_dir, partition, f'{source}-'))
+        paths = sorted(os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.startswith(prefix))
+        parts = []
+        for path in paths:
+            if os.path.getsize(path):
+                parts.append(pd.read_csv(path, header=None, names=['id', 'title', 'rating'],
+                                         dtype={'title': str}, keep_default_na=False))
+            os.remove(path)
+        if parts:
+            frame = pd.concat(parts, ignore_index=True).sort_values('id', kind='stable')
+            frame = frame.drop_duplicates('title', keep='last')
+            frames.append(frame[['title', 'rating']].assign(source=source))
+
+    long_frame = pd.concat(frames, ignore_index=True) if frames else \
+        pd.DataFrame({'title': [], 'rating': [], 'source': []})
+    long_frame['movie_id'] = pd.factorize(long_frame['title'])[0]
+    matrix = RatingMatrix.from_long_frame(long_frame)
+
+    entries = np.empty(matrix.nnz, dtype=ENTRY_DTYPE)
+    entries['movie'] = matrix.movie_codes
+    # 分区内的来源下标换算为全局来源编号
+    source_numbers = np.array([sources.index(name) for name in matrix.source_names], dtype=np.int8)
+    entries['source'] = source_numbers[matrix.source_idx]
+    entries['rating'] = matrix.values
+    np.save(partition_path(work_dir, partition, 'entries.npy'), entries)
+    pd.Series(matrix.titles, name='title').to_csv(partition_path(work_dir, partition, 'titles.csv'), index=False)
+    return matrix.nnz
+
+
+def load_entries(work_dir, partition):
+    # 内存映射方式读取分区条目，不把整个分区复制进内存
+    return np.load(partition_path(work_dir, partition, 'entries.npy'), mmap_mode='r')
+
+
+def partition_final_ratings(entries, trust):
+    # 分区内每部电影的加权评分
+    n_movies = int(entries['movie'].max()) + 1 if len(entries) else 0
+    weights = trust[entries['source']]
+    total_weight = np.bincount(entries['movie'], weights=weights, minlength=n_movies)
+    weighted_sum = np.bincount(entries['movie'], weights=weights * entries['rating'], minlength=n_movies)
+    final = np.zeros(n_movies)
+    np.divide(weighted_sum, total_weight, out=final, where=total_weight != 0)
+    return final
+
+
+# 第二阶段（map）：计算一个分区在当前可信度下各来源的偏差和
+def map_partition(work_dir, partition, trust):
+    """
+    功能:
+    - 在广播的可信度下计算分区内每部电影的加权评分，并按来源汇总 |最终评分 - 来源评分| 与评分条数。
+
+    输入:
+    - work_dir: 分区文件所在目录。
+    - partition: 分区编号。
+    - trust: 按来源编号排列的可信度数组。
+
+    输出:
+    - (deviation_sum, count): 长度为来源数量的数组。
+    """
+    entries = load_entries(work_dir, partition)
+    final = partition_final_ratings(entries, trust)
+    deviations = np.abs(final[entries['movie']] - entries['rating'])
+    deviation_sum = np.bincount(entries['source'], weights=deviations, minlength=len(trust))
+    count = np.bincount(entries['source'], minlength=len(trust))
+    return deviation_sum, count
+
+
+# 第三阶段：按收敛后的可信度写出一个分区的最终评分
+def finalize_partition(work_dir, partition, trust):
+    entries = load_entries(work_dir, partition)
+    titles = pd.read_csv(partition_path(work_dir, partition, 'titles.csv'), dtype=str, keep_default_na=False)
+    titles['final_rating'] = partition_final_ratings(entries, trust)
+    path = partition_path(work_dir, partition, 'final.csv')
+    titles.to_csv(path, index=False)
+    return path
+
+
+# 协调者：分区、迭代归约可信度并汇总最终评分
+def distributed_truth_discovery(db_config, work_dir, output_file, n_partitions=64, max_workers=None,
+                                max_iterations=100, tolerance=0.001, range_size=RANGE_SIZE):
+    """
+    功能:
+    - 以 map-reduce 方式在多进程上执行真值发现：
+      1. 各来源表按主键切分为互不相交的 id 区间，每个区间由一个进程流式读取，按标题分区落盘；
+      2. 每轮迭代把当前可信度广播给各分区，worker 返回各来源的偏差和，协调者归约得到下一轮可信度；
+      3. 收敛后各分区写出最终评分，协调者按分区顺序拼接为一个 CSV 文件。
+    - 任何时刻每个 worker 只处理一个分区，内存占用由分区大小决定；目录中的分区文件可以放在共享存储上，
+      map_partition 只依赖 (目录, 分区编号, 可信度)，便于以后换成跨节点的执行器。
+
+    输入:
+    - db_config: pymysql.connect 的参数字典（需包含 database）。
+    - work_dir: 分区文件所在目录。
+    - output_file: 最终评分 CSV 文件路径。
+    - n_partitions: 分区数量，目录越大应设得越大，默认64。
+    - max_workers: 进程数，默认为 CPU 核数。
+    - max_iterations: 最大迭代次数，默认值为100。
+    - tolerance: 收敛的容差值，默认值为0.001。
+    - range_size: 第一阶段每个任务读取的 id 区间长度。
+
+    输出:
+    - trustworthiness: 可信度字典。
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    # 清理上次中断留下的分区文件，区间划分随表的大小变化，旧文件不会被覆盖
+    for name in os.listdir(work_dir):
+        if name.startswith('part-'):
+            os.remove(os.path.join(work_dir, name))
+    sources = list(SOURCE_TABLES)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # 第一阶段：分区
+        ranges = [task for source in sources for task in id_ranges(db_config, source, range_size)]
+        futures = [executor.submit(shuffle_source_range, db_config, source, lo, hi, work_dir, n_partitions)
+                   for source, lo, hi in ranges]
+        counts = [0] * len(sources)
+        for (source, _, _), future in zip(ranges, futures):
+            counts[sources.index(source)] += future.result()
+        print(f"分区完成（{len(ranges)} 个 id 区间），各来源评分条数：{dict(zip(sources, counts))}")
+        partitions = range(n_partitions)
+        list(executor.map(build_partition, [work_dir] * n_partitions, partitions, [sources] * n_partitions))
+
+        # 第二阶段：迭代，没有评分的来源不参与
+        active = np.array([count > 0 for count in counts])
+        trustworthiness = initialize_trust(sources)
+        trust = np.array([trustworthiness[source] for source in sources], dtype=np.float64)
+        for iteration in range(max_iterations):
+            start = time.perf_counter()
+            previous_trust = trust
+            deviation_sum = np.zeros(len(sources))
+            count = np.zeros(len(sources))
+            for partial_sum, partial_count in executor.map(map_partition, [work_dir] * n_partitions, partitions,
+                                                           [trust] * n_partitions):
+                deviation_sum += partial_sum
+                count += partial_count
+            trust = np.where(active, 1.0 / (1.0 + deviation_sum / np.maximum(count, 1)), trust)
+            trust_diff = np.max(np.abs(trust - previous_trust))
+            print(f"第 {iteration + 1} 轮，可信度变化 {trust_diff:.6f}，耗时 {time.perf_counter() - start:.2f}s")
+            if trust_diff < tolerance:
+                break
+
+        # 第三阶段：写出最终评分
+        paths = list(executor.map(finalize_partition, [work_dir] * n_partitions, partitions,
+                                  [trust] * n_partitions))
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as output:
+        output.write('title,final_rating\n')
+        for path in paths:
+            with open(path, encoding='utf-8') as part:
+                next(part)
+                for line in part:
+                    output.write(line)
+            os.remove(path)
+
+    return {source: float(value) for source, value, kept in zip(sources, trust, active) if kept}
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    db_config = {'host': host, 'user': user, 'password': password, 'port': port, 'database': database,
+                 'charset': charset}
+    trustworthiness = distributed_truth_discovery(db_config, 'rating_partitions', '豆瓣电影_最终评分.csv')
+    print(f"可信度：{trustworthiness}")
+    print("评分更新完成！")
+
+
+if __name__ == '__main__':
+    main()
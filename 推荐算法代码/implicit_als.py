@@ -0,0 +1,302 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pymysql
+import scipy.sparse as sp
+
+# 数据访问层 movie_repository 在 ../数据库代码 中
+MOVIE_REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '数据库代码')
+if MOVIE_REPOSITORY_DIR not in sys.path:
+    sys.path.append(MOVIE_REPOSITORY_DIR)
+
+from movie_repository import stream_rows
+
+# 不同交互的置信度权重：点击详情页比搜索更能说明兴趣
+INTERACTION_WEIGHTS = {
+    'search': 1.0,
+    'click': 3.0,
+}
+
+# 模型目录中记录当前版本子目录名的文件
+CURRENT_FILE = 'CURRENT'
+# 导出新模型后保留的版本数（含当前版本），还在使用上一版本的 web 进程读到的文件不会被删除
+KEEP_VERSIONS = 2
+
+
+# 读取交互记录
+def read_interactions(connection, table='webGUI_interaction'):
+    """
+    功能:
+    - 流式读取 web 端记录的搜索和点击，按 (用户, 电影) 汇总加权次数，构建稀疏交互矩阵。
+
+    输入:
+    - connection: 连接到 Django 数据库的 pymysql 连接。
+    - table: 交互记录表名。
+
+    输出:
+    - interactions: scipy.sparse.csr_matrix，形状为 (用户数, 电影数)，值为加权交互次数。
+    - users: 用户名列表。
+    - items: 电影标题列表。
+    """
+    users, items = {}, {}
+    rows, columns, values = [], [], []
+    for user_name, title, kind in stream_rows(connection, f'SELECT user_name, title, kind FROM {table}'):
+        rows.append(users.setdefault(user_name, len(users)))
+        columns.append(items.setdefault(title, len(items)))
+        values.append(INTERACTION_WEIGHTS.get(kind, 1.0))
+    # 重复的 (用户, 电影) 在转换为 CSR 时自动求和
+    interactions = sp.csr_matrix((np.array(values, dtype=np.float32), (rows, columns)),
+                                 shape=(len(users), len(items)))
+    interactions.sum_duplicates()
+    return interactions, list(users), list(items)
+
+
+def segment_sum(values, lengths):
+    # 按行长度对连续的条目分段求和，空行结果为 0
+    result = np.zeros((len(lengths), values.shape[1]), dtype=values.dtype)
+    nonempty = lengths > 0
+    if len(values):
+        starts = np.r_[0, np.cumsum(lengths)[:-1]][nonempty]
+        result[nonempty] = np.add.reduceat(values, starts, axis=0)
+    return result
+
+
+def solve_rows(confidence, fixed, gram, regularization, current, start, stop, cg_steps):
+    """
+    功能:
+    - 用共轭梯度法（以当前因子为初值）同时求解 confidence 第 start ~ stop 行的隐式 ALS 正规方程：
+      (YᵀY + λI + Yᵀ(Cᵤ - I)Y) xᵤ = YᵀCᵤp，其中只有交互过的电影对 Cᵤ - I 和 p 有贡献。
+    - 所有行的矩阵-向量乘一起向量化计算，每步代价为 O(非零元 × 因子维度)，不需要构造每个用户的 f × f 矩阵。
+    """
+    indptr = confidence.indptr
+    lo, hi = indptr[start], indptr[stop]
+    lengths = np.diff(indptr[start:stop + 1])
+    rows = np.repeat(np.arange(stop - start), lengths)
+    y = fixed[confidence.indices[lo:hi]]
+    c = confidence.data[lo:hi]
+    base = gram + regularization * np.eye(gram.shape[0], dtype=gram.dtype)
+
+    def matvec(x):
+        yx = np.einsum('ij,ij->i', y, x[rows])
+        return x @ base + segment_sum(y * ((c - 1) * yx)[:, None], lengths)
+
+    x = current[start:stop].copy()
+    r = segment_sum(y * c[:, None], lengths) - matvec(x)
+    p = r.copy()
+    rs = np.einsum('ij,ij->i', r, r)
+    for _ in range(cg_steps):
+        ap = matvec(p)
+        pap = np.einsum('ij,ij->i', p, ap)
+        alpha = np.divide(rs, pap, out=np.zeros_like(rs), where=pap > 0)
+        x += alpha[:, None] * p
+        r -= alpha[:, None] * ap
+        rs_new = np.einsum('ij,ij->i', r, r)
+        beta = np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)
+        p = r + beta[:, None] * p
+        rs = rs_new
+    return x
+
+
+def als_half_step(confidence, fixed, current, regularization, executor, n_chunks, cg_steps):
+    # 固定一侧的因子，按行分块在线程池中求解另一侧；NumPy 的矩阵运算会释放 GIL
+    gram = fixed.T @ fixed
+    bounds = np.linspace(0, confidence.shape[0], n_chunks + 1).astype(int)
+    futures = [executor.submit(solve_rows, confidence, fixed, gram, regularization, current, lo, hi, cg_steps)
+               for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+    parts = [future.result() for future in futures]
+    return np.concatenate(parts) if parts else current
+
+
+# 训练隐式反馈 ALS 模型
+def train_implicit_als(interactions, factors=32, regularization=0.1, alpha=10.0, iterations=15, cg_steps=3,
+                       max_workers=None, seed=0, history=None):
+    """
+    功能:
+    - 按 Hu, Koren, Volinsky 的隐式反馈 ALS 训练用户和电影的隐向量：
+      偏好 p = 1（有交互）/ 0，置信度 c = 1 + alpha × 加权交互次数。
+    - 交替固定电影因子求用户因子、固定用户因子求电影因子，每个方向用几步共轭梯度代替精确求解，
+      并按行分块在线程池中并行。
+
+    输入:
+    - interactions: read_interactions 输出的 (用户数, 电影数) 稀疏矩阵。
+    - factors: 隐向量维度。
+    - regularization: L2 正则系数 λ。
+    - alpha: 置信度系数。
+    - iterations: 交替迭代次数。
+    - cg_steps: 每次求解的共轭梯度步数。
+    - max_workers: 线程数，默认为 CPU 核数。
+    - seed: 随机数种子。
+    - history: 可选的列表，传入时每轮追加 {'iteration', 'seconds', 'loss'}。
+
+    输出:
+    - user_factors, item_factors: float32 数组，形状分别为 (用户数, factors) 和 (电影数, factors)。
+    """
+    rng = np.random.default_rng(seed)
+    n_users, n_items = interactions.shape
+    user_confidence = interactions.tocsr().astype(np.float32)
+    user_confidence.data = 1 + alpha * user_confidence.data
+    item_confidence = user_confidence.T.tocsr()
+
+    user_factors = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    n_chunks = max_workers * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            user_factors = als_half_step(user_confidence, item_factors, user_factors, regularization, executor,
+                                         n_chunks, cg_steps)
+            item_factors = als_half_step(item_confidence, user_factors, item_factors, regularization, executor,
+                                         n_chunks, cg_steps)
+            if history is not None:
+                history.append({'iteration': iteration + 1, 'seconds': time.perf_counter() - start,
+                                'loss': implicit_loss(user_confidence, user_factors, item_factors, regularization)})
+    return user_factors, item_factors
+
+
+def implicit_loss(confidence, user_factors, item_factors, regularization):
+    """
+    功能:
+    - 计算目标函数 Σ c(p - xᵀy)² + λ(‖X‖² + ‖Y‖²)，不展开稠密的 用户 × 电影 矩阵：
+      全部 (用户, 电影) 对按 c = 1、p = 0 计算为 tr(XᵀX · YᵀY)，再对有交互的位置修正。
+    """
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    predictions = np.einsum('ij,ij->i', user_factors[rows], item_factors[confidence.indices])
+    loss = float(np.sum((user_factors.T @ user_factors) * (item_factors.T @ item_factors)))
+    loss += float(np.sum(confidence.data * (1 - predictions) ** 2 - predictions ** 2))
+    return loss + regularization * float(np.sum(user_factors ** 2) + np.sum(item_factors ** 2))
+
+
+# 批量为所有用户生成 top-N
+def recommend_all(user_factors, item_factors, interactions, n=50, chunk_size=1024):
+    """
+    功能:
+    - 分块计算 用户因子 × 电影因子ᵀ 的得分矩阵，排除已交互的电影，每个用户取得分最高的 n 部。
+
+    输出:
+    - top_items: int32 数组，形状为 (用户数, n)，不足 n 部时以 -1 填充。
+    """
+    n_users, n_items = interactions.shape
+    n = min(n, n_items)
+    top_items = np.full((n_users, n), -1, dtype=np.int32)
+    if n == 0:
+        return top_items
+    interactions = interactions.tocsr()
+    for start in range(0, n_users, chunk_size):
+        stop = min(start + chunk_size, n_users)
+        scores = user_factors[start:stop] @ item_factors.T
+        # 已交互的电影不再推荐
+        seen = interactions[start:stop]
+        scores[np.repeat(np.arange(stop - start), np.diff(seen.indptr)), seen.indices] = -np.inf
+
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        top_items[start:stop] = np.where(np.isfinite(top_scores), top, -1)
+    return top_items
+
+
+# 当前版本的模型目录
+def current_model_dir(directory):
+    """
+    功能:
+    - 读取 directory 下的 CURRENT，返回它指向的版本子目录；还没有 CURRENT（旧的导出格式，文件直接在 directory 下）时
+      返回 directory 本身。
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), 'r', encoding='utf-8') as file:
+            version = file.read().strip()
+    except OSError:
+        return directory
+    return os.path.join(directory, version)
+
+
+# 导出模型
+def save_model(directory, users, items, user_factors, item_factors, top_items, keep=KEEP_VERSIONS):
+    """
+    功能:
+    - 把因子矩阵和 top-N 表各存为 .npy，用户名和电影标题存为 meta.json，web 端以只读内存映射方式载入。
+    - 每次导出写入一个新的版本子目录：先在临时目录中写完全部文件，整体改名为版本目录，
+      最后用 os.replace 原子地替换 CURRENT 指向它。正在内存映射旧版本的 web 进程不受影响（原地截断重写会导致
+      SIGBUS 或读到新旧混杂的因子），读取 CURRENT 的进程看到的 .npy 与 meta.json 总是同一版本。
+    - 只保留最近 keep 个版本，更早的版本目录被删除。
+
+    输入:
+    - directory: 模型目录。
+    - users, items: 用户名和电影标题列表，与因子矩阵的行一一对应。
+    - user_factors, item_factors, top_items: train_implicit_als 和 recommend_all 的输出。
+    - keep: 保留的版本数。
+
+    输出:
+    - 新版本目录的路径。
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = f'{datetime.now():%Y%m%d_%H%M%S_%f}'
+    staging = tempfile.mkdtemp(prefix=f'.{version}.', dir=directory)
+    try:
+        np.save(os.path.join(staging, 'user_factors.npy'), user_factors)
+        np.save(os.path.join(staging, 'item_factors.npy'), item_factors)
+        np.save(os.path.join(staging, 'top_items.npy'), top_items)
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'users': users, 'items': items}, file, ensure_ascii=False)
+        os.replace(staging, os.path.join(directory, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(directory, f'.{CURRENT_FILE}.{os.getpid()}')
+    with open(pointer, 'w', encoding='utf-8') as file:
+        file.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    # 版本目录名按时间排序；以 . 开头的是未完成的临时目录
+    versions = sorted(name for name in os.listdir(directory)
+                      if not name.startswith('.') and os.path.isdir(os.path.join(directory, name)))
+    for name in versions[:-max(keep, 1)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return os.path.join(directory, version)
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    # web 端（Django）使用的数据库
+    database = 'moviemate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            interactions, users, items = read_interactions(connection)
+        finally:
+            connection.close()
+        print(f"{len(users)} 个用户、{len(items)} 部电影、{interactions.nnz} 条交互")
+
+        history = []
+        user_factors, item_factors = train_implicit_als(interactions, history=history)
+        print(f"训练 {len(history)} 轮，耗时 {sum(record['seconds'] for record in history):.2f}s，"
+              f"最终损失 {history[-1]['loss']:.2f}" if history else "没有训练数据")
+
+        top_items = recommend_all(user_factors, item_factors, interactions)
+        save_model('../GUI/gui/data/collaborative', users, items, user_factors, item_factors, top_items)
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
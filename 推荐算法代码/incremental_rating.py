@@ -0,0 +1,261 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from rating_matrix import RatingMatrix
+from 真值推荐算法 import get_movie_ratings, save_final_ratings, update_final_ratings, update_trustworthiness
+
+
+# 计算指定评分条目的按电影加权和
+def weighted_sums(matrix, trust, entries=None):
+    """
+    功能:
+    - 计算每部电影的加权评分和与总权重；entries 不为空时只累加这些评分条目。
+
+    输入:
+    - matrix: RatingMatrix 稀疏评分矩阵。
+    - trust: 按来源下标排列的可信度数组。
+    - entries: 可选的评分条目下标数组。
+
+    输出:
+    - weighted_sum, total_weight: 长度为电影数量的数组。
+    """
+    movie_codes, source_idx, values = matrix.movie_codes, matrix.source_idx, matrix.values
+    if entries is not None:
+        movie_codes, source_idx, values = movie_codes[entries], source_idx[entries], values[entries]
+    weights = trust[source_idx]
+    total_weight = np.bincount(movie_codes, weights=weights, minlength=matrix.n_movies)
+    weighted_sum = np.bincount(movie_codes, weights=weights * values, minlength=matrix.n_movies)
+    return weighted_sum, total_weight
+
+
+# 计算指定评分条目按来源汇总的偏差和与条数
+def source_deviation_sums(matrix, final, entries=None):
+    """
+    功能:
+    - 按来源汇总 |最终评分 - 来源评分|，即可信度公式 1 / (1 + 平均偏差) 中的分子部分。
+
+    输入:
+    - matrix: RatingMatrix 稀疏评分矩阵。
+    - final: 每部电影的最终评分数组。
+    - entries: 可选的评分条目下标数组，为空时汇总全部条目。
+
+    输出:
+    - deviation_sum, count: 长度为来源数量的数组。
+    """
+    movie_codes, source_idx, values = matrix.movie_codes, matrix.source_idx, matrix.values
+    if entries is not None:
+        movie_codes, source_idx, values = movie_codes[entries], source_idx[entries], values[entries]
+    deviations = np.abs(final[movie_codes] - values)
+    deviation_sum = np.bincount(source_idx, weights=deviations, minlength=matrix.n_sources)
+    count = np.bincount(source_idx, minlength=matrix.n_sources)
+    return deviation_sum, count
+
+
+# 同名电影的出现序号
+def occurrence_numbers(codes):
+    """
+    功能:
+    - 对整数编码的标题数组，返回每个元素是该标题第几次出现（从0开始）。
+    """
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    occurrence = np.empty(len(codes), dtype=np.int64)
+    occurrence[order] = np.arange(len(codes)) - np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    return occurrence
+
+
+# 按标题对齐新旧两次的电影
+def align_movies(old_titles, new_titles):
+    """
+    功能:
+    - 以 (标题, 同名序号) 为键，找出新表中每部电影在旧表中的位置。
+
+    输入:
+    - old_titles: 上一次的电影标题数组。
+    - new_titles: 本次的电影标题数组。
+
+    输出:
+    - position: 长度为新电影数的数组，-1 表示旧表中没有这部电影。
+    """
+    titles = pd.Series(np.concatenate([old_titles, new_titles]), dtype=object).fillna('')
+    codes, _ = pd.factorize(titles)
+    old_codes, new_codes = codes[:len(old_titles)], codes[len(old_titles):]
+
+    # 标题编码与同名序号合并为一个 int64 键
+    old_keys = old_codes.astype(np.int64) * len(titles) + occurrence_numbers(old_codes)
+    new_keys = new_codes.astype(np.int64) * len(titles) + occurrence_numbers(new_codes)
+    return pd.Index(old_keys).get_indexer(new_keys)
+
+
+# 保存收敛后的状态
+def save_rating_state(state_file, matrix, trustworthiness, sums=None):
+    """
+    功能:
+    - 保存收敛后的可信度向量、每部电影的加权和以及各来源的偏差和，供下次增量更新热启动。
+
+    输入:
+    - state_file: str类型，状态文件路径（.npz）。
+    - matrix: 已计算完最终评分的 RatingMatrix。
+    - trustworthiness: 可信度字典。
+    - sums: 可选的 (weighted_sum, total_weight, deviation_sum, count)，增量更新时传入已维护好的值，避免全量重算。
+
+    输出:
+    - 无直接输出，状态写入 state_file。
+    """
+    source_names = matrix.source_names
+    trust = np.array([trustworthiness[source] for source in source_names], dtype=np.float64)
+    if sums is None:
+        weighted_sum, total_weight = weighted_sums(matrix, trust)
+        deviation_sum, count = source_deviation_sums(matrix, matrix.final_ratings)
+    else:
+        weighted_sum, total_weight, deviation_sum, count = sums
+
+    np.savez(
+        state_file,
+        sources=np.array(source_names, dtype=str),
+        trust=trust,
+        titles=pd.Series(matrix.titles, dtype=object).fillna('').to_numpy(dtype=str),
+        indptr=matrix.indptr,
+        source_idx=matrix.source_idx,
+        values=matrix.values,
+        weighted_sum=weighted_sum,
+        total_weight=total_weight,
+        final_ratings=matrix.final_ratings,
+        deviation_sum=deviation_sum,
+        count=count,
+    )
+
+
+# 读取上一次保存的状态
+def load_rating_state(state_file):
+    """
+    功能:
+    - 读取 save_rating_state 保存的状态。
+
+    输入:
+    - state_file: str类型，状态文件路径。
+
+    输出:
+    - state: 字典，包含 matrix（上一次的 RatingMatrix，含 final_ratings）以及 trust、weighted_sum 等数组；
+      文件不存在时返回 None。
+    """
+    if not os.path.exists(state_file):
+        return None
+    with np.load(state_file) as data:
+        state = {key: data[key] for key in data.files}
+    sources = {name: i for i, name in enumerate(state['sources'].tolist())}
+    matrix = RatingMatrix(state['indptr'], state['source_idx'], state['values'],
+                          np.arange(len(state['titles'])), state['titles'].astype(object), sources)
+    matrix.final_ratings = state['final_ratings']
+    state['matrix'] = matrix
+    return state
+
+
+# 增量更新可信度和最终评分
+def incremental_update(matrix, state_file, max_iterations=100, tolerance=0.001, changed_titles=None,
+                       solver='fixed_point'):
+    """
+    功能:
+    - 以上一次收敛的状态为起点，只重新计算评分发生变化的电影的最终评分。
+    - 变化电影的偏差和增量更新到各来源的偏差和中，若由此得到的可信度漂移超过 tolerance，
+      则以旧可信度热启动，重新做一次完整的收敛。
+    - 没有状态文件或评分来源发生变化时，直接做完整计算。
+    - changed_titles 为已知发生变化的电影（例如变更日志中的电影），即使评分向量与上次相同也重新计算。
+
+    输入:
+    - matrix: 本次读取的 RatingMatrix。
+    - state_file: str类型，状态文件路径。
+    - max_iterations: 完整收敛时的最大迭代次数，默认值为100。
+    - tolerance: 收敛容差，同时作为触发完整收敛的可信度漂移阈值，默认值为0.001。
+    - changed_titles: 可选，已知发生变化的电影标题集合。
+    - solver: 完整收敛时的求解器，见 update_trustworthiness。
+
+    输出:
+    - trustworthiness: 可信度字典。
+    - stats: 字典，包含 mode（'full' / 'warm' / 'incremental'）、changed（变化的电影数）、drift（可信度漂移）。
+    """
+    state = load_rating_state(state_file)
+    if state is None or list(state['sources']) != matrix.source_names:
+        trustworthiness = update_trustworthiness(matrix, max_iterations, tolerance, solver=solver)
+        update_final_ratings(matrix, trustworthiness)
+        save_rating_state(state_file, matrix, trustworthiness)
+        return trustworthiness, {'mode': 'full', 'changed': matrix.n_movies, 'drift': None}
+
+    previous = state['matrix']
+    trust = state['trust']
+
+    # 按标题对齐新旧电影，-1 表示新增电影
+    position = align_movies(previous.titles, matrix.titles)
+    matched = position >= 0
+
+    # 评分向量有变化（含新增）的电影
+    new_dense = matrix.to_dense()
+    old_dense = previous.to_dense()
+    changed = ~matched
+    same = np.isclose(new_dense[matched], old_dense[position[matched]], rtol=0, atol=0, equal_nan=True)
+    changed[matched] = ~same.all(axis=1)
+    if changed_titles:
+        changed |= pd.Series(matrix.titles, dtype=object).isin(changed_titles).to_numpy()
+
+    # 旧表中已删除或发生变化的电影，需要从偏差和中扣除
+    removed = np.ones(previous.n_movies, dtype=bool)
+    removed[position[matched & ~changed]] = False
+
+    # 只对变化电影的评分条目重新计算
+    new_entries = np.flatnonzero(changed[matrix.movie_codes])
+    old_entries = np.flatnonzero(removed[previous.movie_codes])
+
+    final = np.zeros(matrix.n_movies)
+    final[matched] = previous.final_ratings[position[matched]]
+    weighted_sum, total_weight = weighted_sums(matrix, trust, new_entries)
+    np.divide(weighted_sum, total_weight, out=final, where=changed & (total_weight != 0))
+    matrix.final_ratings = final
+
+    # 未变化电影沿用保存的加权和
+    unchanged = matched & ~changed
+    weighted_sum[unchanged] = state['weighted_sum'][position[unchanged]]
+    total_weight[unchanged] = state['total_weight'][position[unchanged]]
+
+    # 用变化电影的偏差增量更新各来源的偏差和，估计可信度漂移
+    old_deviation, old_count = source_deviation_sums(previous, previous.final_ratings, old_entries)
+    new_deviation, new_count = source_deviation_sums(matrix, final, new_entries)
+    deviation_sum = state['deviation_sum'] - old_deviation + new_deviation
+    count = state['count'] - old_count + new_count
+    drifted_trust = 1.0 / (1.0 + deviation_sum / np.maximum(count, 1))
+    drift = float(np.max(np.abs(drifted_trust - trust)))
+
+    trustworthiness = {source: float(value) for source, value in zip(matrix.source_names, trust)}
+    if drift < tolerance:
+        save_rating_state(state_file, matrix, trustworthiness, (weighted_sum, total_weight, deviation_sum, count))
+        return trustworthiness, {'mode': 'incremental', 'changed': int(changed.sum()), 'drift': drift}
+
+    # 漂移超过容差：以旧可信度热启动完整收敛
+    trustworthiness = update_trustworthiness(matrix, max_iterations, tolerance, initial_trust=trustworthiness,
+                                             solver=solver)
+    update_final_ratings(matrix, trustworthiness)
+    save_rating_state(state_file, matrix, trustworthiness)
+    return trustworthiness, {'mode': 'warm', 'changed': int(changed.sum()), 'drift': drift}
+
+
+def main():
+    """
+    功能:
+    - 增量模式的主函数：读取合并评分表，基于上一次的状态增量更新最终评分并保存。
+    """
+    file_path = '豆瓣电影_合并评分.parquet'
+    state_file = '豆瓣电影_评分状态.npz'
+
+    matrix = get_movie_ratings(file_path)
+    trustworthiness, stats = incremental_update(matrix, state_file)
+    save_final_ratings(matrix, '豆瓣电影_最终评分.parquet')
+
+    print(f"可信度：{trustworthiness}")
+    print(f"更新模式：{stats['mode']}，变化电影数：{stats['changed']}，可信度漂移：{stats['drift']}")
+    print("评分增量更新完成！")
+
+
+if __name__ == '__main__':
+    main()
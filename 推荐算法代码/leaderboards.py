@@ -0,0 +1,309 @@
+import os
+import re
+import sys
+import time
+
+import pymysql
+
+# 数据访问层 movie_repository 在 ../数据库代码 中
+MOVIE_REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '数据库代码')
+if MOVIE_REPOSITORY_DIR not in sys.path:
+    sys.path.append(MOVIE_REPOSITORY_DIR)
+
+from movie_repository import stream_rows
+from distributed_rating import parse_rating
+
+# 排行榜的数据来源：来源名称 -> (数据表, 评分列)
+LEADERBOARD_SOURCES = {
+    'moviemate': ('moviemate_movies', 'mm_rating'),
+    'douban': ('douban_movies', 'rating'),
+}
+
+# 页面读取的榜单长度
+LEADERBOARD_SIZE = 100
+# 每个榜单实际保存的条数；多出的部分作为缓冲，增量更新时有电影跌出前 LEADERBOARD_SIZE 也能直接补位
+LEADERBOARD_DEPTH = 200
+
+
+def split_values(text):
+    return [value.strip() for value in re.split(r'[/,，]', str(text or '')) if value.strip()]
+
+
+def movie_boards(movie):
+    # 一部电影所属的榜单：总榜、每个类型、每个地区
+    return ['overall'] + [f'genre:{genre}' for genre in split_values(movie['genre'])] + \
+        [f'region:{region}' for region in split_values(movie['region'])]
+
+
+# 创建排行榜数据表和记录各榜单是否截断的状态表
+def create_leaderboard_table(cursor):
+    sql = '''
+    CREATE TABLE IF NOT EXISTS leaderboards (
+        source VARCHAR(32) NOT NULL,
+        board VARCHAR(255) NOT NULL,
+        position SMALLINT NOT NULL,
+        title VARCHAR(255) NOT NULL,
+        rating DECIMAL(4, 1) NOT NULL,
+        poster_url VARCHAR(255) NOT NULL,
+        detail_url VARCHAR(255) NOT NULL,
+        PRIMARY KEY (source, board, position)
+    )
+    '''
+    cursor.execute(sql)
+    # truncated 为 1 表示排序后的候选超过 LEADERBOARD_DEPTH、有电影没有写入榜单，只有完整重建时才会清除
+    sql = '''
+    CREATE TABLE IF NOT EXISTS leaderboard_boards (
+        source VARCHAR(32) NOT NULL,
+        board VARCHAR(255) NOT NULL,
+        truncated TINYINT(1) NOT NULL,
+        PRIMARY KEY (source, board)
+    )
+    '''
+    cursor.execute(sql)
+
+
+def movie_query(source):
+    table, column = LEADERBOARD_SOURCES[source]
+    return f'SELECT title, genre, region, {column}, poster_url, detail_url FROM {table}'
+
+
+def to_movie(row):
+    title, genre, region, rating, poster_url, detail_url = row
+    return {'title': title, 'genre': genre, 'region': region, 'rating': parse_rating(rating),
+            'poster_url': poster_url, 'detail_url': detail_url}
+
+
+def rank_entries(entries, depth=LEADERBOARD_DEPTH):
+    """
+    功能:
+    - 按评分从高到低（同分按标题）排序，同名电影和同一海报只保留评分最高的一条，截取前 depth 条。
+    """
+    ranked, titles, posters = [], set(), set()
+    for movie in sorted(entries, key=lambda movie: (-movie['rating'], movie['title'])):
+        if movie['title'] in titles or movie['poster_url'] in posters:
+            continue
+        titles.add(movie['title'])
+        posters.add(movie['poster_url'])
+        ranked.append(movie)
+        if len(ranked) == depth:
+            break
+    return ranked
+
+
+def rank_board(entries, depth=None):
+    # 排序去重后截取前 depth（默认 LEADERBOARD_DEPTH）条，同时返回是否有电影因此被截掉
+    depth = LEADERBOARD_DEPTH if depth is None else depth
+    ranked = rank_entries(entries, depth + 1)
+    return ranked[:depth], len(ranked) > depth
+
+
+def write_boards(cursor, source, boards, truncated, batch_size=5000):
+    # 整体替换指定榜单的内容和截断状态；truncated 为被截断的榜单名称集合
+    names = list(boards)
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f'DELETE FROM leaderboards WHERE source = %s AND board IN ({placeholders})', (source, *chunk))
+        cursor.execute(f'DELETE FROM leaderboard_boards WHERE source = %s AND board IN ({placeholders})',
+                       (source, *chunk))
+    for start in range(0, len(names), batch_size):
+        cursor.executemany('INSERT INTO leaderboard_boards(source, board, truncated) VALUES(%s, %s, %s)',
+                           [(source, board, int(board in truncated)) for board in names[start:start + batch_size]])
+    rows = [(source, board, position, movie['title'], movie['rating'], movie['poster_url'], movie['detail_url'])
+            for board, entries in boards.items() for position, movie in enumerate(entries)]
+    sql = ('INSERT INTO leaderboards(source, board, position, title, rating, poster_url, detail_url) '
+           'VALUES(%s, %s, %s, %s, %s, %s, %s)')
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+
+
+# 全量重建排行榜
+def rebuild_leaderboards(connection, source='moviemate', boards=None):
+    """
+    功能:
+    - 流式扫描一次来源表，为所有榜单（或只为 boards 中的榜单）排序去重并写入 leaderboards 表。
+
+    输入:
+    - connection: pymysql 连接。
+    - source: LEADERBOARD_SOURCES 中的来源名称。
+    - boards: 可选的榜单名称集合，为空时重建全部榜单。
+
+    输出:
+    - 重建的榜单数。
+    """
+    entries = {}
+    for row in stream_rows(connection, movie_query(source)):
+        movie = to_movie(row)
+        if movie['rating'] is None:
+            continue
+        for board in movie_boards(movie):
+            if boards is None or board in boards:
+                entries.setdefault(board, []).append(movie)
+
+    ranked, truncated = {}, set()
+    for board, movies in entries.items():
+        ranked[board], cut = rank_board(movies)
+        if cut:
+            truncated.add(board)
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            create_leaderboard_table(cursor)
+            if boards is None:
+                cursor.execute('DELETE FROM leaderboards WHERE source = %s', (source,))
+            else:
+                # 已经没有任何电影的榜单也要清空
+                ranked.update({board: [] for board in boards if board not in ranked})
+            write_boards(cursor, source, ranked, truncated)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print('重建排行榜时发生异常：', e)
+        raise
+    return len(ranked)
+
+
+def read_movies(connection, source, values, column='title', batch_size=1000):
+    # 按标题（或 column 指定的其他列）批量读取电影的当前数据
+    movies = []
+    values = list(values)
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            chunk = values[start:start + batch_size]
+            cursor.execute(f'{movie_query(source)} WHERE {column} IN ({", ".join(["%s"] * len(chunk))})', chunk)
+            movies.extend(to_movie(row) for row in cursor.fetchall())
+    return movies
+
+
+def read_boards(connection, source, boards=None, titles=None):
+    # 读取榜单条目；boards 或 titles 不为空时只读取相关榜单
+    sql = 'SELECT board, title, rating, poster_url, detail_url FROM leaderboards WHERE source = %s'
+    params = [source]
+    if boards is not None or titles is not None:
+        conditions = []
+        if boards:
+            conditions.append(f'board IN ({", ".join(["%s"] * len(boards))})')
+            params.extend(boards)
+        if titles:
+            conditions.append(f'board IN (SELECT board FROM leaderboards WHERE source = %s AND title IN '
+                              f'({", ".join(["%s"] * len(titles))}))')
+            params.extend([source, *titles])
+        if not conditions:
+            return {}
+        sql += ' AND (' + ' OR '.join(conditions) + ')'
+    sql += ' ORDER BY board, position'
+
+    result = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for board, title, rating, poster_url, detail_url in cursor.fetchall():
+            result.setdefault(board, []).append({'title': title, 'rating': float(rating), 'poster_url': poster_url,
+                                                 'detail_url': detail_url})
+    return result
+
+
+def read_truncated(connection, source, boards):
+    # 读取榜单的截断状态：{榜单: 是否截断}；没有记录的榜单（状态表出现之前生成的）不在结果中
+    boards = list(boards)
+    result = {}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM information_schema.tables "
+                       "WHERE table_schema = DATABASE() AND table_name = 'leaderboard_boards'")
+        if not cursor.fetchone()[0]:
+            return result
+        for start in range(0, len(boards), 500):
+            chunk = boards[start:start + 500]
+            cursor.execute(f'SELECT board, truncated FROM leaderboard_boards WHERE source = %s AND board IN '
+                           f'({", ".join(["%s"] * len(chunk))})', (source, *chunk))
+            result.update((board, bool(truncated)) for board, truncated in cursor.fetchall())
+    return result
+
+
+# 增量更新排行榜
+def update_leaderboards(connection, titles, source='moviemate'):
+    """
+    功能:
+    - 评分重新加载后，只更新与发生变化的电影相关的榜单：
+      从榜单中去掉这些电影的旧条目，按新数据把它们合并回所属榜单，重新排序去重。
+    - 榜单只保存去重后留下的电影，被同名或同一海报的电影挤掉的条目不在榜单中。按标题读取时同名的电影会一并读出；
+      变化的电影原本在榜单中占着的海报，再按海报读出共用它的其他电影一起合并，旧条目移走后被挤掉的电影能重新上榜。
+    - 榜单是否被截断（有电影排在 LEADERBOARD_DEPTH 之外、没有写入）保存在 leaderboard_boards 中，增量合并时不会清除：
+      截断的榜单经过一次或多次更新后不足 LEADERBOARD_SIZE 时，缓冲区外可能还有应该上榜的电影，
+      这些榜单再做一次针对性的重建。没有截断状态的旧榜单按是否达到 LEADERBOARD_DEPTH 判断。
+
+    输入:
+    - connection: pymysql 连接。
+    - titles: 发生变化（含新增、删除）的电影标题。
+    - source: LEADERBOARD_SOURCES 中的来源名称。
+
+    输出:
+    - 更新的榜单数。
+    """
+    titles = set(titles)
+    if not titles:
+        return 0
+    changed = [movie for movie in read_movies(connection, source, titles) if movie['rating'] is not None]
+    new_boards = {board for movie in changed for board in movie_boards(movie)}
+    current = read_boards(connection, source, boards=sorted(new_boards), titles=sorted(titles))
+
+    # 共用旧海报、因去重不在榜单中的电影
+    posters = {movie['poster_url'] for entries in current.values() for movie in entries if movie['title'] in titles}
+    changed += [movie for movie in read_movies(connection, source, sorted(posters), column='poster_url')
+                if movie['rating'] is not None and movie['title'] not in titles]
+
+    boards = new_boards | set(current)
+    flags = read_truncated(connection, source, sorted(boards))
+    updated, truncated, underflow = {}, set(), set()
+    for board in boards:
+        entries = current.get(board, [])
+        merged = [movie for movie in entries if movie['title'] not in titles]
+        merged += [movie for movie in changed if board in movie_boards(movie)]
+        updated[board], cut = rank_board(merged)
+        if cut or flags.get(board, len(entries) >= LEADERBOARD_DEPTH):
+            truncated.add(board)
+            if len(updated[board]) < LEADERBOARD_SIZE:
+                underflow.add(board)
+
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            create_leaderboard_table(cursor)
+            write_boards(cursor, source, {board: entries for board, entries in updated.items()
+                                          if board not in underflow}, truncated)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print('更新排行榜时发生异常：', e)
+        raise
+    if underflow:
+        rebuild_leaderboards(connection, source, underflow)
+    return len(updated)
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            for source in LEADERBOARD_SOURCES:
+                start = time.perf_counter()
+                count = rebuild_leaderboards(connection, source)
+                print(f"{source}: 重建 {count} 个榜单，耗时 {time.perf_counter() - start:.2f}s")
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
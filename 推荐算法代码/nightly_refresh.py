@@ -0,0 +1,111 @@
+import argparse
+import time
+
+import pymysql
+
+# rating_pipeline 把 ../数据库代码 加入 sys.path，需在 crawl_snapshots、movie_repository 之前导入
+from rating_pipeline import run_pending_ratings
+from batch_recommendations import run_batch
+from crawl_snapshots import SOURCE_FILES, refresh_tables
+from movie_repository import MovieRepository
+from similar_movies import build_similar_movies
+
+# 推荐重建在变更日志中的处理位置名称
+RECOMMENDATION_CONSUMER = 'recommendations'
+
+
+# 电影目录有变化时重建相似电影表和批量推荐
+def rebuild_recommendations(connection, similar_file, web_connection=None, model_dir=None,
+                            consumer=RECOMMENDATION_CONSUMER):
+    """
+    功能:
+    - 变更日志中有 consumer 尚未处理的 moviemate_movies 变更时，重新计算相似电影表（web 端按文件修改时间自动重新加载），
+      传入 web_connection 时再重新生成批量推荐；没有变更时什么也不做。
+
+    输入:
+    - connection: 连接到 MovieMate 数据库的 pymysql 连接。
+    - similar_file: 相似电影表的保存路径。
+    - web_connection: 可选，连接到 web 端（Django）数据库的 pymysql 连接。
+    - model_dir: implicit_als.py 导出的模型目录，可选。
+    - consumer: 变更日志中的处理位置名称。
+
+    输出:
+    - 是否进行了重建。
+    """
+    repository = MovieRepository(connection)
+    upto = repository.last_change_id()
+    changes = repository.pending_changes(consumer, ['moviemate_movies'], upto)
+    if not changes:
+        print("电影目录没有变化，跳过推荐重建。")
+        return False
+    print(f"电影目录有 {len(changes)} 条变更，重建推荐")
+    build_similar_movies(connection, similar_file)
+    if web_connection is not None:
+        run_batch(web_connection, similar_file, model_dir)
+    # 其他表的变更与推荐无关，一并确认
+    repository.ack_changes(consumer, upto)
+    return True
+
+
+# 每晚的增量刷新
+def nightly_refresh(connection, files, similar_file, web_connection=None, model_dir=None, force=False):
+    """
+    功能:
+    - 1. 把各来源的爬取结果与上一次快照比较，只应用新增、更新和删除的电影，并写入变更日志；
+      2. 有变更时重新计算评分，只更新评分或数据变化的电影所在的排行榜；
+      3. 电影目录有变更时重建相似电影表和批量推荐。
+      标题补全索引按变更日志判断是否需要重建（见 MovieRepository.table_version）。
+    - 各步骤独立记录在变更日志中的处理位置，某一步失败后重新运行只会重做尚未完成的步骤。
+
+    输出:
+    - {'tables': refresh_tables 的结果, 'ratings': 是否重新计算了评分, 'recommendations': 是否重建了推荐}。
+    """
+    start = time.perf_counter()
+    tables = refresh_tables(connection, files, force=force)
+    ratings = run_pending_ratings(connection) is not None
+    recommendations = rebuild_recommendations(connection, similar_file, web_connection, model_dir)
+    print(f"刷新完成，耗时 {time.perf_counter() - start:.2f}s")
+    return {'tables': tables, 'ratings': ratings, 'recommendations': recommendations}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='每晚的增量刷新：快照比较、评分、排行榜和推荐只处理变化的部分')
+    parser.add_argument('--tables', nargs='+', choices=list(SOURCE_FILES), default=list(SOURCE_FILES))
+    parser.add_argument('--similar-file', default='../GUI/gui/data/similar_movies.npz')
+    parser.add_argument('--model-dir', default='../GUI/gui/data/collaborative')
+    parser.add_argument('--skip-batch', action='store_true', help='不重新生成批量推荐')
+    parser.add_argument('--force', action='store_true', help='爬取结果文件未变化时也重新比较')
+    args = parser.parse_args()
+    files = {table: SOURCE_FILES[table] for table in args.tables}
+
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    # web 端（Django）使用的数据库
+    web_database = 'moviemate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        web_connection = None
+        try:
+            if not args.skip_batch:
+                web_connection = pymysql.connect(host=host, user=user, password=password, port=port,
+                                                 database=web_database, charset=charset)
+            nightly_refresh(connection, files, args.similar_file, web_connection, args.model_dir, args.force)
+        finally:
+            if web_connection is not None:
+                web_connection.close()
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+# 合并评分表中各评分来源对应的列名
+SOURCE_COLUMNS = {
+    'IMDb': 'IMDb评分',
+    '猫眼': '猫眼评分',
+    '豆瓣': 'rating',
+}
+
+
+class RatingMatrix:
+    """
+    电影 × 评分来源 的稀疏评分矩阵（CSR 格式）。
+
+    - indptr: int64 数组，长度为 电影数+1，第 i 部电影的评分位于 [indptr[i], indptr[i+1]) 区间。
+    - source_idx: int8 数组，每条评分对应的来源下标。
+    - values: float32 数组，每条评分的数值；缺失的评分不占存储。
+    - movie_ids: 每部电影在原始表格中的行号。
+    - titles: 每部电影的标题，每部电影只存一份。
+    - sources: 来源名称到来源下标的字典，例如 {'IMDb': 0, '猫眼': 1, '豆瓣': 2}。
+    - final_ratings: 每部电影的最终评分（float64），由 update_trustworthiness / update_final_ratings 写入。
+    """
+
+    def __init__(self, indptr, source_idx, values, movie_ids, titles, sources):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.source_idx = np.asarray(source_idx, dtype=np.int8)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        self.titles = np.asarray(titles, dtype=object)
+        self.sources = dict(sources)
+        self.final_ratings = np.zeros(self.n_movies, dtype=np.float64)
+        self._movie_codes = None
+
+    @property
+    def n_movies(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_sources(self):
+        return len(self.sources)
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    @property
+    def source_names(self):
+        # 按来源下标排列的来源名称
+        return sorted(self.sources, key=self.sources.get)
+
+    @property
+    def movie_codes(self):
+        # 每条评分对应的电影下标（COO 行号），按需展开并缓存
+        if self._movie_codes is None:
+            self._movie_codes = np.repeat(np.arange(self.n_movies, dtype=np.int32), np.diff(self.indptr))
+        return self._movie_codes
+
+    @property
+    def nbytes(self):
+        # 数值数组占用的字节数（不含标题字符串）
+        return (self.indptr.nbytes + self.source_idx.nbytes + self.values.nbytes
+                + self.movie_ids.nbytes + self.final_ratings.nbytes)
+
+    @classmethod
+    def from_wide_frame(cls, df, source_columns=SOURCE_COLUMNS):
+        """
+        功能:
+        - 从合并评分表（每部电影一行、每个来源一列）构建稀疏评分矩阵。
+
+        输入:
+        - df: 合并评分表的DataFrame，包含 title 列以及 source_columns 中的评分列。
+        - source_columns: 来源名称到评分列名的字典，新增评分来源只需在此添加一列。
+
+        输出:
+        - RatingMatrix 对象；没有任何评分的来源不会出现在 sources 中。
+        """
+        names = [name for name, column in source_columns.items() if column in df.columns]
+        dense = np.column_stack([
+            pd.to_numeric(df[source_columns[name]], errors='coerce').to_numpy(dtype=np.float32)
+            for name in names
+        ]) if names else np.empty((len(df), 0), dtype=np.float32)
+        return cls.from_dense(dense, df['title'].to_numpy(dtype=object), names)
+
+    @classmethod
+    def from_dense(cls, dense, titles, source_names, movie_ids=None):
+        """
+        功能:
+        - 从 电影数 × 来源数 的评分数组（缺失为 NaN）构建稀疏评分矩阵。
+
+        输入:
+        - dense: 二维评分数组，第 j 列对应 source_names[j]。
+        - titles: 每部电影的标题。
+        - source_names: 来源名称列表。
+        - movie_ids: 可选的每部电影的编号（如数据库中的 id），默认为行号。
+
+        输出:
+        - RatingMatrix 对象；没有任何评分的来源不会出现在 sources 中。
+        """
+        dense = np.asarray(dense, dtype=np.float32)
+
+        # 去掉没有任何评分的来源
+        observed = ~np.isnan(dense)
+        keep = observed.any(axis=0)
+        dense = dense[:, keep]
+        observed = observed[:, keep]
+        names = [name for name, kept in zip(source_names, keep) if kept]
+
+        # 按行优先取出非缺失的评分，即 CSR 的存储顺序
+        rows, cols = np.nonzero(observed)
+        indptr = np.zeros(len(dense) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(dense)), out=indptr[1:])
+
+        movie_ids = np.arange(len(dense)) if movie_ids is None else movie_ids
+        return cls(indptr, cols, dense[rows, cols], movie_ids, titles,
+                   {name: i for i, name in enumerate(names)})
+
+    @classmethod
+    def from_long_frame(cls, movie_ratings):
+        """
+        功能:
+        - 从长表格式（movie_id, title, source, rating 每行一条评分）构建稀疏评分矩阵。
+
+        输入:
+        - movie_ratings: 长表格式的DataFrame。
+
+        输出:
+        - RatingMatrix 对象。
+        """
+        movie_ratings = movie_ratings[movie_ratings['rating'].notna()]
+        movie_codes, movie_ids = pd.factorize(movie_ratings['movie_id'], sort=True)
+        source_codes, sources = pd.factorize(movie_ratings['source'], sort=False)
+
+        # 按电影排序得到 CSR 顺序
+        order = np.argsort(movie_codes, kind='stable')
+        indptr = np.zeros(len(movie_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(movie_codes, minlength=len(movie_ids)), out=indptr[1:])
+
+        titles = movie_ratings['title'].to_numpy(dtype=object)[order][indptr[:-1]]
+        return cls(indptr, source_codes[order], movie_ratings['rating'].to_numpy(dtype=np.float32)[order],
+                   np.asarray(movie_ids), titles, {name: i for i, name in enumerate(sources)})
+
+    def observed_mask(self):
+        """
+        功能:
+        - 返回 电影数 × 来源数 的布尔矩阵，True 表示该来源对该电影有评分。
+        """
+        mask = np.zeros((self.n_movies, self.n_sources), dtype=bool)
+        mask[self.movie_codes, self.source_idx] = True
+        return mask
+
+    def to_dense(self):
+        """
+        功能:
+        - 返回 电影数 × 来源数 的 float32 评分矩阵，缺失位置为 NaN。
+        """
+        dense = np.full((self.n_movies, self.n_sources), np.nan, dtype=np.float32)
+        dense[self.movie_codes, self.source_idx] = self.values
+        return dense
+
+    def to_frame(self):
+        """
+        功能:
+        - 返回每部电影一行的 DataFrame，包含 movie_id、title 和 final_rating；没有任何评分的电影不输出。
+        """
+        rated = np.diff(self.indptr) > 0
+        return pd.DataFrame({
+            'movie_id': self.movie_ids[rated],
+            'title': self.titles[rated],
+            'final_rating': self.final_ratings[rated],
+        })
@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pymysql
+
+# 数据访问层 movie_repository 在 ../数据库代码 中
+MOVIE_REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '数据库代码')
+if MOVIE_REPOSITORY_DIR not in sys.path:
+    sys.path.append(MOVIE_REPOSITORY_DIR)
+
+from movie_repository import MovieRepository
+from distributed_rating import SOURCE_TABLES, normalize_title, parse_rating
+from entity_resolution import SOURCE_RECORDS
+from incremental_rating import incremental_update
+from leaderboards import update_leaderboards
+from rating_matrix import RatingMatrix
+from 真值推荐算法 import (convergence_report, movie_segments, update_final_ratings, update_segmented_trustworthiness,
+                    update_trustworthiness)
+
+# 依次写回 moviemate_movies 的 IMDB_rating、maoyan_rating 列的来源
+WRITE_BACK_SOURCES = ['IMDb', '猫眼']
+# 各数据表在实体对齐结果 movie_entity 中的来源名称和记录键
+ENTITY_KEYS = {table: (source, key) for source, (table, key, *_) in SOURCE_RECORDS.items()}
+# 评分流程在变更日志中的处理位置名称
+RATING_CONSUMER = 'rating_pipeline'
+# 增量评分保存的上一次收敛状态（见 incremental_rating.save_rating_state）
+RATING_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'moviemate_评分状态.npz')
+
+
+# 从数据库读取评分矩阵
+def read_rating_matrix(connection, with_attributes=False):
+    """
+    功能:
+    - moviemate_movies 的每一行是矩阵的一行（matrix.movie_ids 为其 id），从各来源表流式读取评分，构建稀疏评分矩阵。
+    - 已运行过实体对齐（数据库代码/entity_resolution.py）时按 movie_entity 的统一电影编号关联各来源，
+      同名的不同电影（如不同年份的翻拍）各占一行、各自得到自己的评分；
+      movie_entity 中还没有的来源记录按规范化标题关联到所有同名的行。
+    - 同一来源中同一部电影出现多次时以最后一次为准。
+
+    输入:
+    - connection: pymysql 连接。
+    - with_attributes: 为 True 时同时返回每部电影的类型和年份，用于分段可信度。
+
+    输出:
+    - matrix: RatingMatrix，movie_ids 为 moviemate_movies.id，titles 为对应的标题（同名电影的标题会重复）。
+    - genres, years: 仅在 with_attributes 为 True 时返回，与 matrix.titles 一一对应。
+    """
+    repository = MovieRepository(connection)
+    use_entities = repository.has_movie_entities()
+
+    def source_rows(table, columns):
+        # 逐行产生 (movie_id, *columns)；没有实体对齐结果时 movie_id 为 None
+        if use_entities:
+            source, key = ENTITY_KEYS[table]
+            return repository.iter_entity_columns(table, source, key, columns)
+        return ((None, *row) for row in repository.iter_columns(table, columns))
+
+    # 统一电影编号、标题 -> 矩阵中的行号列表
+    entity_codes, title_codes = {}, {}
+    ids, titles, genres, years = [], [], [], []
+    for movie_id, row_id, title, genre, year in source_rows('moviemate_movies', ['id', 'title', 'genre', 'year']):
+        code = len(ids)
+        ids.append(row_id)
+        titles.append(title)
+        genres.append(genre)
+        years.append(year)
+        title_codes.setdefault(title, []).append(code)
+        if movie_id is not None:
+            entity_codes.setdefault(movie_id, []).append(code)
+
+    sources = list(SOURCE_TABLES)
+    dense = np.full((len(ids), len(sources)), np.nan, dtype=np.float32)
+    for j, source in enumerate(sources):
+        table, column = SOURCE_TABLES[source]
+        count = 0
+        for movie_id, title, text in source_rows(table, ['title', column]):
+            if movie_id is not None:
+                codes = entity_codes.get(movie_id)
+            else:
+                codes = title_codes.get(normalize_title(title))
+            rating = parse_rating(text)
+            if codes and rating is not None:
+                dense[codes, j] = rating
+                count += 1
+        print(f"{table}: 匹配到 {count} 条评分")
+
+    matrix = RatingMatrix.from_dense(dense, np.array(titles, dtype=object), sources, movie_ids=ids)
+    return (matrix, genres, years) if with_attributes else matrix
+
+
+def format_rating(value):
+    # 与 DECIMAL(3, 1) 列一致：一位小数，缺失写入 NULL
+    return None if np.isnan(value) else round(float(value), 1)
+
+
+# 批量写回 mm_rating 及来源评分
+def write_back_ratings(connection, matrix, batch_size=5000, changed=None):
+    """
+    功能:
+    - 在一个事务内把最终评分和来源评分按 moviemate_movies.id 写回（见 MovieRepository.write_ratings）：
+      先分批写入按 id 建主键的临时表，再用一条 UPDATE ... JOIN 更新；同名的不同电影各自写入自己的评分。
+
+    输入:
+    - connection: pymysql 连接。
+    - matrix: 已计算完最终评分的 RatingMatrix，movie_ids 为 moviemate_movies.id（见 read_rating_matrix）。
+    - batch_size: 每批写入临时表的行数。
+    - changed: 可选的列表，传入时追加最终评分发生变化的电影标题。
+
+    输出:
+    - 更新的行数。
+    """
+    dense = matrix.to_dense()
+    columns = [dense[:, matrix.sources[source]] if source in matrix.sources else np.full(matrix.n_movies, np.nan)
+               for source in WRITE_BACK_SOURCES]
+    rated = np.diff(matrix.indptr) > 0
+
+    rows = [
+        (int(movie_id), format_rating(final), *(format_rating(column[i]) for column in columns))
+        for i, (movie_id, final) in enumerate(zip(matrix.movie_ids, matrix.final_ratings)) if rated[i]
+    ]
+
+    try:
+        return MovieRepository(connection).write_ratings(rows, batch_size, changed)
+    except Exception as e:
+        print('写回评分时发生异常：', e)
+        raise
+
+
+# 数据库内的完整评分流程
+def run_rating_pipeline(connection, solver='anderson', tolerance=0.001, segmented=False, changed_titles=(),
+                        state_file=None):
+    """
+    功能:
+    - 从数据库读取各来源评分，计算可信度和最终评分，并写回 moviemate_movies。
+    - 传入 state_file 时以上一次收敛的状态增量计算（见 incremental_rating.incremental_update），
+      只重新计算评分变化的电影和 changed_titles，可信度漂移超过容差时才重新完整收敛。
+
+    输入:
+    - connection: pymysql 连接。
+    - solver: 可信度迭代的求解器，见 update_trustworthiness；分段模式下不使用。
+    - tolerance: 收敛容差。
+    - segmented: 为 True 时按 类型 × 年代 分段计算可信度，见 update_segmented_trustworthiness。
+    - changed_titles: 评分以外发生变化（新增、删除、海报等更新）的 moviemate 电影标题，一并重新计算并更新排行榜。
+    - state_file: 可选，增量计算的状态文件；分段模式不使用增量状态，运行后删除该文件，下次增量计算时完整收敛。
+
+    输出:
+    - trustworthiness: 可信度字典；分段模式下为 {分段名称: {来源: 可信度}}。
+
+    写回后只对最终评分变化的电影增量更新排行榜（见 leaderboards.update_leaderboards）。
+    """
+    start = time.perf_counter()
+    matrix, genres, years = read_rating_matrix(connection, with_attributes=True)
+    print(f"读取 {matrix.n_movies} 部电影、{matrix.nnz} 条评分，耗时 {time.perf_counter() - start:.2f}s")
+
+    history = []
+    if segmented:
+        segments, labels = movie_segments(genres, years)
+        trustworthiness = update_segmented_trustworthiness(matrix, segments, labels, tolerance=tolerance,
+                                                           history=history)
+        print(f"{len(labels)} 个分段，迭代 {len(history)} 轮，耗时 {sum(r['seconds'] for r in history):.3f}s")
+        if state_file is not None and os.path.exists(state_file):
+            os.remove(state_file)
+    elif state_file is not None:
+        start = time.perf_counter()
+        trustworthiness, stats = incremental_update(matrix, state_file, tolerance=tolerance,
+                                                    changed_titles=set(changed_titles), solver=solver)
+        print(f"{stats['mode']} 模式，重新计算 {stats['changed']} 部电影，可信度漂移 {stats['drift']}，"
+              f"耗时 {time.perf_counter() - start:.3f}s，可信度：{trustworthiness}")
+    else:
+        trustworthiness = update_trustworthiness(matrix, tolerance=tolerance, history=history, solver=solver)
+        update_final_ratings(matrix, trustworthiness)
+        report = convergence_report(history, tolerance)
+        print(f"迭代 {report['iterations']} 轮，耗时 {report['seconds']:.3f}s，可信度：{trustworthiness}")
+
+    start = time.perf_counter()
+    changed = []
+    try:
+        updated = write_back_ratings(connection, matrix, changed=changed)
+    except Exception:
+        # 状态已按本次结果保存，写回失败时删除，下次重新完整计算，不会漏写这次的变化
+        if state_file is not None and os.path.exists(state_file):
+            os.remove(state_file)
+        raise
+    print(f"写回 {updated} 行（{len(changed)} 部电影评分变化），耗时 {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    boards = update_leaderboards(connection, set(changed) | set(changed_titles))
+    print(f"更新 {boards} 个排行榜，耗时 {time.perf_counter() - start:.2f}s")
+    return trustworthiness
+
+
+# 只在数据有变化时运行评分流程
+def run_pending_ratings(connection, consumer=RATING_CONSUMER, state_file=RATING_STATE_FILE, **options):
+    """
+    功能:
+    - 读取变更日志中 consumer 尚未处理的变更（见 数据库代码/crawl_snapshots.py），没有变更时直接返回，
+      否则以 state_file 中上一次收敛的状态增量计算评分：只重新计算评分变化的电影和变更日志中的 moviemate 电影，
+      可信度漂移超过容差或还没有状态文件时才完整收敛；写回评分、更新相关排行榜后确认已处理。
+
+    输入:
+    - connection: pymysql 连接。
+    - consumer: 变更日志中的处理位置名称。
+    - state_file: 增量计算的状态文件，默认为 RATING_STATE_FILE。
+    - options: 传给 run_rating_pipeline 的其他参数。
+
+    输出:
+    - run_rating_pipeline 的结果；没有变更时为 None。
+    """
+    repository = MovieRepository(connection)
+    upto = repository.last_change_id()
+    changes = repository.pending_changes(consumer, upto=upto)
+    if not changes:
+        print("没有新的数据变更，跳过评分计算。")
+        return None
+    print(f"{len(changes)} 条数据变更，重新计算评分")
+    titles = {change.title for change in changes if change.table_name == 'moviemate_movies' and change.title}
+    trustworthiness = run_rating_pipeline(connection, changed_titles=titles, state_file=state_file, **options)
+    repository.ack_changes(consumer, upto)
+    return trustworthiness
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            run_rating_pipeline(connection)
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pymysql
+import scipy.sparse as sp
+
+# 数据访问层 movie_repository 在 ../数据库代码 中
+MOVIE_REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '数据库代码')
+if MOVIE_REPOSITORY_DIR not in sys.path:
+    sys.path.append(MOVIE_REPOSITORY_DIR)
+
+from movie_repository import stream_rows
+
+# 参与相似度计算的字段及权重；同一字段内的多个取值以 '/' 分隔
+FEATURE_WEIGHTS = {
+    'genre': 1.0,
+    'director': 1.0,
+    'starring': 0.7,
+    'region': 0.5,
+    'decade': 0.5,
+}
+
+# 每部电影保存的相似电影数量
+TOP_K = 20
+
+# 超过这个电影数时改用近似最近邻索引
+EXACT_LIMIT = 50000
+
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+
+def split_values(text):
+    return [value.strip() for value in re.split(r'[/,，]', str(text or '')) if value.strip()]
+
+
+# 读取电影目录
+def read_movies(connection):
+    """
+    功能:
+    - 流式读取 moviemate_movies，同名电影只保留第一条。
+
+    输入:
+    - connection: pymysql 连接。
+
+    输出:
+    - movies: 字典列表，键为 title、genre、director、starring、region、year、mm_rating、poster_url、detail_url。
+    """
+    sql = ('SELECT title, genre, director, starring, region, year, mm_rating, poster_url, detail_url '
+           'FROM moviemate_movies')
+    keys = ['title', 'genre', 'director', 'starring', 'region', 'year', 'mm_rating', 'poster_url', 'detail_url']
+    movies, seen = [], set()
+    for row in stream_rows(connection, sql):
+        if row[0] not in seen:
+            seen.add(row[0])
+            movies.append(dict(zip(keys, row)))
+    return movies
+
+
+# 一部电影的特征
+def movie_tokens(movie):
+    """
+    功能:
+    - 把电影的类型、导演、主演、地区和年代编码为 '字段:取值' 特征，同一特征只出现一次。
+
+    输入:
+    - movie: 电影字典。
+
+    输出:
+    - tokens: (特征, 字段权重) 列表。
+    """
+    year = YEAR_PATTERN.search(str(movie.get('year') or ''))
+    fields = {
+        'genre': split_values(movie.get('genre')),
+        'director': split_values(movie.get('director')),
+        'starring': split_values(movie.get('starring')),
+        'region': split_values(movie.get('region')),
+        'decade': [f'{int(year.group(0)) // 10 * 10}s'] if year else [],
+    }
+    return [(f'{field}:{value}', FEATURE_WEIGHTS[field]) for field, values in fields.items()
+            for value in dict.fromkeys(values)]
+
+
+# 构建稀疏特征矩阵
+def build_features(movies):
+    """
+    功能:
+    - 把每部电影的特征（见 movie_tokens）按 IDF × 字段权重加权后做 L2 归一化，
+      两部电影的余弦相似度即两行的内积。
+
+    输入:
+    - movies: read_movies 的输出。
+
+    输出:
+    - features: scipy.sparse.csr_matrix，形状为 (电影数, 特征数)。
+    - tokens: 特征名称列表，与 features 的列一一对应。
+    """
+    vocabulary = {}
+    rows, columns, weights = [], [], []
+    for i, movie in enumerate(movies):
+        for token, weight in movie_tokens(movie):
+            rows.append(i)
+            columns.append(vocabulary.setdefault(token, len(vocabulary)))
+            weights.append(weight)
+
+    features = sp.csr_matrix((np.array(weights, dtype=np.float32), (rows, columns)),
+                             shape=(len(movies), len(vocabulary)))
+
+    # 常见取值（如 '剧情'、'美国'）的权重降低
+    document_frequency = np.bincount(features.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(movies)) / (1 + document_frequency)).astype(np.float32) + 1
+    features = features @ sp.diags(idf)
+
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+    features = sp.csr_matrix(sp.diags(1 / np.maximum(norms, 1e-12)) @ features, dtype=np.float32)
+    return features, list(vocabulary)
+
+
+# 计算每部电影的 top-K 相似电影
+def top_k_neighbours(features, ratings=None, k=TOP_K, chunk_size=512):
+    """
+    功能:
+    - 分块计算余弦相似度，每块只保留每行相似度最高的 k 部电影（排除自身），内存占用为 chunk_size × 电影数。
+    - 相似度相同时按 ratings 从高到低排列。
+
+    输入:
+    - features: build_features 的输出。
+    - ratings: 可选的评分数组，用于打破平局。
+    - k: 每部电影保留的相似电影数量。
+    - chunk_size: 每块的电影数量。
+
+    输出:
+    - neighbours: int32 数组，形状为 (电影数, k)，不足 k 部时以 -1 填充。
+    - scores: float32 数组，对应的相似度。
+    """
+    n = features.shape[0]
+    k = min(k, max(n - 1, 0))
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if k == 0:
+        return neighbours, scores
+
+    # 评分只在相似度相同时起作用
+    tie_break = np.zeros(n) if ratings is None else np.nan_to_num(np.asarray(ratings, dtype=np.float64)) * 1e-6
+    transposed = features.T.tocsr()
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        similarity = (features[start:stop] @ transposed).toarray() + tie_break
+        similarity[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+        # 没有任何共同特征的电影不算相似
+        found = top_scores >= 1e-4
+        neighbours[start:stop] = np.where(found, top, -1)
+        scores[start:stop] = np.where(found, top_scores - tie_break[top], 0)
+    return neighbours, scores
+
+
+# 保存相似电影表
+def save_similar_movies(output_file, movies, neighbours, scores, features, tokens):
+    """
+    功能:
+    - 把相似电影表保存为 .npz，web 端启动时整体载入内存，按标题查表即可得到推荐。
+    - 同时保存特征矩阵和特征名称，web 端据此维护每个用户的兴趣画像并打分。
+
+    输入:
+    - output_file: str类型，输出文件路径。
+    - movies: read_movies 的输出。
+    - neighbours, scores: top_k_neighbours 的输出。
+    - features, tokens: build_features 的输出。
+
+    输出:
+    - 无直接输出，数据写入 output_file。
+    """
+    def column(key):
+        return np.array([str(movie.get(key) or '') for movie in movies], dtype=str)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    np.savez(
+        output_file,
+        titles=column('title'),
+        mm_ratings=column('mm_rating'),
+        poster_urls=column('poster_url'),
+        detail_urls=column('detail_url'),
+        neighbours=neighbours,
+        scores=scores,
+        feature_indptr=features.indptr.astype(np.int64),
+        feature_indices=features.indices.astype(np.int32),
+        feature_values=features.data.astype(np.float32),
+        tokens=np.array(tokens, dtype=str),
+    )
+
+
+def parse_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# 离线任务：从数据库构建相似电影表
+def build_similar_movies(connection, output_file, k=TOP_K, exact_limit=EXACT_LIMIT, index_dir=None):
+    """
+    功能:
+    - 读取电影目录并计算每部电影的 top-K 相似电影。电影数不超过 exact_limit 时两两精确比较，
+      否则用近似最近邻索引（ann_index.MovieIndex），索引可保存到 index_dir 供之后增量插入。
+    """
+    start = time.perf_counter()
+    movies = read_movies(connection)
+    features, tokens = build_features(movies)
+    print(f"{len(movies)} 部电影、{len(tokens)} 个特征，耗时 {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    ratings = [parse_float(movie['mm_rating']) for movie in movies]
+    if len(movies) <= exact_limit:
+        neighbours, scores = top_k_neighbours(features, ratings, k)
+    else:
+        # ann_index 依赖本模块的 movie_tokens，在这里导入以避免循环导入
+        from ann_index import MovieIndex, index_top_k_neighbours
+        index = MovieIndex().build(movies)
+        print(f"近似索引扫描 {index.n_probe}/{len(index.centroids)} 个簇，recall@10 为 {index.recall:.3f}")
+        if index_dir:
+            index.save(index_dir)
+        neighbours, scores = index_top_k_neighbours(index, k, ratings=ratings)
+    save_similar_movies(output_file, movies, neighbours, scores, features, tokens)
+    print(f"相似电影计算完成，耗时 {time.perf_counter() - start:.2f}s，已保存到 {output_file}")
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            build_similar_movies(connection, '../GUI/gui/data/similar_movies.npz')
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
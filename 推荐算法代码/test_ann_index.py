@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from ann_index import RECALL_TARGET, MovieIndex, evaluate_index, index_top_k_neighbours
+
+
+def synthetic_movies(n, seed=0):
+    # 导演、主演集中在少数几个“圈子”里，使向量有簇结构
+    rng = np.random.default_rng(seed)
+    movies = []
+    for i in range(n):
+        circle = int(rng.integers(20))
+        movies.append({
+            'title': f'电影{i}',
+            'genre': '/'.join(f'类型{g}' for g in rng.choice(12, 2, replace=False)),
+            'director': f'导演{circle}-{rng.integers(5)}',
+            'starring': '/'.join(f'演员{circle}-{a}' for a in rng.choice(15, 3, replace=False)),
+            'region': f'地区{circle % 6}',
+            'year': str(1950 + int(rng.integers(70))),
+            'mm_rating': str(round(float(rng.uniform(3, 9)), 1)),
+        })
+    return movies
+
+
+class MovieIndexTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.movies = synthetic_movies(3000)
+        cls.index = MovieIndex().build(cls.movies)
+
+    def test_calibrated_n_probe_meets_recall_target(self):
+        self.assertGreaterEqual(self.index.recall, RECALL_TARGET)
+        self.assertLessEqual(self.index.n_probe, len(self.index.centroids))
+        result, = evaluate_index(self.index, 200, 10, [self.index.n_probe], seed=1)
+        self.assertGreaterEqual(result['recall'], RECALL_TARGET - 0.05)
+
+    def test_uncalibrated_index_requires_n_probe(self):
+        index = MovieIndex()
+        index.centroids = self.index.centroids
+        with self.assertRaises(ValueError):
+            index.search(self.index.vector(0))
+
+    def test_save_and_load_keep_n_probe(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.index.save(directory)
+            loaded = MovieIndex.load(directory, mmap_mode=None)
+        self.assertEqual((loaded.n_probe, loaded.recall), (self.index.n_probe, self.index.recall))
+        self.assertEqual(loaded.search_title('电影7'), self.index.search_title('电影7'))
+
+    def test_batched_neighbours_match_per_movie_search(self):
+        for n_probe in (1, 3, self.index.n_probe):
+            neighbours, scores = index_top_k_neighbours(self.index, 10, n_probe)
+            for movie_id in range(0, self.index.size, 97):
+                ids, found = self.index.search(self.index.vector(movie_id), 10, n_probe, exclude=movie_id)
+                keep = found >= 1e-4
+                self.assertEqual(set(neighbours[movie_id][neighbours[movie_id] >= 0]), set(ids[keep]), n_probe)
+                np.testing.assert_allclose(np.sort(scores[movie_id][neighbours[movie_id] >= 0]),
+                                           np.sort(found[keep]), atol=1e-5)
+
+    def test_filter_and_rating_tie_break(self):
+        # 电影 0、1、2 特征完全相同，评分不同；电影 3 没有任何特征
+        twin = {'genre': '类型甲/类型乙', 'director': '导演甲', 'starring': '演员甲', 'region': '地区甲', 'year': '1990'}
+        movies = [dict(twin, title='a', mm_rating='6.0'), dict(twin, title='b', mm_rating='9.0'),
+                  dict(twin, title='c', mm_rating='7.0'), {'title': 'd'}] + synthetic_movies(200, seed=2)
+        index = MovieIndex().build(movies)
+        ratings = [float(movie['mm_rating']) if movie.get('mm_rating') else np.nan for movie in movies]
+        neighbours, scores = index_top_k_neighbours(index, 5, len(index.centroids), ratings)
+        self.assertEqual(neighbours[0, :2].tolist(), [1, 2])
+        self.assertAlmostEqual(float(scores[0, 0]), 1.0, places=5)
+        self.assertEqual(neighbours[3].tolist(), [-1] * 5)
+        self.assertTrue(np.all(scores[neighbours < 0] == 0))
+        self.assertTrue(np.all(scores[neighbours >= 0] >= 1e-4 - 1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import batch_recommendations
+from batch_recommendations import movie_chunk, prepare_checkpoints
+from similar_movies import build_features, top_k_neighbours
+
+
+def movies(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'title': f'电影{i}', 'genre': f'类型{rng.integers(4)}/类型{rng.integers(4, 8)}',
+             'director': f'导演{rng.integers(6)}', 'starring': f'演员{rng.integers(10)}/演员{rng.integers(10, 20)}',
+             'region': f'地区{rng.integers(3)}', 'year': str(1960 + int(rng.integers(60)))} for i in range(n)]
+
+
+class MovieChunkTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        features, _ = build_features(movies(60))
+        rng = np.random.default_rng(1)
+        factors = rng.normal(size=(60, 8)).astype(np.float32)
+        names = ['_features', '_transposed', '_neighbours', '_scores', '_item_factors']
+        saved = {name: getattr(batch_recommendations, name) for name in names}
+        self.addCleanup(lambda: [setattr(batch_recommendations, name, value) for name, value in saved.items()])
+        batch_recommendations._features = features
+        batch_recommendations._transposed = features.T.tocsr()
+        batch_recommendations._item_factors = factors / np.linalg.norm(factors, axis=1, keepdims=True)
+        self.features = features
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def chunk(self, name, exact):
+        movie_chunk(self.directory.name, name, 0, 60, 10, exact)
+        return np.load(os.path.join(self.directory.name, f'{name}.npy'))
+
+    def test_neighbour_table_matches_exact_when_it_holds_every_candidate(self):
+        # 相似电影表包含所有内容相似的电影时，只有内容得分的两种方式结果相同
+        batch_recommendations._item_factors = None
+        batch_recommendations._neighbours, batch_recommendations._scores = top_k_neighbours(self.features, k=59)
+        exact = self.chunk('exact', True)
+        table = self.chunk('table', False)
+        np.testing.assert_array_equal(exact >= 0, table >= 0)
+        exact_scores = (self.features @ self.features.T).toarray()
+        for movie in range(60):
+            found = exact[movie] >= 0
+            np.testing.assert_allclose(exact_scores[movie, exact[movie][found]],
+                                       exact_scores[movie, table[movie][found]], atol=1e-6)
+
+    def test_cf_rescoring_on_candidates(self):
+        neighbours, scores = top_k_neighbours(self.features, k=59)
+        batch_recommendations._neighbours, batch_recommendations._scores = neighbours, scores
+        table = self.chunk('table', False)
+        factors = batch_recommendations._item_factors
+        for movie in range(0, 60, 7):
+            candidates = neighbours[movie][neighbours[movie] >= 0]
+            hybrid = scores[movie][:len(candidates)] + batch_recommendations.CF_WEIGHT * (factors[candidates] @ factors[movie])
+            order = np.argsort(-hybrid, kind='stable')[:10]
+            expected = candidates[order][hybrid[order] > 1e-4]
+            self.assertEqual(table[movie][table[movie] >= 0].tolist(), expected.tolist())
+
+class PrepareCheckpointsTests(unittest.TestCase):
+    def test_changed_user_watermark_discards_checkpoints(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_dir = os.path.join(directory, 'checkpoints')
+            inputs = {'similar_file': 1.0, 'users': [3, 2, '2024-01-01 00:00:00', 10, 10]}
+            prepare_checkpoints(checkpoint_dir, inputs)
+            open(os.path.join(checkpoint_dir, 'users_000000000.npy'), 'w').close()
+
+            prepare_checkpoints(checkpoint_dir, json.loads(json.dumps(inputs)))
+            self.assertTrue(os.path.exists(os.path.join(checkpoint_dir, 'users_000000000.npy')))
+
+            # 用户数不变，但有新的交互记录
+            prepare_checkpoints(checkpoint_dir, dict(inputs, users=[3, 2, '2024-01-01 00:00:00', 11, 11]))
+            self.assertFalse(os.path.exists(os.path.join(checkpoint_dir, 'users_000000000.npy')))
+
+
+if __name__ == '__main__':
+    unittest.main()
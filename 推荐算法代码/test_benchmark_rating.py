@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+
+import benchmark_rating
+from 真值推荐算法 import update_trustworthiness
+
+
+class RunBenchmarkTests(unittest.TestCase):
+    def test_timed_pass_runs_without_tracemalloc(self):
+        tracing = []
+
+        def traced_update(*args, **kwargs):
+            tracing.append(tracemalloc.is_tracing())
+            return update_trustworthiness(*args, **kwargs)
+
+        with mock.patch.object(benchmark_rating, 'update_trustworthiness', traced_update):
+            result = benchmark_rating.run_benchmark(200, seed=1)
+        # 第一遍计时，第二遍只测内存
+        self.assertEqual(tracing, [False, True])
+        self.assertGreater(result['peak_memory_bytes'], 0)
+        self.assertEqual(result['iterations'], len(result['trust_trajectory']))
+
+    def test_noise_and_bias_are_recorded(self):
+        result = benchmark_rating.run_benchmark(500, 3, noise=[0.1, 0.1, 2.0], bias=[0.0, 0.0, 1.0], seed=1)
+        self.assertEqual((result['noise'], result['bias'], result['seed']), ([0.1, 0.1, 2.0], [0.0, 0.0, 1.0], 1))
+        # 噪声大、有偏差的来源可信度最低
+        self.assertLess(result['trust']['来源2'], min(result['trust']['来源0'], result['trust']['来源1']))
+
+
+class MainTests(unittest.TestCase):
+    def run_main(self, *args):
+        with mock.patch.object(sys, 'argv', ['benchmark_rating.py', *args]), mock.patch('builtins.print'):
+            benchmark_rating.main()
+
+    def test_cli_passes_noise_and_bias(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'result.json')
+            self.run_main('--movies', '100', '--sources', '2', '--noise', '0.3', '0.6', '--bias', '0', '-0.5',
+                          '--output', output)
+            with open(output, 'r', encoding='utf-8') as file:
+                result = json.load(file)['results'][0]
+        self.assertEqual((result['n_sources'], result['noise'], result['bias']), (2, [0.3, 0.6], [0.0, -0.5]))
+
+    def test_cli_rejects_wrong_number_of_values(self):
+        with mock.patch('sys.stderr'), self.assertRaises(SystemExit):
+            self.run_main('--movies', '100', '--sources', '3', '--noise', '0.3', '0.6')
+
+
+if __name__ == '__main__':
+    unittest.main()
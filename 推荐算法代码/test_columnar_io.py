@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from columnar_io import convert_to_parquet, read_columns, write_columns
+
+
+def typed_frame():
+    return pd.DataFrame({
+        # 文本列使用 pandas 默认的字符串类型，读回时应得到同样的类型
+        'title': pd.Series(['霸王别姬', '活着', None]),
+        'year': np.array([1993, 1994, 2019], dtype=np.int64),
+        'rating': np.array([9.6, 9.3, np.nan], dtype=np.float32),
+        'votes': pd.array([2000000, None, 15], dtype='Int64'),
+        'released': pd.to_datetime(['1993-07-26', '1994-05-17', None]),
+        'is_remake': np.array([False, False, True]),
+        'genre': pd.Categorical(['剧情', '剧情', '爱情']),
+    })
+
+
+class ColumnarRoundTripTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_round_trip_preserves_dtypes(self):
+        df = typed_frame()
+        for name in ('movies.parquet', 'movies.feather', 'movies.arrow'):
+            write_columns(df, self.path(name))
+            result = read_columns(self.path(name))
+            pd.testing.assert_frame_equal(result, df, obj=name)
+            self.assertEqual(result.dtypes.to_dict(), df.dtypes.to_dict(), name)
+
+    def test_selected_columns_ignore_missing(self):
+        df = typed_frame()
+        for name in ('movies.parquet', 'movies.arrow'):
+            write_columns(df, self.path(name))
+            result = read_columns(self.path(name), ['rating', 'title', 'no_such_column'])
+            self.assertEqual(sorted(result.columns), ['rating', 'title'], name)
+            pd.testing.assert_series_equal(result['rating'], df['rating'], obj=name)
+
+    def test_arrow_writes_filtered_frame_with_non_default_index(self):
+        df = typed_frame()
+        subset = df[df['year'] > 1993]
+        write_columns(subset, self.path('movies.arrow'))
+        pd.testing.assert_frame_equal(read_columns(self.path('movies.arrow')), subset.reset_index(drop=True))
+
+    def test_csv_and_excel(self):
+        df = pd.DataFrame({'title': ['霸王别姬', '活着'], 'year': [1993, 1994], 'rating': [9.6, 9.3]})
+        df.to_csv(self.path('movies.csv'), index=False)
+        df.to_excel(self.path('movies.xlsx'), index=False)
+        for name in ('movies.csv', 'movies.xlsx'):
+            pd.testing.assert_frame_equal(read_columns(self.path(name)), df, obj=name)
+            self.assertEqual(list(read_columns(self.path(name), ['rating', 'title']).columns), ['title', 'rating'])
+
+    def test_convert_to_parquet(self):
+        df = pd.DataFrame({'title': ['霸王别姬', '活着'], 'year': ['1993', '']})
+        df.to_csv(self.path('movies.csv'), index=False)
+        output_file = convert_to_parquet(self.path('movies.csv'), dtype=str)
+        self.assertEqual(output_file, self.path('movies.parquet'))
+        result = read_columns(output_file)
+        # dtype=str 时年份保持为文本，空单元格为缺失值
+        self.assertTrue(pd.api.types.is_string_dtype(result['year']))
+        self.assertEqual(result['year'][0], '1993')
+        self.assertTrue(pd.isna(result['year'][1]))
+
+    def test_unsupported_formats(self):
+        with self.assertRaises(ValueError):
+            write_columns(typed_frame(), self.path('movies.xlsx'))
+        with self.assertRaises(ValueError):
+            read_columns(self.path('movies.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
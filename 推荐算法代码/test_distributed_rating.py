@@ -0,0 +1,51 @@
+import csv
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from distributed_rating import build_partition, finalize_partition, load_entries, partition_path
+
+
+def write_rows(work_dir, partition, name, rows):
+    with open(partition_path(work_dir, partition, f'{name}.csv'), 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+
+
+class BuildPartitionTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.work_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_duplicate_titles_keep_last_rating_per_source(self):
+        # 豆瓣的同一部电影在两个 id 区间各出现一次、区间内又重复一次，只保留 id 最大的一条
+        write_rows(self.work_dir, 0, '豆瓣-000000000001', [(1, 'a', 7.0), (5, 'a', 8.0)])
+        write_rows(self.work_dir, 0, '豆瓣-000000000100', [(120, 'a', 9.0), (130, 'b', 6.0)])
+        write_rows(self.work_dir, 0, '猫眼-000000000001', [(3, 'a', 8.5)])
+        count = build_partition(self.work_dir, 0, ['IMDb', '猫眼', '豆瓣'])
+
+        self.assertEqual(count, 3)
+        entries = load_entries(self.work_dir, 0)
+        ratings = {(int(movie), int(source)): float(rating) for movie, source, rating in entries.tolist()}
+        self.assertEqual(ratings, {(0, 2): 9.0, (0, 1): 8.5, (1, 2): 6.0})
+        # 各区间的来源文件读取后删除
+        self.assertEqual(sorted(os.listdir(self.work_dir)), ['part-0000.entries.npy', 'part-0000.titles.csv'])
+
+    def test_final_ratings_match_single_rating_per_source(self):
+        write_rows(self.work_dir, 0, '豆瓣-000000000001', [(1, 'a', 6.0), (2, 'a', 6.0), (3, 'a', 6.0)])
+        write_rows(self.work_dir, 0, '猫眼-000000000001', [(1, 'a', 9.0)])
+        build_partition(self.work_dir, 0, ['IMDb', '猫眼', '豆瓣'])
+        path = finalize_partition(self.work_dir, 0, np.array([1.0, 1.0, 1.0]))
+        with open(path, encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        # 重复的豆瓣评分不应增加权重：(6 + 9) / 2
+        self.assertEqual(rows[1][0], 'a')
+        self.assertAlmostEqual(float(rows[1][1]), 7.5, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from implicit_als import current_model_dir, implicit_loss, recommend_all, save_model, train_implicit_als
+
+
+def block_interactions(n_users=40, n_items=20, seed=0):
+    # 前一半用户只看前一半电影，后一半用户只看后一半电影，每个用户随机看其中一部分
+    rng = np.random.default_rng(seed)
+    dense = np.zeros((n_users, n_items), dtype=np.float32)
+    half_users, half_items = n_users // 2, n_items // 2
+    dense[:half_users, :half_items] = rng.random((half_users, half_items)) < 0.5
+    dense[half_users:, half_items:] = rng.random((n_users - half_users, n_items - half_items)) < 0.5
+    dense *= rng.integers(1, 4, dense.shape)
+    return sp.csr_matrix(dense)
+
+
+def dense_loss(interactions, user_factors, item_factors, regularization, alpha):
+    # 直接展开 用户 × 电影 矩阵计算的目标函数
+    counts = interactions.toarray()
+    confidence = 1 + alpha * counts
+    preference = (counts > 0).astype(np.float64)
+    predictions = user_factors.astype(np.float64) @ item_factors.T.astype(np.float64)
+    return float(np.sum(confidence * (preference - predictions) ** 2)
+                 + regularization * (np.sum(user_factors.astype(np.float64) ** 2)
+                                     + np.sum(item_factors.astype(np.float64) ** 2)))
+
+
+class ImplicitLossTests(unittest.TestCase):
+    def test_matches_dense_objective(self):
+        interactions = block_interactions(12, 9)
+        rng = np.random.default_rng(1)
+        user_factors = rng.standard_normal((12, 4)).astype(np.float32)
+        item_factors = rng.standard_normal((9, 4)).astype(np.float32)
+        confidence = interactions.copy()
+        confidence.data = 1 + 10.0 * confidence.data
+        self.assertAlmostEqual(implicit_loss(confidence, user_factors, item_factors, 0.1),
+                               dense_loss(interactions, user_factors, item_factors, 0.1, 10.0), delta=1e-2)
+
+
+class TrainImplicitAlsTests(unittest.TestCase):
+    def test_loss_decreases_and_shapes(self):
+        interactions = block_interactions()
+        history = []
+        user_factors, item_factors = train_implicit_als(interactions, factors=8, iterations=8, max_workers=2,
+                                                        history=history)
+        self.assertEqual(user_factors.shape, (40, 8))
+        self.assertEqual(item_factors.shape, (20, 8))
+        self.assertEqual(user_factors.dtype, np.float32)
+        self.assertEqual([record['iteration'] for record in history], list(range(1, 9)))
+        losses = [record['loss'] for record in history]
+        self.assertLess(losses[-1], losses[0])
+        self.assertTrue(all(later <= earlier * 1.01 for earlier, later in zip(losses, losses[1:])))
+
+    def test_same_seed_is_deterministic(self):
+        interactions = block_interactions()
+        first = train_implicit_als(interactions, factors=4, iterations=3, max_workers=1, seed=3)
+        second = train_implicit_als(interactions, factors=4, iterations=3, max_workers=3, seed=3)
+        np.testing.assert_allclose(first[0], second[0], rtol=1e-4, atol=1e-5)
+        np.testing.assert_allclose(first[1], second[1], rtol=1e-4, atol=1e-5)
+
+    def test_empty_rows_and_columns(self):
+        interactions = sp.csr_matrix(np.array([[1, 0, 0], [0, 0, 0], [2, 0, 1]], dtype=np.float32))
+        user_factors, item_factors = train_implicit_als(interactions, factors=2, iterations=2, max_workers=1)
+        self.assertTrue(np.all(np.isfinite(user_factors)) and np.all(np.isfinite(item_factors)))
+
+
+class RecommendAllTests(unittest.TestCase):
+    def test_recommends_unseen_items_from_own_block(self):
+        interactions = block_interactions()
+        # 因子维度等于分块数时模型只能学到分块结构
+        user_factors, item_factors = train_implicit_als(interactions, factors=2, iterations=10, max_workers=2)
+        top_items = recommend_all(user_factors, item_factors, interactions, n=3, chunk_size=7)
+        self.assertEqual(top_items.shape, (40, 3))
+        self.assertEqual(top_items.dtype, np.int32)
+        seen = interactions.toarray() > 0
+        for user, items in enumerate(top_items):
+            self.assertFalse(seen[user, items[items >= 0]].any())
+            # 同一半中还没看过的电影排在前面
+            own = np.arange(10) + (0 if user < 20 else 10)
+            expected = min(3, int((~seen[user, own]).sum()))
+            self.assertTrue(np.isin(items[:expected], own).all())
+
+    def test_sorted_by_score_and_padded(self):
+        user_factors = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        item_factors = np.array([[3.0, 0.0], [1.0, 1.0], [2.0, 0.0]], dtype=np.float32)
+        interactions = sp.csr_matrix(np.array([[0, 0, 0], [1, 1, 0]], dtype=np.float32))
+        top_items = recommend_all(user_factors, item_factors, interactions, n=3)
+        self.assertEqual(top_items[0].tolist(), [0, 2, 1])
+        # 第二个用户只剩一部没交互过的电影
+        self.assertEqual(top_items[1].tolist(), [2, -1, -1])
+        self.assertEqual(recommend_all(user_factors, item_factors[:0], interactions[:, :0]).shape, (2, 0))
+
+
+class SaveModelTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def save(self, value, keep=2):
+        return save_model(self.path, ['u1', 'u2'], ['m1'], np.full((2, 3), value, dtype=np.float32),
+                          np.full((1, 3), value, dtype=np.float32), np.zeros((2, 1), dtype=np.int32), keep=keep)
+
+    def test_current_points_to_complete_version(self):
+        version = self.save(1.0)
+        self.assertEqual(current_model_dir(self.path), version)
+        self.assertEqual(sorted(os.listdir(version)), ['item_factors.npy', 'meta.json', 'top_items.npy',
+                                                       'user_factors.npy'])
+        with open(os.path.join(version, 'meta.json'), 'r', encoding='utf-8') as file:
+            self.assertEqual(json.load(file), {'users': ['u1', 'u2'], 'items': ['m1']})
+        # 没有残留的临时目录或临时指针文件
+        self.assertEqual(sorted(os.listdir(self.path)), sorted(['CURRENT', os.path.basename(version)]))
+
+    def test_mapped_previous_version_is_not_rewritten(self):
+        first = self.save(1.0)
+        mapped = np.load(os.path.join(first, 'user_factors.npy'), mmap_mode='r')
+        second = self.save(2.0)
+        self.assertNotEqual(first, second)
+        self.assertEqual(current_model_dir(self.path), second)
+        # 旧版本仍在内存映射中的数据不变
+        self.assertEqual(float(mapped[0, 0]), 1.0)
+        self.assertEqual(float(np.load(os.path.join(second, 'user_factors.npy'))[0, 0]), 2.0)
+
+    def test_old_versions_are_pruned(self):
+        versions = [self.save(float(i)) for i in range(4)]
+        self.assertEqual([os.path.exists(version) for version in versions], [False, False, True, True])
+        self.save(9.0, keep=1)
+        self.assertEqual(len([name for name in os.listdir(self.path) if name != 'CURRENT']), 1)
+
+    def test_legacy_layout_without_current(self):
+        self.assertEqual(current_model_dir(self.path), self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+from unittest import mock
+
+import leaderboards
+
+
+def movie(title, rating, poster, genre='剧情', region='中国'):
+    return {'title': title, 'genre': genre, 'region': region, 'rating': rating,
+            'poster_url': poster, 'detail_url': 'https://movie/' + title}
+
+
+def entry(movie):
+    return {key: movie[key] for key in ('title', 'rating', 'poster_url', 'detail_url')}
+
+
+class UpdateLeaderboardsTests(unittest.TestCase):
+    # 用内存中的电影列表和榜单代替数据库，增量更新的结果应与全量重建一致
+    def setUp(self):
+        self.movies = [
+            movie('霸王别姬', 9.6, 'p1'),
+            movie('霸王别姬', 8.0, 'p9'),
+            movie('活着', 9.3, 'p2'),
+            # 与《活着》共用海报，被去重挤掉
+            movie('活着（修复版）', 9.1, 'p2'),
+            movie('阳光灿烂的日子', 8.8, 'p3', region='中国 / 香港'),
+        ]
+        self.stored, self.truncated, self.rebuilds = {}, set(), []
+        self.rebuild(None, 'moviemate')
+        patches = [
+            mock.patch.object(leaderboards, 'read_movies', self.read_movies),
+            mock.patch.object(leaderboards, 'read_boards', self.read_boards),
+            mock.patch.object(leaderboards, 'read_truncated', self.read_truncated),
+            mock.patch.object(leaderboards, 'write_boards', self.write_boards),
+            mock.patch.object(leaderboards, 'create_leaderboard_table'),
+            mock.patch.object(leaderboards, 'rebuild_leaderboards', self.rebuild),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.connection = mock.MagicMock()
+
+    def full_rebuild(self, boards=None):
+        # {榜单: (条目, 是否截断)}
+        entries = {}
+        for item in self.movies:
+            for board in leaderboards.movie_boards(item):
+                if boards is None or board in boards:
+                    entries.setdefault(board, []).append(item)
+        result = {}
+        for board, items in entries.items():
+            ranked, cut = leaderboards.rank_board(items)
+            result[board] = ([entry(item) for item in ranked], cut)
+        return result
+
+    def read_movies(self, connection, source, values, column='title'):
+        return [dict(item) for item in self.movies if item[column] in set(values)]
+
+    def read_boards(self, connection, source, boards=None, titles=None):
+        return {board: [dict(item) for item in entries] for board, entries in self.stored.items()
+                if board in (boards or ()) or any(item['title'] in (titles or ()) for item in entries)}
+
+    def read_truncated(self, connection, source, boards):
+        return {board: board in self.truncated for board in boards if board in self.stored}
+
+    def write_boards(self, cursor, source, boards, truncated):
+        self.stored.update({board: [entry(item) for item in entries] for board, entries in boards.items()})
+        self.truncated = (self.truncated - set(boards)) | (truncated & set(boards))
+
+    def rebuild(self, connection, source, boards=None):
+        rebuilt = self.full_rebuild(boards)
+        self.write_boards(None, source, {board: entries for board, (entries, _) in rebuilt.items()},
+                          {board for board, (_, cut) in rebuilt.items() if cut})
+        self.rebuilds.append(set(rebuilt))
+        return len(rebuilt)
+
+    def assert_matches_full_rebuild(self):
+        # 页面读取的前 LEADERBOARD_SIZE 条与完整重建一致
+        size = leaderboards.LEADERBOARD_SIZE
+        expected = {board: entries[:size] for board, (entries, _) in self.full_rebuild().items()}
+        self.assertEqual({board: entries[:size] for board, entries in self.stored.items() if entries}, expected)
+
+    def test_rating_change(self):
+        self.movies[2]['rating'] = 7.0
+        leaderboards.update_leaderboards(self.connection, ['活着'])
+        self.assert_matches_full_rebuild()
+
+    def test_poster_suppressed_movie_returns_when_holder_drops(self):
+        self.movies[2]['rating'] = 7.0
+        leaderboards.update_leaderboards(self.connection, ['活着'])
+        self.assertIn('活着（修复版）', [item['title'] for item in self.stored['overall']])
+        self.assert_matches_full_rebuild()
+
+    def test_poster_suppressed_movie_returns_when_holder_is_deleted(self):
+        del self.movies[2]
+        leaderboards.update_leaderboards(self.connection, ['活着'])
+        self.assertIn('活着（修复版）', [item['title'] for item in self.stored['genre:剧情']])
+        self.assert_matches_full_rebuild()
+
+    def test_poster_suppressed_movie_returns_when_holder_changes_poster(self):
+        self.movies[2]['poster_url'] = 'p7'
+        leaderboards.update_leaderboards(self.connection, ['活着'])
+        self.assert_matches_full_rebuild()
+
+    def test_same_title_suppressed_movie_returns(self):
+        self.movies[0]['rating'] = 5.0
+        leaderboards.update_leaderboards(self.connection, ['霸王别姬'])
+        self.assertEqual([item['poster_url'] for item in self.stored['overall'] if item['title'] == '霸王别姬'],
+                         ['p9'])
+        self.assert_matches_full_rebuild()
+
+    def test_region_change_moves_movie_between_boards(self):
+        self.movies[4]['region'] = '中国'
+        leaderboards.update_leaderboards(self.connection, ['阳光灿烂的日子'])
+        self.assert_matches_full_rebuild()
+
+    def test_truncated_board_rebuilds_after_several_removals(self):
+        # 缓冲区为 4 条、页面读取 3 条：第一次删除后榜单不再是满的，之后的删除仍要在不足 3 条时重建
+        self.movies = [movie(f'电影{i}', 9.0 - i * 0.1, f'p{i}') for i in range(8)]
+        with mock.patch.object(leaderboards, 'LEADERBOARD_DEPTH', 4), \
+                mock.patch.object(leaderboards, 'LEADERBOARD_SIZE', 3):
+            self.stored, self.truncated = {}, set()
+            self.rebuild(None, 'moviemate')
+            self.rebuilds = []
+            self.assertIn('overall', self.truncated)
+            self.assertEqual(len(self.stored['overall']), 4)
+
+            del self.movies[0]
+            leaderboards.update_leaderboards(self.connection, ['电影0'])
+            self.assertEqual(len(self.stored['overall']), 3)
+            self.assertIn('overall', self.truncated)
+            self.assertEqual(self.rebuilds, [])
+
+            del self.movies[0]
+            leaderboards.update_leaderboards(self.connection, ['电影1'])
+            self.assertIn('overall', self.rebuilds[0])
+            self.assert_matches_full_rebuild()
+
+            for title in ('电影2', '电影3', '电影4'):
+                self.movies = [item for item in self.movies if item['title'] != title]
+                leaderboards.update_leaderboards(self.connection, [title])
+                self.assert_matches_full_rebuild()
+            # 候选已经不超过缓冲区，重建后不再是截断的
+            self.assertEqual([item['title'] for item in self.stored['overall']], ['电影5', '电影6', '电影7'])
+            self.assertNotIn('overall', self.truncated)
+
+    def test_untruncated_board_is_not_rebuilt(self):
+        self.rebuilds = []
+        del self.movies[4]
+        leaderboards.update_leaderboards(self.connection, ['阳光灿烂的日子'])
+        self.assertEqual(self.rebuilds, [])
+        self.assert_matches_full_rebuild()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# rating_pipeline 把 ../数据库代码 加入 sys.path，需在 movie_repository 之前导入
+import rating_pipeline
+from movie_repository import MovieChange
+from benchmark_rating import generate_ratings
+from rating_matrix import RatingMatrix
+from 真值推荐算法 import update_final_ratings, update_trustworthiness
+
+
+class FakeRepository(object):
+    # 只实现 run_pending_ratings 用到的变更日志接口
+    changes = []
+    acked = []
+
+    def __init__(self, connection):
+        pass
+
+    def last_change_id(self, table=None):
+        return max((change.change_id for change in self.changes), default=0)
+
+    def pending_changes(self, consumer, tables=None, upto=None):
+        return [change for change in self.changes if change.change_id > max(self.acked, default=0)]
+
+    def ack_changes(self, consumer, upto):
+        self.acked.append(upto)
+
+
+def change(change_id, table, title):
+    return MovieChange(change_id, 1, table, 'update', b'', title)
+
+
+class RunPendingRatingsTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, 'state.npz')
+        FakeRepository.changes, FakeRepository.acked = [], []
+        self.dense = generate_ratings(500, n_sources=3, seed=4)[0].to_dense()
+        self.written = []
+        patches = [
+            mock.patch.object(rating_pipeline, 'MovieRepository', FakeRepository),
+            mock.patch.object(rating_pipeline, 'read_rating_matrix', self.read_rating_matrix),
+            mock.patch.object(rating_pipeline, 'write_back_ratings', self.write_back_ratings),
+            mock.patch.object(rating_pipeline, 'update_leaderboards', return_value=0),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_rating_matrix(self, connection, with_attributes=False):
+        titles = np.array([f'电影{i}' for i in range(len(self.dense))], dtype=object)
+        matrix = RatingMatrix.from_dense(self.dense, titles, ['IMDb', '猫眼', '豆瓣'])
+        return matrix, [''] * matrix.n_movies, [''] * matrix.n_movies
+
+    def write_back_ratings(self, connection, matrix, batch_size=5000, changed=None):
+        self.written.append(matrix.final_ratings.copy())
+        return matrix.n_movies
+
+    def run_pending(self, **options):
+        with mock.patch('incremental_rating.update_trustworthiness',
+                        wraps=rating_pipeline.update_trustworthiness) as full:
+            result = rating_pipeline.run_pending_ratings(None, state_file=self.state_file, **options)
+        return result, full.call_count
+
+    def test_no_changes_skips(self):
+        self.assertEqual(self.run_pending(), (None, 0))
+        self.assertEqual(self.written, [])
+
+    def test_second_run_is_incremental(self):
+        FakeRepository.changes = [change(1, 'douban_movies', '电影0')]
+        _, full_runs = self.run_pending()
+        self.assertEqual(full_runs, 1)
+        self.assertEqual(FakeRepository.acked, [1])
+
+        movie = np.flatnonzero(~np.isnan(self.dense[:, 0]))[2]
+        self.dense[movie, 0] += 0.3
+        FakeRepository.changes.append(change(2, 'moviemate_movies', '电影3'))
+        _, full_runs = self.run_pending()
+        self.assertEqual(full_runs, 0)
+        self.assertEqual(FakeRepository.acked, [1, 2])
+        # 只有评分变化的电影得到新的最终评分，其他电影沿用上次的结果
+        moved = np.flatnonzero(self.written[1] != self.written[0])
+        self.assertEqual(moved.tolist(), [movie])
+
+    def test_failed_write_back_discards_state(self):
+        FakeRepository.changes = [change(1, 'douban_movies', '电影0')]
+        self.run_pending()
+        with mock.patch.object(rating_pipeline, 'write_back_ratings', side_effect=RuntimeError('lost')):
+            with self.assertRaises(RuntimeError):
+                FakeRepository.changes.append(change(2, 'douban_movies', '电影1'))
+                self.run_pending()
+        self.assertFalse(os.path.exists(self.state_file))
+        self.assertEqual(FakeRepository.acked, [1])
+        # 下次重新完整计算
+        self.assertEqual(self.run_pending()[1], 1)
+
+
+class FakeDatabase(object):
+    # 只按前缀识别 read_rating_matrix 和 MovieRepository.write_ratings 发出的语句，用内存中的表执行
+    ENTITY_SQL = re.compile(r'SELECT e\.movie_id, (.+) FROM (\w+) AS s LEFT JOIN movie_entity AS e '
+                            r'ON e\.source = %s AND e\.source_key = (HEX\()?s\.`(\w+)`')
+    COLUMNS_SQL = re.compile(r'SELECT (`.+`) FROM (\w+)$')
+
+    def __init__(self, tables, entities):
+        self.tables = tables
+        # (来源, 记录键) -> 统一电影编号
+        self.entities = entities
+        self.updates = None
+
+
+class FakeCursor(object):
+    def __init__(self, database):
+        self.database = database
+        self.result = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def fetchmany(self, size):
+        rows, self.result = self.result[:size], self.result[size:]
+        return rows
+
+    def execute(self, sql, params=None):
+        database, sql = self.database, ' '.join(sql.split())
+        match = FakeDatabase.ENTITY_SQL.match(sql)
+        if match:
+            columns = [column.strip()[3:-1] for column in match.group(1).split(',')]
+            table, hexed, key = match.group(2), match.group(3), match.group(4)
+            self.result = [(database.entities.get((params[0], row[key].hex().upper() if hexed else row[key])),
+                            *(row[column] for column in columns))
+                           for row in sorted(database.tables[table], key=lambda row: row['id'])]
+        elif FakeDatabase.COLUMNS_SQL.match(sql):
+            match = FakeDatabase.COLUMNS_SQL.match(sql)
+            columns = [column.strip()[1:-1] for column in match.group(1).split(',')]
+            self.result = [tuple(row[column] for column in columns) for row in database.tables[match.group(2)]]
+        elif sql.startswith('SELECT COUNT(*) FROM information_schema.tables'):
+            self.result = [(1 if database.entities else 0,)]
+        elif sql.startswith('SELECT 1 FROM movie_entity'):
+            self.result = [(1,)] if database.entities else []
+        elif sql.startswith('CREATE TEMPORARY TABLE mm_rating_updates'):
+            database.updates = {}
+        elif sql.startswith('DROP TEMPORARY TABLE'):
+            pass
+        elif sql.startswith('SELECT m.title FROM mm_rating_updates'):
+            self.result = [(row['title'],) for row in database.tables['moviemate_movies']
+                           if row['id'] in database.updates and row['mm_rating'] != database.updates[row['id']][0]]
+        elif sql.startswith('UPDATE moviemate_movies AS m JOIN mm_rating_updates'):
+            self.rowcount = 0
+            for row in database.tables['moviemate_movies']:
+                if row['id'] in database.updates:
+                    row['mm_rating'], row['IMDB_rating'], row['maoyan_rating'] = database.updates[row['id']]
+                    self.rowcount += 1
+        else:
+            raise AssertionError(sql)
+
+    def executemany(self, sql, rows):
+        assert sql.startswith('INSERT IGNORE INTO mm_rating_updates(id, '), sql
+        for movie_id, *ratings in rows:
+            self.database.updates.setdefault(movie_id, tuple(ratings))
+
+
+class FakeConnection(object):
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, *args):
+        return FakeCursor(self.database)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def moviemate(movie_id, title, year):
+    return {'id': movie_id, 'title': title, 'genre': '剧情', 'year': year, 'detail_url': f'https://movie/{movie_id}',
+            'mm_rating': None, 'IMDB_rating': None, 'maoyan_rating': None}
+
+
+class SameTitleMoviesTests(unittest.TestCase):
+    # 不替换 read_rating_matrix 和写回，翻拍片（同名的不同电影）应各自得到自己的评分并按 id 写回
+    def setUp(self):
+        self.tables = {
+            'moviemate_movies': [moviemate(11, '小妇人', 1994), moviemate(12, '小妇人', 2019),
+                                 moviemate(13, '霸王别姬', 1993)],
+            'douban_movies': [{'id': 1, 'title': '小妇人', 'rating': '7.8', 'detail_url': 'd1'},
+                              {'id': 2, 'title': '小妇人', 'rating': '8.1', 'detail_url': 'd2'},
+                              {'id': 3, 'title': '霸王别姬', 'rating': '9.6', 'detail_url': 'd3'}],
+            'maoyan_movies': [{'id': 1, 'title': '小妇人', 'grade': '7.0', 'row_key': b'm1', 'image_url': 'i1'},
+                              {'id': 2, 'title': '小妇人', 'grade': '9.0', 'row_key': b'm2', 'image_url': 'i2'}],
+            'dytt_movies': [{'id': 1, 'title': '小妇人', 'imdb_rating': '7.3', 'download_link': 'l1'},
+                            {'id': 2, 'title': '小妇人', 'imdb_rating': '7.8', 'download_link': 'l2'}],
+        }
+
+    def resolved(self):
+        # 1994 年版为电影 1，2019 年版为电影 2，霸王别姬为电影 3
+        entities = {('moviemate', 'https://movie/11'): 1, ('moviemate', 'https://movie/12'): 2,
+                    ('moviemate', 'https://movie/13'): 3, ('douban', 'd1'): 1, ('douban', 'd2'): 2,
+                    ('douban', 'd3'): 3, ('dytt', 'l1'): 1, ('dytt', 'l2'): 2}
+        # 猫眼按 row_key 对齐，movie_entity 中存的是它的十六进制文本
+        for movie_id, row in enumerate(self.tables['maoyan_movies'], start=1):
+            entities[('maoyan', row['row_key'].hex().upper())] = movie_id
+        return FakeConnection(FakeDatabase(self.tables, entities))
+
+    def rate(self, connection):
+        matrix = rating_pipeline.read_rating_matrix(connection)
+        update_final_ratings(matrix, update_trustworthiness(matrix))
+        changed = []
+        updated = rating_pipeline.write_back_ratings(connection, matrix, changed=changed)
+        return matrix, updated, changed
+
+    def test_remakes_keep_separate_rows_and_ratings(self):
+        matrix, updated, changed = self.rate(self.resolved())
+        self.assertEqual(matrix.movie_ids.tolist(), [11, 12, 13])
+        self.assertEqual(matrix.titles.tolist(), ['小妇人', '小妇人', '霸王别姬'])
+        dense = matrix.to_dense()
+        columns = [matrix.sources[source] for source in ('IMDb', '猫眼', '豆瓣')]
+        self.assertEqual(dense[0, columns].tolist(), np.float32([7.3, 7.0, 7.8]).tolist())
+        self.assertEqual(dense[1, columns].tolist(), np.float32([7.8, 9.0, 8.1]).tolist())
+
+        self.assertEqual(updated, 3)
+        self.assertEqual(sorted(changed), ['小妇人', '小妇人', '霸王别姬'])
+        rows = {row['id']: row for row in self.tables['moviemate_movies']}
+        self.assertEqual((rows[11]['IMDB_rating'], rows[11]['maoyan_rating']), (7.3, 7.0))
+        self.assertEqual((rows[12]['IMDB_rating'], rows[12]['maoyan_rating']), (7.8, 9.0))
+        self.assertNotEqual(rows[11]['mm_rating'], rows[12]['mm_rating'])
+        self.assertEqual(rows[13]['mm_rating'], 9.6)
+
+        # 再次写回时评分没有变化
+        self.assertEqual(self.rate(self.resolved())[2], [])
+
+    def test_without_entities_same_title_rows_share_title_matches(self):
+        matrix, updated, _ = self.rate(FakeConnection(FakeDatabase(self.tables, {})))
+        self.assertEqual(matrix.movie_ids.tolist(), [11, 12, 13])
+        self.assertEqual(updated, 3)
+        rows = {row['id']: row for row in self.tables['moviemate_movies']}
+        # 按标题关联时无法区分翻拍片，同一来源最后一条评分写给所有同名的行
+        self.assertEqual(rows[11]['mm_rating'], rows[12]['mm_rating'])
+        self.assertEqual(rows[11]['maoyan_rating'], 9.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,334 @@
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmark_rating import generate_ratings
+from incremental_rating import incremental_update, load_rating_state
+from rating_matrix import RatingMatrix
+import 真值推荐算法
+from 真值推荐算法 import (convergence_report, movie_segments, update_final_ratings, update_segmented_trustworthiness,
+                    update_trustworthiness)
+
+
+# 改为稀疏矩阵之前的逐部电影循环，作为回归基准
+def baseline_trustworthiness(movie_ratings, max_iterations=100, tolerance=0.001):
+    unique_sources = movie_ratings['source'].unique()
+    trustworthiness = {source: 1.0 for source in unique_sources}
+    movie_ratings['final_rating'] = 0.0
+    movie_ratings['weighted_rating'] = 0.0
+    for _ in range(max_iterations):
+        previous_trust = trustworthiness.copy()
+        for movie_id in movie_ratings['movie_id'].unique():
+            movie_df = movie_ratings[movie_ratings['movie_id'] == movie_id]
+            total_weight = sum(trustworthiness[source] for source in movie_df['source'])
+            if total_weight == 0:
+                continue
+            weighted_sum = sum(trustworthiness[row['source']] * row['rating'] for _, row in movie_df.iterrows())
+            final_rating = weighted_sum / total_weight
+            movie_ratings.loc[movie_ratings['movie_id'] == movie_id, 'final_rating'] = final_rating
+            for _, row in movie_df.iterrows():
+                movie_ratings.loc[(movie_ratings['movie_id'] == movie_id) & (movie_ratings['source'] == row['source']),
+                                  'weighted_rating'] = abs(final_rating - row['rating'])
+        for source in unique_sources:
+            source_diffs = movie_ratings[movie_ratings['source'] == source]['weighted_rating']
+            trustworthiness[source] = 1.0 / (1.0 + source_diffs.mean())
+        trust_diff = max(abs(trustworthiness[source] - previous_trust[source]) for source in unique_sources)
+        if trust_diff < tolerance:
+            break
+    return trustworthiness
+
+
+def long_frame(matrix):
+    return pd.DataFrame({'movie_id': matrix.movie_ids[matrix.movie_codes], 'title': matrix.titles[matrix.movie_codes],
+                         'source': np.array(matrix.source_names, dtype=object)[matrix.source_idx],
+                         'rating': matrix.values.astype(np.float64)})
+
+
+def full_run(matrix):
+    trustworthiness = update_trustworthiness(matrix)
+    update_final_ratings(matrix, trustworthiness)
+    return trustworthiness
+
+
+class BaselineRegressionTests(unittest.TestCase):
+    def test_vectorized_matches_baseline_loop(self):
+        matrix, _ = generate_ratings(80, n_sources=3, missing_rate=0.3, bias=[0.0, 0.5, -0.3], seed=1)
+        movie_ratings = long_frame(matrix)
+        expected = baseline_trustworthiness(movie_ratings)
+        trustworthiness = full_run(matrix)
+        for source in matrix.source_names:
+            self.assertAlmostEqual(trustworthiness[source], expected[source], places=5)
+        final = movie_ratings.groupby('movie_id')['final_rating'].first()
+        np.testing.assert_allclose(matrix.final_ratings, final.loc[matrix.movie_ids].to_numpy(), atol=1e-3)
+
+    def test_sparse_layouts_agree(self):
+        dense = np.array([[7.0, np.nan, 8.0], [np.nan, np.nan, 6.5], [9.0, 8.5, np.nan]])
+        titles = np.array(['a', 'b', 'c'], dtype=object)
+        matrix = RatingMatrix.from_dense(dense, titles, ['IMDb', '猫眼', '豆瓣'])
+        self.assertEqual(matrix.indptr.tolist(), [0, 2, 3, 5])
+        np.testing.assert_array_equal(matrix.to_dense(), dense.astype(np.float32))
+        from_long = RatingMatrix.from_long_frame(long_frame(matrix).sample(frac=1.0, random_state=0))
+        self.assertEqual(from_long.titles.tolist(), titles.tolist())
+        self.assertEqual(full_run(from_long), full_run(matrix))
+
+    def test_accelerated_solvers_reach_same_fixed_point(self):
+        matrix, _ = generate_ratings(2000, n_sources=4, seed=2)
+        expected = update_trustworthiness(matrix, tolerance=1e-8, max_iterations=500)
+        for solver in ('aitken', 'anderson'):
+            trustworthiness = update_trustworthiness(matrix, tolerance=1e-8, max_iterations=500, solver=solver)
+            for source in matrix.source_names:
+                self.assertAlmostEqual(trustworthiness[source], expected[source], places=5, msg=solver)
+
+
+class SolverTests(unittest.TestCase):
+    def setUp(self):
+        self.matrix, _ = generate_ratings(3000, n_sources=5, missing_rate=0.3, bias=[0.0, 0.4, -0.2, 0.8, 0.0], seed=4)
+
+    def run_solver(self, solver, **kwargs):
+        history = []
+        trustworthiness = update_trustworthiness(self.matrix, max_iterations=500, history=history, solver=solver,
+                                                 **kwargs)
+        return trustworthiness, self.matrix.final_ratings.copy(), history
+
+    def test_solvers_agree_with_fixed_point_within_tolerance(self):
+        expected, expected_final, _ = self.run_solver('fixed_point', tolerance=1e-9)
+        for solver in ('aitken', 'anderson'):
+            trustworthiness, final, history = self.run_solver(solver, tolerance=1e-6)
+            self.assertTrue(convergence_report(history, 1e-6)['converged'], solver)
+            for source in self.matrix.source_names:
+                self.assertAlmostEqual(trustworthiness[source], expected[source], delta=1e-5, msg=solver)
+            np.testing.assert_allclose(final, expected_final, atol=1e-4, err_msg=solver)
+
+    def test_unknown_solver(self):
+        with self.assertRaises(ValueError):
+            update_trustworthiness(self.matrix, solver='newton')
+
+    def test_frozen_movies_stop_changing(self):
+        finals = []
+        compute = 真值推荐算法.weighted_final_ratings
+
+        def recording(*args):
+            finals.append(compute(*args))
+            return finals[-1]
+
+        freeze_tolerance = 1e-3
+        with mock.patch.object(真值推荐算法, 'weighted_final_ratings', recording):
+            trustworthiness, _, history = self.run_solver('fixed_point', tolerance=1e-6,
+                                                          freeze_tolerance=freeze_tolerance)
+        self.assertGreater(len(finals), 3)
+        # 第二轮起，评分变化小于 freeze_tolerance 的电影被冻结，之后每一轮都保持不变
+        frozen = np.zeros(self.matrix.n_movies, dtype=bool)
+        for previous, current in zip(finals, finals[1:]):
+            np.testing.assert_array_equal(current[frozen], previous[frozen])
+            frozen |= np.abs(current - previous) < freeze_tolerance
+        active = [record['active_movies'] for record in history]
+        self.assertEqual(active, sorted(active, reverse=True))
+        self.assertLess(active[-1], self.matrix.n_movies)
+        self.assertEqual(active[-1], int((~frozen).sum()))
+        # 冻结只带来 freeze_tolerance 量级的误差
+        expected, _, _ = self.run_solver('fixed_point', tolerance=1e-6)
+        for source in self.matrix.source_names:
+            self.assertAlmostEqual(trustworthiness[source], expected[source], delta=freeze_tolerance)
+
+
+class ConvergenceReportTests(unittest.TestCase):
+    def test_reports_iterations_and_residuals(self):
+        matrix, _ = generate_ratings(500, seed=3)
+        history = []
+        update_trustworthiness(matrix, tolerance=1e-4, history=history)
+        report = convergence_report(history, 1e-4)
+        self.assertEqual(report['iterations'], len(history))
+        self.assertGreater(report['iterations'], 1)
+        self.assertTrue(report['converged'])
+        self.assertEqual(report['trust_diffs'], [record['trust_diff'] for record in history])
+        self.assertEqual(report['final_trust_diff'], report['trust_diffs'][-1])
+        self.assertLess(report['final_trust_diff'], 1e-4)
+        self.assertTrue(all(diff >= 1e-4 for diff in report['trust_diffs'][:-1]))
+        self.assertEqual(report['active_movies'], 500)
+        self.assertAlmostEqual(report['seconds'], sum(record['seconds'] for record in history))
+
+    def test_not_converged_and_empty_history(self):
+        matrix, _ = generate_ratings(500, seed=3)
+        history = []
+        update_trustworthiness(matrix, max_iterations=2, tolerance=1e-12, history=history)
+        report = convergence_report(history, 1e-12)
+        self.assertEqual((report['iterations'], report['converged']), (2, False))
+        self.assertEqual(convergence_report([]), {'iterations': 0, 'converged': False, 'final_trust_diff': None,
+                                                  'seconds': 0, 'active_movies': None, 'trust_diffs': []})
+
+
+# 逐部电影生成分段名称，作为 movie_segments 的对照
+def loop_segments(genres, years):
+    names = []
+    for genre, year in zip(genres, years):
+        genre = '' if genre is None or genre != genre else str(genre).split('/')[0].strip()
+        found = re.search(r'\d{4}', '' if year is None or year != year else str(year))
+        names.append(f"{genre or '未知'}|{int(found.group()) // 10 * 10}s" if found else f"{genre or '未知'}|未知")
+    labels = sorted(set(names))
+    return np.array([labels.index(name) for name in names]), labels
+
+
+# 逐个分段、逐部电影计算的分段可信度，作为单次分组求和版本的对照
+def loop_segmented_trustworthiness(matrix, segments, labels, max_iterations=100, tolerance=0.001,
+                                   prior_strength=20.0):
+    sources = range(matrix.n_sources)
+    trust = {(g, j): 1.0 for g in range(len(labels)) for j in sources}
+    counts = {cell: 0 for cell in trust}
+    for i in range(matrix.n_movies):
+        for j in matrix.source_idx[matrix.indptr[i]:matrix.indptr[i + 1]]:
+            counts[(segments[i], j)] += 1
+    for _ in range(max_iterations):
+        diff_sums = {cell: 0.0 for cell in trust}
+        for g in range(len(labels)):
+            for i in np.flatnonzero(segments == g):
+                entries = range(matrix.indptr[i], matrix.indptr[i + 1])
+                weights = [trust[(g, matrix.source_idx[k])] for k in entries]
+                final = sum(w * matrix.values[k] for w, k in zip(weights, entries)) / sum(weights)
+                for k in entries:
+                    diff_sums[(g, matrix.source_idx[k])] += abs(final - matrix.values[k])
+        global_mean = {j: sum(diff_sums[(g, j)] for g in range(len(labels)))
+                       / max(sum(counts[(g, j)] for g in range(len(labels))), 1) for j in sources}
+        new_trust = {(g, j): 1.0 / (1.0 + (diff_sums[(g, j)] + prior_strength * global_mean[j])
+                                    / (counts[(g, j)] + prior_strength)) for g, j in trust}
+        trust_diff = max([abs(new_trust[cell] - trust[cell]) for cell in trust if counts[cell]], default=0.0)
+        trust = new_trust
+        if trust_diff < tolerance:
+            break
+    return {label: {matrix.source_names[j]: trust[(g, j)] for j in sources if counts[(g, j)]}
+            for g, label in enumerate(labels)}
+
+
+class SegmentedTrustTests(unittest.TestCase):
+    def setUp(self):
+        self.matrix, _ = generate_ratings(300, n_sources=3, missing_rate=0.3, bias=[0.0, 0.6, -0.4], seed=5)
+        rng = np.random.default_rng(5)
+        self.genres = rng.choice(np.array(['剧情/爱情', '喜剧', ' 动作 / 科幻', '', None, np.nan], dtype=object), 300)
+        self.years = rng.choice(np.array([1994, '2019', '2003-05-01', 1987.0, '', None, np.nan, 0], dtype=object), 300)
+
+    def test_movie_segments_matches_per_movie_loop(self):
+        segments, labels = movie_segments(self.genres, self.years)
+        expected_segments, expected_labels = loop_segments(self.genres, self.years)
+        self.assertEqual(labels, expected_labels)
+        np.testing.assert_array_equal(segments, expected_segments)
+        self.assertIn('未知|未知', labels)
+        self.assertIn('动作|1980s', labels)
+
+    def test_single_dimension(self):
+        segments, labels = movie_segments(genres=['剧情', None, '喜剧/剧情'])
+        self.assertEqual(labels, ['剧情', '喜剧', '未知'])
+        self.assertEqual(segments.tolist(), [0, 2, 1])
+        segments, labels = movie_segments(years=[None, '1999', 2001])
+        self.assertEqual([labels[code] for code in segments], ['未知', '1990s', '2000s'])
+        with self.assertRaises(ValueError):
+            movie_segments()
+
+    def test_grouped_update_matches_per_segment_loop(self):
+        segments, labels = movie_segments(self.genres, self.years)
+        # 末尾加一个没有电影的分段
+        labels = labels + ['空分段|2020s']
+        expected = loop_segmented_trustworthiness(self.matrix, segments, labels, tolerance=1e-6)
+        trustworthiness = update_segmented_trustworthiness(self.matrix, segments, labels, tolerance=1e-6)
+        self.assertEqual(trustworthiness['空分段|2020s'], {})
+        self.assertEqual(trustworthiness.keys(), expected.keys())
+        for label, trust in expected.items():
+            self.assertEqual(trustworthiness[label].keys(), trust.keys(), label)
+            for source, value in trust.items():
+                self.assertAlmostEqual(trustworthiness[label][source], value, places=6, msg=label)
+        self.assertTrue(np.all(np.isfinite(self.matrix.final_ratings)))
+
+    def test_single_segment_matches_global(self):
+        # 只有一个分段时先验就是该单元格自己的平均偏差，结果与全局版本相同
+        history = []
+        trustworthiness = update_segmented_trustworthiness(self.matrix, np.zeros(self.matrix.n_movies, dtype=int),
+                                                           ['全部'], tolerance=1e-8, history=history)
+        expected = update_trustworthiness(self.matrix, tolerance=1e-8, max_iterations=100)
+        for source in self.matrix.source_names:
+            self.assertAlmostEqual(trustworthiness['全部'][source], expected[source], places=5)
+        self.assertEqual([record['iteration'] for record in history], list(range(1, len(history) + 1)))
+
+
+class IncrementalUpdateTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, 'state.npz')
+        self.dense = generate_ratings(3000, n_sources=3, seed=3)[0].to_dense()
+        self.titles = np.array([f'电影{i}' for i in range(len(self.dense))], dtype=object)
+        self.sources = ['IMDb', '猫眼', '豆瓣']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def matrix(self, dense, titles=None):
+        return RatingMatrix.from_dense(dense, self.titles if titles is None else titles, self.sources)
+
+    def test_first_run_is_full_and_saves_state(self):
+        matrix = self.matrix(self.dense)
+        trustworthiness, stats = incremental_update(matrix, self.state_file)
+        self.assertEqual(stats['mode'], 'full')
+        self.assertEqual(trustworthiness, full_run(self.matrix(self.dense)))
+        np.testing.assert_allclose(load_rating_state(self.state_file)['final_ratings'], matrix.final_ratings)
+
+    def test_small_delta_matches_full_run(self):
+        incremental_update(self.matrix(self.dense), self.state_file)
+        dense = self.dense.copy()
+        rated = np.flatnonzero(~np.isnan(dense[:, 0]))
+        dense[rated[[5, 17, 400]], 0] += 0.5
+        titles = np.append(self.titles, '新电影')
+        dense = np.vstack([dense, [[7.0, 7.5, np.nan]]])
+        matrix = self.matrix(dense, titles)
+        trustworthiness, stats = incremental_update(matrix, self.state_file)
+        self.assertEqual((stats['mode'], stats['changed']), ('incremental', 4))
+
+        expected = self.matrix(dense, titles)
+        expected_trust = full_run(expected)
+        for source in self.sources:
+            self.assertAlmostEqual(trustworthiness[source], expected_trust[source], delta=0.001)
+        np.testing.assert_allclose(matrix.final_ratings, expected.final_ratings, atol=0.01)
+        # 新增电影按保存的可信度计算评分
+        self.assertAlmostEqual(matrix.final_ratings[-1], 7.25, delta=0.05)
+
+    def test_reordered_and_deleted_movies_align_by_title(self):
+        incremental_update(self.matrix(self.dense), self.state_file)
+        order = np.random.default_rng(0).permutation(len(self.dense))[:-10]
+        matrix = self.matrix(self.dense[order], self.titles[order])
+        _, stats = incremental_update(matrix, self.state_file)
+        self.assertEqual((stats['mode'], stats['changed']), ('incremental', 0))
+        expected = self.matrix(self.dense)
+        full_run(expected)
+        np.testing.assert_allclose(matrix.final_ratings, expected.final_ratings[order], atol=0.01)
+
+    def test_changed_titles_are_recomputed(self):
+        incremental_update(self.matrix(self.dense), self.state_file)
+        _, stats = incremental_update(self.matrix(self.dense), self.state_file, changed_titles={'电影3', '电影9'})
+        self.assertEqual((stats['mode'], stats['changed']), ('incremental', 2))
+        self.assertLess(stats['drift'], 0.001)
+
+    def test_large_drift_falls_back_to_full_convergence(self):
+        incremental_update(self.matrix(self.dense), self.state_file)
+        dense = self.dense.copy()
+        # 猫眼的一半评分整体偏高 3 分，来源可信度明显变化
+        dense[::2, 1] = np.clip(dense[::2, 1] + 3.0, 0.1, 10.0)
+        matrix = self.matrix(dense)
+        trustworthiness, stats = incremental_update(matrix, self.state_file)
+        self.assertEqual(stats['mode'], 'warm')
+        self.assertGreater(stats['drift'], 0.001)
+
+        expected = self.matrix(dense)
+        expected_trust = full_run(expected)
+        for source in self.sources:
+            self.assertAlmostEqual(trustworthiness[source], expected_trust[source], delta=0.002)
+        np.testing.assert_allclose(matrix.final_ratings, expected.final_ratings, atol=0.01)
+
+    def test_new_source_forces_full_run(self):
+        incremental_update(RatingMatrix.from_dense(self.dense[:, :2], self.titles, self.sources[:2]), self.state_file)
+        _, stats = incremental_update(self.matrix(self.dense), self.state_file)
+        self.assertEqual(stats['mode'], 'full')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,46 +1,27 @@
+import time
+
+import numpy as np
 import pandas as pd
 
-# 从 Excel 文件中获取电影及评分数据
-def get_movie_ratings_from_excel(file_path):
+from columnar_io import read_columns, write_columns
+from rating_matrix import SOURCE_COLUMNS, RatingMatrix
+
+# 从文件中获取电影及评分数据
+def get_movie_ratings(file_path):
     """
     功能:
-    - 从Excel文件中获取电影和评分数据，返回pandas DataFrame。
+    - 从 Parquet / Arrow 文件（也兼容旧的 Excel 文件）中获取电影和评分数据，返回稀疏评分矩阵。
 
     输入:
-    - file_path: str类型，Excel文件的路径。
+    - file_path: str类型，合并评分文件的路径。
 
     输出:
-    - DataFrame: 包含电影名称、来源及评分的DataFrame数据结构。
+    - RatingMatrix: 电影 × 评分来源 的稀疏评分矩阵，缺失的评分不占存储。
     """
-    # 读取 Excel 文件
-    df = pd.read_excel(file_path)
-
-    # 确保评分列为数值类型
-    df['IMDb评分'] = pd.to_numeric(df['IMDb评分'], errors='coerce')
-    df['猫眼评分'] = pd.to_numeric(df['猫眼评分'], errors='coerce')
-    df['rating'] = pd.to_numeric(df['rating'], errors='coerce')
-
-    # 将 IMDb评分、猫眼评分 和 豆瓣评分 作为评分来源
-    ratings_list = []
-
-    # IMDb 评分
-    for index, row in df.iterrows():
-        if not pd.isnull(row['IMDb评分']):
-            ratings_list.append({'movie_id': index, 'title': row['title'], 'source': 'IMDb', 'rating': row['IMDb评分']})
+    # 只读取标题和评分列
+    df = read_columns(file_path, ['title', *SOURCE_COLUMNS.values()])
 
-    # 猫眼 评分
-    for index, row in df.iterrows():
-        if not pd.isnull(row['猫眼评分']):
-            ratings_list.append({'movie_id': index, 'title': row['title'], 'source': '猫眼', 'rating': row['猫眼评分']})
-
-    # 豆瓣 评分
-    for index, row in df.iterrows():
-        if not pd.isnull(row['rating']):
-            ratings_list.append({'movie_id': index, 'title': row['title'], 'source': '豆瓣', 'rating': row['rating']})
-
-    # 转换成 DataFrame
-    ratings_df = pd.DataFrame(ratings_list)
-    return ratings_df
+    return RatingMatrix.from_wide_frame(df)
 
 
 # 计算每个数据源的初始可信度
@@ -58,129 +39,359 @@ def initialize_trust(sources):
     return {source: 1.0 for source in sources}
 
 
+# 按电影分组计算加权评分
+def weighted_final_ratings(movie_codes, source_idx, values, trust, previous):
+    """
+    功能:
+    - 对给定的评分条目按电影分组求加权平均，结果写入 previous 的副本；没有条目（总权重为0）的电影保留原值。
+    """
+    weights = trust[source_idx]
+    # 每部电影的总权重与加权和
+    total_weight = np.bincount(movie_codes, weights=weights, minlength=len(previous))
+    weighted_sum = np.bincount(movie_codes, weights=weights * values, minlength=len(previous))
+
+    final = previous.copy()
+    # 总权重为0的电影跳过计算
+    np.divide(weighted_sum, total_weight, out=final, where=total_weight != 0)
+    return final
+
+
+def compute_final_ratings(matrix, trust, previous=None):
+    """
+    功能:
+    - 使用分组求和（np.bincount）一次性计算所有电影的加权评分。
+
+    输入:
+    - matrix: RatingMatrix 稀疏评分矩阵。
+    - trust: 按来源下标排列的可信度数组。
+    - previous: 上一轮每部电影的最终评分；总权重为0的电影保留该值，默认为0。
+
+    输出:
+    - final: 每部电影的最终评分数组，长度为电影数量。
+    """
+    previous = np.zeros(matrix.n_movies) if previous is None else previous
+    return weighted_final_ratings(matrix.movie_codes, matrix.source_idx, matrix.values, trust, previous)
+
+
+# 可信度迭代的加速外推
+def extrapolate_trust(solver, iterates, images, memory=3):
+    """
+    功能:
+    - 根据最近几轮的可信度 x_k 及其迭代映射 g(x_k)，给出下一轮的可信度。
+    - 'fixed_point': 直接取 g(x_k)，即原始的不动点迭代。
+    - 'aitken': 每三次不动点迭代做一次分量级 Aitken Δ² 外推。
+    - 'anderson': 以最近 memory 轮的残差做 Anderson 混合（最小二乘）。
+
+    输入:
+    - solver: 求解器名称。
+    - iterates: 最近几轮的可信度 x_k 列表（按时间顺序）。
+    - images: 对应的 g(x_k) 列表。
+    - memory: Anderson 混合使用的历史长度，默认值为3。
+
+    输出:
+    - next_trust: 下一轮的可信度数组，限制在 (0, 1] 区间。
+    - restart: 是否清空历史（Aitken 外推之后重新积累）。
+    """
+    g = images[-1]
+    if solver == 'fixed_point':
+        return g, False
+
+    if solver == 'aitken':
+        # x0, x1 = g(x0), x2 = g(x1) 构成一组不动点序列
+        if len(iterates) < 2:
+            return g, False
+        x0, x1, x2 = iterates[-2], iterates[-1], g
+        denominator = x2 - 2.0 * x1 + x0
+        safe = np.abs(denominator) > 1e-12
+        accelerated = np.where(safe, x0 - (x1 - x0) ** 2 / np.where(safe, denominator, 1.0), x2)
+        return np.clip(accelerated, 1e-6, 1.0), True
+
+    if solver == 'anderson':
+        if len(iterates) < 2:
+            return g, False
+        x = np.array(iterates[-(memory + 1):])
+        gx = np.array(images[-(memory + 1):])
+        residuals = gx - x
+        delta_f = np.diff(residuals, axis=0).T
+        delta_g = np.diff(gx, axis=0).T
+        gamma = np.linalg.lstsq(delta_f, residuals[-1], rcond=None)[0]
+        return np.clip(g - delta_g @ gamma, 1e-6, 1.0), False
+
+    raise ValueError(f'未知的求解器：{solver}')
+
+
 # 更新可信度直到收敛
-def update_trustworthiness(movie_ratings, max_iterations=100, tolerance=0.001):
+def update_trustworthiness(matrix, max_iterations=100, tolerance=0.001, initial_trust=None, history=None,
+                           solver='fixed_point', freeze_tolerance=None):
     """
     功能:
     - 根据评分差异迭代更新每个数据源的可信度，直到达到收敛条件。
+    - 每轮迭代只做若干次分组求和，复杂度为 O(评分条数)。
+    - 可选 Aitken / Anderson 外推加速可信度收敛；可选冻结最终评分已不再变化的电影，之后的迭代只计算未冻结的电影。
 
     输入:
-    - movie_ratings: 包含电影评分数据的DataFrame，其中包括电影ID、评分来源和评分。
+    - matrix: RatingMatrix 稀疏评分矩阵。
     - max_iterations: 最大迭代次数，默认值为100。
     - tolerance: 收敛的容差值，当两次迭代可信度变化小于该值时停止，默认值为0.001。
+    - initial_trust: 可选的初始可信度字典（例如上一次收敛的结果），用于热启动；缺少的来源按1.0初始化。
+    - history: 可选的列表，传入时每轮迭代追加一条记录 {'iteration', 'trust', 'trust_diff', 'seconds', 'active_movies'}。
+    - solver: 'fixed_point'（默认）、'aitken' 或 'anderson'，见 extrapolate_trust。
+    - freeze_tolerance: 可选，某部电影的最终评分在相邻两轮间的变化小于该值时冻结，默认不冻结。
 
     输出:
     - trustworthiness: 更新后的可信度字典，包含每个数据源的最终可信度。
+    - 最后一轮的最终评分写入 matrix.final_ratings。
     """
-    # 获取所有唯一的评分来源
-    unique_sources = movie_ratings['source'].unique()
+    source_names = matrix.source_names
 
     # 初始化每个数据源的可信度
-    trustworthiness = initialize_trust(unique_sources)
+    trustworthiness = initialize_trust(source_names)
+    if initial_trust:
+        trustworthiness.update((source, initial_trust[source]) for source in source_names if source in initial_trust)
+    trust = np.array([trustworthiness[source] for source in source_names], dtype=np.float64)
+
+    # 每个来源的评分条数，用于求差值均值
+    source_counts = np.bincount(matrix.source_idx, minlength=matrix.n_sources)
 
-    # 为存储最终评分和加权差值添加新列，并指定数据类型为浮点数
-    movie_ratings['final_rating'] = 0.0
-    movie_ratings['weighted_rating'] = 0.0
+    final = np.zeros(matrix.n_movies)
+
+    # 参与计算的评分条目（冻结后只保留未冻结的电影）以及已冻结条目的差值和
+    movie_codes, source_idx, values = matrix.movie_codes, matrix.source_idx, matrix.values
+    frozen_diff_sum = np.zeros(matrix.n_sources)
+    active = np.ones(matrix.n_movies, dtype=bool)
+
+    iterates, images = [], []
+    new_trust = trust
 
     # 进行最大迭代次数
-    for _ in range(max_iterations):
-        # 记录当前的可信度
-        previous_trust = trustworthiness.copy()
+    for iteration in range(max_iterations):
+        start = time.perf_counter()
+        previous_final = final
 
         # 计算每部电影的加权评分
-        for movie_id in movie_ratings['movie_id'].unique():
-            # 筛选出当前电影的所有评分记录
-            movie_df = movie_ratings[movie_ratings['movie_id'] == movie_id]
-
-            # 计算当前电影的总权重（所有来源的可信度总和）
-            total_weight = sum(trustworthiness[source] for source in movie_df['source'])
-            if total_weight == 0:
-                continue  # 如果总权重为0，则跳过计算
-
-            # 计算加权评分的加权和
-            weighted_sum = sum(
-                trustworthiness[row['source']] * row['rating'] for _, row in movie_df.iterrows()
-            )
-
-            # 计算最终评分
-            final_rating = weighted_sum / total_weight
-            movie_ratings.loc[movie_ratings['movie_id'] == movie_id, 'final_rating'] = final_rating
-
-            # 更新每个评分的加权差值
-            for _, row in movie_df.iterrows():
-                weighted_diff = abs(final_rating - row['rating'])
-                movie_ratings.loc[(movie_ratings['movie_id'] == movie_id) & (
-                        movie_ratings['source'] == row['source']), 'weighted_rating'] = weighted_diff
-
-        # 根据加权差值更新每个数据源的可信度
-        for source in unique_sources:
-            source_diffs = movie_ratings[movie_ratings['source'] == source]['weighted_rating']
-            # 使用差值的均值计算可信度，较小的差值表示更高的可信度
-            trustworthiness[source] = 1.0 / (1.0 + source_diffs.mean())
+        final = weighted_final_ratings(movie_codes, source_idx, values, trust, final)
+
+        # 每条评分与最终评分的差值
+        diffs = np.abs(final[movie_codes] - values)
+
+        # 使用差值的均值计算可信度，较小的差值表示更高的可信度
+        source_diff_sum = frozen_diff_sum + np.bincount(source_idx, weights=diffs, minlength=matrix.n_sources)
+        new_trust = 1.0 / (1.0 + source_diff_sum / source_counts)
+        trust_diff = float(np.max(np.abs(new_trust - trust)))
+
+        # 冻结最终评分已稳定的电影，其差值并入常量部分
+        if freeze_tolerance is not None and iteration > 0:
+            stable = active & (np.abs(final - previous_final) < freeze_tolerance)
+            if stable.any():
+                frozen = stable[movie_codes]
+                frozen_diff_sum += np.bincount(source_idx[frozen], weights=diffs[frozen], minlength=matrix.n_sources)
+                active &= ~stable
+                movie_codes, source_idx, values = movie_codes[~frozen], source_idx[~frozen], values[~frozen]
+
+        if history is not None:
+            history.append({
+                'iteration': iteration + 1,
+                'trust': dict(zip(source_names, new_trust.tolist())),
+                'trust_diff': trust_diff,
+                'seconds': time.perf_counter() - start,
+                'active_movies': int(active.sum()),
+            })
 
         # 检查是否达到收敛条件
-        trust_diff = max(abs(trustworthiness[source] - previous_trust[source]) for source in unique_sources)
         if trust_diff < tolerance:
             break  # 如果可信度变化小于容差值，则停止迭代
 
-    return trustworthiness
+        # 下一轮的可信度
+        iterates.append(trust)
+        images.append(new_trust)
+        trust, restart = extrapolate_trust(solver, iterates, images)
+        if restart:
+            iterates, images = [], []
+
+    matrix.final_ratings = final
+
+    return {source: float(value) for source, value in zip(source_names, new_trust)}
+
+
+# 汇总收敛过程
+def convergence_report(history, tolerance=0.001):
+    """
+    功能:
+    - 根据 update_trustworthiness 记录的 history 汇总收敛情况。
+
+    输入:
+    - history: update_trustworthiness 的 history 列表。
+    - tolerance: 收敛容差，应与调用时一致。
+
+    输出:
+    - report: 字典，包含迭代次数、是否收敛、最终可信度变化、总耗时、最终未冻结的电影数以及每轮的可信度变化。
+    """
+    return {
+        'iterations': len(history),
+        'converged': bool(history) and history[-1]['trust_diff'] < tolerance,
+        'final_trust_diff': history[-1]['trust_diff'] if history else None,
+        'seconds': sum(record['seconds'] for record in history),
+        'active_movies': history[-1]['active_movies'] if history else None,
+        'trust_diffs': [record['trust_diff'] for record in history],
+    }
 
 # 更新电影的最终评分
-def update_final_ratings(movie_ratings, trustworthiness):
+def update_final_ratings(matrix, trustworthiness):
     """
     功能:
-    - 对于每一部电影，计算加权评分，考虑所有评分来源，并更新到DataFrame中。
+    - 对于每一部电影，计算加权评分，考虑所有评分来源，并更新到评分矩阵中。
 
     输入:
-    - movie_ratings: 包含电影评分数据的DataFrame。
+    - matrix: RatingMatrix 稀疏评分矩阵。
     - trustworthiness: 包含每个数据源可信度的字典。
 
     输出:
-    - 无直接输出，更新后的最终评分将存储在 movie_ratings 的 'final_rating' 列中。
+    - 无直接输出，更新后的最终评分将存储在 matrix.final_ratings 中。
     """
-    # 对于每部电影，计算其最终评分
-    for movie_id in movie_ratings['movie_id'].unique():
-        # 筛选出当前电影的所有评分记录
-        movie_df = movie_ratings[movie_ratings['movie_id'] == movie_id]
+    trust = np.array([trustworthiness[source] for source in matrix.source_names], dtype=np.float64)
+    matrix.final_ratings = compute_final_ratings(matrix, trust, matrix.final_ratings)
 
-        # 计算当前电影的总权重（所有来源的可信度总和）
-        total_weight = sum(trustworthiness[source] for source in movie_df['source'])
-        if total_weight == 0:
-            continue  # 如果总权重为0，则跳过计算
 
-        # 计算加权评分的加权和
-        weighted_sum = sum(
-            trustworthiness[row['source']] * row['rating'] for _, row in movie_df.iterrows()
-        )
+# 按类型和年代划分电影
+def movie_segments(genres=None, years=None):
+    """
+    功能:
+    - 为每部电影生成分段编号：类型取 '/' 分隔的第一个，年代取年份的十年区间，缺失时记为 '未知'。
+
+    输入:
+    - genres: 每部电影的类型字符串（如 '剧情/爱情'），为 None 时不按类型分段。
+    - years: 每部电影的年份（字符串或数字），为 None 时不按年代分段。
+
+    输出:
+    - segments: 每部电影的分段编号数组。
+    - labels: 分段名称列表，例如 ['剧情|1990s', '喜剧|2010s', ...]。
+    """
+    parts = []
+    if genres is not None:
+        # 先对原始字符串去重，只对不同的取值做字符串处理
+        codes, uniques = pd.factorize(pd.Series(genres, dtype=object).fillna(''))
+        genre = pd.Series(uniques, dtype=object).astype(str).str.split('/').str[0].str.strip().replace('', '未知')
+        parts.append((codes, genre.to_numpy(dtype=object)))
+    if years is not None:
+        codes, uniques = pd.factorize(pd.Series(years, dtype=object).fillna('').astype(str))
+        year = pd.to_numeric(pd.Series(uniques, dtype=object).str.extract(r'(\d{4})')[0], errors='coerce')
+        decade = np.array(['未知' if np.isnan(y) else f'{int(y) // 10 * 10}s' for y in year], dtype=object)
+        parts.append((codes, decade))
+    if not parts:
+        raise ValueError('genres 和 years 至少需要提供一个')
+
+    # 在取值组合上拼接名称，再映射回每部电影，避免逐部电影拼接字符串
+    combined = np.zeros(len(parts[0][0]), dtype=np.int64)
+    names = np.array([''], dtype=object)
+    for i, (codes, part_names) in enumerate(parts):
+        combined = combined * len(part_names) + codes
+        names = np.add.outer(names, (('|' if i else '') + pd.Series(part_names, dtype=object)).to_numpy()).ravel()
+    present, inverse = np.unique(combined, return_inverse=True)
+    present_codes, labels = pd.factorize(names[present], sort=True)
+    return present_codes[inverse.ravel()], list(labels)
+
+
+# 按分段更新可信度
+def update_segmented_trustworthiness(matrix, segments, labels, max_iterations=100, tolerance=0.001,
+                                     prior_strength=20.0, history=None):
+    """
+    功能:
+    - 为每个 (分段, 来源) 单独计算可信度，例如猫眼在近年国产片上的可信度和在老外国片上的可信度可以不同。
+    - 所有分段在同一轮迭代中用一次分组求和完成：评分条目先编码为 分段 × 来源 的单元格下标，
+      每轮的计算量与全局版本相同，只是 bincount 的桶数从 来源数 变为 分段数 × 来源数。
+    - 评分条数少的单元格向该来源的全局平均偏差收缩，prior_strength 为先验的等效条数。
+    - 收敛后按分段可信度计算最终评分，写入 matrix.final_ratings。
 
-        # 计算最终评分
-        final_rating = weighted_sum / total_weight
-        # 将最终评分存储到 DataFrame 中
-        movie_ratings.loc[movie_ratings['movie_id'] == movie_id, 'final_rating'] = final_rating
+    输入:
+    - matrix: RatingMatrix 稀疏评分矩阵。
+    - segments, labels: movie_segments 的输出。
+    - max_iterations: 最大迭代次数，默认值为100。
+    - tolerance: 收敛的容差值，默认值为0.001。
+    - prior_strength: 向全局可信度收缩的强度，默认值为20。
+    - history: 可选的列表，传入时每轮迭代追加一条记录 {'iteration', 'trust_diff', 'seconds'}。
+
+    输出:
+    - trustworthiness: 嵌套字典 {分段名称: {来源: 可信度}}，只包含有评分的单元格。
+    """
+    n_segments, n_sources = len(labels), matrix.n_sources
+    source_names = matrix.source_names
+
+    # 每条评分所在的 (分段, 来源) 单元格
+    cells = np.asarray(segments, dtype=np.int64)[matrix.movie_codes] * n_sources + matrix.source_idx
+    cell_counts = np.bincount(cells, minlength=n_segments * n_sources)
+    source_counts = cell_counts.reshape(n_segments, n_sources).sum(axis=0)
+
+    trust = np.ones(n_segments * n_sources)
+    final = np.zeros(matrix.n_movies)
+
+    for iteration in range(max_iterations):
+        start = time.perf_counter()
+        previous_trust = trust
+
+        final = weighted_final_ratings(matrix.movie_codes, cells, matrix.values, trust, final)
+        diffs = np.abs(final[matrix.movie_codes] - matrix.values)
+
+        # 单元格偏差和；全局平均偏差作为先验
+        cell_diff_sum = np.bincount(cells, weights=diffs, minlength=n_segments * n_sources)
+        global_mean = cell_diff_sum.reshape(n_segments, n_sources).sum(axis=0) / np.maximum(source_counts, 1)
+        prior = np.tile(global_mean, n_segments)
+        trust = 1.0 / (1.0 + (cell_diff_sum + prior_strength * prior) / (cell_counts + prior_strength))
+
+        trust_diff = float(np.max(np.abs(trust - previous_trust)[cell_counts > 0], initial=0.0))
+        if history is not None:
+            history.append({'iteration': iteration + 1, 'trust_diff': trust_diff,
+                            'seconds': time.perf_counter() - start})
+        if trust_diff < tolerance:
+            break
+
+    matrix.final_ratings = weighted_final_ratings(matrix.movie_codes, cells, matrix.values, trust, final)
+
+    trust = trust.reshape(n_segments, n_sources)
+    observed = cell_counts.reshape(n_segments, n_sources) > 0
+    return {
+        label: {source: float(trust[g, j]) for j, source in enumerate(source_names) if observed[g, j]}
+        for g, label in enumerate(labels)
+    }
+
+
+# 保存最终评分
+def save_final_ratings(matrix, output_file):
+    """
+    功能:
+    - 将每部电影的最终评分保存为 Parquet / Arrow 文件，供后续阶段读取。
+
+    输入:
+    - matrix: RatingMatrix 稀疏评分矩阵。
+    - output_file: str类型，保存的文件路径（.parquet / .feather / .arrow）。
+
+    输出:
+    - 无直接输出，最终评分被写入文件中。
+    """
+    write_columns(matrix.to_frame(), output_file)
 
 
-# 保存最终评分到Excel
-def save_final_ratings_to_excel(movie_ratings, output_file):
+# 导出最终评分到Excel
+def save_final_ratings_to_excel(matrix, output_file):
     """
     功能:
     - 将每部电影的最终评分保存到 Excel 文件中。
 
     输入:
-    - movie_ratings: 包含电影评分数据的DataFrame。
+    - matrix: RatingMatrix 稀疏评分矩阵。
     - output_file: str类型，保存的Excel文件路径。
 
     输出:
     - 无直接输出，更新后的数据被写入Excel文件中。
     """
-    # 将 movie_ratings 中的最终评分列保存为 Excel 文件
-    movie_ratings[['movie_id', 'title', 'final_rating']].to_excel(output_file, index=False)
+    # 每部电影一行，保存 movie_id、title 和最终评分
+    matrix.to_frame().to_excel(output_file, index=False)
 
 
 # 主函数
 def main():
     """
     功能:
-    - 主函数，负责执行所有操作：从Excel文件中获取电影及评分数据，计算可信度，更新最终评分并保存到Excel。
+    - 主函数，负责执行所有操作：从合并评分文件中获取电影及评分数据，计算可信度，更新最终评分并保存。
 
     输入:
     - 无直接输入
@@ -188,19 +399,22 @@ def main():
     输出:
     - 无直接输出
     """
-    file_path = '豆瓣电影_合并评分.xlsx'
+    file_path = '豆瓣电影_合并评分.parquet'
 
-    # 获取电影及其评分数据
-    movie_ratings = get_movie_ratings_from_excel(file_path)
+    # 获取电影及其评分数据（稀疏评分矩阵）
+    matrix = get_movie_ratings(file_path)
 
     # 进行可信度更新，直到收敛
-    trustworthiness = update_trustworthiness(movie_ratings)
+    history = []
+    trustworthiness = update_trustworthiness(matrix, history=history)
+    report = convergence_report(history)
+    print(f"迭代 {report['iterations']} 轮，可信度变化 {report['final_trust_diff']:.6f}，耗时 {report['seconds']:.3f}s")
 
     # 更新每部电影的最终评分
-    update_final_ratings(movie_ratings, trustworthiness)
+    update_final_ratings(matrix, trustworthiness)
 
-    # 保存最终评分到 Excel 文件
-    save_final_ratings_to_excel(movie_ratings, '豆瓣电影_最终评分.xlsx')
+    # 保存最终评分，需要查看时再用 save_final_ratings_to_excel 导出
+    save_final_ratings(matrix, '豆瓣电影_最终评分.parquet')
 
     print("评分更新完成！")
 
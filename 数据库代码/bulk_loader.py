@@ -0,0 +1,232 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pymysql
+
+from movie_dimensions import sync_dimensions
+from movie_repository import MovieRepository, batches, count_rows, iter_rows, source_file
+
+# 各数据表默认的爬取结果文件；Parquet 文件还不存在时读取同名的 .csv / .xlsx（见 movie_repository.source_file），
+# 可用 推荐算法代码/columnar_io.py 一次性转换：python columnar_io.py ../爬取网站代码/movies_dytt.xlsx
+SOURCE_FILES = {
+    'moviemate_movies': '../爬取网站代码/moviemate电影.parquet',
+    'douban_movies': '../爬取网站代码/豆瓣电影.parquet',
+    'maoyan_movies': '../爬取网站代码/movies_maoyan_merge.csv',
+    'dytt_movies': '../爬取网站代码/movies_dytt.parquet',
+}
+
+# 每个事务提交的行数：太小时提交（刷 redo log）的开销占比高，太大时回滚段和失败后重做的量大
+CHUNK_SIZE = 20000
+# 每条多行 INSERT 包含的行数，受 max_allowed_packet 限制
+INSERT_BATCH_SIZE = 2000
+
+
+# 创建导入进度表
+def create_progress_table(cursor):
+    try:
+        sql = '''
+        CREATE TABLE IF NOT EXISTS bulk_load_progress (
+            table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+            source_file VARCHAR(512) NOT NULL,
+            signature VARCHAR(64) NOT NULL,
+            loaded_rows BIGINT NOT NULL DEFAULT 0,
+            status VARCHAR(16) NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+        '''
+        cursor.execute(sql)
+    except Exception as e:
+        print('创建数据表时发生异常：', e)
+        raise
+
+
+def file_signature(file_path):
+    # 文件大小和修改时间都不变时认为是同一个文件，可以按已提交的行数续传
+    stat = os.stat(file_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def load_progress(cursor, table):
+    cursor.execute('SELECT source_file, signature, loaded_rows, status FROM bulk_load_progress WHERE table_name = %s',
+                   (table,))
+    return cursor.fetchone()
+
+
+def save_progress(cursor, table, file_path, signature, loaded_rows, status):
+    cursor.execute('INSERT INTO bulk_load_progress(table_name, source_file, signature, loaded_rows, status, updated_at) '
+                   'VALUES(%s, %s, %s, %s, %s, NOW()) ON DUPLICATE KEY UPDATE source_file = VALUES(source_file), '
+                   'signature = VALUES(signature), loaded_rows = VALUES(loaded_rows), status = VALUES(status), '
+                   'updated_at = VALUES(updated_at)',
+                   (table, os.path.abspath(file_path), signature, loaded_rows, status))
+
+
+# 导入一张表
+def load_table(db_config, table, file_path, chunk_size=CHUNK_SIZE, batch_size=INSERT_BATCH_SIZE, method='insert',
+               replace=False, restart=False):
+    """
+    功能:
+    - 流式读取 file_path，每 chunk_size 行为一个事务按唯一键增量写入 table（见 MovieRepository.upsert_many），
+      内存中只保留当前一块。重复导入同一个文件不会产生重复行，只有内容变化的电影会被更新。
+      每块的数据和导入进度在同一个事务中提交，中断后从最后提交的一块之后继续，不会重复或遗漏。
+    - 同一个文件（大小和修改时间不变）上次未导入完成时自动续传；文件变化或 restart 为 True 时从头导入。
+
+    输入:
+    - db_config: pymysql.connect 的参数，每个进程各自建立连接。
+    - table: TYPED_TABLES 中的表名。
+    - file_path: 爬取结果文件（.parquet / .csv / .xlsx），不存在时读取同名的其他格式文件。
+    - chunk_size: 每个事务的行数。
+    - batch_size: 每条多行 INSERT 的行数（method 为 'insert' 时）。
+    - method: 'insert' 为多行 INSERT ... ON DUPLICATE KEY UPDATE；'load' 为 LOAD DATA LOCAL INFILE 导入临时表后合并，
+      需要服务端开启 local_infile。
+    - replace: 从头导入时先清空数据表。
+    - restart: 忽略上次的进度，从头导入。
+
+    输出:
+    - {'table', 'rows', 'skipped', 'seconds', 'inserted', 'updated', 'unchanged'}：本次读取的行数、续传时跳过的行数、
+      耗时，以及其中新增、更新和内容未变的电影数。
+    """
+    file_path = source_file(file_path)
+    connection = pymysql.connect(local_infile=(method == 'load'), **db_config)
+    repository = MovieRepository(connection)
+    try:
+        signature = file_signature(file_path)
+        with connection.cursor() as cursor:
+            create_progress_table(cursor)
+            repository.create_table(table)
+            progress = load_progress(cursor, table)
+        resume = (progress is not None and not restart and progress[3] == 'loading'
+                  and progress[0] == os.path.abspath(file_path) and progress[1] == signature)
+        loaded = progress[2] if resume else 0
+        if not resume:
+            if replace:
+                repository.truncate(table)
+            with connection.cursor() as cursor:
+                save_progress(cursor, table, file_path, signature, 0, 'loading')
+            connection.commit()
+
+        total = count_rows(file_path)
+        rows = itertools.islice(iter_rows(file_path), loaded, None)
+        if loaded:
+            print(f"{table}: 从第 {loaded} 行续传")
+
+        start = time.perf_counter()
+        written = 0
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        for chunk in batches(rows, chunk_size):
+            if method == 'load':
+                chunk_counts = repository.load_rows(table, chunk, commit=False)
+            else:
+                chunk_counts = repository.upsert_many(table, chunk, batch_size, commit=False)
+            for name, count in chunk_counts.items():
+                counts[name] += count
+            loaded += len(chunk)
+            written += len(chunk)
+            with connection.cursor() as cursor:
+                save_progress(cursor, table, file_path, signature, loaded, 'loading')
+            connection.commit()
+
+            elapsed = time.perf_counter() - start
+            percent = f' ({loaded / total:.1%})' if total else ''
+            print(f"{table}: 已导入 {loaded}{'/' + str(total) if total else ''} 行{percent}，"
+                  f"{written / max(elapsed, 1e-9):.0f} 行/秒；新增 {counts['inserted']}，更新 {counts['updated']}，"
+                  f"未变化 {counts['unchanged']}")
+
+        with connection.cursor() as cursor:
+            save_progress(cursor, table, file_path, signature, loaded, 'done')
+        connection.commit()
+        if table == 'moviemate_movies':
+            # 拆分 genre、region 字符串，重建类型、地区关联表
+            sync_dimensions(connection)
+        return {'table': table, 'rows': written, 'skipped': loaded - written, 'seconds': time.perf_counter() - start,
+                **counts}
+    finally:
+        connection.close()
+
+
+# 并行导入多张表
+def load_tables(db_config, files, workers=None, **options):
+    """
+    功能:
+    - 每张表一个进程并行导入（文本解析和类型转换在各自的进程中进行），汇总每张表的行数和吞吐量。
+      某张表失败不影响其他表，失败的表重新运行时从最后提交的一块继续。
+
+    输入:
+    - db_config: pymysql.connect 的参数。
+    - files: {表名: 文件路径}。
+    - workers: 进程数，默认每张表一个。
+    - options: 传给 load_table 的其他参数。
+
+    输出:
+    - {表名: load_table 的结果}；失败的表不在其中。
+    """
+    results, failed = {}, {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or len(files)) as executor:
+        futures = {executor.submit(load_table, db_config, table, file_path, **options): table
+                   for table, file_path in files.items()}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                results[table] = result = future.result()
+                print(f"{table}: 完成，读取 {result['rows']} 行（新增 {result['inserted']}，更新 {result['updated']}，"
+                      f"未变化 {result['unchanged']}），耗时 {result['seconds']:.2f}s，"
+                      f"{result['rows'] / max(result['seconds'], 1e-9):.0f} 行/秒")
+            except Exception as e:
+                failed[table] = e
+                print(f'{table}: 导入时发生异常，重新运行即可从最后提交的一块继续：', e)
+    rows = sum(result['rows'] for result in results.values())
+    elapsed = time.perf_counter() - start
+    print(f"共导入 {rows} 行，耗时 {elapsed:.2f}s，{rows / max(elapsed, 1e-9):.0f} 行/秒；失败 {len(failed)} 张表")
+    return results
+
+
+def source_files(parser, tables, overrides):
+    # --tables 选中的表及其文件，--file 表名=文件路径 替换默认文件
+    files = {table: SOURCE_FILES[table] for table in tables}
+    for item in overrides:
+        table, _, file_path = item.partition('=')
+        if table not in SOURCE_FILES or not file_path:
+            parser.error(f'--file 的格式应为 表名=文件路径，表名为 {"、".join(SOURCE_FILES)} 之一')
+        files[table] = file_path
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流式、分块、可续传地把爬取结果导入各来源数据表')
+    parser.add_argument('--tables', nargs='+', choices=list(SOURCE_FILES), default=list(SOURCE_FILES))
+    parser.add_argument('--file', action='append', default=[], metavar='TABLE=PATH',
+                        help='替换某张表的默认文件，可重复')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--batch-size', type=int, default=INSERT_BATCH_SIZE)
+    parser.add_argument('--method', choices=['insert', 'load'], default='insert')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--replace', action='store_true', help='从头导入时先清空数据表')
+    parser.add_argument('--restart', action='store_true', help='忽略上次的进度，从头导入')
+    args = parser.parse_args()
+
+    files = source_files(parser, args.tables, args.file)
+
+    db_config = {
+        'host': 'localhost',
+        'user': 'root',
+        'password': '123456',
+        'port': 3306,
+        'database': 'MovieMate',
+        'charset': 'utf8mb4',
+    }
+
+    try:
+        load_tables(db_config, files, args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                    method=args.method, replace=args.replace, restart=args.restart)
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+import argparse
+import os
+import time
+
+import pymysql
+
+from bulk_loader import SOURCE_FILES, file_signature, source_files
+from movie_dimensions import sync_dimensions
+from movie_repository import MovieRepository, batches, convert_rows, iter_rows, source_file
+from movie_repository.schema import keyed_rows
+
+# 每批写入快照或数据表的行数
+BATCH_SIZE = 5000
+# 每张表保留的快照数（含最近一次已应用的快照），更早的快照只保留记录，删除其中的行
+KEEP_SNAPSHOTS = 3
+
+
+# 创建快照表
+def create_snapshot_tables(cursor):
+    try:
+        # 每次爬取一条记录；status 为 loading（写入中）、baseline（由数据表现有内容生成）、applied（已应用）或 pruned
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_snapshots (
+            id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(64) NOT NULL,
+            source_file VARCHAR(512) NOT NULL,
+            signature VARCHAR(64) NOT NULL,
+            row_count BIGINT NOT NULL DEFAULT 0,
+            status VARCHAR(16) NOT NULL,
+            created_at DATETIME NOT NULL,
+            KEY idx_crawl_snapshots_table (table_name, status, id)
+        )
+        ''')
+        # 快照只保存每部电影的唯一键和内容哈希（见 movie_repository.schema.natural_key），每行 32 字节
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_snapshot_rows (
+            snapshot_id BIGINT UNSIGNED NOT NULL,
+            row_key BINARY(16) NOT NULL,
+            row_hash BINARY(16) NOT NULL,
+            PRIMARY KEY (snapshot_id, row_key)
+        )
+        ''')
+    except Exception as e:
+        print('创建数据表时发生异常：', e)
+        raise
+
+
+def latest_snapshot(cursor, table):
+    cursor.execute("SELECT id, source_file, signature FROM crawl_snapshots "
+                   "WHERE table_name = %s AND status IN ('baseline', 'applied') ORDER BY id DESC LIMIT 1", (table,))
+    return cursor.fetchone()
+
+
+def new_snapshot(cursor, table, file_path, signature, status):
+    cursor.execute('INSERT INTO crawl_snapshots(table_name, source_file, signature, row_count, status, created_at) '
+                   'VALUES(%s, %s, %s, 0, %s, NOW())', (table, file_path, signature, status))
+    return cursor.lastrowid
+
+
+def delete_snapshot_rows(connection, snapshot_id, batch_size=BATCH_SIZE):
+    # 分批删除，避免一个大事务长时间持有锁
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM crawl_snapshot_rows WHERE snapshot_id = %s LIMIT %s', (snapshot_id, batch_size))
+            deleted = cursor.rowcount
+        connection.commit()
+        if deleted < batch_size:
+            return
+
+
+def baseline_snapshot(connection, table):
+    # 第一次刷新时还没有上一次快照，以数据表现有的内容作为上一次快照
+    with connection.cursor() as cursor:
+        snapshot_id = new_snapshot(cursor, table, '', '', 'baseline')
+        cursor.execute(f'INSERT INTO crawl_snapshot_rows(snapshot_id, row_key, row_hash) '
+                       f'SELECT %s, row_key, row_hash FROM {table} WHERE row_key IS NOT NULL', (snapshot_id,))
+        count = cursor.rowcount
+        cursor.execute('UPDATE crawl_snapshots SET row_count = %s WHERE id = %s', (count, snapshot_id))
+    connection.commit()
+    return snapshot_id
+
+
+def keyed_file_rows(table, file_path, batch_size=BATCH_SIZE):
+    # 流式读取爬取结果，逐行产生转换后的行，末尾带 row_key、row_hash
+    for batch in batches(iter_rows(file_path), batch_size):
+        yield from keyed_rows(table, convert_rows(table, batch))
+
+
+# 把一次爬取结果保存为快照
+def take_snapshot(connection, table, file_path, signature, batch_size=BATCH_SIZE):
+    """
+    功能:
+    - 流式读取 file_path，把每部电影的唯一键和内容哈希写入 crawl_snapshot_rows，每批单独提交。
+      文件中同一部电影出现多次时以最后一行为准，与 MovieRepository.upsert_many 一致。
+
+    输出:
+    - (快照 id, 快照中的电影数)。
+    """
+    with connection.cursor() as cursor:
+        snapshot_id = new_snapshot(cursor, table, os.path.abspath(file_path), signature, 'loading')
+    connection.commit()
+
+    sql = ('INSERT INTO crawl_snapshot_rows(snapshot_id, row_key, row_hash) VALUES(%s, %s, %s) '
+           'ON DUPLICATE KEY UPDATE row_hash = VALUES(row_hash)')
+    for batch in batches(keyed_file_rows(table, file_path, batch_size), batch_size):
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(snapshot_id, row[-2], row[-1]) for row in batch])
+        connection.commit()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM crawl_snapshot_rows WHERE snapshot_id = %s', (snapshot_id,))
+        count, = cursor.fetchone()
+    return snapshot_id, count
+
+
+# 按唯一键比较两次快照，写入变更日志
+def diff_snapshots(cursor, table, snapshot_id, previous_id):
+    """
+    功能:
+    - 在快照表的主键上连接两次快照：本次有、上次没有的为 insert，两次都有但哈希不同的为 update，
+      上次有、本次没有的为 delete。变更写入 movie_changes，删除的电影标题取自数据表中即将删除的行，
+      insert / update 的标题在应用后补上（见 apply_changes）。
+    - 不提交，由调用方与数据表的修改在同一个事务中提交，下游任务不会读到尚未应用的变更。
+
+    输出:
+    - {'inserted', 'updated', 'deleted'}：各类变更的数量。
+    """
+    insert = 'INSERT INTO movie_changes(snapshot_id, table_name, op, row_key, title, created_at) '
+    counts = {}
+    cursor.execute(insert + "SELECT %s, %s, 'insert', n.row_key, '', NOW() FROM crawl_snapshot_rows AS n "
+                            "LEFT JOIN crawl_snapshot_rows AS p ON p.snapshot_id = %s AND p.row_key = n.row_key "
+                            "WHERE n.snapshot_id = %s AND p.row_key IS NULL",
+                   (snapshot_id, table, previous_id, snapshot_id))
+    counts['inserted'] = cursor.rowcount
+    cursor.execute(insert + "SELECT %s, %s, 'update', n.row_key, '', NOW() FROM crawl_snapshot_rows AS n "
+                            "JOIN crawl_snapshot_rows AS p ON p.snapshot_id = %s AND p.row_key = n.row_key "
+                            "WHERE n.snapshot_id = %s AND n.row_hash <> p.row_hash",
+                   (snapshot_id, table, previous_id, snapshot_id))
+    counts['updated'] = cursor.rowcount
+    cursor.execute(insert + f"SELECT %s, %s, 'delete', p.row_key, COALESCE(t.title, ''), NOW() "
+                            f"FROM crawl_snapshot_rows AS p "
+                            f"LEFT JOIN crawl_snapshot_rows AS n ON n.snapshot_id = %s AND n.row_key = p.row_key "
+                            f"LEFT JOIN {table} AS t ON t.row_key = p.row_key "
+                            f"WHERE p.snapshot_id = %s AND n.row_key IS NULL",
+                   (snapshot_id, table, snapshot_id, previous_id))
+    counts['deleted'] = cursor.rowcount
+    return counts
+
+
+def changed_movie_ids(cursor, snapshot_id, deleted):
+    # 本次快照中新增、更新（deleted 为 False）或删除（deleted 为 True）的 moviemate_movies.id
+    cursor.execute(f"SELECT t.id FROM moviemate_movies AS t JOIN movie_changes AS c ON c.row_key = t.row_key "
+                   f"WHERE c.snapshot_id = %s AND c.op {'=' if deleted else '<>'} 'delete'", (snapshot_id,))
+    return [movie_id for movie_id, in cursor.fetchall()]
+
+
+# 把变更应用到数据表
+def apply_changes(connection, table, file_path, snapshot_id, batch_size=BATCH_SIZE):
+    """
+    功能:
+    - 删除 delete 变更对应的行；再读一遍文件，只把 insert / update 变更对应的行按唯一键写入数据表
+      （见 MovieRepository.upsert_many），内容未变的电影不读也不写。
+    - 不提交，由调用方提交。
+
+    输出:
+    - moviemate_movies 中新增、更新或删除的电影 id，用于增量更新类型、地区关联表；其他表为空列表。
+    """
+    movie_ids = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT row_key FROM movie_changes WHERE snapshot_id = %s AND op IN ('insert', 'update')",
+                       (snapshot_id,))
+        keys = {key for key, in cursor.fetchall()}
+        if table == 'moviemate_movies':
+            movie_ids += changed_movie_ids(cursor, snapshot_id, deleted=True)
+        cursor.execute(f"DELETE t FROM {table} AS t JOIN movie_changes AS c ON c.row_key = t.row_key "
+                       f"WHERE c.snapshot_id = %s AND c.op = 'delete'", (snapshot_id,))
+
+    if keys:
+        rows = (row[:-2] for row in keyed_file_rows(table, file_path, batch_size) if row[-2] in keys)
+        MovieRepository(connection).upsert_many(table, rows, batch_size, convert=False, commit=False)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE movie_changes AS c JOIN {table} AS t ON t.row_key = c.row_key SET c.title = t.title "
+                       f"WHERE c.snapshot_id = %s AND c.op <> 'delete'", (snapshot_id,))
+        if table == 'moviemate_movies':
+            movie_ids += changed_movie_ids(cursor, snapshot_id, deleted=False)
+    return movie_ids
+
+
+def prune_snapshots(connection, table, keep=KEEP_SNAPSHOTS):
+    # 只保留最近 keep 次快照的行；中断留下的 loading 快照也一并删除
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, status FROM crawl_snapshots WHERE table_name = %s AND status <> 'pruned' "
+                       "ORDER BY id DESC", (table,))
+        snapshots = cursor.fetchall()
+    kept = [snapshot_id for snapshot_id, status in snapshots if status != 'loading'][:keep]
+    for snapshot_id, _ in snapshots:
+        if snapshot_id not in kept:
+            delete_snapshot_rows(connection, snapshot_id)
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE crawl_snapshots SET status = 'pruned' WHERE id = %s", (snapshot_id,))
+            connection.commit()
+
+
+# 用一次爬取结果刷新一张表
+def refresh_table(connection, table, file_path, batch_size=BATCH_SIZE, force=False):
+    """
+    功能:
+    - 把 file_path 保存为新快照，与上一次快照按唯一键比较，只对数据表执行新增、更新和删除，
+      并把每条变更写入变更日志 movie_changes，供评分流程、缓存失效和推荐重建等下游任务读取。
+    - 变更日志、数据表的修改和快照状态在同一个事务中提交；中断后重新运行即可，未完成的快照会被丢弃。
+    - 文件（大小和修改时间）与上次已应用的快照相同时直接跳过，除非 force 为 True。
+    - 第一次刷新时以数据表现有的内容作为上一次快照。
+
+    输入:
+    - connection: pymysql 连接。
+    - table: TYPED_TABLES 中的表名。
+    - file_path: 爬取结果文件（.parquet / .csv / .xlsx），不存在时读取同名的其他格式文件。
+    - batch_size: 每批的行数。
+    - force: 文件未变化时也重新比较。
+
+    输出:
+    - {'inserted', 'updated', 'deleted', 'unchanged', 'seconds'}；跳过时返回 None。
+    """
+    start = time.perf_counter()
+    repository = MovieRepository(connection)
+    file_path = source_file(file_path)
+    signature = file_signature(file_path)
+    with connection.cursor() as cursor:
+        create_snapshot_tables(cursor)
+        repository.create_table(table)
+        repository.create_change_log()
+        previous = latest_snapshot(cursor, table)
+    connection.commit()
+    if previous and not force and previous[1] == os.path.abspath(file_path) and previous[2] == signature:
+        print(f"{table}: {file_path} 与上次刷新时相同，跳过。")
+        return None
+
+    previous_id = previous[0] if previous else baseline_snapshot(connection, table)
+    snapshot_id, total = take_snapshot(connection, table, file_path, signature, batch_size)
+    print(f"{table}: 快照 {snapshot_id} 共 {total} 部电影，耗时 {time.perf_counter() - start:.2f}s")
+
+    try:
+        with connection.cursor() as cursor:
+            counts = diff_snapshots(cursor, table, snapshot_id, previous_id)
+        movie_ids = apply_changes(connection, table, file_path, snapshot_id, batch_size)
+        if file_signature(file_path) != signature:
+            raise RuntimeError(f'{file_path} 在刷新期间发生了变化，请重新运行')
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE crawl_snapshots SET status = 'applied', row_count = %s WHERE id = %s",
+                           (total, snapshot_id))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    if movie_ids:
+        # 只替换变化的电影的类型、地区关联
+        sync_dimensions(connection, movie_ids)
+    prune_snapshots(connection, table)
+    counts['unchanged'] = total - counts['inserted'] - counts['updated']
+    counts['seconds'] = time.perf_counter() - start
+    print(f"{table}: 新增 {counts['inserted']}，更新 {counts['updated']}，删除 {counts['deleted']}，"
+          f"未变化 {counts['unchanged']}，耗时 {counts['seconds']:.2f}s")
+    return counts
+
+
+# 依次刷新多张表
+def refresh_tables(connection, files, batch_size=BATCH_SIZE, force=False):
+    """
+    功能:
+    - 对 files 中的每张表调用 refresh_table。某张表失败不影响其他表，失败的表重新运行即可。
+
+    输入:
+    - connection: pymysql 连接。
+    - files: {表名: 文件路径}。
+
+    输出:
+    - {表名: refresh_table 的结果}；跳过和失败的表不在其中。
+    """
+    results = {}
+    for table, file_path in files.items():
+        try:
+            counts = refresh_table(connection, table, file_path, batch_size, force)
+            if counts is not None:
+                results[table] = counts
+        except Exception as e:
+            print(f'{table}: 刷新时发生异常：', e)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='把爬取结果保存为快照，与上一次快照比较后只应用变化的电影')
+    parser.add_argument('--tables', nargs='+', choices=list(SOURCE_FILES), default=list(SOURCE_FILES))
+    parser.add_argument('--file', action='append', default=[], metavar='TABLE=PATH',
+                        help='替换某张表的默认文件，可重复')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--force', action='store_true', help='文件未变化时也重新比较')
+    args = parser.parse_args()
+    files = source_files(parser, args.tables, args.file)
+
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            refresh_tables(connection, files, args.batch_size, args.force)
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,55 +1,37 @@
 import json
 
 import pymysql
-import pandas as pd
+
+from movie_repository import MovieRepository, read_csv, read_excel, read_parquet
 
 # 创建数据库
 def create_database(cursor, database):
     try:
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
-        print(f"数据库 {database} 创建或已存在。")
+        MovieRepository(cursor.connection).create_database(database)
     except Exception as e:
         print('创建数据库时发生异常：', e)
         raise
 
-# 创建douban_movies数据表
+# 创建douban_movies数据表，表结构见 movie_repository/schema.py
 def create_douban_table(cursor):
     try:
-        sql = '''
-        CREATE TABLE IF NOT EXISTS douban_movies (
-            director VARCHAR(255) NOT NULL,
-            starring VARCHAR(255) NOT NULL,
-            genre VARCHAR(255) NOT NULL,
-            region VARCHAR(255) NOT NULL,
-            year VARCHAR(255) NOT NULL,
-            detail_url VARCHAR(255) NOT NULL,
-            title VARCHAR(255) NOT NULL,
-            rating VARCHAR(255) NOT NULL,
-            rating_count VARCHAR(255) NOT NULL,
-            poster_url VARCHAR(255) NOT NULL
-        )
-        '''
-        cursor.execute(sql)
-        print("数据表 douban_movies 创建或已存在。")
+        MovieRepository(cursor.connection).create_table('douban_movies')
     except Exception as e:
         print('创建数据表时发生异常：', e)
         raise
 
 def add_all_douban_data(cursor, data):
     try:
-        sql = 'INSERT IGNORE INTO douban_movies(director, starring, genre, region, year, detail_url, title, rating, rating_count, poster_url) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
-        cursor.executemany(sql, data)
-        cursor.connection.commit()
-        print(f"成功添加 {cursor.rowcount} 条数据。")
+        # 评分、年份等文本转换为数值，无法解析的写入 NULL；按唯一键增量写入，重复导入不产生重复行，一次提交
+        counts = MovieRepository(cursor.connection).upsert_many('douban_movies', data)
+        print(f"新增 {counts['inserted']} 条，更新 {counts['updated']} 条，未变化 {counts['unchanged']} 条数据。")
     except Exception as e:
         print('添加所有数据时发生异常：', e)
         raise
 
 def delete_all_douban_data(cursor):
     try:
-        sql = 'TRUNCATE TABLE douban_movies'
-        cursor.execute(sql)
-        print("所有数据已删除。")
+        MovieRepository(cursor.connection).truncate('douban_movies')
     except Exception as e:
         print('删除所有数据时发生异常：', e)
         raise
@@ -57,9 +39,7 @@ def delete_all_douban_data(cursor):
 # 通过电影名称查找单条数据
 def search_single_douban_data_by_title(cursor, title):
     try:
-        sql = 'SELECT * FROM douban_movies WHERE title = %s'
-        cursor.execute(sql, (title,))
-        result = cursor.fetchone()
+        result = MovieRepository(cursor.connection).find_by_title('douban_movies', title)
         if result:
             print("查询结果：", result)
         else:
@@ -69,63 +49,17 @@ def search_single_douban_data_by_title(cursor, title):
         print('查询数据库电影评分数据时发生异常：', e)
         raise
 
-# # 读取csv文件
-# def read_csv(file_path):
-#     try:
-#         return pd.read_csv(file_path, dtype=str).values.tolist()
-#     except Exception as e:
-#         print('读取CSV文件时发生异常：', e)
-#         raise
-
-def read_excel(file_path):
-    try:
-        # 读取 Excel 文件
-        df = pd.read_excel(file_path, dtype=str)
-        # 替换 NaN 值为 ''
-        df.fillna('', inplace=True)
-        # 将 DataFrame 转换为列表
-        return df.values.tolist()
-    except Exception as e:
-        print('读取Excel文件时发生异常：', e)
-        raise
-
-def read_csv(file_path):
-    try:
-        # 读取 CSV 文件
-        df = pd.read_csv(file_path, dtype=str)
-        # 替换 NaN 值为 ''
-        df.fillna('', inplace=True)
-        # 将 DataFrame 转换为列表
-        return df.values.tolist()
-    except Exception as e:
-        print('读取CSV文件时发生异常：', e)
-        raise
-
 
 def best_15_movies(cursor):
     try:
-        # 编写SQL查询语句，按评分降序排列，并限制结果为前15条
-        sql = 'SELECT title, rating, poster_url , detail_url FROM douban_movies ORDER BY rating DESC LIMIT 100'
-        # 执行SQL查询
-        cursor.execute(sql)
-        # 获取查询结果
-        results = cursor.fetchall()
-        # 处理结果
-        best_movies = []
-        for row in results:
-            movie_name, rating, poster_url, detail_url = row
-            best_movies.append({
-                'title': movie_name,
-                'rating': rating,
-                'poster_url': poster_url,
-                'detail_url':detail_url
-            })
+        # 从预先排好序、去过重的总榜读取（见 推荐算法代码/leaderboards.py）前15条
+        best_movies = MovieRepository(cursor.connection).leaderboard('overall', 'douban', 15)
         best_15_movies_poster_url = []
         best_15_movies_detail_url = []
         for movie in best_movies:
-            if movie['poster_url'] not in best_15_movies_poster_url:
-                best_15_movies_poster_url.append(movie['poster_url'])
-                best_15_movies_detail_url.append(movie['detail_url'])
+            if movie.poster_url not in best_15_movies_poster_url:
+                best_15_movies_poster_url.append(movie.poster_url)
+                best_15_movies_detail_url.append(movie.detail_url)
 
         # 读取现有的JSON文件
         with open(r'D:\PythonProject\moviemate\movie-reommendation-system\GUI\gui\webGUI\static\assets\userData\home.json','r', encoding='utf-8') as file:
@@ -145,30 +79,9 @@ def best_15_movies(cursor):
 
 def best_10_movies_by_genre(cursor, genre):
     try:
-        # 编写SQL查询语句，按评分降序排列，并限制结果为前15条，同时筛选特定类别
-        sql = f'SELECT title, rating, poster_url FROM douban_movies WHERE genre LIKE %s ORDER BY rating DESC LIMIT 100'
-        # 执行SQL查询，传入类别参数
-        cursor.execute(sql, (genre,))
-        # 获取查询结果
-        results = cursor.fetchall()
-        # 处理结果
-
-        best_movies = []
-        for row in results:
-            movie_name, rating, poster_url = row
-            best_movies.append({
-                'title': movie_name,
-                'rating': rating,
-                'poster_url': poster_url
-            })
-        best_100_movies_poster_url = []
-        for movie in best_movies:
-            poster_url = movie['poster_url']
-            if poster_url not in best_100_movies_poster_url:
-                best_100_movies_poster_url.append(poster_url)
-        best_10_movies_poster_url = []
-        for i in range(10):
-            best_10_movies_poster_url.append(best_100_movies_poster_url[i])
+        # 从该类型的排行榜读取，榜单已按评分数值排序并去重
+        best_movies = MovieRepository(cursor.connection).best_by_genre(genre, 10, 'douban')
+        best_10_movies_poster_url = list(dict.fromkeys(movie.poster_url for movie in best_movies))
 
         # 读取现有的JSON文件
         with open(
@@ -217,12 +130,11 @@ def main():
             #
             # create_douban_table(cursor)
             #
-            # file_path = r'../爬取网站代码/豆瓣电影.xlsx'
-            # data = read_excel(file_path)
+            # file_path = r'../爬取网站代码/豆瓣电影.parquet'
+            # data = read_parquet(file_path)
             #
             # print('数据长度', len(data))
             #
-            # delete_all_douban_data(cursor)
             # add_all_douban_data(cursor, data)
             # print("数据添加完成。")
 
@@ -1,53 +1,35 @@
 import pymysql
-import pandas as pd
+
+from movie_repository import MovieRepository, iter_rows, source_file
 
 # 创建数据库
 def create_database(cursor, database):
     try:
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
-        print(f"数据库 {database} 创建或已存在。")
+        MovieRepository(cursor.connection).create_database(database)
     except Exception as e:
         print('创建数据库时发生异常：', e)
         raise
 
-# 创建dytt_movies数据表
+# 创建dytt_movies数据表，表结构见 movie_repository/schema.py
 def create_dytt_table(cursor):
     try:
-        sql = '''
-        CREATE TABLE IF NOT EXISTS dytt_movies (
-            title VARCHAR(255) NOT NULL,
-            cover VARCHAR(255) NOT NULL,
-            year VARCHAR(255) NOT NULL,
-            country VARCHAR(255) NOT NULL,
-            category VARCHAR(255) NOT NULL,
-            imdb_rating VARCHAR(255) NOT NULL,
-            douban_rating VARCHAR(255) NOT NULL,
-            duration VARCHAR(255) NOT NULL,
-            download_link VARCHAR(255) NOT NULL,
-            screen_shot VARCHAR(255) NOT NULL
-        )
-        '''
-        cursor.execute(sql)
-        print("数据表 dytt_movies 创建或已存在。")
+        MovieRepository(cursor.connection).create_table('dytt_movies')
     except Exception as e:
         print('创建数据表时发生异常：', e)
         raise
 
 def add_all_dytt_data(cursor, data):
     try:
-        sql = ('INSERT IGNORE INTO dytt_movies(title, cover, year, country, category, imdb_rating, douban_rating, duration, download_link, screen_shot) VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)')
-        cursor.executemany(sql, data)
-        cursor.connection.commit()
-        print(f"成功添加 {cursor.rowcount} 条数据。")
+        # 评分、年份等文本转换为数值，无法解析的写入 NULL；按唯一键增量写入，重复导入不产生重复行，一次提交
+        counts = MovieRepository(cursor.connection).upsert_many('dytt_movies', data)
+        print(f"新增 {counts['inserted']} 条，更新 {counts['updated']} 条，未变化 {counts['unchanged']} 条数据。")
     except Exception as e:
         print('添加所有数据时发生异常：', e)
         raise
 
 def delete_all_dytt_data(cursor):
     try:
-        sql = 'TRUNCATE TABLE dytt_movies'
-        cursor.execute(sql)
-        print("所有数据已删除。")
+        MovieRepository(cursor.connection).truncate('dytt_movies')
     except Exception as e:
         print('删除所有数据时发生异常：', e)
         raise
@@ -55,9 +37,7 @@ def delete_all_dytt_data(cursor):
 # 通过电影名称查找单条数据
 def search_single_dytt_data_by_title(cursor, title):
     try:
-        sql = 'SELECT * FROM dytt_movies WHERE title = %s'
-        cursor.execute(sql, (title,))
-        result = cursor.fetchone()
+        result = MovieRepository(cursor.connection).find_by_title('dytt_movies', title)
         if result:
             print("查询结果：", result)
         else:
@@ -67,18 +47,6 @@ def search_single_dytt_data_by_title(cursor, title):
         print('查询数据库电影评分数据时发生异常：', e)
         raise
 
-def read_excel(file_path):
-    try:
-        # 读取 Excel 文件
-        df = pd.read_excel(file_path, dtype=str)
-        # 替换 NaN 值为 ''
-        df.fillna('', inplace=True)
-        # 将 DataFrame 转换为列表
-        return df.values.tolist()
-    except Exception as e:
-        print('读取Excel文件时发生异常：', e)
-        raise
-
 def main():
     host = 'localhost'
     user = 'root'
@@ -95,12 +63,12 @@ def main():
 
             create_dytt_table(cursor)
 
-            file_path = r'../爬取网站代码/movies_dytt.xlsx'
-            data = read_excel(file_path)
+            # 还没有转换为 Parquet 时读取仓库中的 movies_dytt.xlsx
+            file_path = source_file(r'../爬取网站代码/movies_dytt.parquet')
+            data = list(iter_rows(file_path))
 
             print('数据长度', len(data))
 
-            delete_all_dytt_data(cursor)
             add_all_dytt_data(cursor, data)
             print("数据添加完成。")
 
@@ -0,0 +1,437 @@
+import re
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import pymysql
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from movie_repository.schema import normalize_title, source_key_sql
+
+# 各来源表参与实体对齐的列：(数据表, 记录键, 标题, 年份/上映日期, 导演, 主演)
+# 记录键必须在重新爬取后保持不变，编号才能稳定：猫眼没有电影 id，image_url 随海报更换而变化，
+# 改用由规范化标题 + 上映年份计算的 row_key（见 movie_repository/schema.py 的 natural_key）
+SOURCE_RECORDS = {
+    'douban': ('douban_movies', 'detail_url', 'title', 'year', 'director', 'starring'),
+    'maoyan': ('maoyan_movies', 'row_key', 'title', 'release_date', None, 'cast'),
+    'dytt': ('dytt_movies', 'download_link', 'title', 'year', None, None),
+    'moviemate': ('moviemate_movies', 'detail_url', 'title', 'year', 'director', 'starring'),
+}
+
+# MinHash 签名长度 = 分带数 × 每带行数
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+MERSENNE_PRIME = (1 << 61) - 1
+
+YEAR_PATTERN = re.compile(r'(18|19|20)\d{2}')
+PERSON_SPLIT_PATTERN = re.compile(r'[/,，、|]+')
+
+
+def parse_year(text):
+    # 从 '1994'、'1994-09-10'、'2019年剧情' 等文本中取出年份，取不到返回 0
+    match = YEAR_PATTERN.search(str(text or ''))
+    return int(match.group(0)) if match else 0
+
+
+def parse_people(*texts):
+    # 导演和主演拆分为人名集合
+    people = set()
+    for text in texts:
+        for name in PERSON_SPLIT_PATTERN.split(str(text or '')):
+            name = name.strip().lower()
+            if name and name != 'n/a':
+                people.add(name)
+    return frozenset(people)
+
+
+def title_shingles(title):
+    # 标题的字符二元组，中文标题按字切分即可；单字标题取自身
+    if len(title) < 2:
+        return [title] if title else []
+    return [title[i:i + 2] for i in range(len(title) - 1)]
+
+
+# 从数据库读取各来源的记录
+def read_source_records(connection, sources=SOURCE_RECORDS, batch_size=10000):
+    """
+    功能:
+    - 流式读取各来源表中参与对齐的列，整理为一个记录表。
+
+    输入:
+    - connection: pymysql 连接。
+    - sources: 来源定义，默认 SOURCE_RECORDS。
+    - batch_size: 每次从服务器取回的行数。
+
+    输出:
+    - DataFrame，列为 source、source_key、title、norm_title、year、people。
+    """
+    records = []
+    for source, (table, key, title, year, director, starring) in sources.items():
+        columns = [source_key_sql(key), title, year, director or "''", starring or "''"]
+        with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for source_key, title_text, year_text, director_text, starring_text in rows:
+                    records.append((source, source_key, title_text, normalize_title(title_text),
+                                    parse_year(year_text), parse_people(director_text, starring_text)))
+    return pd.DataFrame(records, columns=['source', 'source_key', 'title', 'norm_title', 'year', 'people'])
+
+
+# 读取 TMDB 爬虫输出的 CSV
+def read_tmdb_records(file_path):
+    """
+    功能:
+    - 读取 IMTB爬取.py 输出的 movie_details.csv，整理为与 read_source_records 相同的记录表。
+    """
+    df = pd.read_csv(file_path, dtype=str).fillna('')
+    return pd.DataFrame({
+        'source': 'tmdb',
+        'source_key': df['Title'] + '|' + df['Release Date'],
+        'title': df['Title'],
+        'norm_title': df['Title'].map(normalize_title),
+        'year': df['Release Date'].map(parse_year),
+        'people': [frozenset()] * len(df),
+    })
+
+
+# 计算 MinHash 签名
+def minhash_signatures(norm_titles, num_hashes=NUM_BANDS * ROWS_PER_BAND, chunk_size=20000, seed=1):
+    """
+    功能:
+    - 对每个规范化标题的字符二元组集合计算 MinHash 签名，按记录分块做向量化计算。
+
+    输入:
+    - norm_titles: 规范化后的标题序列。
+    - num_hashes: 签名长度。
+    - chunk_size: 每块的记录数，控制内存占用。
+    - seed: 随机数种子，保证多次运行签名一致。
+
+    输出:
+    - signatures: 记录数 × num_hashes 的 uint64 数组；空标题的签名全为最大值。
+    """
+    rng = np.random.default_rng(seed)
+    # a 取 29 位以内，保证 a * h（h 为 32 位）不超过 uint64
+    a = rng.integers(1, 1 << 29, num_hashes, dtype=np.uint64)
+    b = rng.integers(0, MERSENNE_PRIME, num_hashes, dtype=np.uint64)
+    empty = np.iinfo(np.uint64).max
+
+    signatures = np.full((len(norm_titles), num_hashes), empty, dtype=np.uint64)
+    for start in range(0, len(norm_titles), chunk_size):
+        hashes, owners = [], []
+        for i, title in enumerate(norm_titles[start:start + chunk_size]):
+            for shingle in title_shingles(title):
+                hashes.append(zlib.crc32(shingle.encode('utf-8')))
+                owners.append(i)
+        if not hashes:
+            continue
+        hashes = np.array(hashes, dtype=np.uint64)
+        owners = np.array(owners, dtype=np.int64)
+
+        # 第 k 个哈希函数为 (a_k * h + b_k) mod p
+        permuted = (a[:, None] * hashes[None, :] + b[:, None]) % np.uint64(MERSENNE_PRIME)
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        mins = np.minimum.reduceat(permuted, starts, axis=1)
+        signatures[start + owners[starts]] = mins.T
+    return signatures
+
+
+# LSH 分带生成候选对
+def candidate_pairs(signatures, years, window=20):
+    """
+    功能:
+    - 把签名分成 NUM_BANDS 个带，同一带内哈希相同且年份相差不超过1年（或年份未知）的记录互为候选；
+      桶内按年份排序后每条记录只与后面 window 条比较，避免热门短标题形成的大桶退化为平方复杂度。
+
+    输入:
+    - signatures: minhash_signatures 的输出。
+    - years: 每条记录的年份数组，0 表示未知。
+    - window: 桶内比较的窗口大小。
+
+    输出:
+    - pairs: (候选对数, 2) 的 int64 数组，每行 i < j，已去重。
+    """
+    empty = np.iinfo(np.uint64).max
+    valid = signatures[:, 0] != empty
+    pairs = []
+    for band in range(NUM_BANDS):
+        rows = signatures[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        # 把一个带内的几个签名值合并为一个 64 位哈希（FNV 风格，溢出按模 2^64 回绕）
+        band_hash = rows[:, 0].copy()
+        for k in range(1, ROWS_PER_BAND):
+            band_hash = (band_hash * np.uint64(0x100000001B3)) ^ rows[:, k]
+        order = np.lexsort((years, band_hash))
+        order = order[valid[order]]
+        sorted_hash = band_hash[order]
+        sorted_years = years[order]
+        for offset in range(1, window + 1):
+            same = sorted_hash[offset:] == sorted_hash[:-offset]
+            if not same.any():
+                break
+            # 按年份分块：年份都已知时只保留相差不超过1年的候选
+            left_years, right_years = sorted_years[:-offset], sorted_years[offset:]
+            same &= (left_years == 0) | (right_years == 0) | (np.abs(left_years - right_years) <= 1)
+            pairs.append(np.column_stack([order[:-offset][same], order[offset:][same]]))
+
+    if not pairs:
+        return np.empty((0, 2), dtype=np.int64)
+    # 编码为单个 int64 后去重，比按行去重快得多
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    n = len(signatures)
+    keys = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return np.column_stack([keys // n, keys % n])
+
+
+# 对候选对打分
+def score_pairs(records, signatures, pairs, threshold=0.75, chunk_size=1000000, with_scores=False):
+    """
+    功能:
+    - 对候选对计算综合得分：标题相似度（MinHash 一致比例）0.6、年份 0.2、导演/主演重合度 0.2，
+      年份都已知且相差超过1年的直接排除；规范化标题完全相同且年份相容的直接判为同一部电影。
+
+    输入:
+    - records: read_source_records 的记录表。
+    - signatures: minhash_signatures 的输出。
+    - pairs: candidate_pairs 的输出。
+    - threshold: 判定为同一部电影的得分阈值。
+    - chunk_size: 每次打分的候选对数量，控制内存占用。
+    - with_scores: 为 True 时同时返回每个匹配的得分，规范化标题完全相同的匹配得分加 1，排在其他匹配之前。
+
+    输出:
+    - matched: 判定为同一部电影的候选对；with_scores 为 True 时为 (matched, scores)。
+    """
+    if len(pairs) > chunk_size:
+        parts = [score_pairs(records, signatures, pairs[start:start + chunk_size], threshold, chunk_size, True)
+                 for start in range(0, len(pairs), chunk_size)]
+        matched = np.concatenate([part[0] for part in parts])
+        scores = np.concatenate([part[1] for part in parts])
+        return (matched, scores) if with_scores else matched
+    if len(pairs) == 0:
+        return (pairs, np.empty(0)) if with_scores else pairs
+    left, right = pairs[:, 0], pairs[:, 1]
+    title_score = (signatures[left] == signatures[right]).mean(axis=1)
+
+    years = records['year'].to_numpy()
+    year_gap = np.abs(years[left] - years[right])
+    known = (years[left] > 0) & (years[right] > 0)
+    year_score = np.where(known, np.select([year_gap == 0, year_gap == 1], [1.0, 0.7], 0.0), 0.5)
+
+    norm_titles = records['norm_title'].to_numpy()
+    same_title = norm_titles[left] == norm_titles[right]
+    compatible = ~known | (year_gap <= 1)
+
+    # 先排除即使导演/主演完全一致也达不到阈值的候选对，只对剩余的计算人名重合度
+    partial = 0.6 * title_score + 0.2 * year_score
+    keep = compatible & ((partial + 0.2 >= threshold) | same_title)
+    pairs, partial, same_title = pairs[keep], partial[keep], same_title[keep]
+
+    people = records['people'].to_numpy()
+    people_score = np.fromiter(
+        (len(people[i] & people[j]) / len(people[i] | people[j]) if people[i] and people[j] else 0.5
+         for i, j in pairs),
+        dtype=np.float64, count=len(pairs))
+
+    score = partial + 0.2 * people_score
+    match = (score >= threshold) | same_title
+    if with_scores:
+        return pairs[match], (score + same_title)[match]
+    return pairs[match]
+
+
+def clustering_edges(matched, scores, years):
+    """
+    功能:
+    - 选出参与连通分量的匹配：两条记录年份都已知的匹配全部保留；年份未知的记录与任何年份都相容，
+      只保留它得分最高的一个匹配（优先年份已知的记录），这样它最多并入一部电影，
+      不会把年份已知且互相矛盾的两部电影（如不同年份的翻拍）连成一个分量。
+
+    输入:
+    - matched, scores: score_pairs(..., with_scores=True) 的输出。
+    - years: 每条记录的年份数组，0 表示未知。
+
+    输出:
+    - 参与连通分量的候选对。
+    """
+    if len(matched) == 0:
+        return matched
+    known = years > 0
+    left, right = matched[:, 0], matched[:, 1]
+    both_known = known[left] & known[right]
+    # 每个涉及年份未知记录的匹配，从未知记录一侧各看一次：(未知记录, 另一条记录)
+    left_unknown, right_unknown = ~known[left], ~known[right]
+    records = np.concatenate([np.column_stack([left[left_unknown], right[left_unknown]]),
+                              np.column_stack([right[right_unknown], left[right_unknown]])])
+    if len(records) == 0:
+        return matched[both_known]
+    other_known = known[records[:, 1]]
+    other_scores = np.concatenate([scores[left_unknown], scores[right_unknown]])
+    # 按 (未知记录, 另一条年份已知, 得分) 排序，每条未知记录取最后一个
+    order = np.lexsort((other_scores, other_known, records[:, 0]))
+    records = records[order]
+    last = np.r_[records[1:, 0] != records[:-1, 0], True]
+    return np.concatenate([matched[both_known], records[last]])
+
+
+# 分配统一电影编号
+def assign_movie_ids(records, threshold=0.75, window=20):
+    """
+    功能:
+    - 完整的实体对齐流程：MinHash 签名 -> LSH 分带候选 -> 打分 -> 连通分量，为每条记录分配统一的 movie_id。
+      年份未知的记录只并入它最匹配的一部电影（见 clustering_edges）。
+
+    输入:
+    - records: read_source_records / read_tmdb_records 拼接后的记录表。
+    - threshold: 匹配阈值。
+    - window: LSH 桶内比较窗口。
+
+    输出:
+    - records: 增加 movie_id 列（从1开始，按分量内最早的记录排序）的记录表。
+    """
+    records = records.reset_index(drop=True)
+    start = time.perf_counter()
+    signatures = minhash_signatures(records['norm_title'].tolist())
+    pairs = candidate_pairs(signatures, records['year'].to_numpy(), window)
+    matched, scores = score_pairs(records, signatures, pairs, threshold, with_scores=True)
+    print(f"{len(records)} 条记录，{len(pairs)} 个候选对，{len(matched)} 个匹配，耗时 {time.perf_counter() - start:.2f}s")
+    edges = clustering_edges(matched, scores, records['year'].to_numpy())
+
+    n = len(records)
+    graph = coo_matrix((np.ones(len(edges), dtype=np.int8), (edges[:, 0], edges[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    # 分量编号按其第一条记录出现的顺序重新编号，保证结果稳定
+    first_seen = np.full(labels.max() + 1 if n else 0, n, dtype=np.int64)
+    np.minimum.at(first_seen, labels, np.arange(n))
+    rank = np.empty_like(first_seen)
+    rank[np.argsort(first_seen, kind='stable')] = np.arange(len(first_seen))
+    records['movie_id'] = rank[labels] + 1
+    return records
+
+
+# 创建 movie_entity 映射表
+def create_movie_entity_table(cursor):
+    try:
+        sql = '''
+        CREATE TABLE IF NOT EXISTS movie_entity (
+            source VARCHAR(32) NOT NULL,
+            source_key VARCHAR(255) NOT NULL,
+            movie_id INT UNSIGNED NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            PRIMARY KEY (source, source_key),
+            KEY idx_movie_entity_movie_id (movie_id)
+        )
+        '''
+        cursor.execute(sql)
+        print("数据表 movie_entity 创建或已存在。")
+    except Exception as e:
+        print('创建数据表时发生异常：', e)
+        raise
+
+
+def entity_keys(records):
+    # movie_entity 的主键：(来源, 截断到列长度的记录键)
+    return list(zip(records['source'], records['source_key'].astype(str).str[:255]))
+
+
+def load_movie_entities(cursor):
+    # 上一次运行保存的 (source, source_key) -> movie_id
+    cursor.execute('SELECT source, source_key, movie_id FROM movie_entity')
+    return {(source, source_key): movie_id for source, source_key, movie_id in cursor.fetchall()}
+
+
+# 沿用上一次运行的电影编号
+def stable_movie_ids(records, existing):
+    """
+    功能:
+    - assign_movie_ids 按本次的连通分量编号，每次运行都可能不同。这里把每个分量映射回上一次的编号：
+      分量中的记录上次大多属于哪个编号就沿用哪个；同一个旧编号被拆到多个分量时，记录最多的分量沿用，
+      其他分量和全新的分量从上次的最大编号之后依次编号。下游按编号关联的数据在重新运行后保持有效。
+
+    输入:
+    - records: assign_movie_ids 的输出。
+    - existing: load_movie_entities 的输出。
+
+    输出:
+    - records: movie_id 替换为稳定编号的记录表。
+    """
+    old = pd.Series([existing.get(key, 0) for key in entity_keys(records)], index=records.index)
+    votes = (pd.DataFrame({'component': records['movie_id'], 'old': old})[old > 0]
+             .value_counts().rename('n').reset_index()
+             .sort_values(['n', 'old', 'component'], ascending=[False, True, True]))
+    mapping, used = {}, set()
+    for component, old_id, _ in votes.itertuples(index=False):
+        if component not in mapping and old_id not in used:
+            mapping[component] = old_id
+            used.add(old_id)
+    next_id = max(existing.values(), default=0) + 1
+    for component in pd.unique(records['movie_id']):
+        if component not in mapping:
+            mapping[component] = next_id
+            next_id += 1
+    records = records.copy()
+    records['movie_id'] = records['movie_id'].map(mapping).astype(np.int64)
+    return records
+
+
+# 写入映射表
+def save_movie_entities(cursor, records, batch_size=5000):
+    """
+    功能:
+    - 按 (source, source_key) 增量写入映射：编号或标题变化的行更新，本次不再出现的记录删除，
+      其余映射不变（编号由 stable_movie_ids 沿用上一次的结果）。
+    """
+    try:
+        existing = load_movie_entities(cursor)
+        sql = ('INSERT INTO movie_entity(source, source_key, movie_id, title) VALUES(%s, %s, %s, %s) '
+               'ON DUPLICATE KEY UPDATE movie_id = VALUES(movie_id), title = VALUES(title)')
+        keys = entity_keys(records)
+        data = [(*key, movie_id, title) for key, movie_id, title in
+                zip(keys, records['movie_id'].astype(int), records['title'].astype(str).str[:255])]
+        for start in range(0, len(data), batch_size):
+            cursor.executemany(sql, data[start:start + batch_size])
+        stale = list(set(existing) - set(keys))
+        for start in range(0, len(stale), batch_size):
+            chunk = stale[start:start + batch_size]
+            cursor.execute(f'DELETE FROM movie_entity WHERE (source, source_key) IN '
+                           f'({", ".join(["(%s, %s)"] * len(chunk))})', [value for key in chunk for value in key])
+        cursor.connection.commit()
+        print(f"成功写入 {len(data)} 条映射，删除 {len(stale)} 条已不存在的映射。")
+    except Exception as e:
+        cursor.connection.rollback()
+        print('写入实体映射时发生异常：', e)
+        raise
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        records = read_source_records(connection)
+        # tmdb_file = r'../爬取网站代码/movie_details.csv'
+        # records = pd.concat([records, read_tmdb_records(tmdb_file)], ignore_index=True)
+        records = assign_movie_ids(records)
+        with connection.cursor() as cursor:
+            create_movie_entity_table(cursor)
+            records = stable_movie_ids(records, load_movie_entities(cursor))
+            print(f"共识别出 {records['movie_id'].nunique()} 部不同的电影")
+            save_movie_entities(cursor, records)
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
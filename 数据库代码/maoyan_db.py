@@ -1,69 +1,42 @@
 import pymysql
-import pandas as pd
+
+from movie_repository import MovieRepository, read_csv
 
 # 创建数据库
 def create_database(cursor, database):
     try:
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
-        print(f"数据库 {database} 创建或已存在。")
+        MovieRepository(cursor.connection).create_database(database)
     except Exception as e:
         print('创建数据库时发生异常：', e)
         raise
 
-# 创建maoyan_movies数据表
+# 创建maoyan_movies数据表，表结构见 movie_repository/schema.py
 def create_maoyan_table(cursor):
     try:
-        sql = '''
-        CREATE TABLE IF NOT EXISTS maoyan_movies (
-            title VARCHAR(255) NOT NULL,
-            grade VARCHAR(255) NOT NULL,
-            genre VARCHAR(255) NOT NULL,
-            cast VARCHAR(255) NOT NULL,
-            release_date VARCHAR(255) NOT NULL,
-            image_url VARCHAR(255) NOT NULL
-        )
-        '''
-        cursor.execute(sql)
-        print("数据表 maoyan_movies 创建或已存在。")
+        MovieRepository(cursor.connection).create_table('maoyan_movies')
     except Exception as e:
         print('创建数据表时发生异常：', e)
         raise
 
-# def add_all_maoyan_data(cursor, data):
-#     try:
-#         sql = 'INSERT IGNORE INTO maoyan_movies(title, grade, genre, cast, release_date, image_url) VALUES(%s, %s, %s, %s, %s, %s)'
-#         cursor.executemany(sql, data)
-#         cursor.connection.commit()
-#         print(f"成功添加 {cursor.rowcount} 条数据。")
-#     except Exception as e:
-#         print('添加数据时发生异常：', e)
-#         raise
-
 def add_all_maoyan_data(cursor, data):
     try:
-        sql = 'INSERT IGNORE INTO maoyan_movies(title, grade, genre, cast, release_date, image_url) VALUES(%s, %s, %s, %s, %s, %s)'
-        for row in data:
-            cursor.execute(sql, row)
-        cursor.connection.commit()
-        print(f"成功添加 {len(data)} 条数据。")
+        # 评分、年份等文本转换为数值，无法解析的写入 NULL；按唯一键增量写入，重复导入不产生重复行，一次提交
+        counts = MovieRepository(cursor.connection).upsert_many('maoyan_movies', data)
+        print(f"新增 {counts['inserted']} 条，更新 {counts['updated']} 条，未变化 {counts['unchanged']} 条数据。")
     except Exception as e:
         print('添加数据时发生异常：', e)
         raise
 
 def delete_all_maoyan_data(cursor):
     try:
-        sql='TRUNCATE TABLE maoyan_movies'
-        cursor.execute(sql)
-        print('成功删除所有数据')
+        MovieRepository(cursor.connection).truncate('maoyan_movies')
     except Exception as e:
         print(f'删除数据时出错{e}')
 
 # 通过电影名称查找单条数据
 def search_maoyan_data_by_title(cursor, title):
     try:
-        sql = 'SELECT * FROM maoyan_movies WHERE title = %s'
-        cursor.execute(sql, (title,))
-        result = cursor.fetchone()
+        result = MovieRepository(cursor.connection).find_by_title('maoyan_movies', title)
         if result:
             print("查询结果：", result)
         else:
@@ -73,17 +46,6 @@ def search_maoyan_data_by_title(cursor, title):
         print('查询数据库电影评分数据时发生异常：', e)
         raise
 
-# 读取csv文件
-def read_csv(file_path):
-    try:
-        df = pd.read_csv(file_path, dtype=str, encoding='utf-8')
-        # 用一个空字符串替换所有的 nan 值
-        df.fillna('', inplace=True)
-        return [tuple(x) for x in df.values.tolist()]
-    except Exception as e:
-        print('读取CSV文件时发生异常：', e)
-        raise
-
 def main():
     host = 'localhost'
     user = 'root'
@@ -105,7 +67,6 @@ def main():
             print('数据长度',len(data))
             print(data[:10])
 
-            delete_all_maoyan_data(cursor)
             add_all_maoyan_data(cursor, data)
             print("数据添加完成。")
 
@@ -0,0 +1,152 @@
+import re
+import time
+
+import pymysql
+
+from movie_repository import MovieRepository
+
+# 维度：名称 -> (维度表, 关联表, 关联表中的维度 id 列, moviemate_movies 中的原始列)
+DIMENSIONS = {
+    'genre': ('genres', 'movie_genre', 'genre_id', 'genre'),
+    'region': ('regions', 'movie_region', 'region_id', 'region'),
+}
+
+SPLIT_PATTERN = re.compile(r'[/,，、|]')
+
+
+def split_values(text):
+    # '剧情/爱情' -> ['剧情', '爱情']，去掉空白和重复，保留原有顺序
+    return list(dict.fromkeys(value.strip() for value in SPLIT_PATTERN.split(str(text or '')) if value.strip()))
+
+
+# 创建维度表和关联表
+def create_dimension_tables(cursor):
+    """
+    功能:
+    - 每个维度一张名称表（整数 id）和一张关联表。关联表以 (维度 id, movie_id) 为主键，
+      按类型/地区筛选电影是主键上的范围扫描；反向的 (movie_id, 维度 id) 索引用于查一部电影的类型。
+      position 为该取值在原字符串中的顺序，第一个类型即原来 split('/')[0] 的结果。
+    """
+    try:
+        for table, link, column, _ in DIMENSIONS.values():
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id SMALLINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                UNIQUE KEY uk_{table}_name (name)
+            )
+            ''')
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {link} (
+                {column} SMALLINT UNSIGNED NOT NULL,
+                movie_id BIGINT UNSIGNED NOT NULL,
+                position TINYINT UNSIGNED NOT NULL,
+                PRIMARY KEY ({column}, movie_id),
+                KEY idx_{link}_movie (movie_id, {column})
+            )
+            ''')
+        print("维度表创建或已存在。")
+    except Exception as e:
+        print('创建维度表时发生异常：', e)
+        raise
+
+
+def dimension_ids(cursor, table, names, batch_size=1000):
+    # 取名称对应的 id，没有的先插入；name 列按二进制比较，查回的名称与传入的完全一致
+    names = sorted(names)
+    ids = {}
+    for start in range(0, len(names), batch_size):
+        chunk = [name[:64] for name in names[start:start + batch_size]]
+        cursor.executemany(f'INSERT IGNORE INTO {table}(name) VALUES(%s)', [(name,) for name in chunk])
+        cursor.execute(f'SELECT name, id FROM {table} WHERE name IN ({", ".join(["%s"] * len(chunk))})', chunk)
+        ids.update(cursor.fetchall())
+    return ids
+
+
+# 由 moviemate_movies 的字符串列生成关联表
+def sync_dimensions(connection, movie_ids=None, batch_size=5000):
+    """
+    功能:
+    - 拆分 moviemate_movies 的 genre、region 字符串，写入维度表和关联表。
+    - movie_ids 为空时重建全部关联；否则只替换这些电影的关联（用于增量导入）。
+
+    输入:
+    - connection: pymysql 连接。
+    - movie_ids: 可选的 moviemate_movies.id 列表。
+    - batch_size: 每批写入的行数。
+
+    输出:
+    - {维度名称: 写入的关联行数}。
+    """
+    start = time.perf_counter()
+    sql = 'SELECT id, genre, region FROM moviemate_movies'
+    rows = []
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        if movie_ids is None:
+            cursor.execute(sql)
+            rows = list(cursor.fetchall_unbuffered())
+        else:
+            movie_ids = list(movie_ids)
+            for offset in range(0, len(movie_ids), batch_size):
+                chunk = movie_ids[offset:offset + batch_size]
+                cursor.execute(f'{sql} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+                rows.extend(cursor.fetchall_unbuffered())
+
+    counts = {}
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            create_dimension_tables(cursor)
+            # rows 的第 1、2 列分别为 genre、region
+            for offset, (dimension, (table, link, column, _)) in enumerate(DIMENSIONS.items(), start=1):
+                values = [(row[0], split_values(row[offset])) for row in rows]
+                ids = dimension_ids(cursor, table, {name for _, names in values for name in names})
+                links = [(ids[name[:64]], movie_id, position) for movie_id, names in values
+                         for position, name in enumerate(names[:255])]
+
+                if movie_ids is None:
+                    cursor.execute(f'DELETE FROM {link}')
+                else:
+                    for start_row in range(0, len(movie_ids), batch_size):
+                        chunk = movie_ids[start_row:start_row + batch_size]
+                        cursor.execute(f'DELETE FROM {link} WHERE movie_id IN ({", ".join(["%s"] * len(chunk))})',
+                                       chunk)
+                for start_row in range(0, len(links), batch_size):
+                    cursor.executemany(f'INSERT IGNORE INTO {link}({column}, movie_id, position) VALUES(%s, %s, %s)',
+                                       links[start_row:start_row + batch_size])
+                counts[dimension] = len(links)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        print('写入维度关联时发生异常：', e)
+        raise
+    print(f"{len(rows)} 部电影的类型、地区关联已更新：{counts}，耗时 {time.perf_counter() - start:.2f}s")
+    return counts
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        try:
+            sync_dimensions(connection)
+            for movie in MovieRepository(connection).movies_by_dimensions(['剧情', '爱情'], ['美国']):
+                print(movie)
+        finally:
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+from .files import count_rows, iter_rows, read_csv, read_excel, read_parquet, source_file
+from .records import RECORDS, DoubanMovie, DyttMovie, MaoyanMovie, MovieCard, MovieChange, MoviemateMovie
+from .repository import PAGE_SIZE, MovieRepository, batches, query_stats, reset_query_stats, stream_rows
+from .schema import TYPED_TABLES, convert_rows, typed_table_sql
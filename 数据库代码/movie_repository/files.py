@@ -0,0 +1,123 @@
+import os
+
+import pandas as pd
+
+
+# 依次尝试的爬取结果文件格式
+SOURCE_SUFFIXES = ('.parquet', '.csv', '.xlsx')
+
+
+# 找到实际存在的爬取结果文件
+def source_file(file_path):
+    """
+    功能:
+    - file_path 存在时原样返回；否则依次尝试同名的 .parquet、.csv、.xlsx 文件。
+      默认路径都指向 Parquet，还没有用 推荐算法代码/columnar_io.py 的 convert_to_parquet 转换时直接读取 Excel / CSV。
+
+    输入:
+    - file_path: 文件路径。
+
+    输出:
+    - 实际存在的文件路径；都不存在时抛出 FileNotFoundError。
+    """
+    if os.path.exists(file_path):
+        return file_path
+    stem = os.path.splitext(file_path)[0]
+    for suffix in SOURCE_SUFFIXES:
+        if os.path.exists(stem + suffix):
+            return stem + suffix
+    raise FileNotFoundError(f'找不到 {file_path}，也没有同名的 {"、".join(SOURCE_SUFFIXES)} 文件')
+
+
+# 爬取结果文件的读取。所有列都按字符串读取、缺失值替换为 ''，再由 schema.convert_rows 转换为各列的类型。
+def read_parquet(file_path, columns=None):
+    try:
+        # 读取 Parquet 文件，只解码需要的列，并以内存映射方式打开
+        df = pd.read_parquet(file_path, columns=columns, memory_map=True)
+        # 替换缺失值为 ''，并与 Excel 读取一样统一为字符串
+        df = df.fillna('').astype(str)
+        # 将 DataFrame 转换为列表
+        return df.values.tolist()
+    except Exception as e:
+        print('读取Parquet文件时发生异常：', e)
+        raise
+
+
+def read_excel(file_path):
+    try:
+        # 读取 Excel 文件
+        df = pd.read_excel(file_path, dtype=str)
+        # 替换 NaN 值为 ''
+        df.fillna('', inplace=True)
+        # 将 DataFrame 转换为列表
+        return df.values.tolist()
+    except Exception as e:
+        print('读取Excel文件时发生异常：', e)
+        raise
+
+
+def read_csv(file_path):
+    try:
+        # 读取 CSV 文件
+        df = pd.read_csv(file_path, dtype=str, encoding='utf-8')
+        # 替换 NaN 值为 ''
+        df.fillna('', inplace=True)
+        # 将 DataFrame 转换为列表
+        return df.values.tolist()
+    except Exception as e:
+        print('读取CSV文件时发生异常：', e)
+        raise
+
+
+# 流式读取爬取结果文件
+def iter_rows(file_path, batch_size=50000):
+    """
+    功能:
+    - 按扩展名（.parquet / .csv / .xlsx）逐行读取文件，内存中最多只有 batch_size 行，
+      与 read_parquet / read_csv / read_excel 的结果一致：不含表头，每行为字符串列表，缺失值为 ''。
+
+    输入:
+    - file_path: 文件路径。
+    - batch_size: 每次从文件解码的行数。
+
+    输出:
+    - 生成器，逐行产生字符串列表。
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_path, memory_map=True).iter_batches(batch_size=batch_size):
+            yield from batch.to_pandas().fillna('').astype(str).values.tolist()
+    elif extension == '.csv':
+        with pd.read_csv(file_path, dtype=str, encoding='utf-8', chunksize=batch_size) as reader:
+            for chunk in reader:
+                yield from chunk.fillna('').values.tolist()
+    elif extension in ('.xlsx', '.xlsm'):
+        # 只读模式按行解析工作表，不把整个文件载入内存
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            next(rows, None)
+            for row in rows:
+                yield ['' if value is None else str(value) for value in row]
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f'不支持的文件类型：{file_path}')
+
+
+def count_rows(file_path):
+    # 不读取数据就能得到的总行数，用于显示进度；CSV 需要完整扫描一遍，返回 None
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).metadata.num_rows
+    if extension in ('.xlsx', '.xlsm'):
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return max(workbook.worksheets[0].max_row - 1, 0)
+        finally:
+            workbook.close()
+    return None
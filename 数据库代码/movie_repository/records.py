@@ -0,0 +1,98 @@
+import datetime
+from decimal import Decimal
+from typing import NamedTuple, Optional, Union
+
+# DECIMAL(3, 1) 评分列：从数据库读出时为 Decimal，由爬取文本转换得到时为 float
+Rating = Union[Decimal, float]
+
+
+# 各数据表一行对应的记录类型，字段顺序与 schema.TYPED_TABLES 中的列一致，代理主键 id 在最后。
+# 记录是元组，可以直接作为 executemany 的参数；新记录的 id 为 None，写入时不带 id 列。
+class MoviemateMovie(NamedTuple):
+    director: str
+    starring: str
+    genre: str
+    region: str
+    year: Optional[int]
+    detail_url: str
+    title: str
+    rating: Optional[Rating]
+    rating_count: Optional[int]
+    poster_url: str
+    mm_rating: Optional[Rating]
+    IMDB_rating: Optional[Rating]
+    maoyan_rating: Optional[Rating]
+    id: Optional[int] = None
+
+
+class DoubanMovie(NamedTuple):
+    director: str
+    starring: str
+    genre: str
+    region: str
+    year: Optional[int]
+    detail_url: str
+    title: str
+    rating: Optional[Rating]
+    rating_count: Optional[int]
+    poster_url: str
+    id: Optional[int] = None
+
+
+class MaoyanMovie(NamedTuple):
+    title: str
+    grade: Optional[Rating]
+    genre: str
+    cast: str
+    release_date: Optional[datetime.date]
+    image_url: str
+    id: Optional[int] = None
+
+
+class DyttMovie(NamedTuple):
+    title: str
+    cover: str
+    year: Optional[int]
+    country: str
+    category: str
+    imdb_rating: Optional[Rating]
+    douban_rating: Optional[Rating]
+    duration: str
+    download_link: str
+    screen_shot: str
+    id: Optional[int] = None
+
+
+RECORDS = {
+    'moviemate_movies': MoviemateMovie,
+    'douban_movies': DoubanMovie,
+    'maoyan_movies': MaoyanMovie,
+    'dytt_movies': DyttMovie,
+}
+
+
+# 页面上展示的一部电影：海报、评分和详情链接
+class MovieCard(NamedTuple):
+    title: str
+    rating: Optional[Rating]
+    poster_url: str
+    detail_url: str
+
+    def as_dict(self):
+        # 与页面使用的 JSON 字段一致，评分转为字符串，缺失时为 ''
+        return {
+            'title': self.title,
+            'mm_rating': '' if self.rating is None else str(self.rating),
+            'poster_url': self.poster_url,
+            'detail_url': self.detail_url,
+        }
+
+
+# 变更日志中的一条记录（见 MovieRepository.pending_changes）：op 为 'insert'、'update' 或 'delete'
+class MovieChange(NamedTuple):
+    change_id: int
+    snapshot_id: Optional[int]
+    table_name: str
+    op: str
+    row_key: bytes
+    title: str
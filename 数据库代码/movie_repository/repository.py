@@ -0,0 +1,650 @@
+import contextlib
+import functools
+import itertools
+import math
+import os
+import tempfile
+import threading
+import time
+
+import pymysql
+
+from .records import RECORDS, MovieCard, MovieChange
+from .schema import KEY_COLUMNS, TYPED_TABLES, column_names, content_columns, convert_rows, keyed_rows, quoted_columns, \
+    source_key_sql, typed_table_sql
+
+# ngram 全文索引的分词长度（MySQL 默认的 ngram_token_size），更短的查询改用标题前缀匹配
+NGRAM_TOKEN_SIZE = 2
+PAGE_SIZE = 10
+BATCH_SIZE = 5000
+
+# 各查询的累计调用次数和耗时（秒）：{名称: [次数, 总耗时, 最大耗时]}，见 query_stats()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def timed(name):
+    # 记录一次查询的耗时；流式读取的耗时包括调用方处理每一行的时间
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            entry = _stats.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+
+def query_stats():
+    """
+    功能:
+    - 返回进程启动（或上次 reset_query_stats）以来每类查询的调用次数、总耗时、平均耗时和最大耗时（毫秒）。
+    """
+    with _stats_lock:
+        return {name: {'calls': calls, 'total_ms': total * 1000, 'avg_ms': total / calls * 1000, 'max_ms': worst * 1000}
+                for name, (calls, total, worst) in _stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# 语句按表和写入方式生成一次后缓存。PyMySQL 只支持文本协议，没有服务端预处理语句；
+# 参数始终通过占位符传入，executemany 会把同一条 INSERT 的多行参数合并为一条多行 INSERT 发送。
+@functools.lru_cache(maxsize=None)
+def insert_sql(table, ignore=True):
+    placeholders = ', '.join(['%s'] * (len(column_names(table)) + len(KEY_COLUMNS)))
+    return (f'INSERT {"IGNORE " if ignore else ""}INTO {table}({quoted_columns(table)}, {", ".join(KEY_COLUMNS)}) '
+            f'VALUES({placeholders})')
+
+
+@functools.lru_cache(maxsize=None)
+def on_duplicate_sql(table):
+    # row_key 冲突时只在内容哈希变化时更新爬取内容的列；row_hash 必须最后赋值，前面的比较读到的是旧值。
+    # 内容未变时所有列都赋为原值，MySQL 不写入这一行，受影响行数为 0
+    updates = [f'`{column}` = IF(row_hash <=> VALUES(row_hash), `{column}`, VALUES(`{column}`))'
+               for column in content_columns(table)]
+    updates.append('row_hash = VALUES(row_hash)')
+    return 'ON DUPLICATE KEY UPDATE ' + ', '.join(updates)
+
+
+@functools.lru_cache(maxsize=None)
+def upsert_sql(table):
+    return f'{insert_sql(table, ignore=False)} {on_duplicate_sql(table)}'
+
+
+@functools.lru_cache(maxsize=None)
+def select_sql(table):
+    return f'SELECT {quoted_columns(table)}, id FROM {table}'
+
+
+def batches(rows, batch_size):
+    # 把任意可迭代对象（包括生成器）切成列表，不需要一次性读入全部数据
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+# 流式读取查询结果
+def stream_rows(connection, sql, batch_size=10000, params=None):
+    """
+    功能:
+    - 使用服务端游标（SSCursor）逐批读取查询结果，不在客户端缓存整个结果集。
+      读取完成前同一个连接不能执行其他查询。
+
+    输入:
+    - connection: pymysql 连接。
+    - sql: 查询语句。
+    - batch_size: 每次从服务器取回的行数。
+    - params: 可选的查询参数。
+
+    输出:
+    - 生成器，逐行产生查询结果。
+    """
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def tsv_field(value):
+    # LOAD DATA 默认格式：NULL 写为 \N，反斜杠、制表符和换行需要转义
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def to_search_result(row):
+    title, mm_rating, poster_url, detail_url, genre, starring, year, score, exact, prefix = row
+    return {
+        'title': title,
+        'mm_rating': '' if mm_rating is None else str(mm_rating),
+        'poster_url': poster_url,
+        'detail_url': detail_url,
+        'genre': genre,
+        'starring': starring,
+        'year': '' if year is None else str(year),
+        'score': round(float(score or 0), 4),
+        'exact': bool(exact),
+    }
+
+
+def unique_cards(rows, limit=None, exclude=None):
+    # (title, rating, poster_url, detail_url) 行按标题去重，保留先出现的一条
+    cards, seen = [], {exclude}
+    for row in rows:
+        if row[0] not in seen:
+            seen.add(row[0])
+            cards.append(MovieCard(*row))
+            if limit is not None and len(cards) >= limit:
+                break
+    return cards
+
+
+class MovieRepository(object):
+    """
+    电影数据的统一访问入口：导入脚本、评分流程和网页视图都通过它读写 moviemate_movies、douban_movies、
+    maoyan_movies、dytt_movies 以及派生的排行榜、类型关联表。
+
+    - 表结构和各列的类型转换来自 schema.TYPED_TABLES，一行数据对应 records 中的一个记录类型。
+    - 写入按 batch_size 分批执行多行 INSERT，整个写入在一个事务中提交；每行带有由 natural_key 计算的唯一键 row_key
+      和内容哈希 row_hash，upsert_many / load_rows 按唯一键增量写入，重复导入不会产生重复行。
+    - 大表扫描使用服务端游标逐批读取，见 iter_records / iter_columns。
+    - 每类查询的次数和耗时记录在 query_stats() 中。
+    - 爬取快照刷新（数据库代码/crawl_snapshots.py）把每次新增、更新、删除的电影记入变更日志 movie_changes，
+      评分流程、缓存和推荐重建等下游任务各自记录已处理到的位置，见 pending_changes / ack_changes。
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    # 创建数据库并切换到该数据库
+    def create_database(self, database):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+            cursor.execute(f"USE {database}")
+        print(f"数据库 {database} 创建或已存在。")
+
+    # 按 TYPED_TABLES 创建数据表
+    def create_table(self, table):
+        with self.connection.cursor() as cursor:
+            cursor.execute(typed_table_sql(table))
+        print(f"数据表 {table} 创建或已存在。")
+
+    def truncate(self, table):
+        if table not in TYPED_TABLES:
+            raise ValueError(f'未知的数据表：{table}')
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE TABLE {table}')
+        print(f"数据表 {table} 的所有数据已删除。")
+
+    def _write(self, name, sql, batches_of_rows, commit=True):
+        # commit 为 False 时由调用方提交，用于与其他语句（如进度记录）放在同一个事务中
+        written = 0
+        try:
+            with timed(name), self.connection.cursor() as cursor:
+                for batch in batches_of_rows:
+                    written += cursor.executemany(sql, batch) or 0
+            if commit:
+                self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return written
+
+    # 批量写入，同一部电影（row_key 相同）已存在时跳过
+    def insert_many(self, table, rows, batch_size=BATCH_SIZE, convert=True, commit=True):
+        """
+        功能:
+        - 分批写入 rows，整个写入在一个事务中提交，失败时回滚。
+
+        输入:
+        - table: TYPED_TABLES 中的表名。
+        - rows: 可迭代的行，可以是生成器；按 TYPED_TABLES 的列顺序排列，多出的列（如记录的 id）忽略。
+        - batch_size: 每条多行 INSERT 包含的行数。
+        - convert: 为 True 时行是爬取得到的文本，先按列类型转换；已经是记录类型时传 False。
+        - commit: 为 False 时不提交，由调用方提交。
+
+        输出:
+        - 写入的行数。
+        """
+        prepared = (keyed_rows(table, self._typed(table, batch, convert)) for batch in batches(rows, batch_size))
+        return self._write(f'insert:{table}', insert_sql(table), prepared, commit)
+
+    def _typed(self, table, rows, convert):
+        n = len(column_names(table))
+        return convert_rows(table, rows) if convert else [tuple(row)[:n] for row in rows]
+
+    # 按唯一键增量写入
+    def upsert_many(self, table, rows, batch_size=BATCH_SIZE, convert=True, commit=True):
+        """
+        功能:
+        - 按 row_key（见 schema.natural_key）把 rows 同步到数据表：新电影写入；已有的电影只在内容哈希变化时
+          INSERT ... ON DUPLICATE KEY UPDATE，内容未变的行不发送。重复导入同一个文件不会产生新行，也不会改写数据。
+        - 每批先按唯一键查出已有行的哈希（唯一索引上的点查），同一批中键相同的行以最后一行为准。
+        - derived 列（如 mm_rating）只在新写入时使用文件中的值，之后由评分流程维护。
+
+        输入:
+        - table: TYPED_TABLES 中的表名。
+        - rows: 可迭代的行，可以是生成器；含义同 insert_many。
+        - batch_size: 每批的行数。
+        - convert: 为 True 时行是爬取得到的文本，先按列类型转换。
+        - commit: 为 False 时不提交，由调用方提交。
+
+        输出:
+        - {'inserted', 'updated', 'unchanged'}：新增、内容变化而更新、内容未变的行数。
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        try:
+            with timed(f'upsert:{table}'), self.connection.cursor() as cursor:
+                for batch in batches(rows, batch_size):
+                    latest = {row[-2]: row for row in keyed_rows(table, self._typed(table, batch, convert))}
+                    cursor.execute(f'SELECT row_key, row_hash FROM {table} '
+                                   f'WHERE row_key IN ({", ".join(["%s"] * len(latest))})', list(latest))
+                    existing = dict(cursor.fetchall())
+                    changed = [row for key, row in latest.items() if existing.get(key) != row[-1]]
+                    counts['unchanged'] += len(latest) - len(changed)
+                    counts['updated'] += sum(1 for row in changed if row[-2] in existing)
+                    counts['inserted'] += sum(1 for row in changed if row[-2] not in existing)
+                    if changed:
+                        cursor.executemany(upsert_sql(table), changed)
+            if commit:
+                self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return counts
+
+    # 通过 LOAD DATA LOCAL INFILE 批量增量写入
+    def load_rows(self, table, rows, convert=True, commit=True):
+        """
+        功能:
+        - 与 upsert_many 的结果相同，但数据先写入临时的制表符分隔文件，用一条 LOAD DATA LOCAL INFILE
+          导入临时表，再用一条 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并，省去逐条语句的解析，
+          大批量导入时通常比多行 INSERT 更快。
+        - 需要连接时传入 local_infile=True，并且服务端开启 local_infile。
+
+        输入:
+        - table: TYPED_TABLES 中的表名。
+        - rows: 可迭代的行，含义同 insert_many。
+        - convert: 为 True 时行是爬取得到的文本，先按列类型转换。
+        - commit: 为 False 时不提交，由调用方提交。
+
+        输出:
+        - {'inserted', 'updated', 'unchanged'}。
+        """
+        staging = f'{table}__load'
+        columns = quoted_columns(table)
+        fd, path = tempfile.mkstemp(suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as file:
+                for batch in batches(rows, BATCH_SIZE):
+                    for row in keyed_rows(table, self._typed(table, batch, convert)):
+                        values = [tsv_field(value) for value in row[:-2]] + [row[-2].hex(), row[-1].hex()]
+                        file.write('\t'.join(values) + '\n')
+            with timed(f'load:{table}'), self.connection.cursor() as cursor:
+                # 临时表只有各列和以 row_key 为主键的索引；REPLACE 使文件中键相同的行以最后一行为准
+                definitions = ', '.join(f'`{column}` {definition}' for column, definition, _ in
+                                        TYPED_TABLES[table]['columns'])
+                cursor.execute(f'DROP TEMPORARY TABLE IF EXISTS {staging}')
+                cursor.execute(f'CREATE TEMPORARY TABLE {staging} ({definitions}, row_key BINARY(16) NOT NULL, '
+                               f'row_hash BINARY(16) NOT NULL, PRIMARY KEY (row_key))')
+                cursor.execute(f"LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE {staging} CHARACTER SET utf8mb4 "
+                               f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                               f"({columns}, @row_key, @row_hash) "
+                               f"SET row_key = UNHEX(@row_key), row_hash = UNHEX(@row_hash)", (path,))
+                cursor.execute(f'SELECT COUNT(*) FROM {staging}')
+                total, = cursor.fetchone()
+                cursor.execute(f'SELECT COUNT(*) FROM {staging} AS s JOIN {table} AS t '
+                               f'ON t.row_key = s.row_key AND t.row_hash = s.row_hash')
+                unchanged, = cursor.fetchone()
+                cursor.execute(f'INSERT INTO {table}({columns}, {", ".join(KEY_COLUMNS)}) '
+                               f'SELECT {columns}, {", ".join(KEY_COLUMNS)} FROM {staging} {on_duplicate_sql(table)}')
+                # 受影响行数：新增计 1，更新计 2，内容未变计 0
+                updated = cursor.rowcount - (total - unchanged)
+                cursor.execute(f'DROP TEMPORARY TABLE {staging}')
+            if commit:
+                self.connection.commit()
+            return {'inserted': total - unchanged - updated, 'updated': updated, 'unchanged': unchanged}
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            os.remove(path)
+
+    # 按标题精确查找一行
+    def find_by_title(self, table, title):
+        with timed(f'find_by_title:{table}'), self.connection.cursor() as cursor:
+            cursor.execute(f'{select_sql(table)} WHERE title = %s ORDER BY id LIMIT 1', (title,))
+            row = cursor.fetchone()
+        return RECORDS[table]._make(row) if row else None
+
+    # 流式读取整张表
+    def iter_records(self, table, batch_size=10000):
+        # 逐行产生记录；读取完成前同一个连接不能执行其他查询
+        record = RECORDS[table]
+        with timed(f'iter_records:{table}'):
+            for row in stream_rows(self.connection, select_sql(table), batch_size):
+                yield record._make(row)
+
+    def iter_columns(self, table, columns, batch_size=10000):
+        # 只读取部分列时使用，逐行产生元组
+        if table not in TYPED_TABLES:
+            raise ValueError(f'未知的数据表：{table}')
+        sql = f'SELECT {", ".join(f"`{column}`" for column in columns)} FROM {table}'
+        with timed(f'iter_columns:{table}'):
+            yield from stream_rows(self.connection, sql, batch_size)
+
+    def has_movie_entities(self):
+        # 实体对齐（数据库代码/entity_resolution.py）是否已经运行过
+        with timed('has_movie_entities'), self.connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() AND table_name = 'movie_entity'")
+            if not cursor.fetchone()[0]:
+                return False
+            cursor.execute('SELECT 1 FROM movie_entity LIMIT 1')
+            return cursor.fetchone() is not None
+
+    def iter_entity_columns(self, table, source, key, columns, batch_size=10000):
+        # 按主键顺序逐行产生 (movie_id, *columns)，movie_id 为实体对齐得到的统一电影编号，
+        # 这条记录在 movie_entity 中还没有映射时为 None；读取完成前同一个连接不能执行其他查询
+        if table not in TYPED_TABLES:
+            raise ValueError(f'未知的数据表：{table}')
+        sql = (f'SELECT e.movie_id, {", ".join(f"s.`{column}`" for column in columns)} FROM {table} AS s '
+               f'LEFT JOIN movie_entity AS e ON e.source = %s AND e.source_key = {source_key_sql(key, "s.")} '
+               'ORDER BY s.id')
+        with timed(f'iter_entity_columns:{table}'):
+            yield from stream_rows(self.connection, sql, batch_size, (source,))
+
+    def table_version(self, table):
+        # MAX(id) 走主键，UPDATE_TIME 在导入或评分写回后变化；information_schema 的统计可能有缓存，
+        # 快照刷新只更新、删除已有行时还要看变更日志的最后一条。三者都不变时可以认为表没有更新
+        with timed('table_version'), self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT MAX(id) FROM {table}')
+            max_id, = cursor.fetchone()
+            cursor.execute('SELECT UPDATE_TIME FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', (table,))
+            row = cursor.fetchone()
+        return max_id, str(row[0]) if row else None, self.last_change_id(table)
+
+    # 创建变更日志和各下游任务的处理位置表
+    def create_change_log(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movie_changes (
+                change_id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                snapshot_id BIGINT UNSIGNED NULL,
+                table_name VARCHAR(64) NOT NULL,
+                op VARCHAR(8) NOT NULL,
+                row_key BINARY(16) NOT NULL,
+                title VARCHAR(255) NOT NULL DEFAULT '',
+                created_at DATETIME NOT NULL,
+                KEY idx_movie_changes_table (table_name, change_id),
+                KEY idx_movie_changes_snapshot (snapshot_id, op)
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_consumers (
+                consumer VARCHAR(64) NOT NULL PRIMARY KEY,
+                last_change_id BIGINT UNSIGNED NOT NULL DEFAULT 0,
+                updated_at DATETIME NOT NULL
+            )
+            ''')
+
+    def last_change_id(self, table=None):
+        # 变更日志的最后一条（可只看某张表）；还没有变更日志时为 0
+        sql = 'SELECT MAX(change_id) FROM movie_changes'
+        try:
+            with timed('last_change_id'), self.connection.cursor() as cursor:
+                if table is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(f'{sql} WHERE table_name = %s', (table,))
+                change_id, = cursor.fetchone()
+        except pymysql.err.ProgrammingError:
+            return 0
+        return change_id or 0
+
+    # 某个下游任务尚未处理的变更
+    def pending_changes(self, consumer, tables=None, upto=None):
+        """
+        功能:
+        - 返回 consumer 上次 ack_changes 之后、upto 及之前的变更，按 change_id 排序。
+          下游任务先取 upto = last_change_id()，处理完返回的变更后 ack_changes(consumer, upto)，
+          处理期间新写入的变更留到下一次。
+
+        输入:
+        - consumer: 下游任务的名称，如 'rating_pipeline'。
+        - tables: 可选的表名列表，只返回这些表的变更。
+        - upto: 可选，只返回 change_id 不超过它的变更。
+
+        输出:
+        - MovieChange 列表；还没有变更日志时为空列表。
+        """
+        sql = ('SELECT c.change_id, c.snapshot_id, c.table_name, c.op, c.row_key, c.title FROM movie_changes AS c '
+               'WHERE c.change_id > COALESCE((SELECT last_change_id FROM change_consumers WHERE consumer = %s), 0)')
+        params = [consumer]
+        if tables:
+            sql += f' AND c.table_name IN ({", ".join(["%s"] * len(tables))})'
+            params.extend(tables)
+        if upto is not None:
+            sql += ' AND c.change_id <= %s'
+            params.append(upto)
+        try:
+            with timed('pending_changes'), self.connection.cursor() as cursor:
+                cursor.execute(sql + ' ORDER BY c.change_id', params)
+                return [MovieChange._make(row) for row in cursor.fetchall()]
+        except pymysql.err.ProgrammingError:
+            return []
+
+    def ack_changes(self, consumer, change_id):
+        # 记录 consumer 已处理到 change_id；只会前进，重复或乱序的确认不会让位置后退
+        with self.connection.cursor() as cursor:
+            cursor.execute('INSERT INTO change_consumers(consumer, last_change_id, updated_at) VALUES(%s, %s, NOW()) '
+                           'ON DUPLICATE KEY UPDATE last_change_id = GREATEST(last_change_id, VALUES(last_change_id)), '
+                           'updated_at = VALUES(updated_at)', (consumer, change_id))
+        self.connection.commit()
+
+    # 按相关度排序的标题搜索
+    def search_titles(self, query, page=1, page_size=PAGE_SIZE):
+        """
+        功能:
+        - 在 moviemate_movies.title 的 ngram 全文索引上检索，同名电影只保留一条，
+          排序为：标题完全相同 > 标题以查询开头 > 全文相关度 > mm_rating。
+          检索只访问倒排索引中命中的行，耗时取决于命中数而不是表的大小。
+        - 查询短于 NGRAM_TOKEN_SIZE 时全文索引无法分词，改为在 title 索引上做前缀范围扫描。
+
+        输入:
+        - query: 搜索词。
+        - page: 页码，从 1 开始。
+        - page_size: 每页条数。
+
+        输出:
+        - {'query', 'page', 'page_size', 'total', 'pages', 'results'}；results 为电影字典列表，
+          每项带有相关度 score 和是否完全匹配 exact。没有匹配时 results 为空列表。
+        """
+        query = ' '.join(str(query or '').split())
+        page = max(int(page), 1)
+        result = {'query': query, 'page': page, 'page_size': page_size, 'total': 0, 'pages': 0, 'results': []}
+        if not query:
+            return result
+
+        prefix = escape_like(query) + '%'
+        if len(query) >= NGRAM_TOKEN_SIZE:
+            match = 'MATCH(title) AGAINST(%s IN NATURAL LANGUAGE MODE)'
+            matched = (f'SELECT MIN(id) AS id, MAX({match}) AS score FROM moviemate_movies '
+                       f'WHERE {match} GROUP BY title')
+            matched_params = (query, query)
+            count_sql = f'SELECT COUNT(DISTINCT title) FROM moviemate_movies WHERE {match}'
+            count_params = (query,)
+        else:
+            matched = 'SELECT MIN(id) AS id, 0 AS score FROM moviemate_movies WHERE title LIKE %s GROUP BY title'
+            matched_params = (prefix,)
+            count_sql = 'SELECT COUNT(DISTINCT title) FROM moviemate_movies WHERE title LIKE %s'
+            count_params = (prefix,)
+
+        with timed('search_titles'), self.connection.cursor() as cursor:
+            cursor.execute(count_sql, count_params)
+            total = cursor.fetchone()[0]
+            result.update(total=total, pages=math.ceil(total / page_size))
+            if not total:
+                return result
+
+            sql = ('SELECT m.title, m.mm_rating, m.poster_url, m.detail_url, m.genre, m.starring, m.year, '
+                   't.score, m.title = %s AS exact, m.title LIKE %s AS prefix '
+                   f'FROM ({matched}) AS t JOIN moviemate_movies AS m ON m.id = t.id '
+                   'ORDER BY exact DESC, prefix DESC, t.score DESC, m.mm_rating DESC, m.id '
+                   'LIMIT %s OFFSET %s')
+            cursor.execute(sql, (query, prefix, *matched_params, page_size, (page - 1) * page_size))
+            result['results'] = [to_search_result(row) for row in cursor.fetchall()]
+        return result
+
+    # 电影的全部类别，按原有顺序排列；类型关联表中没有这部电影时返回空列表
+    def movie_genres(self, title):
+        with timed('movie_genres'), self.connection.cursor() as cursor:
+            cursor.execute('SELECT g.name FROM moviemate_movies AS m JOIN movie_genre AS mg ON mg.movie_id = m.id '
+                           'JOIN genres AS g ON g.id = mg.genre_id WHERE m.title = %s ORDER BY m.id, mg.position',
+                           (title,))
+            return list(dict.fromkeys(name for name, in cursor.fetchall()))
+
+    # 按类型、地区筛选评分最高的电影
+    def movies_by_dimensions(self, genres=(), regions=(), match_all=True, limit=10, exclude=None):
+        """
+        功能:
+        - 查出同时属于给定类型（match_all 为 False 时为属于任一类型）且属于任一给定地区的电影，按 mm_rating 降序、
+          按标题去重。每个类型、地区都是关联表主键上的一次范围扫描，不需要对 genre、region 列做 LIKE '%x%' 全表扫描。
+
+        输入:
+        - genres: 类型名称列表。
+        - regions: 地区名称列表。
+        - match_all: 是否要求同时属于全部给定类型。
+        - limit: 返回的最大条数。
+        - exclude: 需要排除的标题（如当前正在查看的电影）。
+
+        输出:
+        - MovieCard 列表，最多 limit 条。
+        """
+        joins, params = [], []
+        genres, regions = list(dict.fromkeys(genres)), list(dict.fromkeys(regions))
+        if genres:
+            having = f'HAVING COUNT(*) = {len(genres)}' if match_all else ''
+            joins.append('JOIN (SELECT mg.movie_id FROM movie_genre AS mg JOIN genres AS g ON g.id = mg.genre_id '
+                         f'WHERE g.name IN ({", ".join(["%s"] * len(genres))}) GROUP BY mg.movie_id {having}) AS gf '
+                         'ON gf.movie_id = m.id ')
+            params += genres
+        if regions:
+            joins.append('JOIN (SELECT DISTINCT mr.movie_id FROM movie_region AS mr '
+                         'JOIN regions AS r ON r.id = mr.region_id '
+                         f'WHERE r.name IN ({", ".join(["%s"] * len(regions))})) AS rf ON rf.movie_id = m.id ')
+            params += regions
+        sql = ('SELECT m.title, m.mm_rating, m.poster_url, m.detail_url FROM moviemate_movies AS m '
+               f'{"".join(joins)}ORDER BY m.mm_rating DESC LIMIT %s')
+        with timed('movies_by_dimensions'), self.connection.cursor() as cursor:
+            # 导入时已按唯一键去重，只剩不同电影同名的情况，多取少量再按标题去重
+            cursor.execute(sql, (*params, limit * 3))
+            return unique_cards(cursor.fetchall(), limit, exclude)
+
+    # 同时属于全部给定类别的评分最高的电影
+    def best_movies_by_genres(self, genres, limit=10, exclude=None):
+        if not genres:
+            return []
+        return self.movies_by_dimensions(genres, limit=limit, exclude=exclude)
+
+    # 按主键顺序读取预先排好序、去过重的排行榜（见 推荐算法代码/leaderboards.py）
+    def leaderboard(self, board, source='moviemate', limit=10):
+        with timed('leaderboard'), self.connection.cursor() as cursor:
+            cursor.execute('SELECT title, rating, poster_url, detail_url FROM leaderboards '
+                           'WHERE source = %s AND board = %s ORDER BY position LIMIT %s', (source, board, limit))
+            return [MovieCard(*row) for row in cursor.fetchall()]
+
+    # 某个类别评分最高的电影
+    def best_by_genre(self, genre, limit=10, source='moviemate'):
+        """
+        功能:
+        - 优先读取该类别的排行榜；排行榜尚未生成时，moviemate 的数据经类型关联表筛选（主键范围扫描）后按评分降序、
+          按标题去重。
+
+        输出:
+        - MovieCard 列表，最多 limit 条。
+        """
+        try:
+            cards = self.leaderboard('genre:' + genre, source, limit)
+            if cards or source != 'moviemate':
+                return cards
+        except pymysql.MySQLError as e:
+            print(f'读取类别为 {genre} 的排行榜时发生错误: {e}')
+        # 导入时已按唯一键去重，只剩不同电影同名的情况，多取少量再按标题去重
+        sql = ('SELECT m.title, m.mm_rating, m.poster_url, m.detail_url FROM movie_genre AS mg '
+               'JOIN genres AS g ON g.id = mg.genre_id JOIN moviemate_movies AS m ON m.id = mg.movie_id '
+               'WHERE g.name = %s ORDER BY m.mm_rating DESC LIMIT %s')
+        with timed('best_by_genre'), self.connection.cursor() as cursor:
+            cursor.execute(sql, (genre, limit * 3))
+            return unique_cards(cursor.fetchall(), limit)
+
+    # 批量写回 mm_rating 及来源评分
+    def write_ratings(self, rows, batch_size=BATCH_SIZE, changed=None):
+        """
+        功能:
+        - 在一个事务内把评分写回 moviemate_movies：先分批写入按 id 建主键的临时表，
+          再用一条按主键的 UPDATE ... JOIN 更新；同名的不同电影（如翻拍）各自写入自己的评分。
+
+        输入:
+        - rows: (id, mm_rating, IMDB_rating, maoyan_rating) 元组的列表，id 为 moviemate_movies.id，缺失的评分为 None。
+        - batch_size: 每批写入临时表的行数。
+        - changed: 可选的列表，传入时追加 mm_rating 发生变化的电影标题。
+
+        输出:
+        - 更新的行数。
+        """
+        try:
+            self.connection.begin()
+            with timed('write_ratings'), self.connection.cursor() as cursor:
+                cursor.execute('DROP TEMPORARY TABLE IF EXISTS mm_rating_updates')
+                cursor.execute('''
+                CREATE TEMPORARY TABLE mm_rating_updates (
+                    id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+                    mm_rating DECIMAL(3, 1) NULL,
+                    IMDB_rating DECIMAL(3, 1) NULL,
+                    maoyan_rating DECIMAL(3, 1) NULL
+                )
+                ''')
+                sql = ('INSERT IGNORE INTO mm_rating_updates(id, mm_rating, IMDB_rating, maoyan_rating) '
+                       'VALUES(%s, %s, %s, %s)')
+                for batch in batches(rows, batch_size):
+                    cursor.executemany(sql, batch)
+
+                if changed is not None:
+                    cursor.execute('''
+                    SELECT m.title FROM mm_rating_updates AS u
+                    JOIN moviemate_movies AS m ON m.id = u.id
+                    WHERE NOT (m.mm_rating <=> u.mm_rating)
+                    ''')
+                    changed.extend(title for title, in cursor.fetchall())
+
+                cursor.execute('''
+                UPDATE moviemate_movies AS m
+                JOIN mm_rating_updates AS u ON m.id = u.id
+                SET m.mm_rating = u.mm_rating, m.IMDB_rating = u.IMDB_rating, m.maoyan_rating = u.maoyan_rating
+                ''')
+                updated = cursor.rowcount
+                cursor.execute('DROP TEMPORARY TABLE mm_rating_updates')
+            self.connection.commit()
+            return updated
+        except Exception:
+            self.connection.rollback()
+            raise
@@ -0,0 +1,247 @@
+import datetime
+import functools
+import hashlib
+import re
+import unicodedata
+
+# 各数据表的目标结构：按原有顺序排列的 (列名, 类型, 转换方式)，以及需要建二级索引的列。
+# 代理主键 id 放在最后一列，原有 SELECT * 按位置取列的代码不受影响。
+# natural_key 为识别同一部电影的列：有 url 列且不为空时按链接识别，否则按规范化的标题 + 年份识别；
+# derived 为由评分流程计算、不属于爬取内容的列，重新导入时不覆盖。
+TYPED_TABLES = {
+    'moviemate_movies': {
+        'columns': [
+            ('director', 'VARCHAR(255) NOT NULL', 'text'),
+            ('starring', 'VARCHAR(255) NOT NULL', 'text'),
+            ('genre', 'VARCHAR(255) NOT NULL', 'text'),
+            ('region', 'VARCHAR(255) NOT NULL', 'text'),
+            ('year', 'SMALLINT UNSIGNED NULL', 'year'),
+            ('detail_url', 'VARCHAR(255) NOT NULL', 'text'),
+            ('title', 'VARCHAR(255) NOT NULL', 'text'),
+            ('rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('rating_count', 'INT UNSIGNED NULL', 'count'),
+            ('poster_url', 'VARCHAR(255) NOT NULL', 'text'),
+            ('mm_rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('IMDB_rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('maoyan_rating', 'DECIMAL(3, 1) NULL', 'rating'),
+        ],
+        'indexes': ['title', 'year', 'rating', 'mm_rating'],
+        # 标题的 ngram 全文索引，用于按相关度排序的标题搜索（中文不以空格分词）
+        'fulltext': ['title'],
+        'natural_key': {'url': 'detail_url', 'title': 'title', 'year': 'year'},
+        'derived': ['mm_rating', 'IMDB_rating', 'maoyan_rating'],
+    },
+    'douban_movies': {
+        'columns': [
+            ('director', 'VARCHAR(255) NOT NULL', 'text'),
+            ('starring', 'VARCHAR(255) NOT NULL', 'text'),
+            ('genre', 'VARCHAR(255) NOT NULL', 'text'),
+            ('region', 'VARCHAR(255) NOT NULL', 'text'),
+            ('year', 'SMALLINT UNSIGNED NULL', 'year'),
+            ('detail_url', 'VARCHAR(255) NOT NULL', 'text'),
+            ('title', 'VARCHAR(255) NOT NULL', 'text'),
+            ('rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('rating_count', 'INT UNSIGNED NULL', 'count'),
+            ('poster_url', 'VARCHAR(255) NOT NULL', 'text'),
+        ],
+        'indexes': ['title', 'year', 'rating'],
+        'natural_key': {'url': 'detail_url', 'title': 'title', 'year': 'year'},
+    },
+    'maoyan_movies': {
+        'columns': [
+            ('title', 'VARCHAR(255) NOT NULL', 'text'),
+            ('grade', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('genre', 'VARCHAR(255) NOT NULL', 'text'),
+            ('cast', 'VARCHAR(255) NOT NULL', 'text'),
+            ('release_date', 'DATE NULL', 'date'),
+            ('image_url', 'VARCHAR(255) NOT NULL', 'text'),
+        ],
+        'indexes': ['title', 'release_date', 'grade'],
+        # 爬取结果中没有猫眼的电影 id；image_url 随海报更换而变化，不适合作为键
+        'natural_key': {'url': None, 'title': 'title', 'year': 'release_date'},
+    },
+    'dytt_movies': {
+        'columns': [
+            ('title', 'VARCHAR(255) NOT NULL', 'text'),
+            ('cover', 'VARCHAR(255) NOT NULL', 'text'),
+            ('year', 'SMALLINT UNSIGNED NULL', 'year'),
+            ('country', 'VARCHAR(255) NOT NULL', 'text'),
+            ('category', 'VARCHAR(255) NOT NULL', 'text'),
+            ('imdb_rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('douban_rating', 'DECIMAL(3, 1) NULL', 'rating'),
+            ('duration', 'VARCHAR(255) NOT NULL', 'text'),
+            ('download_link', 'VARCHAR(255) NOT NULL', 'text'),
+            ('screen_shot', 'VARCHAR(255) NOT NULL', 'text'),
+        ],
+        'indexes': ['title', 'year', 'douban_rating'],
+        # 同一部电影会有多个下载链接，按标题 + 年份识别
+        'natural_key': {'url': None, 'title': 'title', 'year': 'year'},
+    },
+}
+
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+YEAR_PATTERN = re.compile(r'(18|19|20)\d{2}')
+DATE_PATTERN = re.compile(r'((?:18|19|20)\d{2})(?:[-/.年](\d{1,2}))?(?:[-/.月](\d{1,2}))?')
+BOOK_TITLE_PATTERN = re.compile(r'《(.+?)》')
+TITLE_YEAR_PATTERN = re.compile(r'\s*[(（]\d{4}[)）]\s*$')
+PUNCTUATION_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+# 由 natural_key 计算的唯一键和由爬取内容计算的哈希，都是 16 字节的 MD5
+KEY_COLUMNS = ['row_key', 'row_hash']
+
+
+def parse_rating(text):
+    # '7.5'、'7.5/10' -> 7.5；无法解析或不在 (0, 10] 区间时为 NULL
+    match = NUMBER_PATTERN.search(str(text or ''))
+    if not match:
+        return None
+    rating = round(float(match.group(0)), 1)
+    return rating if 0 < rating <= 10 else None
+
+
+def parse_year(text):
+    match = YEAR_PATTERN.search(str(text or ''))
+    return int(match.group(0)) if match else None
+
+
+def parse_count(text):
+    # '12,345人评价' -> 12345
+    digits = re.sub(r'[^\d]', '', str(text or ''))
+    return min(int(digits), 4294967295) if digits else None
+
+
+def parse_date(text):
+    # '2019-05-01'、'2019-05'、'2019年5月1日中国大陆上映' -> date；只有年份时取该年 1 月 1 日
+    if isinstance(text, datetime.date):
+        return text
+    match = DATE_PATTERN.search(str(text or ''))
+    if not match:
+        return None
+    year, month, day = match.group(1), match.group(2) or 1, match.group(3) or 1
+    try:
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return datetime.date(int(year), 1, 1)
+
+
+CONVERTERS = {
+    'text': lambda value: '' if value is None else str(value),
+    'rating': parse_rating,
+    'year': parse_year,
+    'count': parse_count,
+    'date': parse_date,
+}
+
+
+# 把爬取得到的文本行转换为目标结构的类型
+def convert_rows(table, rows):
+    """
+    功能:
+    - 按 TYPED_TABLES 中各列的转换方式转换每一行；无法解析的数值、日期转为 None（写入 NULL）。
+
+    输入:
+    - table: 数据表名。
+    - rows: 按原有列顺序排列的行（元组或列表）。
+
+    输出:
+    - 转换后的元组列表。
+    """
+    converters = [CONVERTERS[kind] for _, _, kind in TYPED_TABLES[table]['columns']]
+    return [tuple(convert(value) for convert, value in zip(converters, row)) for row in rows]
+
+
+def column_names(table):
+    return [name for name, _, _ in TYPED_TABLES[table]['columns']]
+
+
+def quoted_columns(table, prefix=''):
+    # cast 等列名需要加反引号
+    return ', '.join(f'{prefix}`{name}`' for name in column_names(table))
+
+
+# 标题规范化
+def normalize_title(title):
+    """
+    功能:
+    - 全角转半角、转小写，电影天堂标题取书名号内的部分，去掉结尾的 '(1995)' 年份和所有标点空白。
+    """
+    title = unicodedata.normalize('NFKC', str(title or '')).lower()
+    match = BOOK_TITLE_PATTERN.search(title)
+    if match:
+        title = match.group(1)
+    title = TITLE_YEAR_PATTERN.sub('', title)
+    return PUNCTUATION_PATTERN.sub('', title)
+
+
+def normalize_url(url):
+    # 'http://movie.douban.com/subject/1292052/' 与 'https://movie.douban.com/subject/1292052' 视为同一个链接
+    url = str(url or '').strip()
+    url = re.sub(r'^https?://', '', url, flags=re.IGNORECASE).split('#')[0]
+    return url.rstrip('/').lower()
+
+
+@functools.lru_cache(maxsize=None)
+def key_positions(table):
+    # natural_key 中各列以及参与内容哈希的列在行中的位置
+    names = column_names(table)
+    spec = TYPED_TABLES[table]
+    key = spec['natural_key']
+    url = names.index(key['url']) if key['url'] else None
+    content = tuple(i for i, name in enumerate(names) if name not in spec.get('derived', []))
+    return url, names.index(key['title']), names.index(key['year']), content
+
+
+def natural_key(table, row):
+    """
+    功能:
+    - 由转换后的一行计算唯一键（MD5）：按 natural_key 中的 url 列识别，链接为空时按规范化的标题 + 年份识别。
+      同一部电影从不同豆列、不同批次爬取得到的多行得到相同的键。
+    """
+    url_index, title_index, year_index, _ = key_positions(table)
+    url = normalize_url(row[url_index]) if url_index is not None else ''
+    if url:
+        text = 'url:' + url
+    else:
+        year = row[year_index]
+        year = year.year if isinstance(year, datetime.date) else year
+        text = f'title:{normalize_title(row[title_index])}|{year or ""}'
+    return hashlib.md5(text.encode('utf-8')).digest()
+
+
+def content_columns(table):
+    # 参与内容哈希、重新导入时可以被更新的列（不含 derived）
+    names = column_names(table)
+    return [names[i] for i in key_positions(table)[3]]
+
+
+def row_hash(table, row):
+    # 爬取内容的哈希；转换后的值与从数据库读出的值（Decimal、date）转为字符串后相同
+    text = '\x1f'.join('\\N' if row[i] is None else str(row[i]) for i in key_positions(table)[3])
+    return hashlib.md5(text.encode('utf-8')).digest()
+
+
+def source_key_sql(column, alias=''):
+    # 实体对齐中记录键列的 SQL 表达式；row_key 是 16 字节的二进制，转为十六进制文本后才能存入 movie_entity.source_key
+    if column == 'row_key':
+        return f'HEX({alias}`row_key`)'
+    return f'{alias}`{column}`'
+
+
+def keyed_rows(table, rows):
+    # 转换后的行末尾加上 row_key、row_hash
+    return [tuple(row) + (natural_key(table, row), row_hash(table, row)) for row in rows]
+
+
+# 目标结构的建表语句
+def typed_table_sql(table, name=None):
+    spec = TYPED_TABLES[table]
+    lines = [f'`{column}` {definition}' for column, definition, _ in spec['columns']]
+    lines.append('id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT')
+    # 允许为 NULL：在线迁移复制的旧数据先不计算，之后由 schema_migrations.add_natural_keys 补齐并去重
+    lines.append('row_key BINARY(16) NULL')
+    lines.append('row_hash BINARY(16) NULL')
+    lines.append('PRIMARY KEY (id)')
+    lines.append(f'UNIQUE KEY uk_{table}_row_key (row_key)')
+    lines += [f'KEY idx_{table}_{column} (`{column}`)' for column in spec['indexes']]
+    lines += [f'FULLTEXT KEY ft_{table}_{column} (`{column}`) WITH PARSER ngram' for column in spec.get('fulltext', [])]
+    return f'CREATE TABLE IF NOT EXISTS {name or table} (\n    ' + ',\n    '.join(lines) + '\n)'
@@ -0,0 +1,395 @@
+import time
+
+import pymysql
+
+from movie_dimensions import sync_dimensions
+from movie_repository.schema import KEY_COLUMNS, TYPED_TABLES, column_names, convert_rows, keyed_rows, quoted_columns, \
+    typed_table_sql
+
+# 当前的数据表结构版本，各表的目标结构见 movie_repository/schema.py 中的 TYPED_TABLES
+SCHEMA_VERSION = 1
+
+
+# 创建迁移记录表
+def create_migration_table(cursor):
+    try:
+        sql = '''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+            version INT NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            copied_rows BIGINT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        )
+        '''
+        cursor.execute(sql)
+    except Exception as e:
+        print('创建数据表时发生异常：', e)
+        raise
+
+
+def migration_state(cursor, table):
+    cursor.execute('SELECT version, status, copied_rows FROM schema_migrations WHERE table_name = %s', (table,))
+    return cursor.fetchone()
+
+
+def set_migration_state(cursor, table, status, copied_rows=0, version=SCHEMA_VERSION):
+    cursor.execute('INSERT INTO schema_migrations(table_name, version, status, copied_rows, updated_at) '
+                   'VALUES(%s, %s, %s, %s, NOW()) ON DUPLICATE KEY UPDATE version = VALUES(version), '
+                   'status = VALUES(status), copied_rows = VALUES(copied_rows), updated_at = VALUES(updated_at)',
+                   (table, version, status, copied_rows))
+
+
+def table_exists(cursor, table):
+    cursor.execute('SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                   (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute('SELECT COUNT(*) FROM information_schema.columns '
+                   'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s', (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute('SELECT COUNT(*) FROM information_schema.statistics '
+                   'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s', (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def is_typed(cursor, table):
+    # 已经有代理主键 id 的表视为已迁移（包括直接按新结构创建的表）
+    return column_exists(cursor, table, 'id')
+
+
+def create_change_capture(cursor, table):
+    """
+    功能:
+    - 在原表上建触发器，把复制期间新增、修改、删除的电影标题记入 {table}__changes，
+      复制完成后按标题把这些电影从原表重新同步到新表。
+    """
+    changes = f'{table}__changes'
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {changes} (change_id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY, '
+                   f'title VARCHAR(255) NOT NULL)')
+    cursor.execute(f'DROP TRIGGER IF EXISTS {table}__typed_insert')
+    cursor.execute(f'DROP TRIGGER IF EXISTS {table}__typed_update')
+    cursor.execute(f'DROP TRIGGER IF EXISTS {table}__typed_delete')
+    cursor.execute(f'CREATE TRIGGER {table}__typed_insert AFTER INSERT ON {table} FOR EACH ROW '
+                   f'INSERT INTO {changes}(title) VALUES (NEW.title)')
+    cursor.execute(f'CREATE TRIGGER {table}__typed_update AFTER UPDATE ON {table} FOR EACH ROW '
+                   f'INSERT INTO {changes}(title) VALUES (OLD.title), (NEW.title)')
+    cursor.execute(f'CREATE TRIGGER {table}__typed_delete AFTER DELETE ON {table} FOR EACH ROW '
+                   f'INSERT INTO {changes}(title) VALUES (OLD.title)')
+
+
+def drop_change_capture(cursor, table):
+    for event in ('insert', 'update', 'delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}__typed_{event}')
+    cursor.execute(f'DROP TABLE IF EXISTS {table}__changes')
+
+
+def insert_typed_rows(cursor, table, target, rows, batch_size):
+    sql = (f'INSERT INTO {target}({quoted_columns(table)}) '
+           f'VALUES({", ".join(["%s"] * len(column_names(table)))})')
+    rows = convert_rows(table, rows)
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def replay_changes(connection, table, batch_size=5000):
+    """
+    功能:
+    - 把变更日志中出现过的标题从原表整体重新同步到新表（先删后插，与原表当前内容一致），再删除已处理的日志。
+      调用方在切换前持有表锁时也使用同一个函数，因此这里不使用表别名，也不开启事务。
+
+    输出:
+    - 本次同步的标题数。
+    """
+    target, changes = f'{table}__typed', f'{table}__changes'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(change_id) FROM {changes}')
+        last, = cursor.fetchone()
+        if last is None:
+            return 0
+        cursor.execute('DROP TEMPORARY TABLE IF EXISTS schema_sync_titles')
+        cursor.execute('CREATE TEMPORARY TABLE schema_sync_titles (title VARCHAR(255) NOT NULL PRIMARY KEY)')
+        cursor.execute(f'INSERT IGNORE INTO schema_sync_titles SELECT title FROM {changes} WHERE change_id <= %s',
+                       (last,))
+        synced = cursor.rowcount
+        cursor.execute(f'DELETE {target} FROM {target} JOIN schema_sync_titles '
+                       f'ON {target}.title = schema_sync_titles.title')
+        cursor.execute(f'SELECT {quoted_columns(table, table + ".")} FROM {table} JOIN schema_sync_titles '
+                       f'ON {table}.title = schema_sync_titles.title')
+        insert_typed_rows(cursor, table, target, cursor.fetchall(), batch_size)
+        cursor.execute(f'DELETE FROM {changes} WHERE change_id <= %s', (last,))
+        cursor.execute('DROP TEMPORARY TABLE schema_sync_titles')
+    return synced
+
+
+# 在线迁移一张表
+def migrate_table(connection, copy_connection, table, batch_size=5000, pause=0.0, keep_backup=True, restart=False):
+    """
+    功能:
+    - 把全是 VARCHAR 的旧表在线迁移为 TYPED_TABLES 中的结构（数值/日期列、代理主键、title/年份/评分索引）：
+      1. 按新结构创建 {table}__typed，在旧表上建触发器记录复制期间发生变化的标题；
+      2. 用流式游标读取旧表的一致性快照，分批转换、写入新表，每批单独提交并记录进度，中断后从记录的行数继续；
+      3. 反复按变更日志同步，直到剩余变更很少；
+      4. 短暂锁表，同步最后的变更、核对行数，原子地 RENAME 完成切换，旧表保留为 {table}__untyped。
+    - 复制期间旧表照常可读写，只有第 4 步会短暂阻塞写入。
+
+    输入:
+    - connection: pymysql 连接，用于写入新表。
+    - copy_connection: 另一个 pymysql 连接，用于流式读取旧表。
+    - table: TYPED_TABLES 中的表名。
+    - batch_size: 每批复制的行数。
+    - pause: 每批之间暂停的秒数，用于降低对线上查询的影响。
+    - keep_backup: 为 False 时切换后删除旧表。
+    - restart: 为 True 时忽略上次的进度，重新完整复制。
+
+    输出:
+    - 复制的行数；表已迁移时返回 0。
+    """
+    target = f'{table}__typed'
+    with connection.cursor() as cursor:
+        create_migration_table(cursor)
+        if is_typed(cursor, table):
+            print(f"数据表 {table} 已是新结构，跳过。")
+            return 0
+        state = migration_state(cursor, table)
+        copied = state[2] if state and state[1] == 'copying' and not restart else 0
+        if not copied:
+            cursor.execute(f'DROP TABLE IF EXISTS {target}')
+            cursor.execute(f'DROP TABLE IF EXISTS {table}__changes')
+        cursor.execute(typed_table_sql(table, target))
+        # 触发器必须在读取快照之前建好，快照之后的变化才不会遗漏
+        create_change_capture(cursor, table)
+        set_migration_state(cursor, table, 'copying', copied)
+    connection.commit()
+
+    start = time.perf_counter()
+    copy_connection.begin()
+    with copy_connection.cursor(pymysql.cursors.SSCursor) as source:
+        source.execute(f'SELECT {quoted_columns(table)} FROM {table}')
+        # 续传时跳过上次已提交的行；没有主键时 InnoDB 按内部行号顺序扫描，两次扫描的顺序一致
+        skipped = 0
+        while skipped < copied:
+            rows = source.fetchmany(min(batch_size, copied - skipped))
+            if not rows:
+                break
+            skipped += len(rows)
+        while True:
+            rows = source.fetchmany(batch_size)
+            if not rows:
+                break
+            with connection.cursor() as cursor:
+                insert_typed_rows(cursor, table, target, rows, batch_size)
+                copied += len(rows)
+                set_migration_state(cursor, table, 'copying', copied)
+            connection.commit()
+            if pause:
+                time.sleep(pause)
+    copy_connection.commit()
+    print(f"{table}: 复制 {copied} 行，耗时 {time.perf_counter() - start:.2f}s")
+
+    # 先在不锁表的情况下追平变更，最后锁表时只剩很少的变更
+    for _ in range(10):
+        synced = replay_changes(connection, table, batch_size)
+        connection.commit()
+        if synced < batch_size:
+            break
+
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLES {table} WRITE, {target} WRITE, {table}__changes WRITE')
+        try:
+            replay_changes(connection, table, batch_size)
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            old_count, = cursor.fetchone()
+            cursor.execute(f'SELECT COUNT(*) FROM {target}')
+            new_count, = cursor.fetchone()
+            if old_count != new_count:
+                # 中断期间旧表有删除时，按行数续传可能错位，此时需要重新完整迁移
+                raise RuntimeError(f'{table} 迁移后行数不一致：{old_count} != {new_count}，请以 restart=True 重新迁移')
+            for event in ('insert', 'update', 'delete'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {table}__typed_{event}')
+            cursor.execute(f'RENAME TABLE {table} TO {table}__untyped, {target} TO {table}')
+        finally:
+            cursor.execute('UNLOCK TABLES')
+        cursor.execute(f'DROP TABLE IF EXISTS {table}__changes')
+        if not keep_backup:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}__untyped')
+        set_migration_state(cursor, table, 'done', copied)
+    connection.commit()
+    print(f"{table}: 切换完成，锁表 {time.perf_counter() - start:.3f}s")
+    return copied
+
+
+# 为已迁移的表补建全文索引
+def add_fulltext_indexes(connection, table):
+    """
+    功能:
+    - 按 TYPED_TABLES 中的 fulltext 为表补建 ngram 全文索引，已存在的跳过。
+      InnoDB 建第一个全文索引时需要重建表，期间不能写入，应在导入数据之后、低峰时执行。
+    """
+    with connection.cursor() as cursor:
+        for column in TYPED_TABLES[table].get('fulltext', []):
+            name = f'ft_{table}_{column}'
+            if index_exists(cursor, table, name):
+                continue
+            start = time.perf_counter()
+            cursor.execute(f'ALTER TABLE {table} ADD FULLTEXT KEY {name} (`{column}`) WITH PARSER ngram')
+            print(f"{table}: 建立全文索引 {name}，耗时 {time.perf_counter() - start:.2f}s")
+    connection.commit()
+
+
+# 为已迁移的表补齐唯一键并去重
+def add_natural_keys(connection, copy_connection, table, batch_size=5000):
+    """
+    功能:
+    - 为 row_key / row_hash（见 movie_repository.schema.natural_key）尚未计算的行补齐这两列，
+      同一部电影的重复行只保留 id 最大（最后导入）的一行，然后建立 row_key 唯一索引，之后的导入按唯一键增量写入。
+      1. 列不存在时在线添加（可为 NULL 的列，InnoDB 不需要重建表）；
+      2. 用流式游标读取 row_key 为 NULL 的行，分批计算后写入工作表 {table}__keys；
+      3. 删除重复行：工作表中键相同而 id 较小的行，以及与已有唯一键冲突的行；
+      4. 一条 UPDATE ... JOIN 写回剩余行的 row_key / row_hash，补建唯一索引。
+    - 删除了 moviemate_movies 的行时重建类型、地区关联表。
+
+    输入:
+    - connection: pymysql 连接，用于写入。
+    - copy_connection: 另一个 pymysql 连接，用于流式读取。
+    - table: TYPED_TABLES 中的表名。
+    - batch_size: 每批写入工作表的行数。
+
+    输出:
+    - 删除的重复行数。
+    """
+    work, unique_key = f'{table}__keys', f'uk_{table}_row_key'
+    with connection.cursor() as cursor:
+        for column, after in zip(KEY_COLUMNS, ['id'] + KEY_COLUMNS):
+            if not column_exists(cursor, table, column):
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} BINARY(16) NULL AFTER {after}')
+        # 工作表在同一条 DELETE 中要引用两次，不能使用临时表
+        cursor.execute(f'DROP TABLE IF EXISTS {work}')
+        cursor.execute(f'CREATE TABLE {work} (id BIGINT UNSIGNED NOT NULL PRIMARY KEY, row_key BINARY(16) NOT NULL, '
+                       f'row_hash BINARY(16) NOT NULL, KEY idx_{work}_row_key (row_key))')
+    connection.commit()
+
+    start = time.perf_counter()
+    computed = 0
+    copy_connection.begin()
+    with copy_connection.cursor(pymysql.cursors.SSCursor) as source:
+        source.execute(f'SELECT {quoted_columns(table)}, id FROM {table} WHERE row_key IS NULL')
+        while True:
+            rows = source.fetchmany(batch_size)
+            if not rows:
+                break
+            with connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {work}(id, row_key, row_hash) VALUES(%s, %s, %s)',
+                                   [(row[-1], *keyed_row[-2:]) for row, keyed_row in
+                                    zip(rows, keyed_rows(table, [row[:-1] for row in rows]))])
+            connection.commit()
+            computed += len(rows)
+    copy_connection.commit()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE t FROM {table} AS t JOIN {work} AS w ON w.id = t.id '
+                       f'JOIN {work} AS newer ON newer.row_key = w.row_key AND newer.id > w.id')
+        removed = cursor.rowcount
+        cursor.execute(f'DELETE t FROM {table} AS t JOIN {work} AS w ON w.id = t.id '
+                       f'JOIN {table} AS keyed ON keyed.row_key = w.row_key')
+        removed += cursor.rowcount
+        cursor.execute(f'UPDATE {table} AS t JOIN {work} AS w ON w.id = t.id '
+                       f'SET t.row_key = w.row_key, t.row_hash = w.row_hash')
+        connection.commit()
+        if not index_exists(cursor, table, unique_key):
+            cursor.execute(f'ALTER TABLE {table} ADD UNIQUE KEY {unique_key} (row_key)')
+        cursor.execute(f'DROP TABLE {work}')
+    connection.commit()
+    if removed and table == 'moviemate_movies':
+        sync_dimensions(connection)
+    print(f"{table}: 计算 {computed} 行的唯一键，删除 {removed} 行重复数据，耗时 {time.perf_counter() - start:.2f}s")
+    return removed
+
+
+def benchmark_queries(table):
+    # 有代表性的查询：按标题精确查找、按年份范围筛选、按评分取前 10
+    spec = {
+        'moviemate_movies': ('year', "year BETWEEN 1990 AND 1999", 'mm_rating'),
+        'douban_movies': ('year', "year BETWEEN 1990 AND 1999", 'rating'),
+        'maoyan_movies': ('release_date', "release_date BETWEEN '1990-01-01' AND '1999-12-31'", 'grade'),
+        'dytt_movies': ('year', "year BETWEEN 1990 AND 1999", 'douban_rating'),
+    }
+    _, year_filter, rating = spec[table]
+    return {
+        'title': f'SELECT * FROM {table} WHERE title = %s',
+        'year_range': f'SELECT COUNT(*) FROM {table} WHERE {year_filter}',
+        'top_rated': f'SELECT title, {rating} FROM {table} ORDER BY {rating} DESC LIMIT 10',
+    }
+
+
+# 迁移前后的查询耗时
+def benchmark_table(connection, table, repeat=5):
+    """
+    功能:
+    - 对 benchmark_queries 中的每条查询重复执行 repeat 次，取中位数耗时（毫秒）。
+      按标题查找使用表中的一个真实标题。
+
+    输出:
+    - {查询名称: 毫秒}。
+    """
+    timings = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT title FROM {table} LIMIT 1')
+        row = cursor.fetchone()
+        title = row[0] if row else ''
+        for name, sql in benchmark_queries(table).items():
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cursor.execute(sql, (title,) if '%s' in sql else None)
+                cursor.fetchall()
+                seconds.append(time.perf_counter() - start)
+            timings[name] = sorted(seconds)[len(seconds) // 2] * 1000
+    return timings
+
+
+def main():
+    host = 'localhost'
+    user = 'root'
+    password = '123456'
+    port = 3306
+    database = 'MovieMate'
+    charset = 'utf8mb4'
+
+    try:
+        connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                     charset=charset)
+        copy_connection = pymysql.connect(host=host, user=user, password=password, port=port, database=database,
+                                          charset=charset)
+        try:
+            for table in TYPED_TABLES:
+                with connection.cursor() as cursor:
+                    if not table_exists(cursor, table):
+                        print(f"数据表 {table} 不存在，跳过。")
+                        continue
+                before = benchmark_table(connection, table)
+                migrate_table(connection, copy_connection, table)
+                add_natural_keys(connection, copy_connection, table)
+                add_fulltext_indexes(connection, table)
+                after = benchmark_table(connection, table)
+                for name in before:
+                    print(f"{table} {name}: {before[name]:.2f}ms -> {after[name]:.2f}ms "
+                          f"({before[name] / max(after[name], 1e-6):.1f}x)")
+        finally:
+            copy_connection.close()
+            connection.close()
+    except Exception as e:
+        print('在执行主函数main时发生异常：', e)
+        raise
+    finally:
+        print("程序执行完毕")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bulk_loader
+
+TABLE = 'dytt_movies'
+
+
+class FakeDatabase(object):
+    # 已提交的数据行 {标题: 行} 和导入进度；未提交的写入在 commit 时生效，rollback 或断开连接时丢弃
+    def __init__(self):
+        self.rows = {}
+        self.progress = None
+        self.pending_rows = {}
+        self.pending_progress = None
+        self.truncated = 0
+        # 每次提交后的 (进度中的行数, 状态, 已提交的数据行数)
+        self.commits = []
+
+    def commit(self):
+        self.rows.update(self.pending_rows)
+        if self.pending_progress is not None:
+            self.progress = self.pending_progress
+        self.rollback()
+        self.commits.append((self.progress[2], self.progress[3], len(self.rows)))
+
+    def rollback(self):
+        self.pending_rows, self.pending_progress = {}, None
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchone(self):
+        return self.result
+
+    def execute(self, sql, params=None):
+        query = ' '.join(sql.split())
+        if query.startswith('SELECT source_file, signature, loaded_rows, status FROM bulk_load_progress'):
+            self.result = self.db.progress
+        elif query.startswith('INSERT INTO bulk_load_progress'):
+            _, source_file, signature, loaded_rows, status = params
+            self.db.pending_progress = (source_file, signature, loaded_rows, status)
+        elif not query.startswith('CREATE TABLE IF NOT EXISTS bulk_load_progress'):
+            raise AssertionError(query)
+
+
+class FakeConnection(object):
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, *args):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.rollback()
+
+
+class FakeRepository(object):
+    # 按标题增量写入，写入的行在连接提交前不可见；fail_at 为第几次写入时模拟中断
+    db = None
+    fail_at = None
+    chunks = []
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_table(self, table):
+        pass
+
+    def truncate(self, table):
+        self.db.rows = {}
+        self.db.truncated += 1
+
+    def upsert_many(self, table, rows, batch_size=None, commit=True):
+        FakeRepository.chunks.append([row[0] for row in rows])
+        if len(FakeRepository.chunks) == FakeRepository.fail_at:
+            raise ConnectionError('连接中断')
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        for row in rows:
+            old = self.db.pending_rows.get(row[0], self.db.rows.get(row[0]))
+            counts['inserted' if old is None else 'unchanged' if old == row else 'updated'] += 1
+            self.db.pending_rows[row[0]] = row
+        return counts
+
+    load_rows = upsert_many
+
+
+class LoadTableTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.file_path = os.path.join(self.directory.name, 'movies_dytt.csv')
+        self.write_file(10)
+        self.db = FakeDatabase()
+        FakeRepository.db, FakeRepository.fail_at, FakeRepository.chunks = self.db, None, []
+        self.sync_dimensions = mock.MagicMock()
+        patches = [
+            mock.patch.object(bulk_loader.pymysql, 'connect', lambda **kwargs: FakeConnection(self.db)),
+            mock.patch.object(bulk_loader, 'MovieRepository', FakeRepository),
+            mock.patch.object(bulk_loader, 'sync_dimensions', self.sync_dimensions),
+            mock.patch('builtins.print'),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_file(self, n, rating='8.0'):
+        with open(self.file_path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['title', 'imdb_rating'])
+            writer.writerows([f'电影{i}', rating] for i in range(n))
+
+    def load(self, **kwargs):
+        return bulk_loader.load_table({}, TABLE, self.file_path, chunk_size=3, **kwargs)
+
+    def interrupted_load(self, fail_at=3):
+        FakeRepository.fail_at = fail_at
+        with self.assertRaises(ConnectionError):
+            self.load()
+        FakeRepository.fail_at, FakeRepository.chunks = None, []
+
+    def test_full_load(self):
+        result = self.load()
+        self.assertEqual((result['rows'], result['skipped'], result['inserted']), (10, 0, 10))
+        self.assertEqual(len(self.db.rows), 10)
+        self.assertEqual(self.db.progress[2:], (10, 'done'))
+        self.assertEqual(self.db.progress[0], os.path.abspath(self.file_path))
+        self.sync_dimensions.assert_not_called()
+
+    def test_progress_committed_with_each_chunk(self):
+        self.load()
+        # 每次提交时记录的进度都等于已提交的数据行数
+        self.assertEqual(self.db.commits, [(0, 'loading', 0), (3, 'loading', 3), (6, 'loading', 6),
+                                           (9, 'loading', 9), (10, 'loading', 10), (10, 'done', 10)])
+
+    def test_interrupted_chunk_is_rolled_back(self):
+        self.interrupted_load()
+        self.assertEqual(len(self.db.rows), 6)
+        self.assertEqual(self.db.progress[2:], (6, 'loading'))
+
+    def test_resume_from_progress(self):
+        self.interrupted_load()
+        result = self.load()
+        self.assertEqual((result['rows'], result['skipped'], result['inserted'], result['unchanged']), (4, 6, 4, 0))
+        # 续传从第一块未提交的行开始
+        self.assertEqual(FakeRepository.chunks[0], ['电影6', '电影7', '电影8'])
+        self.assertEqual(sorted(self.db.rows), sorted(f'电影{i}' for i in range(10)))
+        self.assertEqual(self.db.progress[2:], (10, 'done'))
+
+    def test_changed_file_is_loaded_from_start(self):
+        self.interrupted_load()
+        # 重新爬取后文件的大小和修改时间都变了，签名不同，不能按行数续传
+        self.write_file(11, rating='8.5')
+        os.utime(self.file_path, ns=(1, 1))
+        result = self.load()
+        self.assertEqual((result['rows'], result['skipped']), (11, 0))
+        self.assertEqual((result['inserted'], result['updated']), (5, 6))
+        self.assertEqual(FakeRepository.chunks[0], ['电影0', '电影1', '电影2'])
+
+    def test_restart_ignores_progress(self):
+        self.interrupted_load()
+        result = self.load(restart=True)
+        self.assertEqual((result['rows'], result['skipped'], result['inserted'], result['unchanged']), (10, 0, 4, 6))
+        self.assertEqual(self.db.truncated, 0)
+
+    def test_replace_truncates_only_when_starting_over(self):
+        self.interrupted_load()
+        # 续传时不清空已提交的数据
+        self.load(replace=True)
+        self.assertEqual(self.db.truncated, 0)
+        result = self.load(replace=True)
+        self.assertEqual(self.db.truncated, 1)
+        self.assertEqual((result['rows'], result['inserted']), (10, 10))
+
+    def test_finished_load_is_not_resumed(self):
+        self.load()
+        result = self.load()
+        self.assertEqual((result['rows'], result['skipped'], result['unchanged']), (10, 0, 10))
+
+    def test_moviemate_rebuilds_dimensions(self):
+        bulk_loader.load_table({}, 'moviemate_movies', self.file_path, chunk_size=3)
+        self.sync_dimensions.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
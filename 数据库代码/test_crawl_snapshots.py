@@ -0,0 +1,243 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from crawl_snapshots import apply_changes, baseline_snapshot, diff_snapshots, refresh_table, take_snapshot
+from movie_repository import MovieRepository
+from movie_repository.repository import upsert_sql
+
+TABLE = 'dytt_movies'
+COLUMNS = ['title', 'cover', 'year', 'country', 'category', 'imdb_rating', 'douban_rating', 'duration',
+           'download_link', 'screen_shot']
+
+
+class FakeDatabase(object):
+    # 按语句前缀模拟 crawl_snapshots 用到的 MySQL 语句，表内容以 row_key 为键保存
+    def __init__(self):
+        self.snapshots = {}
+        self.snapshot_rows = {}
+        self.table = {}
+        self.changes = []
+        self.upserted = 0
+
+    def snapshot(self, snapshot_id):
+        return {key: row_hash for (sid, key), row_hash in self.snapshot_rows.items() if sid == snapshot_id}
+
+    def add_changes(self, snapshot_id, op, keys):
+        for key in keys:
+            title = self.table[key][0] if op == 'delete' and key in self.table else ''
+            self.changes.append({'snapshot_id': snapshot_id, 'op': op, 'row_key': key, 'title': title})
+        return len(keys)
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def executemany(self, sql, rows):
+        db = self.db
+        if sql.startswith('INSERT INTO crawl_snapshot_rows'):
+            for snapshot_id, key, row_hash in rows:
+                db.snapshot_rows[snapshot_id, key] = row_hash
+        elif sql == upsert_sql(TABLE):
+            for row in rows:
+                db.table[row[-2]] = row
+            db.upserted += len(rows)
+        else:
+            raise AssertionError(sql)
+
+    def execute(self, sql, params=None):
+        db, query = self.db, ' '.join(sql.split())
+        self.result, self.rowcount = [], 0
+        if query.startswith('CREATE'):
+            return
+        if query.startswith('SELECT id, source_file, signature FROM crawl_snapshots'):
+            self.result = sorted((i, s['file'], s['signature']) for i, s in db.snapshots.items()
+                                 if s['table'] == params[0] and s['status'] in ('baseline', 'applied'))[-1:]
+        elif query.startswith('INSERT INTO crawl_snapshots'):
+            self.lastrowid = max(db.snapshots, default=0) + 1
+            db.snapshots[self.lastrowid] = dict(zip(['table', 'file', 'signature', 'status'], params))
+        elif query.startswith('INSERT INTO crawl_snapshot_rows(snapshot_id, row_key, row_hash) SELECT'):
+            for key, row in db.table.items():
+                db.snapshot_rows[params[0], key] = row[-1]
+            self.rowcount = len(db.table)
+        elif query.startswith('UPDATE crawl_snapshots SET row_count = %s WHERE'):
+            pass
+        elif query.startswith("UPDATE crawl_snapshots SET status = 'applied'"):
+            db.snapshots[params[1]]['status'] = 'applied'
+        elif query.startswith("UPDATE crawl_snapshots SET status = 'pruned'"):
+            db.snapshots[params[0]]['status'] = 'pruned'
+        elif query.startswith('SELECT COUNT(*) FROM crawl_snapshot_rows'):
+            self.result = [(len(db.snapshot(params[0])),)]
+        elif query.startswith('INSERT INTO movie_changes'):
+            current = db.snapshot(params[0])
+            if "'delete'" in query:
+                previous = db.snapshot(params[3])
+                self.rowcount = db.add_changes(params[0], 'delete', [k for k in previous if k not in current])
+            else:
+                previous = db.snapshot(params[2])
+                if "'insert'" in query:
+                    self.rowcount = db.add_changes(params[0], 'insert', [k for k in current if k not in previous])
+                else:
+                    self.rowcount = db.add_changes(params[0], 'update', [k for k in current
+                                                                         if k in previous and previous[k] != current[k]])
+        elif query.startswith('SELECT row_key FROM movie_changes'):
+            self.result = [(c['row_key'],) for c in db.changes if c['snapshot_id'] == params[0] and c['op'] != 'delete']
+        elif query.startswith('DELETE t FROM'):
+            for c in db.changes:
+                if c['snapshot_id'] == params[0] and c['op'] == 'delete':
+                    db.table.pop(c['row_key'], None)
+        elif query.startswith('SELECT row_key, row_hash FROM'):
+            self.result = [(key, db.table[key][-1]) for key in params if key in db.table]
+        elif query.startswith('UPDATE movie_changes AS c JOIN'):
+            for c in db.changes:
+                if c['snapshot_id'] == params[0] and c['op'] != 'delete' and c['row_key'] in db.table:
+                    c['title'] = db.table[c['row_key']][0]
+        elif query.startswith('SELECT id, status FROM crawl_snapshots'):
+            self.result = sorted(((i, s['status']) for i, s in db.snapshots.items()
+                                  if s['table'] == params[0] and s['status'] != 'pruned'), reverse=True)
+        elif query.startswith('DELETE FROM crawl_snapshot_rows'):
+            keys = [key for key in db.snapshot_rows if key[0] == params[0]]
+            for key in keys:
+                del db.snapshot_rows[key]
+            self.rowcount = len(keys)
+        else:
+            raise AssertionError(query)
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.db = FakeDatabase()
+
+    def cursor(self, *args):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def movie(i, rating='7.5', link=None):
+    return [f'2023年剧情《电影{i}》BD中字', f'cover{i}.jpg', '2023', '中国大陆', '剧情', '', rating, '120分钟',
+            link or f'magnet:{i}', '']
+
+
+class RefreshTableTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, 'movies_dytt.csv')
+        self.connection = FakeConnection()
+        self.db = self.connection.db
+        self.mtime = 10 ** 9
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, rows):
+        with open(self.file_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        # 每次写入都换一个修改时间，保证文件签名变化
+        self.mtime += 1
+        os.utime(self.file_path, (self.mtime, self.mtime))
+
+    def titles(self):
+        return sorted(row[0] for row in self.db.table.values())
+
+    def test_first_refresh_inserts_everything(self):
+        self.write([movie(i) for i in range(5)])
+        counts = refresh_table(self.connection, TABLE, self.file_path)
+        self.assertEqual({k: counts[k] for k in ('inserted', 'updated', 'deleted', 'unchanged')},
+                         {'inserted': 5, 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(len(self.db.table), 5)
+        self.assertEqual([c['title'] for c in self.db.changes], [movie(i)[0] for i in range(5)])
+
+    def test_unchanged_file_is_skipped(self):
+        self.write([movie(i) for i in range(5)])
+        refresh_table(self.connection, TABLE, self.file_path)
+        self.assertIsNone(refresh_table(self.connection, TABLE, self.file_path))
+        upserted = self.db.upserted
+        counts = refresh_table(self.connection, TABLE, self.file_path, force=True)
+        self.assertEqual((counts['unchanged'], self.db.upserted), (5, upserted))
+        self.assertEqual(len(self.db.changes), 5)
+
+    def test_only_changed_movies_are_written(self):
+        self.write([movie(i) for i in range(6)])
+        refresh_table(self.connection, TABLE, self.file_path)
+        upserted = self.db.upserted
+        # 删除电影0，电影1 评分变化，新增电影9；同一部电影的其他下载链接算作同一部电影
+        self.write([movie(1, '8.0')] + [movie(i) for i in range(2, 6)] + [movie(3, link='ftp://3'), movie(9)])
+        counts = refresh_table(self.connection, TABLE, self.file_path)
+        self.assertEqual({k: counts[k] for k in ('inserted', 'updated', 'deleted', 'unchanged')},
+                         {'inserted': 1, 'updated': 2, 'deleted': 1, 'unchanged': 3})
+        self.assertEqual(self.db.upserted - upserted, 3)
+        self.assertEqual(self.titles(), sorted(movie(i)[0] for i in (1, 2, 3, 4, 5, 9)))
+        latest = [(c['op'], c['title']) for c in self.db.changes[6:]]
+        self.assertEqual(sorted(latest), sorted([('insert', movie(9)[0]), ('update', movie(1)[0]),
+                                                 ('update', movie(3)[0]), ('delete', movie(0)[0])]))
+
+    def test_existing_table_becomes_baseline(self):
+        self.write([movie(i) for i in range(4)])
+        MovieRepository(self.connection).upsert_many(TABLE, [movie(i) for i in range(3)])
+        counts = refresh_table(self.connection, TABLE, self.file_path)
+        self.assertEqual((counts['inserted'], counts['unchanged']), (1, 3))
+        self.assertEqual(self.db.snapshots[1]['status'], 'baseline')
+
+    def test_old_snapshots_are_pruned(self):
+        for rating in ('6.0', '6.5', '7.0', '7.5', '8.0'):
+            self.write([movie(1, rating)])
+            refresh_table(self.connection, TABLE, self.file_path)
+        statuses = [s['status'] for _, s in sorted(self.db.snapshots.items())]
+        # 第一次刷新的基准快照同样只保留记录
+        self.assertEqual(statuses, ['pruned', 'pruned', 'pruned', 'applied', 'applied', 'applied'])
+        self.assertEqual({sid for sid, _ in self.db.snapshot_rows}, {4, 5, 6})
+
+
+class DiffSnapshotsTests(unittest.TestCase):
+    def test_diff_then_apply(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        file_path = os.path.join(directory.name, 'movies.csv')
+        connection = FakeConnection()
+        db = connection.db
+        # 上一次快照与数据表一致：电影1、2、3
+        MovieRepository(connection).upsert_many(TABLE, [movie(1), movie(2, '9.0'), movie(3)])
+        previous_id = baseline_snapshot(connection, TABLE)
+
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows([COLUMNS, movie(1), movie(2, '8.0'), movie(4)])
+        snapshot_id, count = take_snapshot(connection, TABLE, file_path, 'b')
+        self.assertEqual(count, 3)
+        with connection.cursor() as cursor:
+            counts = diff_snapshots(cursor, TABLE, snapshot_id, previous_id)
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'deleted': 1})
+
+        upserted = db.upserted
+        self.assertEqual(apply_changes(connection, TABLE, file_path, snapshot_id), [])
+        self.assertEqual(db.upserted - upserted, 2)
+        self.assertEqual(sorted((row[0], row[6]) for row in db.table.values()),
+                         [(movie(1)[0], 7.5), (movie(2)[0], 8.0), (movie(4)[0], 7.5)])
+        self.assertTrue(all(c['title'] for c in db.changes))
+
+
+if __name__ == '__main__':
+    unittest.main()
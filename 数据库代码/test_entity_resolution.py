@@ -0,0 +1,131 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from entity_resolution import (SOURCE_RECORDS, assign_movie_ids, clustering_edges, normalize_title, parse_people,
+                               read_source_records, stable_movie_ids)
+from movie_repository.schema import convert_rows, keyed_rows
+
+
+def make_records(rows):
+    # rows: (source, source_key, title, year, people)
+    return pd.DataFrame({
+        'source': [row[0] for row in rows],
+        'source_key': [row[1] for row in rows],
+        'title': [row[2] for row in rows],
+        'norm_title': [normalize_title(row[2]) for row in rows],
+        'year': [row[3] for row in rows],
+        'people': [parse_people(row[4]) for row in rows],
+    })
+
+
+class AssignMovieIdsTests(unittest.TestCase):
+    def test_unknown_year_does_not_bridge_remakes(self):
+        records = assign_movie_ids(make_records([
+            ('douban', 'd1', '哈姆雷特', 1948, '劳伦斯·奥利弗'),
+            ('douban', 'd2', '哈姆雷特', 1996, '肯尼思·布拉纳'),
+            ('dytt', 'x1', '2020年剧情《哈姆雷特》BD中字', 0, ''),
+        ]))
+        ids = records['movie_id'].tolist()
+        self.assertNotEqual(ids[0], ids[1])
+        # 年份未知的记录并入其中一部
+        self.assertIn(ids[2], ids[:2])
+
+    def test_same_movie_across_sources(self):
+        records = assign_movie_ids(make_records([
+            ('douban', 'd1', '霸王别姬', 1993, '陈凯歌/张国荣'),
+            ('maoyan', 'm1', '霸王别姬', 1993, '张国荣'),
+            ('dytt', 'x1', '《霸王别姬》', 0, ''),
+            ('douban', 'd2', '活着', 1994, '张艺谋'),
+        ]))
+        ids = records['movie_id'].tolist()
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(ids[0], ids[2])
+        self.assertNotEqual(ids[0], ids[3])
+
+    def test_clustering_edges_keeps_one_edge_per_unknown_record(self):
+        years = np.array([1948, 1996, 0, 0])
+        matched = np.array([[0, 2], [1, 2], [2, 3], [0, 1]])
+        scores = np.array([1.2, 1.5, 1.9, 1.0])
+        edges = clustering_edges(matched, scores, years)
+        # 0-1 年份都已知保留；记录 2 只连得分最高的已知年份记录 1；记录 3 只连记录 2
+        self.assertEqual(sorted(map(tuple, edges.tolist())), [(0, 1), (2, 1), (3, 2)])
+
+
+class StableMovieIdsTests(unittest.TestCase):
+    def test_reuses_previous_ids(self):
+        records = make_records([
+            ('douban', 'd1', 'a', 2000, ''), ('maoyan', 'm1', 'a', 2000, ''),
+            ('douban', 'd2', 'b', 2001, ''), ('douban', 'd3', 'c', 2002, ''),
+        ]).assign(movie_id=[1, 1, 2, 3])
+        existing = {('douban', 'd1'): 7, ('maoyan', 'm1'): 7, ('douban', 'd2'): 4}
+        ids = stable_movie_ids(records, existing)['movie_id'].tolist()
+        self.assertEqual(ids, [7, 7, 4, 8])
+
+    def test_split_component_keeps_id_for_larger_part(self):
+        records = make_records([
+            ('douban', 'd1', 'a', 2000, ''), ('maoyan', 'm1', 'a', 2000, ''), ('dytt', 'x1', 'a', 2000, ''),
+        ]).assign(movie_id=[1, 1, 2])
+        existing = {('douban', 'd1'): 5, ('maoyan', 'm1'): 5, ('dytt', 'x1'): 5}
+        ids = stable_movie_ids(records, existing)['movie_id'].tolist()
+        self.assertEqual(ids, [5, 5, 6])
+
+    def test_rerun_is_stable(self):
+        records = assign_movie_ids(make_records([
+            ('douban', 'd1', '霸王别姬', 1993, ''), ('maoyan', 'm1', '霸王别姬', 1993, ''),
+            ('douban', 'd2', '活着', 1994, ''),
+        ]))
+        first = stable_movie_ids(records, {})
+        existing = dict(zip(zip(first['source'], first['source_key']), first['movie_id']))
+        # 新增一条排在最前面的记录，已有记录的编号不变
+        rerun = assign_movie_ids(pd.concat([make_records([('douban', 'd0', '阳光灿烂的日子', 1994, '')]), records],
+                                           ignore_index=True).drop(columns='movie_id'))
+        second = stable_movie_ids(rerun, existing)
+        self.assertEqual(second['movie_id'].tolist()[1:], first['movie_id'].tolist())
+        self.assertEqual(second['movie_id'].tolist()[0], first['movie_id'].max() + 1)
+
+
+class MaoyanCursor(object):
+    # 按 SQL 中 HEX(`row_key`) 的写法返回十六进制文本的记录键
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql):
+        self.executed.append(sql)
+        self.result = [(row_key.hex().upper() if sql.startswith('SELECT HEX(`row_key`)') else row_key,
+                        row[0], row[4], '', row[3]) for *row, row_key, _ in self.rows]
+
+    def fetchmany(self, size):
+        rows, self.result = self.result[:size], self.result[size:]
+        return rows
+
+
+class MaoyanSourceKeyTests(unittest.TestCase):
+    def maoyan_records(self, image_url):
+        rows = keyed_rows('maoyan_movies', convert_rows('maoyan_movies', [
+            ('霸王别姬', '9.5', '剧情', '张国荣,张丰毅', '1993-01-01', image_url)]))
+        cursor = MaoyanCursor(rows)
+        connection = type('Connection', (), {'cursor': lambda self, *args: cursor})()
+        records = read_source_records(connection, {'maoyan': SOURCE_RECORDS['maoyan']})
+        return cursor, records
+
+    def test_key_does_not_change_with_poster(self):
+        cursor, first = self.maoyan_records('https://p0.meituan.net/a.jpg')
+        _, second = self.maoyan_records('https://p1.meituan.net/b.jpg')
+        self.assertTrue(cursor.executed[0].startswith('SELECT HEX(`row_key`), title, release_date'))
+        self.assertEqual(first['source_key'].tolist(), second['source_key'].tolist())
+        self.assertEqual(len(first['source_key'][0]), 32)
+        self.assertEqual(first['year'].tolist(), [1993])
+
+
+if __name__ == '__main__':
+    unittest.main()
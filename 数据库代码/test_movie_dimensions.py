@@ -0,0 +1,159 @@
+import re
+import unittest
+from unittest import mock
+
+from movie_dimensions import DIMENSIONS, split_values, sync_dimensions
+
+
+class SplitValuesTests(unittest.TestCase):
+    def test_delimiters(self):
+        for text in ('剧情/爱情/同性', '剧情,爱情,同性', '剧情，爱情，同性', '剧情、爱情、同性', '剧情|爱情|同性',
+                     '剧情 / 爱情，同性'):
+            self.assertEqual(split_values(text), ['剧情', '爱情', '同性'], text)
+
+    def test_blanks_and_whitespace(self):
+        self.assertEqual(split_values(' 中国大陆 /  / 香港　/'), ['中国大陆', '香港'])
+        self.assertEqual(split_values('\t美国\n'), ['美国'])
+        for text in ('', '  ', '/', ' / ，', None):
+            self.assertEqual(split_values(text), [], repr(text))
+
+    def test_duplicates_keep_first_position(self):
+        self.assertEqual(split_values('爱情/剧情/爱情 / 剧情/喜剧'), ['爱情', '剧情', '喜剧'])
+
+    def test_non_string_values(self):
+        self.assertEqual(split_values(1993), ['1993'])
+
+
+class FakeDatabase(object):
+    # 维度表为 {名称: id}，关联表为 {(维度 id, movie_id): position}，INSERT IGNORE 遇到重复键时保留原行
+    def __init__(self, movies):
+        self.movies = movies
+        self.dimensions = {table: {} for table, _, _, _ in DIMENSIONS.values()}
+        self.links = {link: {} for _, link, _, _ in DIMENSIONS.values()}
+
+    def state(self):
+        # 用名称表示的关联，便于与期望结果比较
+        result = {}
+        for table, link, _, _ in DIMENSIONS.values():
+            names = {value: name for name, value in self.dimensions[table].items()}
+            result[link] = sorted((movie_id, position, names[value])
+                                  for (value, movie_id), position in self.links[link].items())
+        return result
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchall(self):
+        return self.result
+
+    def fetchall_unbuffered(self):
+        return iter(self.result)
+
+    def executemany(self, sql, rows):
+        db = self.db
+        match = re.match(r'INSERT IGNORE INTO (\w+)\((\w+)', sql)
+        table = match.group(1)
+        if table in db.dimensions:
+            for name, in rows:
+                db.dimensions[table].setdefault(name, len(db.dimensions[table]) + 1)
+        else:
+            for value, movie_id, position in rows:
+                db.links[table].setdefault((value, movie_id), position)
+
+    def execute(self, sql, params=None):
+        db, query = self.db, ' '.join(sql.split())
+        self.result = []
+        if query.startswith('SELECT id, genre, region FROM moviemate_movies'):
+            ids = set(params) if params else None
+            self.result = [(movie_id, genre, region) for movie_id, (genre, region) in db.movies.items()
+                           if ids is None or movie_id in ids]
+        elif query.startswith('SELECT name, id FROM'):
+            table = query.split()[4]
+            self.result = [(name, db.dimensions[table][name]) for name in params if name in db.dimensions[table]]
+        elif query.startswith('DELETE FROM'):
+            link = query.split()[2]
+            ids = set(params) if params else None
+            db.links[link] = {key: position for key, position in db.links[link].items()
+                              if ids is not None and key[1] not in ids}
+        elif not query.startswith('CREATE TABLE IF NOT EXISTS'):
+            raise AssertionError(query)
+
+
+class FakeConnection(object):
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, *args):
+        return FakeCursor(self.db)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def expected_links(movies):
+    # 直接按 split_values 拆分得到的关联
+    return {link: sorted((movie_id, position, name) for movie_id, values in movies.items()
+                         for position, name in enumerate(split_values(values[offset])))
+            for offset, (_, link, _, _) in enumerate(DIMENSIONS.values())}
+
+
+class SyncDimensionsTests(unittest.TestCase):
+    def setUp(self):
+        self.movies = {
+            1: ('剧情/爱情/同性', '中国大陆 / 香港'),
+            2: ('剧情，爱情', '美国'),
+            3: ('', ''),
+            4: ('喜剧|喜剧 / 剧情', '美国、英国'),
+        }
+        self.db = FakeDatabase(self.movies)
+        self.connection = FakeConnection(self.db)
+        patcher = mock.patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_sync_is_idempotent(self):
+        counts = sync_dimensions(self.connection)
+        self.assertEqual(counts, {'genre': 7, 'region': 5})
+        self.assertEqual(self.db.state(), expected_links(self.movies))
+        dimensions = {table: dict(names) for table, names in self.db.dimensions.items()}
+        self.assertEqual(sync_dimensions(self.connection), counts)
+        self.assertEqual(self.db.state(), expected_links(self.movies))
+        # 重新同步不产生新的名称，已有名称的 id 不变
+        self.assertEqual(self.db.dimensions, dimensions)
+
+    def test_incremental_sync_replaces_only_given_movies(self):
+        sync_dimensions(self.connection)
+        self.movies[2] = ('动作', '美国 / 加拿大')
+        self.movies[3] = ('纪录片', '')
+        counts = sync_dimensions(self.connection, movie_ids=[2, 3])
+        self.assertEqual(counts, {'genre': 2, 'region': 2})
+        self.assertEqual(self.db.state(), expected_links(self.movies))
+        state = self.db.state()
+        sync_dimensions(self.connection, movie_ids=[2, 3])
+        self.assertEqual(self.db.state(), state)
+
+    def test_incremental_sync_in_batches(self):
+        sync_dimensions(self.connection)
+        self.movies[1] = ('科幻', '日本')
+        self.movies[4] = ('', '法国')
+        sync_dimensions(self.connection, movie_ids=[1, 2, 3, 4], batch_size=1)
+        self.assertEqual(self.db.state(), expected_links(self.movies))
+
+
+if __name__ == '__main__':
+    unittest.main()
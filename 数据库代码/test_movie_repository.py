@@ -0,0 +1,437 @@
+import datetime
+import os
+import re
+import tempfile
+import unittest
+from decimal import Decimal
+
+import pandas as pd
+
+from movie_repository import MovieRepository, iter_rows, source_file
+from movie_repository.repository import NGRAM_TOKEN_SIZE, on_duplicate_sql, upsert_sql
+from movie_repository.schema import (TYPED_TABLES, content_columns, convert_rows, keyed_rows, natural_key,
+                                     normalize_title, normalize_url, row_hash)
+
+DOUBAN_ROW = ['陈凯歌', '张国荣 / 张丰毅', '剧情 / 爱情', '中国大陆', '1993', 'https://movie.douban.com/subject/1291546/',
+              '霸王别姬', '9.6', '2,000,000人评价', 'https://img/p1.jpg']
+MOVIEMATE_ROW = DOUBAN_ROW + ['9.5', '8.1', '9.5']
+
+
+def from_database(table, row):
+    # 模拟写入 MySQL 再读出：DECIMAL(3, 1) 读出为 Decimal，其他类型与写入时相同
+    return tuple(None if value is None else Decimal(f'{value:.1f}') if kind == 'rating' else value
+                 for value, (_, _, kind) in zip(row, TYPED_TABLES[table]['columns']))
+
+
+class ConvertRowsTests(unittest.TestCase):
+    def test_edge_inputs(self):
+        row, = convert_rows('douban_movies', [DOUBAN_ROW])
+        self.assertEqual(row[4], 1993)
+        self.assertEqual(row[7], 9.6)
+        self.assertEqual(row[8], 2000000)
+        row, = convert_rows('maoyan_movies', [['霸王别姬', '9.6/10', '剧情', '张国荣', '1993年7月26日中国香港上映', '']])
+        self.assertEqual(row[1], 9.6)
+        self.assertEqual(row[4], datetime.date(1993, 7, 26))
+        row, = convert_rows('maoyan_movies', [['a', '暂无评分', '', '', '2019-13-40', '']])
+        self.assertIsNone(row[1])
+        self.assertEqual(row[4], datetime.date(2019, 1, 1))
+        row, = convert_rows('dytt_movies', [['a', '', '', '', '', '', '0', '', '', '']])
+        self.assertIsNone(row[2])
+        self.assertIsNone(row[6])
+
+
+class NaturalKeyTests(unittest.TestCase):
+    def test_normalize_url(self):
+        urls = ['https://movie.douban.com/subject/1291546/', 'http://movie.douban.com/subject/1291546',
+                'HTTPS://Movie.Douban.com/subject/1291546/#comments', ' https://movie.douban.com/subject/1291546// ']
+        self.assertEqual({normalize_url(url) for url in urls}, {'movie.douban.com/subject/1291546'})
+        self.assertEqual(normalize_url(None), '')
+
+    def test_normalize_title(self):
+        self.assertEqual(normalize_title('2023年剧情《涉过愤怒的海》BD国语中字'), '涉过愤怒的海')
+        self.assertEqual(normalize_title('肖申克的救赎 (1994)'), '肖申克的救赎')
+        self.assertEqual(normalize_title('ＴＨＥ　Ｍａｔｒｉｘ！'), 'thematrix')
+
+    def test_url_variants_share_a_key(self):
+        rows = convert_rows('douban_movies', [DOUBAN_ROW, DOUBAN_ROW[:5] + ['http://movie.douban.com/subject/1291546']
+                                              + DOUBAN_ROW[6:]])
+        self.assertEqual(natural_key('douban_movies', rows[0]), natural_key('douban_movies', rows[1]))
+
+    def test_empty_url_falls_back_to_title_and_year(self):
+        rows = convert_rows('douban_movies', [DOUBAN_ROW[:5] + [''] + DOUBAN_ROW[6:],
+                                              DOUBAN_ROW[:5] + [''] + ['霸王别姬 (1993)'] + DOUBAN_ROW[7:],
+                                              DOUBAN_ROW[:4] + ['2005', ''] + DOUBAN_ROW[6:]])
+        keys = [natural_key('douban_movies', row) for row in rows]
+        self.assertEqual(keys[0], keys[1])
+        # 同名不同年份是另一部电影
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_dytt_book_title_form(self):
+        rows = convert_rows('dytt_movies', [['2023年剧情《银河写手》HD国语中字', 'c', '2024', '', '', '', '', '', 'l1', ''],
+                                            ['《银河写手》', 'c', '2024', '', '', '', '', '', 'l2', '']])
+        self.assertEqual(natural_key('dytt_movies', rows[0]), natural_key('dytt_movies', rows[1]))
+
+    def test_maoyan_key_uses_release_year(self):
+        rows = convert_rows('maoyan_movies', [['霸王别姬', '9.6', '', '', '1993-07-26', 'a.jpg'],
+                                              ['霸王别姬', '9.5', '', '', '1993-01-01', 'b.jpg'],
+                                              ['霸王别姬', '9.5', '', '', '2023-01-01', 'b.jpg']])
+        keys = [natural_key('maoyan_movies', row) for row in rows]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+
+class RowHashTests(unittest.TestCase):
+    def test_hash_survives_database_round_trip(self):
+        for table, raw in [('douban_movies', DOUBAN_ROW), ('moviemate_movies', MOVIEMATE_ROW),
+                           ('maoyan_movies', ['霸王别姬', '9', '剧情', '张国荣', '1993-07-26', 'a.jpg']),
+                           ('dytt_movies', ['《a》', 'c', '1993', '', '', '7.0', '8.25', '', 'l', ''])]:
+            row, = convert_rows(table, [raw])
+            stored = from_database(table, row)
+            self.assertEqual(row_hash(table, row), row_hash(table, stored), table)
+            self.assertEqual(natural_key(table, row), natural_key(table, stored), table)
+
+    def test_decimal_and_float_ratings_hash_equal(self):
+        row, = convert_rows('dytt_movies', [['a', '', '1993', '', '', '9', '8.0', '', '', '']])
+        self.assertEqual(row[5], 9.0)
+        stored = row[:5] + (Decimal('9.0'), Decimal('8.0')) + row[7:]
+        self.assertEqual(row_hash('dytt_movies', row), row_hash('dytt_movies', stored))
+
+    def test_derived_columns_do_not_change_hash(self):
+        row, = convert_rows('moviemate_movies', [MOVIEMATE_ROW])
+        rerated, = convert_rows('moviemate_movies', [MOVIEMATE_ROW[:10] + ['7.0', '', '']])
+        self.assertEqual(row_hash('moviemate_movies', row), row_hash('moviemate_movies', rerated))
+        self.assertNotIn('mm_rating', content_columns('moviemate_movies'))
+
+    def test_content_change_changes_hash(self):
+        row, = convert_rows('douban_movies', [DOUBAN_ROW])
+        changed, = convert_rows('douban_movies', [DOUBAN_ROW[:7] + ['9.7'] + DOUBAN_ROW[8:]])
+        self.assertNotEqual(row_hash('douban_movies', row), row_hash('douban_movies', changed))
+        self.assertEqual(natural_key('douban_movies', row), natural_key('douban_movies', changed))
+
+    def test_empty_string_and_null_hash_differently(self):
+        row, = convert_rows('dytt_movies', [['a', '', '', '', '', '', '', '', '', '']])
+        self.assertIsNone(row[2])
+        self.assertNotEqual(row_hash('dytt_movies', row), row_hash('dytt_movies', row[:2] + ('',) + row[3:]))
+
+
+class UpsertSqlTests(unittest.TestCase):
+    def test_row_hash_assigned_last(self):
+        # 前面各列的 IF 比较读到的必须是旧的 row_hash
+        sql = on_duplicate_sql('moviemate_movies')
+        self.assertTrue(sql.endswith('row_hash = VALUES(row_hash)'))
+        self.assertNotIn('`mm_rating`', sql)
+        self.assertEqual(upsert_sql('douban_movies').count('%s'), len(TYPED_TABLES['douban_movies']['columns']) + 2)
+
+
+class FakeTable(object):
+    # 按 row_key 保存行，模拟 upsert_many 用到的两条语句
+    def __init__(self, table):
+        self.table = table
+        self.rows = {}
+        self.statements = 0
+
+
+class FakeCursor(object):
+    def __init__(self, fake):
+        self.fake = fake
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql, params=None):
+        assert sql.startswith('SELECT row_key, row_hash FROM'), sql
+        self.result = [(key, self.fake.rows[key][-1]) for key in params if key in self.fake.rows]
+
+    def fetchall(self):
+        return self.result
+
+    def executemany(self, sql, rows):
+        assert sql == upsert_sql(self.fake.table), sql
+        self.fake.statements += 1
+        for row in rows:
+            old = self.fake.rows.get(row[-2])
+            if old is not None and old[-1] == row[-1]:
+                continue
+            self.fake.rows[row[-2]] = row
+
+
+class FakeConnection(object):
+    def __init__(self, table):
+        self.fake = FakeTable(table)
+
+    def cursor(self, *args):
+        return FakeCursor(self.fake)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class UpsertManyTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection('douban_movies')
+        self.repository = MovieRepository(self.connection)
+        self.rows = [DOUBAN_ROW[:5] + [f'https://movie.douban.com/subject/{i}/'] + [f'电影{i}'] + DOUBAN_ROW[7:]
+                     for i in range(10)]
+
+    def test_reimport_is_idempotent(self):
+        self.assertEqual(self.repository.upsert_many('douban_movies', self.rows),
+                         {'inserted': 10, 'updated': 0, 'unchanged': 0})
+        self.assertEqual(self.repository.upsert_many('douban_movies', self.rows),
+                         {'inserted': 0, 'updated': 0, 'unchanged': 10})
+        self.assertEqual(len(self.connection.fake.rows), 10)
+        # 内容未变时不发送写入语句
+        self.assertEqual(self.connection.fake.statements, 1)
+
+    def test_changed_and_duplicate_rows(self):
+        self.repository.upsert_many('douban_movies', self.rows)
+        changed = [list(row) for row in self.rows[:3]]
+        changed[0][7] = '8.0'
+        # 同一批中同一部电影出现两次，以最后一行为准；https 与 http 是同一个链接
+        duplicate = list(changed[0])
+        duplicate[5] = duplicate[5].replace('https://', 'http://')
+        duplicate[7] = '7.0'
+        counts = self.repository.upsert_many('douban_movies', changed + [duplicate], batch_size=2)
+        self.assertEqual(counts['inserted'], 0)
+        self.assertEqual(len(self.connection.fake.rows), 10)
+        key = natural_key('douban_movies', convert_rows('douban_movies', [duplicate])[0])
+        self.assertEqual(self.connection.fake.rows[key][7], 7.0)
+
+    def test_rows_read_back_from_database_are_unchanged(self):
+        self.repository.upsert_many('douban_movies', self.rows)
+        stored = [from_database('douban_movies', row[:-2]) for row in self.connection.fake.rows.values()]
+        self.assertEqual(self.repository.upsert_many('douban_movies', stored, convert=False),
+                         {'inserted': 0, 'updated': 0, 'unchanged': 10})
+
+    def test_keyed_rows_append_key_and_hash(self):
+        row, = keyed_rows('douban_movies', convert_rows('douban_movies', [DOUBAN_ROW]))
+        self.assertEqual(len(row), len(DOUBAN_ROW) + 2)
+        self.assertEqual([len(row[-2]), len(row[-1])], [16, 16])
+
+
+class RecordingCursor(FakeCursor):
+    # 记录执行的语句，返回预先给定的结果
+    def execute(self, sql, params=None):
+        self.fake.statements.append((sql, params))
+        self.result = self.fake.result
+
+
+class DimensionQueryTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection('moviemate_movies')
+        self.connection.fake.statements = []
+        self.connection.fake.result = [('霸王别姬', Decimal('9.5'), 'p1', 'd1'), ('霸王别姬', Decimal('9.0'), 'p2', 'd2'),
+                                       ('活着', Decimal('9.3'), 'p3', 'd3')]
+        self.connection.cursor = lambda *args: RecordingCursor(self.connection.fake)
+        self.repository = MovieRepository(self.connection)
+
+    def test_genres_and_regions(self):
+        movies = self.repository.movies_by_dimensions(['剧情', '爱情', '剧情'], ['美国'], limit=5)
+        (sql, params), = self.connection.fake.statements
+        self.assertIn('HAVING COUNT(*) = 2', sql)
+        self.assertIn('movie_region', sql)
+        self.assertEqual(params, ('剧情', '爱情', '美国', 15))
+        # 按标题去重，保留评分最高的一条
+        self.assertEqual([(movie.title, movie.poster_url) for movie in movies], [('霸王别姬', 'p1'), ('活着', 'p3')])
+
+    def test_any_genre_without_regions(self):
+        self.repository.movies_by_dimensions(['剧情', '爱情'], match_all=False, exclude='活着')
+        (sql, params), = self.connection.fake.statements
+        self.assertNotIn('HAVING', sql)
+        self.assertNotIn('movie_region', sql)
+        self.assertEqual(params, ('剧情', '爱情', 30))
+
+    def test_best_movies_by_genres(self):
+        self.assertEqual(self.repository.best_movies_by_genres([]), [])
+        movies = self.repository.best_movies_by_genres(['剧情'], limit=1)
+        self.assertEqual([movie.title for movie in movies], ['霸王别姬'])
+        self.assertIn('HAVING COUNT(*) = 1', self.connection.fake.statements[0][0])
+
+
+def ngram_score(title, query):
+    # 近似 ngram 解析器的自然语言模式：查询中每个长度为 NGRAM_TOKEN_SIZE 的词元在标题中出现一次记 1 分，
+    # 短于词元长度的词不产生词元
+    tokens = {word[i:i + NGRAM_TOKEN_SIZE] for word in query.split()
+              for i in range(len(word) - NGRAM_TOKEN_SIZE + 1)}
+    return float(sum(token in title for token in tokens))
+
+
+def like(text, pattern):
+    # 只支持 search_titles 使用的 '前缀%' 形式，前缀中的 %、_、\ 已转义
+    prefix = re.sub(r'\\(.)', r'\1', pattern[:-1])
+    return text.startswith(prefix)
+
+
+class SearchCursor(object):
+    # 在内存中的 (id, title, mm_rating) 上执行 search_titles 的计数和检索语句，按语句中的排序规则排序
+    ORDER = 'ORDER BY exact DESC, prefix DESC, t.score DESC, m.mm_rating DESC, m.id'
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def matched(self, sql, param):
+        # 每个标题取 id 最小的一行和最高的相关度，与 GROUP BY title 一致
+        groups = {}
+        for movie_id, title, rating in self.fake.movies:
+            if 'MATCH(title)' in sql:
+                score = ngram_score(title, param)
+                if not score:
+                    continue
+            elif like(title, param):
+                score = 0.0
+            else:
+                continue
+            best = groups.get(title)
+            groups[title] = (min(best[0], movie_id), max(best[1], score)) if best else (movie_id, score)
+        return groups
+
+    def execute(self, sql, params=None):
+        self.fake.statements.append((sql, params))
+        if sql.startswith('SELECT COUNT(DISTINCT title)'):
+            self.result = [(len(self.matched(sql, params[0])),)]
+            return
+        assert self.ORDER in sql, sql
+        query, prefix, matched_param, *_, limit, offset = params
+        movies = {movie_id: (title, rating) for movie_id, title, rating in self.fake.movies}
+        rows = []
+        for movie_id, score in self.matched(sql, matched_param).values():
+            title, rating = movies[movie_id]
+            rows.append((title, rating, f'p{movie_id}', f'd{movie_id}', '剧情', '', 1990, score, int(title == query),
+                         int(like(title, prefix)), movie_id))
+        rows.sort(key=lambda row: (-row[8], -row[9], -row[7], -float(row[1] or 0), row[10]))
+        self.result = [row[:10] for row in rows[offset:offset + limit]]
+
+
+class SearchTitlesTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection('moviemate_movies')
+        self.connection.fake.statements = []
+        self.connection.fake.movies = [
+            (1, '霸王别姬', Decimal('9.5')),
+            (2, '新霸王别姬传', Decimal('9.9')),
+            (3, '霸王别姬', Decimal('8.0')),
+            (4, '霸王', Decimal('7.0')),
+            (5, '西楚霸王', Decimal('8.8')),
+            (6, '别姬', None),
+            (7, '活着', Decimal('9.3')),
+            (8, '100%女孩', Decimal('6.0')),
+            (9, '1000个女孩', Decimal('6.5')),
+        ]
+        self.connection.cursor = lambda *args: SearchCursor(self.connection.fake)
+        self.repository = MovieRepository(self.connection)
+
+    def titles(self, query, **kwargs):
+        return [movie['title'] for movie in self.repository.search_titles(query, **kwargs)['results']]
+
+    def test_fulltext_ranking_order(self):
+        result = self.repository.search_titles('霸王别姬')
+        self.assertIn('MATCH(title) AGAINST(%s IN NATURAL LANGUAGE MODE)', self.connection.fake.statements[0][0])
+        # 完全相同 > 以查询开头 > 相关度 > 评分；同名电影只保留 id 最小的一条。
+        # 西楚霸王、霸王、别姬都只命中一个词元，按评分排序，没有评分的排在最后
+        self.assertEqual([movie['title'] for movie in result['results']],
+                         ['霸王别姬', '新霸王别姬传', '西楚霸王', '霸王', '别姬'])
+        self.assertEqual(result['total'], 5)
+        first = result['results'][0]
+        self.assertEqual((first['exact'], first['mm_rating'], first['detail_url']), (True, '9.5', 'd1'))
+        self.assertEqual(result['results'][-1]['mm_rating'], '')
+
+    def test_prefix_ranks_above_relevance(self):
+        self.assertEqual(self.titles('霸王'), ['霸王', '霸王别姬', '新霸王别姬传', '西楚霸王'])
+
+    def test_pages(self):
+        result = self.repository.search_titles('霸王别姬', page=2, page_size=2)
+        self.assertEqual((result['total'], result['pages']), (5, 3))
+        self.assertEqual([movie['title'] for movie in result['results']], ['西楚霸王', '霸王'])
+        sql, params = self.connection.fake.statements[-1]
+        self.assertEqual(params[-2:], (2, 2))
+        self.assertEqual(self.repository.search_titles('霸王别姬', page=0)['page'], 1)
+
+    def test_short_query_uses_prefix_scan(self):
+        self.assertEqual(len('活'), NGRAM_TOKEN_SIZE - 1)
+        result = self.repository.search_titles('活')
+        self.assertEqual([movie['title'] for movie in result['results']], ['活着'])
+        self.assertEqual(result['results'][0]['score'], 0.0)
+        self.assertFalse(any('MATCH' in sql for sql, _ in self.connection.fake.statements))
+        self.assertEqual(self.connection.fake.statements[0][1], ('活%',))
+        # 单字查询只按前缀匹配，不命中标题中间的字
+        self.assertEqual(self.titles('姬'), [])
+        # 前缀匹配的结果都不是完全相同时按评分排序
+        self.assertEqual(self.titles('霸'), ['霸王别姬', '霸王'])
+
+    def test_short_query_escapes_like_wildcards(self):
+        self.assertEqual(self.titles('%'), [])
+        self.assertEqual(self.connection.fake.statements[0][1], ('\\%%',))
+        self.assertEqual(self.titles('1'), ['1000个女孩', '100%女孩'])
+
+    def test_blank_and_no_match(self):
+        empty = {'query': '', 'page': 1, 'page_size': 10, 'total': 0, 'pages': 0, 'results': []}
+        self.assertEqual(self.repository.search_titles('   '), empty)
+        self.assertEqual(self.connection.fake.statements, [])
+        result = self.repository.search_titles('  阿凡  达 ')
+        self.assertEqual((result['query'], result['total'], result['results']), ('阿凡 达', 0, []))
+        # 没有命中时不执行检索语句
+        self.assertEqual(len(self.connection.fake.statements), 1)
+
+
+class SourceFileTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.stem = os.path.join(self.directory.name, 'movies_dytt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def touch(self, suffix):
+        open(self.stem + suffix, 'w').close()
+
+    def test_falls_back_to_excel_and_csv(self):
+        self.touch('.xlsx')
+        self.assertEqual(source_file(self.stem + '.parquet'), self.stem + '.xlsx')
+        self.touch('.csv')
+        self.assertEqual(source_file(self.stem + '.parquet'), self.stem + '.csv')
+        self.touch('.parquet')
+        self.assertEqual(source_file(self.stem + '.parquet'), self.stem + '.parquet')
+        # 明确给出的文件存在时不替换
+        self.assertEqual(source_file(self.stem + '.xlsx'), self.stem + '.xlsx')
+
+    def test_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            source_file(self.stem + '.parquet')
+
+    def test_fallback_files_read_the_same_rows(self):
+        # 还没转换为 Parquet 时读取 Excel / CSV，得到的行与转换后的 Parquet 一致
+        df = pd.DataFrame({'title': ['霸王别姬', '活着'], 'year': ['1993', ''], 'imdb_rating': ['8.1', '8.5']})
+        expected = [['霸王别姬', '1993', '8.1'], ['活着', '', '8.5']]
+        df.to_excel(self.stem + '.xlsx', index=False)
+        self.assertEqual(list(iter_rows(source_file(self.stem + '.parquet'))), expected)
+        df.to_csv(self.stem + '.csv', index=False)
+        self.assertEqual(list(iter_rows(source_file(self.stem + '.parquet'))), expected)
+        df.to_parquet(self.stem + '.parquet', index=False)
+        self.assertEqual(list(iter_rows(source_file(self.stem + '.parquet'))), expected)
+
+    def test_checked_in_dytt_file_is_found(self):
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '爬取网站代码')
+        self.assertTrue(os.path.exists(source_file(os.path.join(directory, 'movies_dytt.parquet'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
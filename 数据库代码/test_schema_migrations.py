@@ -0,0 +1,194 @@
+import unittest
+from unittest import mock
+
+import schema_migrations
+from movie_repository.schema import TYPED_TABLES, column_names, convert_rows
+from schema_migrations import SCHEMA_VERSION, migrate_table
+
+TABLE = 'dytt_movies'
+TARGET = f'{TABLE}__typed'
+
+
+def source_row(i):
+    row = [''] * len(column_names(TABLE))
+    row[0], row[2] = f'电影{i}', str(1990 + i)
+    return tuple(row)
+
+
+class FakeDatabase(object):
+    # 按语句前缀模拟 migrate_table 用到的 MySQL 语句；迁移记录在提交时才生效
+    def __init__(self, rows):
+        self.tables = {TABLE: list(rows)}
+        self.typed = set()
+        self.migrations = {}
+        self.pending = {}
+        self.statements = []
+        # (提交前最后一条迁移记录, 提交时新表的行数)
+        self.commits = []
+
+    def commit(self):
+        self.migrations.update(self.pending)
+        self.pending = {}
+        if TABLE in self.migrations:
+            self.commits.append((self.migrations[TABLE], len(self.tables.get(TARGET, []))))
+
+
+class FakeCursor(object):
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchmany(self, size):
+        rows, self.result = self.result[:size], self.result[size:]
+        return rows
+
+    def executemany(self, sql, rows):
+        assert sql.startswith(f'INSERT INTO {TARGET}('), sql
+        self.db.tables[TARGET].extend(rows)
+
+    def execute(self, sql, params=None):
+        db, query = self.db, ' '.join(sql.split())
+        db.statements.append(query)
+        self.result = []
+        if query.startswith('SELECT COUNT(*) FROM information_schema.columns'):
+            self.result = [(int(params[0] in db.typed and params[1] == 'id'),)]
+        elif query.startswith('SELECT version, status, copied_rows FROM schema_migrations'):
+            state = db.migrations.get(params[0])
+            self.result = [state] if state else []
+        elif query.startswith('INSERT INTO schema_migrations'):
+            table, version, status, copied = params
+            db.pending[table] = (version, status, copied)
+        elif query.startswith(f'CREATE TABLE IF NOT EXISTS {TARGET} '):
+            db.tables.setdefault(TARGET, [])
+        elif query.startswith(f'DROP TABLE IF EXISTS {TARGET}'):
+            db.tables.pop(TARGET, None)
+        elif query.startswith('SELECT `title`'):
+            self.result = list(db.tables[query.rsplit(' ', 1)[1]])
+        elif query.startswith('SELECT MAX(change_id)'):
+            self.result = [(None,)]
+        elif query.startswith('SELECT COUNT(*) FROM '):
+            self.result = [(len(db.tables[query.rsplit(' ', 1)[1]]),)]
+        elif query.startswith('RENAME TABLE'):
+            db.tables[f'{TABLE}__untyped'] = db.tables.pop(TABLE)
+            db.tables[TABLE] = db.tables.pop(TARGET)
+            db.typed.add(TABLE)
+        elif not query.startswith(('CREATE TABLE IF NOT EXISTS', 'DROP', 'CREATE TRIGGER', 'LOCK TABLES',
+                                   'UNLOCK TABLES')):
+            raise AssertionError(query)
+
+
+class FakeConnection(object):
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, *args):
+        return FakeCursor(self.db)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.db.commit()
+
+
+class MigrateTableTests(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase([source_row(i) for i in range(7)])
+        self.connection = FakeConnection(self.db)
+        patcher = mock.patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def migrate(self, **kwargs):
+        return migrate_table(self.connection, self.connection, TABLE, batch_size=3, **kwargs)
+
+    def test_copies_in_batches_and_records_version(self):
+        self.assertEqual(self.migrate(), 7)
+        self.assertEqual(self.db.tables[TABLE], convert_rows(TABLE, [source_row(i) for i in range(7)]))
+        self.assertEqual(self.db.migrations[TABLE], (SCHEMA_VERSION, 'done', 7))
+        # 每批的进度与该批的行一起提交
+        progress = {(state[2], count) for state, count in self.db.commits if state[1] == 'copying'}
+        self.assertEqual(sorted(progress), [(0, 0), (3, 3), (6, 6), (7, 7)])
+
+    def test_steps_run_in_order(self):
+        self.migrate()
+        statements = self.db.statements
+
+        def position(prefix):
+            return next(i for i, query in enumerate(statements) if query.startswith(prefix))
+
+        self.assertLess(position(f'CREATE TABLE IF NOT EXISTS {TARGET}'), position('CREATE TRIGGER'))
+        # 触发器先于读取快照
+        self.assertLess(position('CREATE TRIGGER'), position('SELECT `title`'))
+        self.assertLess(position('SELECT `title`'), position('LOCK TABLES'))
+        self.assertLess(position('LOCK TABLES'), position('RENAME TABLE'))
+        self.assertLess(position('RENAME TABLE'), position('UNLOCK TABLES'))
+
+    def test_rerun_skips_migrated_table(self):
+        self.migrate()
+        statements, commits = len(self.db.statements), len(self.db.commits)
+        self.assertEqual(self.migrate(), 0)
+        new = self.db.statements[statements:]
+        self.assertFalse([query for query in new if query.startswith(('INSERT', 'DROP', 'RENAME', 'SELECT `'))])
+        self.assertEqual(self.db.migrations[TABLE], (SCHEMA_VERSION, 'done', 7))
+        self.assertEqual(len(self.db.commits), commits)
+
+    def test_resume_from_recorded_progress(self):
+        # 上次复制了 3 行后中断
+        self.db.tables[TARGET] = convert_rows(TABLE, [source_row(i) for i in range(3)])
+        self.db.migrations[TABLE] = (SCHEMA_VERSION, 'copying', 3)
+        self.assertEqual(self.migrate(), 7)
+        self.assertEqual(self.db.tables[TABLE], convert_rows(TABLE, [source_row(i) for i in range(7)]))
+        self.assertNotIn(f'DROP TABLE IF EXISTS {TARGET}', self.db.statements)
+
+    def test_restart_ignores_progress(self):
+        self.db.tables[TARGET] = convert_rows(TABLE, [source_row(i) for i in range(3)])
+        self.db.migrations[TABLE] = (SCHEMA_VERSION, 'copying', 3)
+        self.assertEqual(self.migrate(restart=True), 7)
+        self.assertIn(f'DROP TABLE IF EXISTS {TARGET}', self.db.statements)
+        self.assertEqual(len(self.db.tables[TABLE]), 7)
+
+    def test_row_count_mismatch_keeps_old_table(self):
+        # 续传时进度与新表内容不符，切换前的行数核对失败
+        self.db.tables[TARGET] = convert_rows(TABLE, [source_row(0)])
+        self.db.migrations[TABLE] = (SCHEMA_VERSION, 'copying', 3)
+        with self.assertRaises(RuntimeError):
+            self.migrate()
+        self.assertNotIn(TABLE, self.db.typed)
+        self.assertEqual(self.db.statements[-1], 'UNLOCK TABLES')
+        self.assertEqual(self.db.migrations[TABLE][1], 'copying')
+
+
+class MainTests(unittest.TestCase):
+    def test_tables_are_migrated_in_order(self):
+        calls = []
+        patches = [
+            mock.patch.object(schema_migrations.pymysql, 'connect'),
+            mock.patch.object(schema_migrations, 'table_exists', lambda cursor, table: table != 'maoyan_movies'),
+            mock.patch.object(schema_migrations, 'benchmark_table', lambda connection, table: {}),
+            mock.patch('builtins.print'),
+        ]
+        for name in ('migrate_table', 'add_natural_keys', 'add_fulltext_indexes'):
+            patches.append(mock.patch.object(schema_migrations, name,
+                                             lambda *args, name=name: calls.append((name, args[-1]))))
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        schema_migrations.main()
+        expected = [(name, table) for table in TYPED_TABLES if table != 'maoyan_movies'
+                    for name in ('migrate_table', 'add_natural_keys', 'add_fulltext_indexes')]
+        self.assertEqual(calls, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
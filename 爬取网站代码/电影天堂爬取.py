@@ -129,12 +129,27 @@ def spider():
             except Exception as exc:
                 print(f'Page {page_number} generated an exception: {exc}')
             time.sleep(1)  # 避免过于频繁地请求服务器
-    save_movies_to_excel(all_movies, 'movies.xlsx')
+    # 与入库脚本默认读取的文件同名（数据库代码/bulk_loader.py 的 SOURCE_FILES）
+    save_movies_to_parquet(all_movies, 'movies_dytt.parquet')
+
+
+def save_movies_to_parquet(movies, filename):
+    """
+    将电影数据保存到 Parquet 文件中，供入库脚本按列读取
+
+    参数:
+    movies (list of dict): 包含电影信息的字典列表
+    filename (str): 要保存的 Parquet 文件名
+    """
+    # 所有字段按字符串保存，与入库时的 VARCHAR 列一致
+    df = pd.DataFrame(movies).astype('string')
+
+    df.to_parquet(filename, index=False, compression='zstd')
 
 
 def save_movies_to_excel(movies, filename):
     """
-    将电影数据保存到 Excel 文件中
+    将电影数据导出到 Excel 文件中，便于人工查看
 
     参数:
     movies (list of dict): 包含电影信息的字典列表